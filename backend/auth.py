@@ -8,6 +8,7 @@ import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from database import get_supabase
+from repositories import users
 import config  # This will be config_web or config_mobile depending on which server loaded it
 
 # Security configuration (shared with mobile project)
@@ -46,11 +47,10 @@ def authenticate_user(mobile: str, password: str):
         return False
     
     try:
-        result = supabase.table("users").select("*").eq("mobile", mobile).eq("is_active", True).execute()
-        if not result.data:
+        user = users.for_login(mobile)
+        if not user:
             return False
         
-        user = result.data[0]
         if not verify_password(password, user["password_hash"]):
             return False
         return user
@@ -79,10 +79,11 @@ async def get_current_user(
         raise credentials_exception
     
     try:
-        result = supabase.table("users").select("*").eq("id", int(user_id)).execute()
-        if not result.data:
+        # Profile columns only: password_hash never leaves authenticate_user
+        user = users.profile(int(user_id))
+        if not user:
             raise credentials_exception
-        return result.data[0]
+        return user
     except Exception:
         raise credentials_exception
 
@@ -0,0 +1,89 @@
+"""
+Concurrent booking load test
+Fires N simultaneous bookings for the same slot and checks exactly one wins.
+
+Run against a live server:
+    python benchmarks/booking_concurrency.py --url http://127.0.0.1:8000 --hospital-id 1
+    python benchmarks/booking_concurrency.py --url http://127.0.0.1:3000 --web --token <JWT> --doctor-id 2
+
+Without --url the mobile app is exercised in-process (in-memory storage fallback).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_payloads(args, slot_date: str):
+    """One payload per simulated client, all targeting the same slot"""
+    if args.web:
+        return [{
+            "doctor_id": args.doctor_id,
+            "date": slot_date,
+            "time_slot": args.time_slot,
+            "reason": f"load test {i}"
+        } for i in range(args.concurrency)]
+    return [{
+        "patient_mobile": f"9{i:09d}",
+        "patient_name": f"Load Test {i}",
+        "place": "Pune",
+        "hospital_id": args.hospital_id,
+        "date": slot_date,
+        "time": args.time
+    } for i in range(args.concurrency)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent slot booking test")
+    parser.add_argument("--url", help="Server base URL (omit to run server_mobile in-process)")
+    parser.add_argument("--web", action="store_true", help="Target the web API (needs --token and --doctor-id)")
+    parser.add_argument("--token", help="Bearer token for the web API")
+    parser.add_argument("--doctor-id", type=int, default=1)
+    parser.add_argument("--hospital-id", type=int, default=1)
+    parser.add_argument("--time-slot", default="10:00", help="Web API slot (HH:MM)")
+    parser.add_argument("--time", default="10:00 AM", help="Mobile API slot (HH:MM AM/PM)")
+    parser.add_argument("--days-ahead", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    slot_date = str(date.today() + timedelta(days=args.days_ahead))
+    payloads = build_payloads(args, slot_date)
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+
+    if args.url:
+        import requests
+        session = requests.Session()
+
+        def post(payload):
+            return session.post(f"{args.url}/api/appointments/book", json=payload, headers=headers, timeout=30)
+    else:
+        from fastapi.testclient import TestClient
+        import server_mobile
+        client = TestClient(server_mobile.app)
+
+        def post(payload):
+            return client.post("/api/appointments/book", json=payload)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        responses = list(pool.map(post, payloads))
+    elapsed = time.perf_counter() - started
+
+    codes = Counter(r.status_code for r in responses)
+    successes = codes.get(200, 0)
+    print(f"Slot {slot_date} - {args.concurrency} concurrent requests in {elapsed:.2f}s")
+    print(f"Status codes: {dict(codes)}")
+    if successes == 1:
+        print("✅ Exactly one booking succeeded")
+        return 0
+    print(f"❌ Expected exactly one successful booking, got {successes}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
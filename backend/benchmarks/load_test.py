@@ -0,0 +1,408 @@
+"""
+Load test for the booking, listing and payment flows
+Seeds the local PostgREST stand-in (benchmarks/postgrest_stub.py) with
+hospitals, doctors and patients, hosts the Razorpay simulator, starts both
+servers against them and drives concurrent virtual users through:
+
+    web:    login -> available-slots -> book -> create-order -> pay (simulator)
+            -> webhook -> my-appointments -> my-payments
+    mobile: login -> cities/search -> create-order -> pay (simulator) -> verify
+            -> book -> payments/history
+
+Every step reports throughput, p50/p95/p99 and error rate; slot conflicts
+(409) are expected under contention and counted separately. Save a run with
+--json and compare later runs against it with --baseline to catch
+regressions; the exit code is nonzero when a threshold is exceeded.
+
+    python benchmarks/load_test.py --users 20 --duration 60
+    python benchmarks/load_test.py --users 50 --iterations 20 --db-latency 0.003 --json runs/base.json
+    python benchmarks/load_test.py --users 50 --iterations 20 --baseline runs/base.json --tolerance 0.2
+    python benchmarks/load_test.py --only mobile --max-error-rate 0.01 --max-p95-ms 250
+    python benchmarks/load_test.py --backend sqlite --users 20 --iterations 10
+
+The spawned servers don't read .env (it would point them at the real
+Supabase). To load servers that are already running, start them with
+SUPABASE_URL/SUPABASE_KEY for the stand-in and pass --web-url/--mobile-url
+together with --stub-port/--razorpay-port so the harness hosts those ports.
+Booking writes the per-day CSV exports under appointment_exports/ as usual.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from postgrest.exceptions import APIError
+from benchmarks.postgrest_stub import PostgrestStub, PostgrestError, seed_dataset, STUB_KEY
+from benchmarks.razorpay_simulator import RazorpaySimulator, DEFAULT_KEY_ID, DEFAULT_KEY_SECRET, DEFAULT_WEBHOOK_SECRET
+from services.local_db import LocalClient
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WEB_SLOTS = ["09:30", "10:00", "10:30", "11:00", "11:30", "12:00", "12:30", "13:00", "13:30",
+             "14:00", "14:30", "15:00", "15:30", "18:00", "18:30", "19:00", "19:30", "20:00", "20:30"]
+MOBILE_TIMES = ["09:30 AM", "10:30 AM", "11:30 AM", "12:30 PM", "02:00 PM", "03:00 PM", "06:00 PM", "07:00 PM"]
+CITY_QUERIES = ["pu", "mum", "nag", "ind", "bho", "ahm", "ben", "hyd", "che", "jai"]
+
+# Servers read their settings at import; load_dotenv is disabled so the
+# repository .env (override=True) can't replace the stand-in URLs
+BOOTSTRAP = (
+    "import sys, dotenv, uvicorn; dotenv.load_dotenv = lambda *a, **k: False; "
+    "uvicorn.run(sys.argv[1] + ':app', host='127.0.0.1', port=int(sys.argv[2]), log_level='warning')"
+)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else 0.0
+
+
+class Recorder:
+    """Latency samples and outcomes per (flow, step)"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.conflicts: Dict[str, int] = defaultdict(int)
+        self.error_examples: Dict[str, str] = {}
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, step: str, seconds: float, ok: bool, conflict: bool = False, detail: str = ""):
+        self.samples[step].append(seconds)
+        if conflict:
+            self.conflicts[step] += 1
+        elif not ok:
+            self.errors[step] += 1
+            self.error_examples.setdefault(step, detail[:200])
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        report = {}
+        for step, samples in self.samples.items():
+            ordered = sorted(samples)
+            report[step] = {
+                "count": len(samples),
+                "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(ordered, 0.50), 2),
+                "p95_ms": round(percentile(ordered, 0.95), 2),
+                "p99_ms": round(percentile(ordered, 0.99), 2),
+                "error_rate": round(self.errors[step] / len(samples), 4),
+                "conflicts": self.conflicts[step],
+            }
+        return report
+
+
+async def call(client: httpx.AsyncClient, recorder: Recorder, step: str, method: str, url: str,
+               expect: Tuple[int, ...] = (200,), conflict: Tuple[int, ...] = (), **kwargs) -> Optional[httpx.Response]:
+    """Timed request; returns the response when its status is expected"""
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        recorder.record(step, time.perf_counter() - started, False, detail=f"{type(e).__name__}: {e}")
+        return None
+    elapsed = time.perf_counter() - started
+    if response.status_code in conflict:
+        recorder.record(step, elapsed, True, conflict=True)
+        return None
+    ok = response.status_code in expect
+    recorder.record(step, elapsed, ok, detail=f"{response.status_code} {response.text}")
+    return response if ok else None
+
+
+# ---- flows -------------------------------------------------------------------
+
+async def web_login(client: httpx.AsyncClient, recorder: Recorder, mobile: str, password: str) -> Optional[str]:
+    response = await call(client, recorder, "web.login", "POST", "/api/users/login",
+                          json={"mobile": mobile, "password": password})
+    return response.json().get("access_token") if response else None
+
+
+async def web_iteration(client: httpx.AsyncClient, recorder: Recorder, simulator: RazorpaySimulator,
+                        token: str, dataset: Dict[str, Any], rng: random.Random, amount: float):
+    headers = {"Authorization": f"Bearer {token}"}
+    doctor = rng.choice(dataset["doctors"])
+    day = str(date.today() + timedelta(days=rng.randint(1, 30)))
+
+    response = await call(client, recorder, "web.available_slots", "GET", "/api/appointments/available-slots",
+                          params={"doctor_id": doctor["id"], "date": day}, headers=headers)
+    slots = (response.json().get("available_slots") if response else None) or WEB_SLOTS
+
+    response = await call(client, recorder, "web.book", "POST", "/api/appointments/book", conflict=(400, 409),
+                          json={"doctor_id": doctor["id"], "date": day, "time_slot": rng.choice(slots),
+                                "reason": "Load test consultation"}, headers=headers)
+    if response is not None:
+        appointment_id = response.json().get("id") or response.json().get("appointment", {}).get("id")
+        response = await call(client, recorder, "web.create_order", "POST", "/api/payments/create-order",
+                              json={"appointment_id": appointment_id, "amount": amount}, headers=headers)
+        if response is not None:
+            payment = simulator.pay_order(response.json()["order_id"])
+            body, webhook_headers = simulator.signed_webhook(simulator.webhook_event(payment))
+            await call(client, recorder, "web.webhook", "POST", "/api/payments/webhook",
+                       content=body, headers=webhook_headers)
+
+    await call(client, recorder, "web.my_appointments", "GET", "/api/appointments/my-appointments", headers=headers)
+    await call(client, recorder, "web.my_payments", "GET", "/api/payments/my-payments", headers=headers)
+
+
+async def mobile_iteration(client: httpx.AsyncClient, recorder: Recorder, simulator: RazorpaySimulator,
+                           patient: Dict[str, Any], dataset: Dict[str, Any], rng: random.Random, amount: float):
+    await call(client, recorder, "mobile.login", "POST", "/api/users/login",
+               json={"mobile": patient["mobile"], "password": dataset["password"]})
+    await call(client, recorder, "mobile.city_search", "GET", "/api/cities/search",
+               params={"q": rng.choice(CITY_QUERIES)})
+
+    response = await call(client, recorder, "mobile.create_order", "POST", "/api/payments/create-order",
+                          json={"type": "appointment", "amount": amount, "patient_name": "Load Test Patient",
+                                "patient_mobile": patient["mobile"]})
+    if response is not None:
+        order_id = response.json()["order_id"]
+        payment = simulator.pay_order(order_id)
+        await call(client, recorder, "mobile.verify", "POST", "/api/payments/verify",
+                   json={"order_id": order_id, "payment_id": payment["id"],
+                         "signature": simulator.checkout_signature(order_id, payment["id"])})
+
+    # Booked without order_id: /verify marks payments `status` paid while the
+    # booking check reads `payment_status`, so a paid order_id is still refused
+    await call(client, recorder, "mobile.book", "POST", "/api/appointments/book", conflict=(409,),
+               json={"patient_mobile": patient["mobile"], "patient_name": "Load Test Patient", "place": "Pune",
+                     "hospital_id": rng.choice(dataset["hospitals"]), "payment_method": "upi",
+                     "date": str(date.today() + timedelta(days=rng.randint(1, 60))),
+                     "time": rng.choice(MOBILE_TIMES)})
+    await call(client, recorder, "mobile.payment_history", "GET", f"/api/payments/history/{patient['mobile']}")
+
+
+async def virtual_user(flow: str, index: int, base_url: str, recorder: Recorder, simulator: RazorpaySimulator,
+                       dataset: Dict[str, Any], args, deadline: Optional[float]):
+    rng = random.Random(args.seed * 1000 + index)
+    patient = dataset["patients"][index % len(dataset["patients"])]
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+        token = None
+        if flow == "web":
+            token = await web_login(client, recorder, patient["mobile"], dataset["password"])
+            if not token:
+                return
+        iteration = 0
+        while (iteration < args.iterations) if deadline is None else (time.perf_counter() < deadline):
+            if flow == "web":
+                await web_iteration(client, recorder, simulator, token, dataset, rng, args.amount)
+            else:
+                await mobile_iteration(client, recorder, simulator, patient, dataset, rng, args.amount)
+            iteration += 1
+            if args.think_time:
+                await asyncio.sleep(rng.uniform(0, args.think_time))
+
+
+# ---- servers -----------------------------------------------------------------
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(module: str, port: int, database_env: Dict[str, str], razorpay_url: str,
+                 workdir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ, **database_env,
+        RAZORPAY_BASE_URL=f"{razorpay_url}/v1", RAZORPAY_KEY_ID=DEFAULT_KEY_ID,
+        RAZORPAY_KEY_SECRET=DEFAULT_KEY_SECRET, RAZORPAY_WEBHOOK_SECRET=DEFAULT_WEBHOOK_SECRET,
+        JWT_SECRET=os.environ.get("JWT_SECRET", "load-test-secret"),
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        WEBHOOK_QUEUE_PATH=os.path.join(workdir, f"{module}_webhooks.db"),
+        PRIMARY_LOCK_PATH=os.path.join(workdir, f"{module}_primary.lock"),
+        WHATSAPP_OUTBOX_PATH=os.path.join(workdir, f"{module}_whatsapp_outbox.db"),
+    )
+    return subprocess.Popen([sys.executable, "-c", BOOTSTRAP, module, str(port)], cwd=BACKEND_DIR, env=env)
+
+
+async def wait_ready(base_url: str, process: Optional[subprocess.Popen], timeout: float = 60) -> bool:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.perf_counter() < deadline:
+            if process is not None and process.poll() is not None:
+                return False
+            try:
+                if (await client.get("/health/live")).status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    return False
+
+
+# ---- reporting ---------------------------------------------------------------
+
+def print_report(report: Dict[str, Dict[str, float]], recorder: Recorder):
+    print(f"\n{'step':<24}{'count':>7}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'409':>6}")
+    for step in sorted(report):
+        row = report[step]
+        print(f"{step:<24}{row['count']:>7}{row['rps']:>9.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+              f"{row['p99_ms']:>9.1f}{row['error_rate']:>8.1%}{row['conflicts']:>6}")
+    for step, example in sorted(recorder.error_examples.items()):
+        print(f"   ⚠️ {step}: {example}")
+
+
+def compare(report: Dict[str, Dict[str, float]], args) -> List[str]:
+    """Threshold and baseline violations"""
+    problems = []
+    for step, row in sorted(report.items()):
+        if row["error_rate"] > args.max_error_rate:
+            problems.append(f"{step}: error rate {row['error_rate']:.1%} > {args.max_error_rate:.1%}")
+        if args.max_p95_ms and row["p95_ms"] > args.max_p95_ms:
+            problems.append(f"{step}: p95 {row['p95_ms']:.1f}ms > {args.max_p95_ms:.1f}ms")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["steps"]
+        for step, row in sorted(report.items()):
+            before = baseline.get(step)
+            if not before:
+                continue
+            if before["p95_ms"] and row["p95_ms"] > before["p95_ms"] * (1 + args.tolerance):
+                problems.append(f"{step}: p95 {row['p95_ms']:.1f}ms vs baseline {before['p95_ms']:.1f}ms")
+            if before["rps"] and row["rps"] < before["rps"] * (1 - args.tolerance):
+                problems.append(f"{step}: {row['rps']:.1f} rps vs baseline {before['rps']:.1f} rps")
+            if row["error_rate"] > before["error_rate"] + 0.01:
+                problems.append(f"{step}: error rate {row['error_rate']:.1%} vs baseline {before['error_rate']:.1%}")
+    return problems
+
+
+class LocalSeeder:
+    """seed_dataset() target that writes into a local SQLite database (DATABASE_BACKEND=sqlite)"""
+
+    def __init__(self, client: LocalClient):
+        self.client = client
+
+    def insert(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        try:
+            return self.client.table(table).insert(rows).execute().data
+        except APIError as e:
+            raise PostgrestError(409, e.code or "", e.message or str(e))
+
+    def count(self, table: str) -> int:
+        return self.client.table(table).select("id", count="exact").limit(0).execute().count
+
+
+async def run(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    stub_server = None
+    if args.backend == "sqlite":
+        sqlite_path = args.sqlite_path or os.path.join(workdir, "load_test.sqlite3")
+        database = LocalSeeder(LocalClient(sqlite_path))
+        database_env = {"DATABASE_BACKEND": "sqlite", "SQLITE_PATH": sqlite_path}
+        location = sqlite_path
+    else:
+        database = PostgrestStub(latency=args.db_latency, seed=args.seed)
+        stub_server = database.serve(port=args.stub_port)
+        location = f"http://127.0.0.1:{stub_server.server_address[1]}"
+        database_env = {"DATABASE_BACKEND": "supabase", "SUPABASE_URL": location, "SUPABASE_KEY": STUB_KEY,
+                        "SUPABASE_SERVICE_ROLE_KEY": STUB_KEY}
+        location += f" (db latency {args.db_latency * 1000:.1f}ms)"
+    dataset = seed_dataset(database, args.hospitals, args.doctors_per_hospital, args.patients, seed=args.seed)
+    simulator = RazorpaySimulator()
+    razorpay_server = simulator.serve(port=args.razorpay_port)
+    razorpay_url = f"http://127.0.0.1:{razorpay_server.server_address[1]}"
+    print(f"🌱 Seeded {len(dataset['hospitals'])} hospitals, {len(dataset['doctors'])} doctors, "
+          f"{len(dataset['patients'])} patients at {location}")
+
+    flows = ["web", "mobile"] if args.only is None else [args.only]
+    urls = {"web": args.web_url, "mobile": args.mobile_url}
+    processes = []
+    try:
+        for flow in flows:
+            process = None
+            if not urls[flow]:
+                port = free_port()
+                process = start_server(f"server_{flow}", port, database_env, razorpay_url, workdir)
+                processes.append(process)
+                urls[flow] = f"http://127.0.0.1:{port}"
+            if not await wait_ready(urls[flow], process):
+                print(f"❌ {flow} server at {urls[flow]} did not become ready")
+                return 1
+            print(f"✅ {flow} server ready at {urls[flow]}")
+
+        recorder = Recorder()
+        deadline = time.perf_counter() + args.duration if args.duration else None
+        print(f"🚀 {args.users} users per flow, "
+              + (f"{args.duration}s" if deadline else f"{args.iterations} iterations each"))
+        await asyncio.gather(*(
+            virtual_user(flow, index, urls[flow], recorder, simulator, dataset, args, deadline)
+            for flow in flows for index in range(args.users)
+        ))
+        recorder.finished = time.perf_counter()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if stub_server is not None:
+            stub_server.shutdown()
+        razorpay_server.shutdown()
+
+    report = recorder.summary()
+    print_report(report, recorder)
+    print(f"\n⏱️ {recorder.finished - recorder.started:.1f}s, {sum(r['count'] for r in report.values())} requests, "
+          + (f"{database.requests_seen} database calls, " if stub_server is not None else "")
+          + f"{database.count('appointments')} appointments, {database.count('payments')} payments")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump({"config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+                       "steps": report}, f, indent=2)
+        print(f"💾 Saved {args.json}")
+
+    problems = compare(report, args)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if not problems:
+        print("✅ Within thresholds" + (f" and {args.tolerance:.0%} of {args.baseline}" if args.baseline else ""))
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the booking, listing and payment flows")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users per flow")
+    parser.add_argument("--duration", type=float, default=0, help="Seconds to run (overrides --iterations)")
+    parser.add_argument("--iterations", type=int, default=10, help="Flow iterations per user")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between iterations (s)")
+    parser.add_argument("--only", choices=["web", "mobile"])
+    parser.add_argument("--web-url", help="Use a running web server instead of starting one")
+    parser.add_argument("--mobile-url", help="Use a running mobile server instead of starting one")
+    parser.add_argument("--stub-port", type=int, default=0)
+    parser.add_argument("--razorpay-port", type=int, default=0)
+    parser.add_argument("--backend", choices=["stub", "sqlite"], default="stub",
+                        help="PostgREST stand-in over HTTP, or the servers' local SQLite backend")
+    parser.add_argument("--sqlite-path", help="SQLite file for --backend sqlite (default: a temporary file)")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Seconds added to every stand-in call")
+    parser.add_argument("--hospitals", type=int, default=20)
+    parser.add_argument("--doctors-per-hospital", type=int, default=5)
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--amount", type=float, default=500.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Report from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95/throughput regression vs baseline")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-p95-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+"""
+End-to-end payment benchmark against the local Razorpay stand-in
+Creates orders through a running server, pays them in the simulator, delivers
+signed webhooks (with duplicates and out-of-order events) and checks that every
+payment settles to the right state exactly once.
+
+The harness hosts the simulator; start the server under test pointed at it:
+    RAZORPAY_BASE_URL=http://127.0.0.1:9100/v1 python server_web.py
+The simulator accepts the RAZORPAY_KEY_ID/RAZORPAY_KEY_SECRET/RAZORPAY_WEBHOOK_SECRET
+the server loads from .env (or the simulator defaults when unset).
+
+Web app (create-order-hospital, or create-order with --token/--appointment-ids; /webhook):
+    python benchmarks/payment_benchmark.py --url http://127.0.0.1:3000 --orders 200 \\
+        --webhook-rate 100 --duplicate-rate 0.2 --failed-attempt-rate 0.2 --reorder-rate 0.5
+Add --doctor-token <JWT> to also exercise POST /api/payments/{id}/verify.
+
+Mobile app (create-order; checkout verification stands in for webhooks):
+    python benchmarks/payment_benchmark.py --url http://127.0.0.1:8000 --mobile --orders 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from typing import List, Dict, Any, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from dotenv import load_dotenv
+from benchmarks.razorpay_simulator import RazorpaySimulator, DEFAULT_KEY_ID, DEFAULT_KEY_SECRET, DEFAULT_WEBHOOK_SECRET
+
+# Same .env the servers load, so the simulator accepts their credentials
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), ".env"))
+
+failures = []
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    print(f"{'✅' if condition else '❌'} {name}{f' ({detail})' if detail else ''}")
+    if not condition:
+        failures.append(name)
+
+
+def percentiles(samples: List[float]) -> str:
+    if not samples:
+        return "n/a"
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return f"p50 {pick(0.50):.1f}ms  p95 {pick(0.95):.1f}ms  p99 {pick(0.99):.1f}ms  max {ordered[-1] * 1000:.1f}ms"
+
+
+# ---- phase 1: order creation ------------------------------------------------
+
+def order_request(args, run_id: str, i: int):
+    """(path, json, headers) for the i-th create-order call"""
+    if args.mobile:
+        return "/api/payments/create-order", {
+            "type": "appointment",
+            "amount": args.amount,
+            "patient_name": f"Benchmark {i}",
+            "patient_mobile": f"9{i:09d}",
+            "metadata": {"benchmark_run": run_id, "n": str(i)}
+        }, {}
+    if args.appointment_ids:
+        appointment_id = args.appointment_ids[i % len(args.appointment_ids)]
+        return "/api/payments/create-order", {
+            "appointment_id": appointment_id, "amount": args.amount
+        }, {"Authorization": f"Bearer {args.token}"}
+    return "/api/payments/create-order-hospital", {
+        "plan_name": f"benchmark-{run_id}-{i}", "amount": args.amount
+    }, {}
+
+
+async def create_orders(client: httpx.AsyncClient, args, run_id: str) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    statuses = Counter()
+
+    async def one(i: int) -> Optional[Dict[str, Any]]:
+        path, body, headers = order_request(args, run_id, i)
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body, headers=headers)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                return None
+            latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] += 1
+        return response.json() if response.status_code == 200 else None
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.orders)))
+    elapsed = time.perf_counter() - started
+
+    orders = [result for result in results if result]
+    print(f"\nOrders: {len(orders)}/{args.orders} in {elapsed:.2f}s -> {len(orders) / elapsed:.1f} orders/sec")
+    print(f"  latency {percentiles(latencies)}")
+    print(f"  responses {dict(statuses)}")
+    return orders
+
+
+# ---- phase 2: payments and webhook delivery ---------------------------------
+
+def plan_deliveries(simulator: RazorpaySimulator, orders: List[Dict[str, Any]], args, rng: random.Random):
+    """
+    Pay every order in the simulator and build the delivery schedule.
+
+    Some orders get a failed attempt before the captured one; with
+    --reorder-rate the failed event is delivered after the captured event,
+    and --duplicate-rate re-delivers events. Returns (deliveries, expected)
+    where expected maps order id -> final Razorpay payment status.
+    """
+    queues: Dict[str, List[Dict[str, Any]]] = {}
+    expected = {}
+    for order in orders:
+        order_id = order["order_id"]
+        payments = []
+        if rng.random() < args.failed_attempt_rate:
+            payments.append(simulator.pay_order(order_id, status="failed"))
+        payments.append(simulator.pay_order(order_id, status="captured"))
+        expected[order_id] = payments[-1]
+        if len(payments) > 1 and rng.random() < args.reorder_rate:
+            payments.reverse()
+
+        originals, duplicates = [], []
+        for payment in payments:
+            event = simulator.webhook_event(payment)
+            body, headers = simulator.signed_webhook(event)
+            delivery = {"order_id": order_id, "payment": payment, "event": event, "body": body, "headers": headers}
+            originals.append(delivery)
+            if rng.random() < args.duplicate_rate:
+                duplicates.append(delivery)
+        # Duplicates trail the originals, as Razorpay redeliveries do
+        queues[order_id] = originals + duplicates
+
+    # Interleave orders randomly while keeping each order's own sequence
+    slots = [order_id for order_id, queue in queues.items() for _ in queue]
+    rng.shuffle(slots)
+    cursors = {order_id: iter(queue) for order_id, queue in queues.items()}
+    return [next(cursors[order_id]) for order_id in slots], expected
+
+
+async def deliver(client: httpx.AsyncClient, deliveries: List[Dict[str, Any]], args) -> Dict[str, float]:
+    """POST deliveries at --webhook-rate per second; returns first-delivery start time per order"""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    outcomes = Counter()
+    first_sent: Dict[str, float] = {}
+    interval = 1.0 / args.webhook_rate if args.webhook_rate > 0 else 0
+    started = time.perf_counter()
+
+    async def one(index: int, delivery: Dict[str, Any]):
+        delay = started + index * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with semaphore:
+            sent = time.perf_counter()
+            if delivery["payment"]["status"] == "captured":
+                first_sent.setdefault(delivery["order_id"], sent)
+            try:
+                if args.mobile:
+                    payment = delivery["payment"]
+                    response = await client.post("/api/payments/verify", json={
+                        "order_id": payment["order_id"],
+                        "payment_id": payment["id"],
+                        "signature": delivery["signature"]
+                    })
+                else:
+                    response = await client.post("/api/payments/webhook", content=delivery["body"],
+                                                 headers=delivery["headers"])
+            except httpx.HTTPError as e:
+                outcomes[type(e).__name__] += 1
+                return
+            latencies.append(time.perf_counter() - sent)
+        try:
+            payload = response.json()
+            outcome = payload.get("message") or f"verified={payload.get('verified')}"
+        except ValueError:
+            outcome = f"HTTP {response.status_code}"
+        outcomes[outcome] += 1
+
+    await asyncio.gather(*(one(i, d) for i, d in enumerate(deliveries)))
+    elapsed = time.perf_counter() - started
+    label = "Verifications" if args.mobile else "Webhooks"
+    print(f"\n{label}: {len(deliveries)} deliveries in {elapsed:.2f}s -> {len(deliveries) / elapsed:.1f}/sec")
+    print(f"  latency {percentiles(latencies)}")
+    print(f"  outcomes {dict(outcomes)}")
+    return first_sent
+
+
+def plan_verifications(simulator: RazorpaySimulator, orders: List[Dict[str, Any]], args, rng: random.Random):
+    """Mobile flow: checkout signatures sent to /api/payments/verify, with duplicates"""
+    deliveries = []
+    expected = {}
+    for order in orders:
+        payment = simulator.pay_order(order["order_id"], status="captured")
+        expected[order["order_id"]] = payment
+        delivery = {
+            "order_id": order["order_id"],
+            "payment": payment,
+            "signature": simulator.checkout_signature(order["order_id"], payment["id"])
+        }
+        deliveries.append(delivery)
+        if rng.random() < args.duplicate_rate:
+            deliveries.append(dict(delivery, duplicate=True))
+    rng.shuffle(deliveries)
+    return deliveries, expected
+
+
+# ---- phase 3: correctness ---------------------------------------------------
+
+def expected_status(args, payment: Dict[str, Any]) -> str:
+    if args.mobile:
+        return "paid"
+    return "COMPLETED" if payment["status"] == "captured" else "FAILED"
+
+
+def database_configured() -> bool:
+    """Web state checks read the payments table directly (same .env as the server)"""
+    from database import get_supabase
+    return get_supabase() is not None
+
+
+async def read_states(client: httpx.AsyncClient, order_ids: List[str], args) -> Dict[str, Optional[str]]:
+    """Current payment status per order id (public status endpoint for mobile, Supabase for web)"""
+    if args.mobile:
+        async def one(order_id: str):
+            response = await client.get(f"/api/payments/status/{order_id}")
+            return response.json().get("status") if response.status_code == 200 else None
+        return dict(zip(order_ids, await asyncio.gather(*(one(order_id) for order_id in order_ids))))
+
+    from database import get_supabase
+    supabase = get_supabase()
+    states = {}
+    for start in range(0, len(order_ids), 100):
+        chunk = order_ids[start:start + 100]
+        result = supabase.table("payments").select("razorpay_order_id, status").in_(
+            "razorpay_order_id", chunk
+        ).execute()
+        states.update({row["razorpay_order_id"]: row["status"] for row in result.data or []})
+    return states
+
+
+async def wait_for_settlement(client: httpx.AsyncClient, expected: Dict[str, Dict[str, Any]],
+                              first_sent: Dict[str, float], args) -> Dict[str, Optional[str]]:
+    """Poll until every order shows its expected status (or --settle-timeout); prints time-to-settle"""
+    pending = set(expected)
+    settled_after = []
+    states: Dict[str, Optional[str]] = {}
+    deadline = time.perf_counter() + args.settle_timeout
+    while pending and time.perf_counter() < deadline:
+        observed = await read_states(client, sorted(pending), args)
+        now = time.perf_counter()
+        for order_id, state in observed.items():
+            states[order_id] = state
+            if state == expected_status(args, expected[order_id]):
+                pending.discard(order_id)
+                if order_id in first_sent:
+                    settled_after.append(now - first_sent[order_id])
+        if pending:
+            await asyncio.sleep(args.poll_interval)
+    print(f"\nSettlement: {len(expected) - len(pending)}/{len(expected)} orders reached their final state")
+    print(f"  delivery-to-visible {percentiles(settled_after)}")
+    return states
+
+
+async def verify_manually(client: httpx.AsyncClient, orders: List[Dict[str, Any]],
+                          expected: Dict[str, Dict[str, Any]], args):
+    """POST /api/payments/{id}/verify for every order (doctor token required)"""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    mismatches = []
+
+    async def one(order: Dict[str, Any]):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(f"/api/payments/{order['payment_id']}/verify",
+                                         headers={"Authorization": f"Bearer {args.doctor_token}"})
+            latencies.append(time.perf_counter() - started)
+        status = response.json().get("status") if response.status_code == 200 else f"HTTP {response.status_code}"
+        if status != expected_status(args, expected[order["order_id"]]):
+            mismatches.append((order["order_id"], status))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(order) for order in orders))
+    elapsed = time.perf_counter() - started
+    print(f"\nManual verify: {len(orders)} calls in {elapsed:.2f}s -> {len(orders) / elapsed:.1f}/sec")
+    print(f"  latency {percentiles(latencies)}")
+    check("manual verify agrees with gateway", not mismatches, f"{len(mismatches)} mismatch(es)")
+
+
+async def run(args) -> int:
+    rng = random.Random(args.seed)
+    simulator = RazorpaySimulator(args.key_id, args.key_secret, args.gateway_latency, args.gateway_fail_rate,
+                                  seed=args.seed, webhook_secret=args.webhook_secret)
+    server = simulator.serve(port=args.simulator_port)
+    print(f"Razorpay simulator on http://127.0.0.1:{server.server_address[1]}/v1")
+    run_id = uuid.uuid4().hex[:8]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        orders = await create_orders(client, args, run_id)
+        foreign = [order for order in orders if order.get("order_id") not in simulator.orders]
+        check("orders created through the simulator", orders and not foreign,
+              f"{len(foreign)} order(s) not from the simulator; is RAZORPAY_BASE_URL set on the server?" if foreign else "")
+        order_ids = {order["order_id"] for order in orders}
+        check("one gateway order per payment", len(simulator.orders) == len(order_ids),
+              f"{len(simulator.orders)} simulator orders for {len(order_ids)} distinct order ids")
+        if not orders or foreign:
+            server.shutdown()
+            return 1
+        orders = list({order["order_id"]: order for order in orders}.values())
+
+        if args.mobile:
+            deliveries, expected = plan_verifications(simulator, orders, args, rng)
+        else:
+            deliveries, expected = plan_deliveries(simulator, orders, args, rng)
+        first_sent = await deliver(client, deliveries, args)
+
+        if not args.mobile and not database_configured():
+            print("\n⚠️ Supabase not configured for the harness; skipping state checks")
+            server.shutdown()
+            return 1 if failures else 0
+
+        states = await wait_for_settlement(client, expected, first_sent, args)
+        wrong = {order_id: states.get(order_id) for order_id, payment in expected.items()
+                 if states.get(order_id) != expected_status(args, payment)}
+        check("every payment settled to the gateway's final state", not wrong,
+              f"{len(wrong)} wrong, e.g. {list(wrong.items())[:3]}" if wrong else f"{len(expected)} orders")
+
+        if not args.mobile:
+            unique_events = len({delivery["event"]["id"] for delivery in deliveries})
+            fetches = sum(simulator.payment_fetches.values())
+            check("duplicate webhooks not re-processed", fetches <= unique_events,
+                  f"{fetches} gateway fetches for {unique_events} unique events, {len(deliveries)} deliveries")
+
+        if args.doctor_token and not args.mobile:
+            await verify_manually(client, orders, expected, args)
+
+    server.shutdown()
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end payment benchmark against the Razorpay simulator")
+    parser.add_argument("--url", required=True, help="Server under test, e.g. http://127.0.0.1:3000")
+    parser.add_argument("--mobile", action="store_true", help="Target server_mobile instead of server_web")
+    parser.add_argument("--token", help="Patient JWT for /api/payments/create-order (web)")
+    parser.add_argument("--appointment-ids", type=lambda v: [int(x) for x in v.split(",")],
+                        help="Comma-separated appointments owned by --token's user (web)")
+    parser.add_argument("--doctor-token", help="Doctor JWT; also benchmarks POST /api/payments/{id}/verify (web)")
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--amount", type=float, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--webhook-rate", type=float, default=50, help="Deliveries per second (0 = as fast as possible)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.2, help="Fraction of events delivered twice")
+    parser.add_argument("--failed-attempt-rate", type=float, default=0.2,
+                        help="Fraction of orders with a failed attempt before the captured payment")
+    parser.add_argument("--reorder-rate", type=float, default=0.5,
+                        help="Fraction of those where payment.failed arrives after payment.captured")
+    parser.add_argument("--gateway-latency", type=float, default=0.0, help="Seconds added to every simulator response")
+    parser.add_argument("--gateway-fail-rate", type=float, default=0.0, help="Fraction of simulator calls answered 503")
+    parser.add_argument("--simulator-port", type=int, default=9100)
+    parser.add_argument("--key-id", default=os.getenv("RAZORPAY_KEY_ID") or DEFAULT_KEY_ID)
+    parser.add_argument("--key-secret", default=os.getenv("RAZORPAY_KEY_SECRET") or DEFAULT_KEY_SECRET)
+    parser.add_argument("--webhook-secret", default=os.getenv("RAZORPAY_WEBHOOK_SECRET") or DEFAULT_WEBHOOK_SECRET)
+    parser.add_argument("--settle-timeout", type=float, default=30)
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.appointment_ids and not args.token:
+        parser.error("--appointment-ids requires --token")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+UPI QR code micro-benchmark
+Measures requests/sec of POST /api/payments/generate-qr with every request
+rendering a new code (the old behaviour) and with repeated inputs served
+from the QR cache, and compares PNG and SVG payload sizes.
+
+    python benchmarks/qr_benchmark.py
+    python benchmarks/qr_benchmark.py --url http://127.0.0.1:3000 --requests 2000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+UPI_ID = "benchmark@upi"
+
+
+def measure(post, payloads) -> float:
+    """Requests/sec for posting each payload sequentially"""
+    started = time.perf_counter()
+    for payload in payloads:
+        response = post(payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+    return len(payloads) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UPI QR code generation micro-benchmark")
+    parser.add_argument("--url", help="Running server_web base URL (default: in-process)")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    args = parser.parse_args()
+
+    if args.url:
+        import requests
+        session = requests.Session()
+
+        def post(payload):
+            return session.post(f"{args.url}/api/payments/generate-qr", json=payload, timeout=30)
+    else:
+        from fastapi.testclient import TestClient
+        import server_web
+        client = TestClient(server_web.app)
+
+        def post(payload):
+            return client.post("/api/payments/generate-qr", json=payload)
+
+    results = {}
+    for fmt in ("png", "svg"):
+        # Before: a fresh transaction_id per request, so every call renders
+        unique = [{"upi_id": UPI_ID, "amount": "500", "transaction_id": f"BENCH{uuid.uuid4().hex}", "format": fmt}
+                  for _ in range(args.requests)]
+        # After: the same inputs repeatedly (fee codes, retried page loads)
+        repeated = [{"upi_id": UPI_ID, "amount": "500", "transaction_id": "BENCHFIXED", "format": fmt}] * args.requests
+        post(repeated[0])  # warm the cache entry
+
+        uncached = measure(post, unique)
+        cached = measure(post, repeated)
+        size = len(post(repeated[0]).json()["qr_code"])
+        results[fmt] = (uncached, cached, size)
+
+    print(f"{'format':<8}{'uncached req/s':>16}{'cached req/s':>16}{'speedup':>10}{'data URI bytes':>16}")
+    for fmt, (uncached, cached, size) in results.items():
+        print(f"{fmt:<8}{uncached:>16.1f}{cached:>16.1f}{cached / uncached:>9.1f}x{size:>16}")
+
+    if not args.url:
+        from services.upi_qr import get_qr_cache_stats
+        print(f"\nQR cache: {get_qr_cache_stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
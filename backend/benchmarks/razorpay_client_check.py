@@ -0,0 +1,119 @@
+"""
+Razorpay HTTP client checks against the local stand-in
+Verifies connection reuse, timeout bounds, retry policy and idempotency keys
+for both the sync and async clients, then prints latency histograms.
+
+    python benchmarks/razorpay_client_check.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from benchmarks.razorpay_simulator import RazorpaySimulator, DEFAULT_KEY_ID, DEFAULT_KEY_SECRET
+from services.razorpay_client import RazorpayHTTPClient, AsyncRazorpayHTTPClient
+from services.metrics import render_prometheus
+
+AUTH = (DEFAULT_KEY_ID, DEFAULT_KEY_SECRET)
+failures = []
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    print(f"{'✅' if condition else '❌'} {name}{f' ({detail})' if detail else ''}")
+    if not condition:
+        failures.append(name)
+
+
+def run_sync(simulator: RazorpaySimulator, base_url: str):
+    client = RazorpayHTTPClient(base_url, auth=AUTH, connect_timeout=1, read_timeout=0.5,
+                                max_retries=2, pool_size=4)
+
+    # Keep-alive: many sequential calls share one connection
+    simulator.connections.clear()
+    order = client.post("/orders", json={"amount": 50000, "currency": "INR", "receipt": "r1"}).json()
+    for _ in range(50):
+        client.get(f"/orders/{order['id']}")
+    check("sync: connections reused", len(simulator.connections) <= 1, f"{len(simulator.connections)} connection(s) for 51 calls")
+
+    # POST retried on 503 with the same idempotency key, creating one order
+    simulator.fail_next = 2
+    simulator.idempotency_keys_seen.clear()
+    orders_before = len(simulator.orders)
+    response = client.post("/orders", json={"amount": 50000, "receipt": "r2"}, idempotency_key="receipt_r2")
+    check("sync: POST retried through 503s", response.status_code == 200, f"status {response.status_code}")
+    check("sync: idempotency key stable across retries",
+          simulator.idempotency_keys_seen == ["receipt_r2"] * 3, str(simulator.idempotency_keys_seen))
+    check("sync: exactly one order created", len(simulator.orders) == orders_before + 1)
+
+    # Replaying the same key returns the same order
+    replay = client.post("/orders", json={"amount": 50000, "receipt": "r2"}, idempotency_key="receipt_r2")
+    check("sync: idempotent replay", replay.json()["id"] == response.json()["id"])
+
+    # A hung gateway is bounded by the read timeout; POSTs are not retried after a read timeout
+    simulator.hang_seconds = 2
+    started = time.perf_counter()
+    try:
+        client.post("/orders", json={"amount": 50000})
+        timed_out = False
+    except requests.ReadTimeout:
+        timed_out = True
+    elapsed = time.perf_counter() - started
+    check("sync: POST read timeout not retried", timed_out and elapsed < 1.0, f"{elapsed:.2f}s")
+
+    # GETs are retried after read timeouts, bounded by max_retries
+    started = time.perf_counter()
+    try:
+        client.get(f"/orders/{order['id']}")
+        timed_out = False
+    except requests.ReadTimeout:
+        timed_out = True
+    elapsed = time.perf_counter() - started
+    check("sync: GET retries bounded", timed_out and elapsed < 3 * 0.5 + 2, f"{elapsed:.2f}s for 3 attempts")
+    simulator.hang_seconds = 0
+    client.close()
+
+
+async def run_async(simulator: RazorpaySimulator, base_url: str):
+    client = AsyncRazorpayHTTPClient(base_url, auth=AUTH, connect_timeout=1, read_timeout=0.5,
+                                     max_retries=2, pool_size=4)
+
+    simulator.connections.clear()
+    order = (await client.post("/orders", json={"amount": 70000, "receipt": "a1"})).json()
+    await asyncio.gather(*(client.get(f"/orders/{order['id']}") for _ in range(50)))
+    check("async: concurrent calls bounded by pool", len(simulator.connections) <= 4,
+          f"{len(simulator.connections)} connection(s) for 51 calls")
+
+    simulator.fail_next = 1
+    simulator.idempotency_keys_seen.clear()
+    response = await client.post("/orders", json={"amount": 70000, "receipt": "a2"}, idempotency_key="receipt_a2")
+    check("async: POST retried through 503", response.status_code == 200)
+    check("async: idempotency key stable across retries", simulator.idempotency_keys_seen == ["receipt_a2"] * 2)
+
+    payment = simulator.pay_order(order["id"])
+    refund = await client.post(f"/payments/{payment['id']}/refund", json={"amount": 1000})
+    check("async: refund created", refund.status_code == 200 and refund.json()["amount"] == 1000)
+    await client.aclose()
+
+
+def main():
+    simulator = RazorpaySimulator(seed=1)
+    server = simulator.serve()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    run_sync(simulator, base_url)
+    asyncio.run(run_async(simulator, base_url))
+    server.shutdown()
+
+    print()
+    print("\n".join(
+        line for line in render_prometheus().splitlines()
+        if line.startswith(("razorpay_request_duration_seconds_count", "razorpay_request_retries_total"))
+    ))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
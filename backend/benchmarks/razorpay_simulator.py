@@ -0,0 +1,314 @@
+"""
+Local Razorpay stand-in
+Implements the subset of the Razorpay REST API used by PaymentGateway
+(orders, order payments, payment fetch, refunds) with injectable latency and failures, and
+builds signed webhook events for the payments it creates.
+
+Run standalone:
+    python benchmarks/razorpay_simulator.py --port 9100 --latency 0.05 --fail-rate 0.1
+then point the servers at it:
+    RAZORPAY_BASE_URL=http://127.0.0.1:9100/v1 RAZORPAY_KEY_ID=rzp_test_sim RAZORPAY_KEY_SECRET=sim_secret \
+    RAZORPAY_WEBHOOK_SECRET=sim_webhook_secret
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, Tuple
+
+DEFAULT_KEY_ID = "rzp_test_sim"
+DEFAULT_KEY_SECRET = "sim_secret"
+DEFAULT_WEBHOOK_SECRET = "sim_webhook_secret"
+
+
+def _rzp_id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:14]}"
+
+
+def sign(secret: str, message: str) -> str:
+    """HMAC-SHA256 hex digest, as Razorpay signs webhooks and checkout responses"""
+    return hmac.new(secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class RazorpaySimulator:
+    """In-memory Razorpay state plus fault-injection knobs"""
+
+    def __init__(self, key_id: str = DEFAULT_KEY_ID, key_secret: str = DEFAULT_KEY_SECRET,
+                 latency: float = 0.0, fail_rate: float = 0.0, fail_status: int = 503, seed: Optional[int] = None,
+                 webhook_secret: str = DEFAULT_WEBHOOK_SECRET):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.webhook_secret = webhook_secret
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.fail_next = 0  # Fail this many upcoming requests regardless of fail_rate
+        self.hang_seconds = 0.0  # Sleep this long before answering (simulates a stuck gateway)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.payments: Dict[str, Dict[str, Any]] = {}
+        self.refunds: Dict[str, Dict[str, Any]] = {}
+        self.idempotent_responses: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self.requests_seen = 0
+        self.idempotency_keys_seen = []
+        self.connections = set()
+        self.payment_fetches: Counter = Counter()  # payment id -> GET /payments/{id} calls
+
+    # ---- state helpers -------------------------------------------------
+
+    def create_order(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        amount = body.get("amount")
+        if not isinstance(amount, int) or amount < 100:
+            return 400, {"error": {"code": "BAD_REQUEST_ERROR", "description": "amount must be at least 100 paise"}}
+        order = {
+            "id": _rzp_id("order"),
+            "entity": "order",
+            "amount": amount,
+            "amount_paid": 0,
+            "amount_due": amount,
+            "currency": body.get("currency", "INR"),
+            "receipt": body.get("receipt"),
+            "status": "created",
+            "attempts": 0,
+            "notes": body.get("notes") or {},
+            "created_at": int(time.time())
+        }
+        self.orders[order["id"]] = order
+        return 200, order
+
+    def pay_order(self, order_id: str, method: str = "upi", status: str = "captured") -> Dict[str, Any]:
+        """Simulate the customer paying an order (creates a payment entity)"""
+        with self.lock:
+            order = self.orders[order_id]
+            payment = {
+                "id": _rzp_id("pay"),
+                "entity": "payment",
+                "amount": order["amount"],
+                "currency": order["currency"],
+                "status": status,
+                "order_id": order_id,
+                "method": method,
+                "captured": status == "captured",
+                "amount_refunded": 0,
+                "refund_status": None,
+                "notes": order["notes"],
+                "error_code": None,
+                "error_description": None,
+                "created_at": int(time.time())
+            }
+            if status == "failed":
+                payment["error_code"] = "BAD_REQUEST_ERROR"
+                payment["error_description"] = "Payment was declined by the bank"
+            self.payments[payment["id"]] = payment
+            order["attempts"] += 1
+            order["status"] = "attempted"
+            if status == "captured":
+                order["status"] = "paid"
+                order["amount_paid"] = order["amount"]
+                order["amount_due"] = 0
+            return dict(payment)
+
+    def checkout_signature(self, order_id: str, payment_id: str) -> str:
+        """razorpay_signature the Checkout widget hands back to the client"""
+        return sign(self.key_secret, f"{order_id}|{payment_id}")
+
+    def webhook_event(self, payment: Dict[str, Any], event: Optional[str] = None) -> Dict[str, Any]:
+        """Webhook event body for a payment (payment.captured / payment.failed by default)"""
+        event = event or ("payment.captured" if payment["status"] == "captured" else f"payment.{payment['status']}")
+        return {
+            # Razorpay sends the event id in X-Razorpay-Event-Id; the handler reads it from the body
+            "id": _rzp_id("evt"),
+            "entity": "event",
+            "account_id": "acc_simulator",
+            "event": event,
+            "contains": ["payment"],
+            "payload": {"payment": {"entity": dict(payment)}},
+            "created_at": int(time.time())
+        }
+
+    def signed_webhook(self, event: Dict[str, Any]) -> Tuple[bytes, Dict[str, str]]:
+        """
+        Serialize and sign a webhook event.
+
+        Returns:
+            (body, headers) ready to POST to the webhook endpoint
+        """
+        # Compact separators: the handler re-serializes the parsed payload this way and checks the signature again
+        body = json.dumps(event, separators=(",", ":"))
+        headers = {
+            "Content-Type": "application/json",
+            "X-Razorpay-Signature": sign(self.webhook_secret, body),
+            "X-Razorpay-Event-Id": event["id"]
+        }
+        return body.encode("utf-8"), headers
+
+    def create_refund(self, payment_id: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        payment = self.payments.get(payment_id)
+        if not payment:
+            return 400, {"error": {"code": "BAD_REQUEST_ERROR", "description": "The id provided does not exist"}}
+        amount = body.get("amount") or payment["amount"] - payment["amount_refunded"]
+        if amount <= 0 or payment["amount_refunded"] + amount > payment["amount"]:
+            return 400, {"error": {"code": "BAD_REQUEST_ERROR", "description": "The refund amount exceeds the payment amount"}}
+        refund = {
+            "id": _rzp_id("rfnd"),
+            "entity": "refund",
+            "amount": amount,
+            "currency": payment["currency"],
+            "payment_id": payment_id,
+            "notes": body.get("notes") or {},
+            "status": "processed",
+            "created_at": int(time.time())
+        }
+        payment["amount_refunded"] += amount
+        payment["refund_status"] = "full" if payment["amount_refunded"] == payment["amount"] else "partial"
+        if payment["refund_status"] == "full":
+            payment["status"] = "refunded"
+        self.refunds[refund["id"]] = refund
+        return 200, refund
+
+    # ---- HTTP dispatch -------------------------------------------------
+
+    def handle(self, method: str, path: str, body: Dict[str, Any],
+               idempotency_key: Optional[str]) -> Tuple[int, Dict[str, Any]]:
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if parts[:1] == ["v1"]:
+            parts = parts[1:]
+
+        with self.lock:
+            if method == "POST" and idempotency_key and idempotency_key in self.idempotent_responses:
+                return self.idempotent_responses[idempotency_key]
+
+            if method == "POST" and parts == ["orders"]:
+                result = self.create_order(body)
+            elif method == "GET" and len(parts) == 2 and parts[0] == "orders":
+                order = self.orders.get(parts[1])
+                result = (200, order) if order else (404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "The id provided does not exist"}})
+            elif method == "GET" and len(parts) == 3 and parts[0] == "orders" and parts[2] == "payments":
+                if parts[1] in self.orders:
+                    items = [dict(p) for p in self.payments.values() if p["order_id"] == parts[1]]
+                    result = (200, {"entity": "collection", "count": len(items), "items": items})
+                else:
+                    result = (404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "The id provided does not exist"}})
+            elif method == "GET" and len(parts) == 2 and parts[0] == "payments":
+                payment = self.payments.get(parts[1])
+                self.payment_fetches[parts[1]] += 1
+                result = (200, payment) if payment else (404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "The id provided does not exist"}})
+            elif method == "POST" and len(parts) == 3 and parts[0] == "payments" and parts[2] == "refund":
+                result = self.create_refund(parts[1], body)
+            else:
+                result = (404, {"error": {"code": "NOT_FOUND", "description": f"No route for {method} {path}"}})
+
+            if method == "POST" and idempotency_key and result[0] < 500:
+                self.idempotent_responses[idempotency_key] = result
+            return result
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+            return self.fail_rate > 0 and self.random.random() < self.fail_rate
+
+    def make_handler(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+            def log_message(self, format, *args):
+                pass
+
+            def _authorized(self) -> bool:
+                header = self.headers.get("Authorization", "")
+                if not header.startswith("Basic "):
+                    return False
+                expected = base64.b64encode(f"{simulator.key_id}:{simulator.key_secret}".encode()).decode()
+                return header[6:] == expected
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client gave up (timeout) before we answered
+                    self.close_connection = True
+
+            def _dispatch(self, method: str):
+                with simulator.lock:
+                    simulator.requests_seen += 1
+                    simulator.connections.add(self.client_address)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                idempotency_key = self.headers.get("X-Idempotency-Key")
+                if idempotency_key:
+                    with simulator.lock:
+                        simulator.idempotency_keys_seen.append(idempotency_key)
+
+                if simulator.hang_seconds:
+                    time.sleep(simulator.hang_seconds)
+                if simulator.latency:
+                    time.sleep(simulator.latency)
+                if not self._authorized():
+                    return self._send(401, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Authentication failed"}})
+                if simulator.should_fail():
+                    return self._send(simulator.fail_status, {"error": {"code": "SERVER_ERROR", "description": "Injected failure"}})
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    return self._send(400, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Invalid JSON"}})
+                status, payload = simulator.handle(method, self.path, body, idempotency_key)
+                self._send(status, payload)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+        return Handler
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        """Start serving on a daemon thread; returns the server (server_address has the port)"""
+        server = ThreadingHTTPServer((host, port), self.make_handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="razorpay-simulator", daemon=True).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Razorpay stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--key-id", default=DEFAULT_KEY_ID)
+    parser.add_argument("--key-secret", default=DEFAULT_KEY_SECRET)
+    parser.add_argument("--webhook-secret", default=DEFAULT_WEBHOOK_SECRET)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with --fail-status")
+    parser.add_argument("--fail-status", type=int, default=503)
+    args = parser.parse_args()
+
+    simulator = RazorpaySimulator(args.key_id, args.key_secret, args.latency, args.fail_rate, args.fail_status,
+                                  webhook_secret=args.webhook_secret)
+    server = simulator.serve(args.host, args.port)
+    print(f"✅ Razorpay simulator on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
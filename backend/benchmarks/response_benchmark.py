@@ -0,0 +1,147 @@
+"""
+Response pipeline benchmark
+Bytes on the wire and p50/p99 latency for the listing endpoints with the old
+pipeline (stdlib JSON through response_model, uncompressed) and the new one
+(orjson list_response, gzip/brotli, fields= projection).
+
+In-process mode serves synthetic rows shaped like
+/api/appointments/doctor-appointments and /api/hospitals/ through both
+pipelines; --url measures a running server_web instead.
+
+    python benchmarks/response_benchmark.py
+    python benchmarks/response_benchmark.py --rows 2000
+    python benchmarks/response_benchmark.py --url http://127.0.0.1:8000 --token <doctor JWT>
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import List, Dict, Any, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config_web
+sys.modules["config"] = config_web
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from services.responses import CompressionMiddleware, list_response, parse_fields
+
+APPOINTMENT_FIELDS = "id,date,time_slot,status,user_name"
+HOSPITAL_FIELDS = "id,name,city,status"
+
+
+def appointment_rows(count: int) -> List[Dict[str, Any]]:
+    return [{
+        "id": i, "user_id": 1000 + i, "doctor_id": 7, "date": f"2026-02-{i % 28 + 1:02d}",
+        "time_slot": f"{9 + i % 8}:{'30' if i % 2 else '00'}", "status": ("pending", "confirmed", "cancelled")[i % 3],
+        "created_at": f"2026-01-{i % 28 + 1:02d}T10:{i % 60:02d}:00.000000+00:00",
+        "user_name": f"Patient {i}", "doctor_name": "Dr Mehta", "hospital_name": "Anagha Multispeciality Hospital"
+    } for i in range(count)]
+
+
+def hospital_rows(count: int) -> List[Dict[str, Any]]:
+    rows = []
+    for i in range(count):
+        row = {
+            "id": i, "name": f"Hospital {i}", "email": f"hospital{i}@example.com", "mobile": f"98765{i:05d}",
+            "address_line1": f"{i} MG Road", "address_line2": "Near City Mall", "address_line3": None,
+            "city": ("Pune", "Mumbai", "Indore", "Bhopal")[i % 4], "state": "Maharashtra", "pincode": "411001",
+            "status": "approved", "created_at": "2026-01-10T10:00:00.000000+00:00", "updated_at": None,
+            "upi_id": f"hospital{i}@upi", "gpay_upi_id": f"hospital{i}@okaxis", "phonepay_upi_id": f"hospital{i}@ybl",
+            "paytm_upi_id": f"hospital{i}@paytm", "bhim_upi_id": f"hospital{i}@upi",
+            "whatsapp_enabled": "true", "whatsapp_confirmation_template": None,
+            "whatsapp_followup_template": None, "whatsapp_reminder_template": None,
+            "smtp_host": "smtp.example.com", "smtp_port": 587, "smtp_username": f"hospital{i}@example.com",
+            "smtp_from_email": f"hospital{i}@example.com", "smtp_enabled": False, "smtp_use_tls": True,
+            "plan_name": "Professional", "plan_price": 9999, "plan_expiry": "2027-01-10",
+        }
+        rows.append(row)
+    return rows
+
+
+def build_apps(appointments, hospitals):
+    """(old, new) apps serving the same rows"""
+    old = FastAPI()
+
+    @old.get("/api/appointments/doctor-appointments", response_model=List[dict])
+    def old_appointments():
+        return appointments
+
+    @old.get("/api/hospitals/", response_model=List[dict])
+    def old_hospitals():
+        return hospitals
+
+    new = FastAPI()
+    new.add_middleware(CompressionMiddleware, minimum_size=config_web.RESPONSE_COMPRESSION_MIN_SIZE,
+                       gzip_level=config_web.RESPONSE_GZIP_LEVEL, brotli_quality=config_web.RESPONSE_BROTLI_QUALITY)
+
+    @new.get("/api/appointments/doctor-appointments", response_model=List[dict])
+    def new_appointments(fields: Optional[str] = None):
+        return list_response(appointments, parse_fields(fields))
+
+    @new.get("/api/hospitals/", response_model=List[dict])
+    def new_hospitals(fields: Optional[str] = None):
+        return list_response(hospitals, parse_fields(fields))
+
+    return old, new
+
+
+def measure(get, path: str, headers: Dict[str, str], requests: int):
+    """(bytes on the wire, p50 ms, p99 ms)"""
+    latencies = []
+    wire = 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = get(path, headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path}: HTTP {response.status_code} {response.text[:200]}")
+        wire = response.num_bytes_downloaded
+    latencies.sort()
+    return wire, statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response pipeline benchmark")
+    parser.add_argument("--url", help="Running server_web base URL (default: in-process)")
+    parser.add_argument("--token", help="Bearer token of a doctor (for --url)")
+    parser.add_argument("--rows", type=int, default=500, help="Synthetic appointment rows (hospitals: rows / 5)")
+    parser.add_argument("--requests", type=int, default=300, help="Requests per scenario")
+    args = parser.parse_args()
+
+    endpoints = [("/api/appointments/doctor-appointments", APPOINTMENT_FIELDS), ("/api/hospitals/", HOSPITAL_FIELDS)]
+    scenarios = [
+        ("identity", {"Accept-Encoding": "identity"}, None),
+        ("gzip", {"Accept-Encoding": "gzip"}, None),
+        ("gzip+fields", {"Accept-Encoding": "gzip"}, "fields"),
+    ]
+
+    if args.url:
+        client = httpx.Client(base_url=args.url, timeout=30,
+                              headers={"Authorization": f"Bearer {args.token}"} if args.token else {})
+        pipelines = {"server": lambda path, headers: client.get(path, headers=headers)}
+    else:
+        old, new = build_apps(appointment_rows(args.rows), hospital_rows(max(1, args.rows // 5)))
+        old_client, new_client = TestClient(old), TestClient(new)
+        pipelines = {
+            "old": lambda path, headers: old_client.get(path, headers=headers),
+            "new": lambda path, headers: new_client.get(path, headers=headers),
+        }
+
+    print(f"{'endpoint':<40}{'pipeline':<10}{'scenario':<14}{'bytes':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for path, fields in endpoints:
+        for name, get in pipelines.items():
+            for scenario, headers, projection in scenarios:
+                if name == "old" and scenario != "identity":
+                    continue  # No compression or projection before
+                target = f"{path}?fields={fields}" if projection else path
+                wire, p50, p99 = measure(get, target, headers, args.requests)
+                print(f"{path:<40}{name:<10}{scenario:<14}{wire:>10}{p50:>10.2f}{p99:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
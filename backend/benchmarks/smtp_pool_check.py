@@ -0,0 +1,156 @@
+"""
+SMTP connection pool checks against a local aiosmtpd stand-in
+Verifies session reuse, bulk sends, reconnects on settings change, idle
+timeout and server disconnects (caught by the NOOP probe), then compares
+messages/sec with a fresh connection per message (the old behaviour).
+
+    pip install aiosmtpd
+    python benchmarks/smtp_pool_check.py
+"""
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from services.smtp_pool import SMTPConnectionPool
+
+# aiosmtpd logs a login_data deprecation warning for every AUTH
+logging.getLogger("mail.log").setLevel(logging.ERROR)
+
+failures = []
+
+
+def check(name: str, condition: bool, detail: str = ""):
+    print(f"{'✅' if condition else '❌'} {name}{f' ({detail})' if detail else ''}")
+    if not condition:
+        failures.append(name)
+
+
+class StandIn:
+    """Accepts every message and counts sessions (AUTH logins) and deliveries"""
+
+    def __init__(self):
+        self.logins = 0
+        self.delivered = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.delivered += 1
+        return "250 OK"
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins += 1
+        return AuthResult(success=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(handler: StandIn, port: int) -> Controller:
+    controller = Controller(handler, hostname="127.0.0.1", port=port,
+                            authenticator=handler.authenticate, auth_require_tls=False)
+    controller.start()
+    return controller
+
+
+def message(i: int) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = "hospital@example.com"
+    msg["To"] = f"patient{i}@example.com"
+    msg["Subject"] = f"Appointment reminder {i}"
+    msg.set_content("Your appointment is tomorrow at 10:00.")
+    return msg
+
+
+async def run(handler: StandIn, port: int, controller: Controller, count: int):
+    account = {"host": "127.0.0.1", "port": port, "username": "clinic", "password": "secret", "use_ssl": False}
+    pool = SMTPConnectionPool("check", idle_timeout=0.5, max_messages=100, require_starttls=False)
+
+    errors = []
+    for i in range(20):
+        errors += await pool.send_messages(1, account, [message(i)])
+    check("sequential sends share one session", handler.logins == 1 and not any(errors),
+          f"{handler.logins} login(s) for 20 emails")
+
+    handler.logins = 0
+    errors = await pool.send_messages(1, account, [message(i) for i in range(250)])
+    # 20 + 250 messages at 100 per session: sessions end at 100, 200 and 270
+    check("bulk send rotates sessions at max_messages", handler.logins == 2 and not any(errors),
+          f"{handler.logins} new login(s) for 250 emails after 20 already sent")
+
+    handler.logins = 0
+    await asyncio.gather(*(pool.send_messages(key, account, [message(key)]) for key in (2, 3, 2, 3)))
+    check("one session per hospital", handler.logins == 2, f"{handler.logins} login(s) for 2 hospitals")
+
+    handler.logins = 0
+    await pool.send_messages(1, dict(account, password="rotated"), [message(0)])
+    check("changed settings reconnect", handler.logins == 1)
+
+    handler.logins = 0
+    await asyncio.sleep(0.7)
+    check("idle sessions closed", pool.stats()["sessions"] == 0, f"{pool.stats()['sessions']} open")
+    await pool.send_messages(1, account, [message(0)])
+    check("reconnect after idle", handler.logins == 1)
+
+    # Server restarts under a pooled session: the NOOP probe notices before
+    # anything is sent and the message goes out on a new session
+    pool.probe_after = 0
+    controller.stop()
+    controller = start_server(handler, port)
+    handler.logins = 0
+    handler.delivered = 0
+    errors = await pool.send_messages(1, account, [message(0)])
+    check("server disconnect detected before sending", not any(errors) and handler.logins == 1
+          and handler.delivered == 1, str(errors))
+
+    await pool.close()
+    check("close() releases sessions", pool.stats()["sessions"] == 0)
+
+    # Throughput: fresh connection + AUTH per message vs pooled session
+    started = time.perf_counter()
+    for i in range(count):
+        await aiosmtplib.send(message(i), hostname="127.0.0.1", port=port, username="clinic",
+                              password="secret", start_tls=False)
+    unpooled = count / (time.perf_counter() - started)
+
+    pool = SMTPConnectionPool("check", idle_timeout=60, max_messages=1000, require_starttls=False)
+    started = time.perf_counter()
+    for i in range(count):
+        await pool.send_messages(1, account, [message(i)])
+    pooled = count / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await pool.send_messages(1, account, [message(i) for i in range(count)])
+    bulk = count / (time.perf_counter() - started)
+    await pool.close()
+
+    print(f"\nmessages/sec over {count} emails (loopback, no TLS):")
+    print(f"  connection per message: {unpooled:8.1f}")
+    print(f"  pooled session:         {pooled:8.1f}")
+    print(f"  send_messages batch:    {bulk:8.1f}")
+    return controller
+
+
+def main():
+    handler = StandIn()
+    port = free_port()
+    controller = start_server(handler, port)
+    try:
+        controller = asyncio.run(run(handler, port, controller, count=300))
+    finally:
+        controller.stop()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -216,6 +216,13 @@ BEGIN
   IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='appointments' AND column_name='payment_required') THEN
     ALTER TABLE appointments ADD COLUMN payment_required TEXT DEFAULT 'false';
   END IF;
+  -- Mobile bookings (server_mobile.py) are per hospital/date/time, without doctor_id
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='appointments' AND column_name='appointment_date') THEN
+    ALTER TABLE appointments ADD COLUMN appointment_date DATE;
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='appointments' AND column_name='appointment_time') THEN
+    ALTER TABLE appointments ADD COLUMN appointment_time TEXT;
+  END IF;
 END $$;
 
 -- Create operations table if not exists
@@ -244,6 +251,10 @@ BEGIN
   IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='operations' AND column_name='payment_required') THEN
     ALTER TABLE operations ADD COLUMN payment_required TEXT DEFAULT 'false';
   END IF;
+  -- Mobile bookings (server_mobile.py) are per hospital/date/time
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='operations' AND column_name='operation_time') THEN
+    ALTER TABLE operations ADD COLUMN operation_time TEXT;
+  END IF;
 END $$;
 
 -- ============================================
@@ -498,6 +509,11 @@ CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments(status);
 CREATE INDEX IF NOT EXISTS idx_appointments_followup_date ON appointments(followup_date);
 CREATE INDEX IF NOT EXISTS idx_appointments_visit_date ON appointments(visit_date);
 CREATE INDEX IF NOT EXISTS idx_appointments_status_date ON appointments(status, date);
+-- One active booking per doctor/date/slot (cancelled rows free the slot again).
+-- Remove any existing duplicates before running this or the index build fails.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_doctor_slot_active ON appointments(doctor_id, date, time_slot) WHERE status <> 'cancelled';
+-- Mobile bookings have no doctor_id: one active booking per hospital/date/time
+CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_hospital_slot_active ON appointments(hospital_id, appointment_date, appointment_time) WHERE status <> 'cancelled';
 
 -- Operations indexes
 CREATE INDEX IF NOT EXISTS idx_operations_hospital_id ON operations(hospital_id);
@@ -506,6 +522,8 @@ CREATE INDEX IF NOT EXISTS idx_operations_doctor_id ON operations(doctor_id);
 CREATE INDEX IF NOT EXISTS idx_operations_operation_date ON operations(operation_date);
 CREATE INDEX IF NOT EXISTS idx_operations_status ON operations(status);
 CREATE INDEX IF NOT EXISTS idx_operations_specialty ON operations(specialty);
+-- Mobile bookings: one active operation per hospital/date/time
+CREATE UNIQUE INDEX IF NOT EXISTS idx_operations_hospital_slot_active ON operations(hospital_id, operation_date, operation_time) WHERE status <> 'cancelled';
 
 -- Payments indexes
 CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id);
@@ -559,7 +577,165 @@ CREATE INDEX IF NOT EXISTS idx_whatsapp_logs_status ON whatsapp_logs(status);
 CREATE INDEX IF NOT EXISTS idx_whatsapp_logs_sent_at ON whatsapp_logs(sent_at);
 
 -- ============================================
--- 5. ROW LEVEL SECURITY - DISABLED
+-- 5. FUNCTIONS
+-- ============================================
+
+-- Atomically reserve a doctor's slot and create the appointment in one round trip.
+-- Returns the new appointment row, or no rows if the slot is already taken.
+-- (Drops the earlier signature without p_status so calls are not ambiguous.)
+DROP FUNCTION IF EXISTS reserve_appointment_slot(INTEGER, INTEGER, INTEGER, DATE, TEXT, TEXT);
+CREATE OR REPLACE FUNCTION reserve_appointment_slot(
+  p_user_id INTEGER,
+  p_doctor_id INTEGER,
+  p_hospital_id INTEGER,
+  p_date DATE,
+  p_time_slot TEXT,
+  p_reason TEXT DEFAULT NULL,
+  p_status TEXT DEFAULT 'pending'
+)
+RETURNS SETOF appointments
+LANGUAGE sql
+AS $$
+  INSERT INTO appointments (user_id, doctor_id, hospital_id, date, time_slot, status, reason)
+  VALUES (p_user_id, p_doctor_id, p_hospital_id, p_date, p_time_slot, p_status, p_reason)
+  ON CONFLICT (doctor_id, date, time_slot) WHERE status <> 'cancelled' DO NOTHING
+  RETURNING *;
+$$;
+
+-- Claim a Razorpay webhook and apply its payment state transition in one transaction.
+-- Returns {"outcome": ..., "payment_id": ...} where outcome is one of
+-- processed, duplicate, payment_not_found, verification_mismatch, ignored.
+CREATE OR REPLACE FUNCTION apply_payment_webhook(
+  p_webhook_id TEXT,
+  p_event_type TEXT,
+  p_razorpay_payment_id TEXT,
+  p_razorpay_order_id TEXT,
+  p_payload JSONB,
+  p_signature TEXT,
+  p_gateway_order_id TEXT,
+  p_gateway_amount BIGINT,  -- paise, as fetched from the Razorpay API
+  p_failure_reason TEXT DEFAULT NULL,
+  p_failure_code TEXT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_webhook_row INTEGER;
+  v_payment payments%ROWTYPE;
+  v_outcome TEXT := 'processed';
+  v_error TEXT;
+BEGIN
+  -- Claim the webhook id; a row left unprocessed by an earlier failure is re-claimed
+  INSERT INTO payment_webhooks (
+    webhook_id, event_type, razorpay_payment_id, razorpay_order_id,
+    webhook_payload, signature_verified, processed
+  )
+  VALUES (
+    p_webhook_id, p_event_type, p_razorpay_payment_id, p_razorpay_order_id,
+    p_payload, TRUE, FALSE
+  )
+  ON CONFLICT (webhook_id) DO UPDATE SET retry_count = payment_webhooks.retry_count + 1
+    WHERE payment_webhooks.processed = FALSE
+  RETURNING id INTO v_webhook_row;
+
+  IF v_webhook_row IS NULL THEN
+    RETURN jsonb_build_object('outcome', 'duplicate');
+  END IF;
+
+  SELECT * INTO v_payment FROM payments
+  WHERE razorpay_order_id = p_razorpay_order_id
+  ORDER BY id
+  LIMIT 1
+  FOR UPDATE;
+
+  IF NOT FOUND THEN
+    v_outcome := 'payment_not_found';
+    v_error := 'Payment not found for order ' || p_razorpay_order_id;
+  ELSIF p_gateway_order_id IS DISTINCT FROM p_razorpay_order_id
+        OR round(v_payment.amount * 100) <> p_gateway_amount THEN
+    v_outcome := 'verification_mismatch';
+    v_error := 'Payment verification mismatch';
+  ELSIF p_event_type = 'payment.captured' THEN
+    UPDATE payments SET
+      status = 'COMPLETED',
+      razorpay_payment_id = p_razorpay_payment_id,
+      razorpay_signature = p_signature,
+      gateway_transaction_id = p_razorpay_payment_id,
+      completed_at = COALESCE(completed_at, CURRENT_TIMESTAMP),
+      updated_at = CURRENT_TIMESTAMP
+    WHERE id = v_payment.id AND status NOT IN ('COMPLETED', 'REFUNDED', 'PARTIALLY_REFUNDED');
+
+    IF v_payment.appointment_id IS NOT NULL THEN
+      UPDATE appointments SET status = 'confirmed' WHERE id = v_payment.appointment_id;
+    ELSIF v_payment.operation_id IS NOT NULL THEN
+      UPDATE operations SET status = 'confirmed' WHERE id = v_payment.operation_id;
+    END IF;
+  ELSIF p_event_type = 'payment.failed' THEN
+    -- A late payment.failed from an earlier attempt must not undo a captured payment
+    UPDATE payments SET
+      status = 'FAILED',
+      razorpay_payment_id = p_razorpay_payment_id,
+      failure_reason = p_failure_reason,
+      failure_code = p_failure_code,
+      failed_at = CURRENT_TIMESTAMP,
+      updated_at = CURRENT_TIMESTAMP
+    WHERE id = v_payment.id AND status IN ('INITIATED', 'PENDING', 'FAILED');
+  ELSE
+    v_outcome := 'ignored';
+  END IF;
+
+  UPDATE payment_webhooks SET
+    processed = TRUE,
+    processed_at = CURRENT_TIMESTAMP,
+    payment_id = v_payment.id,
+    processing_error = v_error
+  WHERE id = v_webhook_row;
+
+  RETURN jsonb_build_object('outcome', v_outcome, 'payment_id', v_payment.id);
+END;
+$$;
+
+-- Apply payment reconciler transitions in bulk.
+-- p_updates: [{"id", "status" (COMPLETED | FAILED), "razorpay_payment_id", "failure_reason", "failure_code"}]
+-- Only rows still INITIATED/PENDING change; returns (payment_id, razorpay_order_id)
+-- of the rows that were updated so callers can wake waiters keyed by either.
+DROP FUNCTION IF EXISTS apply_payment_reconciliation(JSONB);  -- return type changed from SETOF INTEGER
+CREATE OR REPLACE FUNCTION apply_payment_reconciliation(p_updates JSONB)
+RETURNS TABLE (payment_id INTEGER, razorpay_order_id TEXT)
+LANGUAGE sql
+AS $$
+  WITH changes AS (
+    SELECT * FROM jsonb_to_recordset(p_updates) AS c(
+      id INTEGER, status TEXT, razorpay_payment_id TEXT, failure_reason TEXT, failure_code TEXT
+    )
+  ), updated AS (
+    UPDATE payments p SET
+      status = c.status,
+      razorpay_payment_id = COALESCE(c.razorpay_payment_id, p.razorpay_payment_id),
+      gateway_transaction_id = CASE WHEN c.status = 'COMPLETED' THEN c.razorpay_payment_id ELSE p.gateway_transaction_id END,
+      completed_at = CASE WHEN c.status = 'COMPLETED' THEN CURRENT_TIMESTAMP ELSE p.completed_at END,
+      failed_at = CASE WHEN c.status = 'FAILED' THEN CURRENT_TIMESTAMP ELSE p.failed_at END,
+      failure_reason = CASE WHEN c.status = 'FAILED' THEN c.failure_reason ELSE p.failure_reason END,
+      failure_code = CASE WHEN c.status = 'FAILED' THEN c.failure_code ELSE p.failure_code END,
+      updated_at = CURRENT_TIMESTAMP
+    FROM changes c
+    WHERE p.id = c.id AND p.status IN ('INITIATED', 'PENDING')
+    RETURNING p.id, p.razorpay_order_id, p.status, p.appointment_id, p.operation_id
+  ), confirmed_appointments AS (
+    UPDATE appointments a SET status = 'confirmed'
+    FROM updated u
+    WHERE u.status = 'COMPLETED' AND a.id = u.appointment_id
+  ), confirmed_operations AS (
+    UPDATE operations o SET status = 'confirmed'
+    FROM updated u
+    WHERE u.status = 'COMPLETED' AND u.appointment_id IS NULL AND o.id = u.operation_id
+  )
+  SELECT u.id, u.razorpay_order_id::TEXT FROM updated u;
+$$;
+
+-- ============================================
+-- 6. ROW LEVEL SECURITY - DISABLED
 -- ============================================
 -- RLS is disabled to avoid infinite recursion issues
 -- If you need RLS, implement it at the application level or use service role keys
@@ -576,7 +752,7 @@ ALTER TABLE payments DISABLE ROW LEVEL SECURITY;
 DROP POLICY IF EXISTS "Admins can view audit logs" ON audit_logs;
 
 -- ============================================
--- 6. TABLE COMMENTS FOR DOCUMENTATION
+-- 7. TABLE COMMENTS FOR DOCUMENTATION
 -- ============================================
 
 COMMENT ON TABLE hospitals IS 'Hospital registration and management with UPI, WhatsApp, and SMTP settings';
@@ -35,6 +35,11 @@ ADMIN_PANEL_URL = os.getenv("ADMIN_PANEL_URL", f"http://{SERVER_HOST}:{ADMIN_PAN
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# Database backend: "supabase", or "sqlite" for a local database file (single-clinic
+# deployments, offline tests and benchmarks); web and mobile share the file like the Supabase project
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "supabase").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", str(Path(__file__).parent / "data" / "local.sqlite3"))
+
 # Email Configuration
 SMTP_HOST = os.getenv("SMTP_HOST", "mail.anaghasafar.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
@@ -46,6 +51,60 @@ SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", "info@anaghasafar.com")
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "info@uabiotech.in")
 ADMIN_WHATSAPP = os.getenv("ADMIN_WHATSAPP", "+919039939555")
 
+# Metadata Cache Configuration (hospital and doctor rows)
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", 300))  # seconds
+METADATA_CACHE_MAX_SIZE = int(os.getenv("METADATA_CACHE_MAX_SIZE", 1000))
+METADATA_CACHE_NEGATIVE_TTL = int(os.getenv("METADATA_CACHE_NEGATIVE_TTL", 30))  # remember "not found"
+
+# City autocomplete index refresh interval
+CITY_INDEX_REFRESH_SECONDS = int(os.getenv("CITY_INDEX_REFRESH_SECONDS", 3600))
+
+# Doctor search index refresh interval
+DOCTOR_INDEX_REFRESH_SECONDS = int(os.getenv("DOCTOR_INDEX_REFRESH_SECONDS", 900))
+
+# Search cache configuration (city, popular-city and doctor search)
+SEARCH_CACHE_MAX_SIZE = int(os.getenv("SEARCH_CACHE_MAX_SIZE", 2000))
+CITY_CACHE_TTL = int(os.getenv("CITY_CACHE_TTL", 3600))  # seconds
+DOCTOR_SEARCH_CACHE_TTL = int(os.getenv("DOCTOR_SEARCH_CACHE_TTL", 60))
+SEARCH_CACHE_NEGATIVE_TTL = int(os.getenv("SEARCH_CACHE_NEGATIVE_TTL", 60))  # empty results
+
+# Payment Status Long-Poll Configuration (status endpoints park until the payment changes)
+PAYMENT_STATUS_WAIT_TIMEOUT = float(os.getenv("PAYMENT_STATUS_WAIT_TIMEOUT", 25))  # seconds, default wait
+PAYMENT_STATUS_WAIT_MAX_TIMEOUT = float(os.getenv("PAYMENT_STATUS_WAIT_MAX_TIMEOUT", 60))
+PAYMENT_STATUS_MAX_WAITERS = int(os.getenv("PAYMENT_STATUS_MAX_WAITERS", 10000))
+
+# Admin Panel Serving (kept in memory, revalidated with ETags)
+ADMIN_PANEL_CACHE_CONTROL = os.getenv("ADMIN_PANEL_CACHE_CONTROL", "no-cache")  # clients revalidate; 304 when unchanged
+STATIC_ASSET_CHECK_INTERVAL = float(os.getenv("STATIC_ASSET_CHECK_INTERVAL", 2))  # seconds between mtime checks
+
+# Response Pipeline Configuration (orjson serialization, gzip/brotli compression)
+RESPONSE_ORJSON_ENABLED = os.getenv("RESPONSE_ORJSON_ENABLED", "true").lower() == "true"
+RESPONSE_COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() == "true"
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", 1024))  # bytes; smaller bodies sent as-is
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", 6))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", 4))  # used when the brotli package is installed
+
+# Health Check Configuration (probes read a background-refreshed snapshot)
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 15))  # seconds between dependency checks
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 5))  # seconds before a check counts as failed
+HEALTH_STALE_AFTER = float(os.getenv("HEALTH_STALE_AFTER", 60))  # not ready if no refresh completed for this long
+
+# Metrics Configuration (per-route latency/size/Supabase calls, exposed on GET /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Logging Configuration (queued, non-blocking; JSON lines on stderr)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING,apscheduler=WARNING")  # module=LEVEL,...
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.1))  # fraction of DEBUG records kept per call site
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # records buffered before dropping
+
+# Query Tracing Configuration (per-request Supabase call log, N+1 detection)
+QUERY_TRACE_ENABLED = os.getenv("QUERY_TRACE_ENABLED", "true").lower() == "true"
+QUERY_TRACE_N_PLUS_ONE_THRESHOLD = int(os.getenv("QUERY_TRACE_N_PLUS_ONE_THRESHOLD", 5))  # repeats of one query shape
+QUERY_TRACE_LOG_ALL = os.getenv("QUERY_TRACE_LOG_ALL", "false").lower() == "true"  # log every request's trace (dev)
+QUERY_TRACE_RESPONSE_HEADER = os.getenv("QUERY_TRACE_RESPONSE_HEADER", "false").lower() == "true"  # X-Query-Trace (dev)
+
 # JWT Configuration
 JWT_SECRET = os.getenv("JWT_SECRET", "anagha-hospital-solutions-secret-key-2024")
 JWT_ALGORITHM = "HS256"
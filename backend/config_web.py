@@ -37,17 +37,99 @@ ADMIN_PANEL_URL = os.getenv("ADMIN_PANEL_URL", f"http://{SERVER_HOST}:{ADMIN_PAN
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# Database backend: "supabase", or "sqlite" for a local database file (single-clinic
+# deployments, offline tests and benchmarks); web and mobile share the file like the Supabase project
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "supabase").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", str(Path(__file__).parent / "data" / "local.sqlite3"))
+
 # Email Configuration
 SMTP_HOST = os.getenv("SMTP_HOST", "mail.anaghasafar.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_USERNAME = os.getenv("SMTP_USERNAME", "info@anaghasafar.com")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "Uabiotech*2309")
 SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", "info@anaghasafar.com")
+SMTP_POOL_IDLE_TIMEOUT = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT", 60))  # seconds an unused session stays open
+SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", 100))  # messages per session before reconnecting
+SMTP_REQUIRE_STARTTLS = os.getenv("SMTP_REQUIRE_STARTTLS", "true").lower() == "true"
 
 # Admin Configuration
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "info@uabiotech.in")
 ADMIN_WHATSAPP = os.getenv("ADMIN_WHATSAPP", "+919039939555")
 
+# Metadata Cache Configuration (hospital and doctor rows)
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", 300))  # seconds
+METADATA_CACHE_MAX_SIZE = int(os.getenv("METADATA_CACHE_MAX_SIZE", 1000))
+METADATA_CACHE_NEGATIVE_TTL = int(os.getenv("METADATA_CACHE_NEGATIVE_TTL", 30))  # remember "not found"
+
+# Webhook Queue Configuration (verified Razorpay webhooks are persisted, then applied by workers)
+WEBHOOK_QUEUE_ENABLED = os.getenv("WEBHOOK_QUEUE_ENABLED", "true").lower() == "true"
+WEBHOOK_QUEUE_PATH = os.getenv("WEBHOOK_QUEUE_PATH", str(Path(__file__).parent / "data" / "webhook_queue.sqlite3"))
+WEBHOOK_QUEUE_WORKERS = int(os.getenv("WEBHOOK_QUEUE_WORKERS", 4))
+WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", 8))
+WEBHOOK_QUEUE_RETENTION_DAYS = int(os.getenv("WEBHOOK_QUEUE_RETENTION_DAYS", 7))
+
+# Multi-worker Configuration (run_servers.py --workers N): one worker owns the
+# scheduler and WhatsApp sessions; the others queue WhatsApp actions for it
+PRIMARY_LOCK_PATH = os.getenv("PRIMARY_LOCK_PATH", str(Path(__file__).parent / "data" / "web_primary.lock"))
+PRIMARY_LOCK_RETRY_SECONDS = float(os.getenv("PRIMARY_LOCK_RETRY_SECONDS", 10))
+WHATSAPP_OUTBOX_PATH = os.getenv("WHATSAPP_OUTBOX_PATH", str(Path(__file__).parent / "data" / "whatsapp_outbox.sqlite3"))
+WHATSAPP_OUTBOX_POLL_SECONDS = int(os.getenv("WHATSAPP_OUTBOX_POLL_SECONDS", 5))
+WHATSAPP_OUTBOX_MAX_ATTEMPTS = int(os.getenv("WHATSAPP_OUTBOX_MAX_ATTEMPTS", 5))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", os.getenv("WEB_CONCURRENCY", 1)))  # set by run_servers.py; gunicorn reads WEB_CONCURRENCY
+SERVER_RELOAD = os.getenv("SERVER_RELOAD", "false").lower() == "true"  # uvicorn autoreload for `python server_web.py` (dev)
+
+# Payment Reconciliation Configuration (stale INITIATED/PENDING payments vs Razorpay)
+RECONCILE_INTERVAL_MINUTES = int(os.getenv("RECONCILE_INTERVAL_MINUTES", 10))
+RECONCILE_STALE_MINUTES = int(os.getenv("RECONCILE_STALE_MINUTES", 15))
+RECONCILE_FAIL_AFTER_MINUTES = int(os.getenv("RECONCILE_FAIL_AFTER_MINUTES", 60))
+RECONCILE_PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", 200))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", 8))
+RECONCILE_RATE_PER_SECOND = float(os.getenv("RECONCILE_RATE_PER_SECOND", 10))
+RECONCILE_MAX_PAYMENTS = int(os.getenv("RECONCILE_MAX_PAYMENTS", 5000))
+
+# UPI QR Code Configuration (rendered codes are cached; fee codes can be pre-rendered per hospital)
+UPI_QR_CACHE_MAX_SIZE = int(os.getenv("UPI_QR_CACHE_MAX_SIZE", 2000))
+UPI_QR_FEE_AMOUNTS = os.getenv("UPI_QR_FEE_AMOUNTS", "500")  # comma-separated rupee amounts
+
+# Payment Status Long-Poll Configuration (status endpoints park until the payment changes)
+PAYMENT_STATUS_WAIT_TIMEOUT = float(os.getenv("PAYMENT_STATUS_WAIT_TIMEOUT", 25))  # seconds, default wait
+PAYMENT_STATUS_WAIT_MAX_TIMEOUT = float(os.getenv("PAYMENT_STATUS_WAIT_MAX_TIMEOUT", 60))
+PAYMENT_STATUS_MAX_WAITERS = int(os.getenv("PAYMENT_STATUS_MAX_WAITERS", 10000))
+
+# Response Pipeline Configuration (orjson serialization, gzip/brotli compression)
+RESPONSE_ORJSON_ENABLED = os.getenv("RESPONSE_ORJSON_ENABLED", "true").lower() == "true"
+RESPONSE_COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() == "true"
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", 1024))  # bytes; smaller bodies sent as-is
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", 6))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", 4))  # used when the brotli package is installed
+
+# Health Check Configuration (probes read a background-refreshed snapshot)
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 15))  # seconds between dependency checks
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 5))  # seconds before a check counts as failed
+HEALTH_STALE_AFTER = float(os.getenv("HEALTH_STALE_AFTER", 60))  # not ready if no refresh completed for this long
+
+# Metrics Configuration (per-route latency/size/Supabase calls, exposed on GET /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Logging Configuration (queued, non-blocking; JSON lines on stderr)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING,apscheduler=WARNING")  # module=LEVEL,...
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.1))  # fraction of DEBUG records kept per call site
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # records buffered before dropping
+
+# Query Tracing Configuration (per-request Supabase call log, N+1 detection)
+QUERY_TRACE_ENABLED = os.getenv("QUERY_TRACE_ENABLED", "true").lower() == "true"
+QUERY_TRACE_N_PLUS_ONE_THRESHOLD = int(os.getenv("QUERY_TRACE_N_PLUS_ONE_THRESHOLD", 5))  # repeats of one query shape
+QUERY_TRACE_LOG_ALL = os.getenv("QUERY_TRACE_LOG_ALL", "false").lower() == "true"  # log every request's trace (dev)
+QUERY_TRACE_RESPONSE_HEADER = os.getenv("QUERY_TRACE_RESPONSE_HEADER", "false").lower() == "true"  # X-Query-Trace (dev)
+
+# Appointment Export Configuration (buffered per-day CSV files, streamed admin downloads)
+EXPORT_BUFFER_MAX_ROWS = int(os.getenv("EXPORT_BUFFER_MAX_ROWS", 500))  # rows buffered before a write (1 with several workers)
+EXPORT_FLUSH_INTERVAL = float(os.getenv("EXPORT_FLUSH_INTERVAL", 5))  # seconds a buffered row may wait
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 1000))  # Supabase rows per streamed page
+EXPORT_COLUMNAR_FORMAT = os.getenv("EXPORT_COLUMNAR_FORMAT", "").lower()  # "parquet" compacts closed days (needs pyarrow)
+
 # JWT Configuration (shared with mobile project)
 JWT_SECRET = os.getenv("JWT_SECRET", "anagha-hospital-solutions-secret-key-2024")
 JWT_ALGORITHM = "HS256"
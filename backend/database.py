@@ -5,6 +5,10 @@ import os
 from typing import Optional
 from dotenv import load_dotenv
 from pathlib import Path
+import config
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Load .env from current directory or parent directory
 env_path = Path(__file__).parent / ".env"
@@ -23,9 +27,13 @@ else:
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# Initialize Supabase client
+# Initialize Supabase client (or the local SQLite stand-in when DATABASE_BACKEND=sqlite)
 supabase: Optional[object] = None
-if SUPABASE_URL and SUPABASE_KEY:
+if config.DATABASE_BACKEND == "sqlite":
+    from services.local_db import get_local_client
+    supabase = get_local_client(config.SQLITE_PATH)
+    logger.info(f"✅ Local SQLite database initialized at {config.SQLITE_PATH}")
+elif SUPABASE_URL and SUPABASE_KEY:
     try:
         from supabase import create_client, Client
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
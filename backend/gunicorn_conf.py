@@ -0,0 +1,51 @@
+"""
+Gunicorn settings for the production runner (run_servers.py --workers N)
+Uvicorn workers under a gunicorn master: the app is imported once in the
+master (preload) and forked, workers that stop heartbeating for
+GUNICORN_TIMEOUT seconds are killed and replaced, workers are recycled after
+GUNICORN_MAX_REQUESTS requests, and SIGHUP replaces every worker gracefully
+(new workers start before the old ones drain).
+
+    gunicorn server_web:app -c gunicorn_conf.py --workers 4 --bind 0.0.0.0:3000
+"""
+import faulthandler
+import os
+import sys
+import logging
+
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))  # heartbeat: a worker blocked this long is killed
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))  # drain time on restart/shutdown
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))  # recycle workers (0 disables)
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 1000))  # so they don't all restart together
+accesslog = None  # uvicorn.access goes through the app's logging pipeline
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def post_fork(server, worker):
+    # UvicornWorker points uvicorn's loggers at gunicorn's synchronous handlers
+    # while it is built in the master; route them back through the queue
+    from services.log_pipeline import route_uvicorn_loggers
+    route_uvicorn_loggers()
+
+
+def post_worker_init(worker):
+    logger.info(f"Worker {worker.pid} ready")
+
+
+def worker_abort(worker):
+    # Heartbeat timeout: dump every thread's stack before the worker is killed
+    logger.error(f"❌ Worker {worker.pid} timed out after {timeout}s; thread stacks follow")
+    faulthandler.dump_traceback(file=sys.stderr, all_threads=True)
+
+
+def child_exit(server, worker):
+    logger.info(f"Worker {worker.pid} exited")
+
+
+def on_reload(server):
+    logger.info("🔄 SIGHUP: replacing workers" + (" (preloaded app: code changes need a full restart)"
+                                                  if preload_app else ""))
@@ -7,10 +7,10 @@ import os
 import hmac
 import hashlib
 import json
+import uuid
 from typing import Optional, Dict, Any
 from datetime import datetime
 from pathlib import Path
-import requests
 import logging
 
 # Load environment variables
@@ -23,13 +23,15 @@ if env_path.exists():
     load_dotenv(env_path, override=True)
 load_dotenv(override=True)
 
+# Pooled, timeout-bounded Razorpay HTTP clients (read env on import, so load .env first)
+from services.razorpay_client import get_client, get_async_client
+
 logger = logging.getLogger(__name__)
 
 # Razorpay Configuration
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID", "")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET", "")
 RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET", "")
-RAZORPAY_BASE_URL = "https://api.razorpay.com/v1"
 
 # Log Razorpay config status
 if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
@@ -37,9 +39,44 @@ if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
 else:
     logger.warning("⚠️ Razorpay credentials not configured, using UPI fallback")
 
+def _razorpay_http():
+    return get_client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+
+
+def _razorpay_http_async():
+    return get_async_client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+
+
 class PaymentGateway:
     """Payment Gateway handler for Razorpay and UPI"""
     
+    @staticmethod
+    def _order_payload(amount: float, currency: str, receipt: Optional[str],
+                       notes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "amount": int(amount * 100),  # Convert to paise
+            "currency": currency,
+            "receipt": receipt or f"receipt_{int(datetime.now().timestamp())}",
+            "notes": notes or {}
+        }
+    
+    @staticmethod
+    def _order_result(response, amount: float, currency: str, receipt: Optional[str],
+                      notes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Turn a Razorpay /orders response into an order, falling back to UPI on failure"""
+        if response.status_code == 200 or response.status_code == 201:
+            order_data = response.json()
+            return {
+                "order_id": order_data.get("id"),
+                "amount": amount,
+                "currency": currency,
+                "status": "created",
+                "razorpay_order_id": order_data.get("id"),
+                "key_id": RAZORPAY_KEY_ID,
+            }
+        logger.error(f"❌ Razorpay order creation failed: {response.text}")
+        return PaymentGateway._create_upi_order(amount, receipt, notes)
+    
     @staticmethod
     def create_order(amount: float, currency: str = "INR", receipt: Optional[str] = None, 
                      notes: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
@@ -56,42 +93,35 @@ class PaymentGateway:
             Order details or None if failed
         """
         if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
-            print("⚠️ Razorpay credentials not configured, using UPI fallback")
+            logger.warning("⚠️ Razorpay credentials not configured, using UPI fallback")
             return PaymentGateway._create_upi_order(amount, receipt, notes)
         
         try:
-            amount_in_paise = int(amount * 100)  # Convert to paise
-            
-            payload = {
-                "amount": amount_in_paise,
-                "currency": currency,
-                "receipt": receipt or f"receipt_{int(datetime.now().timestamp())}",
-                "notes": notes or {}
-            }
-            
-            response = requests.post(
-                f"{RAZORPAY_BASE_URL}/orders",
-                auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET),
-                json=payload,
-                headers={"Content-Type": "application/json"}
+            payload = PaymentGateway._order_payload(amount, currency, receipt, notes)
+            # Receipts are not unique (second resolution), so each call gets its
+            # own idempotency key; the client reuses it across retries
+            response = _razorpay_http().post("/orders", json=payload, idempotency_key=uuid.uuid4().hex)
+            return PaymentGateway._order_result(response, amount, currency, receipt, notes)
+        except Exception as e:
+            logger.error(f"❌ Error creating Razorpay order: {e}")
+            return PaymentGateway._create_upi_order(amount, receipt, notes)
+    
+    @staticmethod
+    async def create_order_async(amount: float, currency: str = "INR", receipt: Optional[str] = None,
+                                 notes: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Async variant of create_order for use from async request handlers"""
+        if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
+            logger.warning("⚠️ Razorpay credentials not configured, using UPI fallback")
+            return PaymentGateway._create_upi_order(amount, receipt, notes)
+        
+        try:
+            payload = PaymentGateway._order_payload(amount, currency, receipt, notes)
+            response = await _razorpay_http_async().post(
+                "/orders", json=payload, idempotency_key=uuid.uuid4().hex
             )
-            
-            if response.status_code == 200 or response.status_code == 201:
-                order_data = response.json()
-                return {
-                    "order_id": order_data.get("id"),
-                    "amount": amount,
-                    "currency": currency,
-                    "status": "created",
-                    "razorpay_order_id": order_data.get("id"),
-                    "key_id": RAZORPAY_KEY_ID,
-                }
-            else:
-                print(f"Razorpay order creation failed: {response.text}")
-                return PaymentGateway._create_upi_order(amount, receipt, notes)
-                
+            return PaymentGateway._order_result(response, amount, currency, receipt, notes)
         except Exception as e:
-            print(f"Error creating Razorpay order: {e}")
+            logger.error(f"❌ Error creating Razorpay order: {e}")
             return PaymentGateway._create_upi_order(amount, receipt, notes)
     
     @staticmethod
@@ -167,6 +197,13 @@ class PaymentGateway:
             logger.error(f"Error verifying webhook signature: {e}")
             return False
     
+    @staticmethod
+    def _json_result(response) -> Optional[Dict[str, Any]]:
+        """Response body for 200/201, None otherwise"""
+        if response.status_code == 200 or response.status_code == 201:
+            return response.json()
+        return None
+    
     @staticmethod
     def get_payment_details(payment_id: str) -> Optional[Dict[str, Any]]:
         """Get payment details from Razorpay"""
@@ -174,22 +211,39 @@ class PaymentGateway:
             return None
         
         try:
-            response = requests.get(
-                f"{RAZORPAY_BASE_URL}/payments/{payment_id}",
-                auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET),
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                return response.json()
+            response = _razorpay_http().get(f"/payments/{payment_id}")
+            return response.json() if response.status_code == 200 else None
+        except Exception as e:
+            logger.error(f"❌ Error getting payment details: {e}")
             return None
+    
+    @staticmethod
+    async def get_payment_details_async(payment_id: str) -> Optional[Dict[str, Any]]:
+        """Async variant of get_payment_details"""
+        if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
+            return None
+        
+        try:
+            response = await _razorpay_http_async().get(f"/payments/{payment_id}")
+            return response.json() if response.status_code == 200 else None
         except Exception as e:
-            print(f"Error getting payment details: {e}")
+            logger.error(f"❌ Error getting payment details: {e}")
             return None
     
+    @staticmethod
+    def _refund_payload(amount: Optional[float], notes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        payload = {
+            "notes": notes or {}
+        }
+        
+        if amount:
+            payload["amount"] = int(amount * 100)  # Convert to paise
+        return payload
+    
     @staticmethod
     def create_refund(payment_id: str, amount: Optional[float] = None, 
-                      notes: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+                      notes: Optional[Dict[str, Any]] = None,
+                      idempotency_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Create a refund for a payment
         
@@ -197,34 +251,44 @@ class PaymentGateway:
             payment_id: Razorpay payment ID
             amount: Refund amount (None for full refund)
             notes: Refund notes
+            idempotency_key: Key reused across retries (generated if not given)
         
         Returns:
             Refund details or None if failed
         """
         if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
-            print("⚠️ Razorpay not configured, cannot process refund")
+            logger.warning("⚠️ Razorpay not configured, cannot process refund")
             return None
         
         try:
-            payload = {
-                "notes": notes or {}
-            }
-            
-            if amount:
-                payload["amount"] = int(amount * 100)  # Convert to paise
-            
-            response = requests.post(
-                f"{RAZORPAY_BASE_URL}/payments/{payment_id}/refund",
-                auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET),
-                json=payload,
-                headers={"Content-Type": "application/json"}
+            response = _razorpay_http().post(
+                f"/payments/{payment_id}/refund",
+                json=PaymentGateway._refund_payload(amount, notes),
+                idempotency_key=idempotency_key
             )
-            
-            if response.status_code == 200 or response.status_code == 201:
-                return response.json()
+            return PaymentGateway._json_result(response)
+        except Exception as e:
+            logger.error(f"❌ Error creating refund: {e}")
             return None
+    
+    @staticmethod
+    async def create_refund_async(payment_id: str, amount: Optional[float] = None,
+                                  notes: Optional[Dict[str, Any]] = None,
+                                  idempotency_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Async variant of create_refund"""
+        if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
+            logger.warning("⚠️ Razorpay not configured, cannot process refund")
+            return None
+        
+        try:
+            response = await _razorpay_http_async().post(
+                f"/payments/{payment_id}/refund",
+                json=PaymentGateway._refund_payload(amount, notes),
+                idempotency_key=idempotency_key
+            )
+            return PaymentGateway._json_result(response)
         except Exception as e:
-            print(f"Error creating refund: {e}")
+            logger.error(f"❌ Error creating refund: {e}")
             return None
     
     @staticmethod
@@ -0,0 +1,22 @@
+"""
+Repositories
+Named, projected queries for the hot tables. Call sites ask for what they
+need (users.contacts_by_ids(ids), appointments.for_doctor(id)) instead
+of building select("*") queries inline, so column lists, batching and the
+client (Supabase or DATABASE_BACKEND=sqlite) are decided in one place.
+"""
+from repositories.base import Repository, BATCH_SIZE, set_client_provider, get_client
+from repositories.users import users, UserRepository
+from repositories.hospitals import hospitals, HospitalRepository
+from repositories.appointments import appointments, AppointmentRepository
+from repositories.operations import operations, OperationRepository
+from repositories.payments import payments, PaymentRepository
+
+__all__ = [
+    "Repository", "BATCH_SIZE", "set_client_provider", "get_client",
+    "users", "UserRepository",
+    "hospitals", "HospitalRepository",
+    "appointments", "AppointmentRepository",
+    "operations", "OperationRepository",
+    "payments", "PaymentRepository",
+]
@@ -0,0 +1,36 @@
+"""
+Appointments Repository
+"""
+from datetime import date
+from typing import List, Union
+from repositories.base import Repository, Row
+
+LIST_COLUMNS = "id, user_id, doctor_id, hospital_id, date, time_slot, status, created_at"
+
+Day = Union[date, str]
+
+
+class AppointmentRepository(Repository):
+    table = "appointments"
+
+    def _listing(self, column: str, value: int) -> List[Row]:
+        query = self.select(LIST_COLUMNS).eq(column, value)
+        return self.rows(query.order("date", desc=False).order("time_slot", desc=False).execute())
+
+    def for_user(self, user_id: int) -> List[Row]:
+        """A patient's appointments in date/slot order"""
+        return self._listing("user_id", user_id)
+
+    def for_doctor(self, doctor_id: int) -> List[Row]:
+        """A doctor's appointments in date/slot order"""
+        return self._listing("doctor_id", doctor_id)
+
+    def booked_slots(self, doctor_id: int, day: Day) -> List[str]:
+        """Time slots of the doctor's non-cancelled appointments on one day"""
+        result = self.select("time_slot").eq("doctor_id", doctor_id).eq("date", str(day)).neq(
+            "status", "cancelled"
+        ).execute()
+        return [row["time_slot"] for row in self.rows(result)]
+
+
+appointments = AppointmentRepository()
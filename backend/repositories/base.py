@@ -0,0 +1,67 @@
+"""
+Repository Base
+Every repository reads its client from one provider (database.get_supabase by
+default, so DATABASE_BACKEND applies to all of them); set_client_provider()
+swaps it centrally, e.g. for a caching or test client.
+"""
+from typing import Optional, Dict, Any, List, Callable, Iterable
+
+# Ids per `in.(...)` filter in batch lookups (keeps PostgREST URLs short)
+BATCH_SIZE = 100
+
+Row = Dict[str, Any]
+
+_client_provider: Optional[Callable[[], Any]] = None
+
+
+def set_client_provider(provider: Optional[Callable[[], Any]]):
+    """Client factory for every repository (None restores database.get_supabase)"""
+    global _client_provider
+    _client_provider = provider
+
+
+def get_client():
+    if _client_provider is not None:
+        return _client_provider()
+    from database import get_supabase
+    return get_supabase()
+
+
+class Repository:
+    """Named queries for one table; subclasses set `table` and their column lists"""
+
+    table: str = ""
+
+    @property
+    def client(self):
+        client = get_client()
+        if client is None:
+            raise RuntimeError("Database not configured")
+        return client
+
+    def select(self, columns: str):
+        return self.client.table(self.table).select(columns)
+
+    @staticmethod
+    def first(result) -> Optional[Row]:
+        return result.data[0] if result.data else None
+
+    @staticmethod
+    def rows(result) -> List[Row]:
+        return result.data or []
+
+    def get(self, row_id: int, columns: str = "*") -> Optional[Row]:
+        return self.first(self.select(columns).eq("id", row_id).limit(1).execute())
+
+    def by_ids(self, ids: Iterable[Any], columns: str = "*", key: str = "id") -> Dict[Any, Row]:
+        """
+        Rows for many ids in ceil(n / BATCH_SIZE) queries, keyed by `key`
+        (which must be among `columns`); missing ids are simply absent
+        """
+        wanted = sorted({value for value in ids if value is not None}, key=str)
+        found: Dict[Any, Row] = {}
+        for start in range(0, len(wanted), BATCH_SIZE):
+            chunk = wanted[start:start + BATCH_SIZE]
+            for row in self.rows(self.select(columns).in_(key, chunk).execute()):
+                found[row[key]] = row
+        return found
@@ -0,0 +1,18 @@
+"""
+Hospitals Repository
+Full rows feed services.metadata_cache (SMTP, WhatsApp and UPI settings are
+read from them), which also serves the hospital names in listings.
+"""
+from typing import Optional
+from repositories.base import Repository, Row
+
+
+class HospitalRepository(Repository):
+    table = "hospitals"
+
+    def settings(self, hospital_id: int) -> Optional[Row]:
+        """Every column (cached by services.metadata_cache.get_hospital)"""
+        return self.get(hospital_id)
+
+
+hospitals = HospitalRepository()
@@ -0,0 +1,28 @@
+"""
+Operations Repository
+"""
+from typing import Optional, List
+from repositories.base import Repository, Row
+
+LIST_COLUMNS = "id, patient_id, doctor_id, hospital_id, specialty, operation_date, status, notes, created_at"
+
+
+class OperationRepository(Repository):
+    table = "operations"
+
+    def _listing(self, column: str, value: int, specialty: Optional[str]) -> List[Row]:
+        query = self.select(LIST_COLUMNS).eq(column, value)
+        if specialty:
+            query = query.eq("specialty", specialty)
+        return self.rows(query.order("operation_date", desc=False).execute())
+
+    def for_patient(self, patient_id: int, specialty: Optional[str] = None) -> List[Row]:
+        """A patient's operations by date, optionally for one specialty"""
+        return self._listing("patient_id", patient_id, specialty)
+
+    def for_doctor(self, doctor_id: int, specialty: Optional[str] = None) -> List[Row]:
+        """A doctor's operations by date, optionally for one specialty"""
+        return self._listing("doctor_id", doctor_id, specialty)
+
+
+operations = OperationRepository()
@@ -0,0 +1,22 @@
+"""
+Payments Repository
+"""
+from typing import List
+from repositories.base import Repository, Row
+
+LIST_COLUMNS = (
+    "id, appointment_id, operation_id, amount, currency, status, payment_method, razorpay_order_id, "
+    "razorpay_payment_id, transaction_id, internal_transaction_id, payment_date, created_at, completed_at, "
+    "failed_at, failure_reason"
+)
+
+
+class PaymentRepository(Repository):
+    table = "payments"
+
+    def for_user(self, user_id: int) -> List[Row]:
+        """A user's payments, newest first"""
+        return self.rows(self.select(LIST_COLUMNS).eq("user_id", user_id).order("created_at", desc=True).execute())
+
+
+payments = PaymentRepository()
@@ -0,0 +1,46 @@
+"""
+Users Repository
+Patients, pharma professionals and doctors (users table)
+"""
+from typing import Optional, Dict, List, Iterable
+from repositories.base import Repository, Row
+
+# Everything the API returns for a user; password_hash is only read for login
+PROFILE_COLUMNS = (
+    "id, name, mobile, role, is_active, hospital_id, address_line1, address_line2, address_line3, "
+    "company_name, product1, product2, product3, product4, degree, institute_name, "
+    "experience1, experience2, experience3, experience4, last_login_at, created_at"
+)
+LOGIN_COLUMNS = f"{PROFILE_COLUMNS}, password_hash"
+CONTACT_COLUMNS = "id, name, mobile"
+DOCTOR_LIST_COLUMNS = "id, name, mobile, degree, institute_name"
+
+
+class UserRepository(Repository):
+    table = "users"
+
+    def for_login(self, mobile: str) -> Optional[Row]:
+        """Active user by mobile, with password_hash for verification"""
+        return self.first(self.select(LOGIN_COLUMNS).eq("mobile", mobile).eq("is_active", True).limit(1).execute())
+
+    def profile(self, user_id: int) -> Optional[Row]:
+        """User row without password_hash (the authenticated user on every request)"""
+        return self.get(user_id, PROFILE_COLUMNS)
+
+    def active_doctor(self, doctor_id: int) -> Optional[Row]:
+        return self.first(self.select(PROFILE_COLUMNS).eq("id", doctor_id).eq("role", "doctor").eq(
+            "is_active", True
+        ).limit(1).execute())
+
+    def active_doctors(self) -> List[Row]:
+        return self.rows(self.select(DOCTOR_LIST_COLUMNS).eq("role", "doctor").eq("is_active", True).execute())
+
+    def contacts_by_ids(self, user_ids: Iterable[int]) -> Dict[int, Row]:
+        """{id: {id, name, mobile}} for the users referenced by a listing"""
+        return self.by_ids(user_ids, CONTACT_COLUMNS)
+
+    def mobile_taken(self, mobile: str) -> bool:
+        return bool(self.select("id").eq("mobile", mobile).limit(1).execute().data)
+
+
+users = UserRepository()
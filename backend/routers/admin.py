@@ -1,7 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse, FileResponse
+from datetime import date
+from typing import Optional
 from models import UserRole
 # Note: User SQLAlchemy model removed - using Supabase now
 from auth import get_current_user
+from services import metadata_cache
+from services.webhook_queue import get_webhook_pool
+from services import payment_reconciliation
+from services import appointment_export
+from database import get_supabase
 import json
 import os
 
@@ -146,3 +154,96 @@ def get_public_pricing():
 
 
 
+
+@router.get("/cache-stats")
+def get_cache_stats(admin_user: dict = Depends(get_admin_user)):
+    """Get hospital/doctor metadata cache statistics"""
+    return metadata_cache.get_cache_stats()
+
+
+@router.get("/webhook-queue")
+def get_webhook_queue_stats(admin_user: dict = Depends(get_admin_user)):
+    """Get Razorpay webhook queue depth and worker pool status"""
+    pool = get_webhook_pool()
+    if not pool:
+        return {"running": False}
+    return pool.stats()
+
+
+@router.get("/reconciliation")
+def get_reconciliation_report(admin_user: dict = Depends(get_admin_user)):
+    """Get the report of the last payment reconciliation run (and the id of one in progress)"""
+    report = dict(payment_reconciliation.get_last_report() or {"message": "No reconciliation run yet"})
+    report["running_run_id"] = payment_reconciliation.get_running_run_id()
+    return report
+
+
+@router.post("/reconciliation/run", status_code=status.HTTP_202_ACCEPTED)
+def run_reconciliation(dry_run: bool = False, admin_user: dict = Depends(get_admin_user)):
+    """
+    Start payment reconciliation in the background (dry_run=true decides without writing).
+    Poll GET /reconciliation for the report carrying the returned run_id.
+    """
+    run_id = payment_reconciliation.start_reconciliation_run(dry_run=dry_run)
+    if run_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Reconciliation already running"
+        )
+    return {"run_id": run_id, "status": "started", "dry_run": dry_run}
+
+
+@router.get("/exports/appointments")
+def stream_appointment_export(
+    hospital_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    doctor_id: Optional[int] = None,
+    admin_user: dict = Depends(get_admin_user)
+):
+    """Download a hospital's appointments as CSV, streamed from the database page by page"""
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    supabase = get_supabase()
+    if not supabase:
+        raise HTTPException(status_code=503, detail="Database not available")
+
+    name_parts = [f"hospital_{hospital_id}_appointments"]
+    if start_date or end_date:
+        name_parts.append(f"{start_date or 'start'}_to_{end_date or 'today'}")
+    if doctor_id:
+        name_parts.append(f"doctor_{doctor_id}")
+    return StreamingResponse(
+        appointment_export.stream_appointments_csv(
+            supabase, hospital_id,
+            start_date=start_date.isoformat() if start_date else None,
+            end_date=end_date.isoformat() if end_date else None,
+            doctor_id=doctor_id
+        ),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{"_".join(name_parts)}.csv"'}
+    )
+
+
+@router.get("/exports/files")
+def list_appointment_export_files(hospital_id: int, admin_user: dict = Depends(get_admin_user)):
+    """List a hospital's per-day appointment export files"""
+    # Flushes this worker's buffer only; with several workers rows are written
+    # unbuffered (see services.appointment_export), so none wait elsewhere
+    appointment_export.flush_exports()
+    return {
+        "hospital_id": hospital_id,
+        "files": appointment_export.list_export_files(hospital_id),
+        "stats": appointment_export.get_export_stats()
+    }
+
+
+@router.get("/exports/files/{hospital_id}/{name}")
+def download_appointment_export_file(hospital_id: int, name: str, admin_user: dict = Depends(get_admin_user)):
+    """Download one per-day appointment export file"""
+    appointment_export.flush_exports()
+    path = appointment_export.get_export_file(hospital_id, name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Export file not found")
+    media_type = "text/csv" if name.endswith(".csv") else "application/vnd.apache.parquet"
+    return FileResponse(path, media_type=media_type, filename=f"hospital_{hospital_id}_{name}")
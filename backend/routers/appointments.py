@@ -3,13 +3,17 @@ from datetime import date, datetime
 from database import get_supabase
 from schemas import AppointmentCreate, AppointmentResponse
 from auth import get_current_user, get_current_doctor
-from typing import List
+from typing import List, Optional
 import logging
 
 # Import services
 from services.csv_service import save_appointment_csv
 from services.whatsapp_service import send_whatsapp_message_by_hospital_id
 from services.message_templates import get_confirmation_message
+from services.slot_reservation import reserve_appointment_slot, SLOT_TAKEN_MESSAGE
+from services.metadata_cache import get_hospital, get_doctor
+from services.responses import parse_fields, list_response
+from repositories import users as user_repo, appointments as appointment_repo
 
 logger = logging.getLogger(__name__)
 
@@ -54,13 +58,12 @@ def book_appointment(
             )
         
         # Verify doctor exists and is a doctor
-        doctor_result = supabase.table("users").select("*").eq("id", appointment.doctor_id).eq("role", "doctor").eq("is_active", True).execute()
-        if not doctor_result.data:
+        doctor = get_doctor(appointment.doctor_id)
+        if not doctor:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Doctor not found"
             )
-        doctor = doctor_result.data[0]
         
         # Validate doctor-hospital relationship
         doctor_hospital_id = doctor.get("hospital_id")
@@ -84,13 +87,12 @@ def book_appointment(
         hospital_id = doctor_hospital_id
         
         # Verify hospital exists and is approved
-        hospital_result = supabase.table("hospitals").select("*").eq("id", hospital_id).execute()
-        if not hospital_result.data:
+        hospital = get_hospital(hospital_id)
+        if not hospital:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Hospital not found"
             )
-        hospital = hospital_result.data[0]
         
         # Ensure hospital is approved
         if hospital.get("status") != "approved":
@@ -99,19 +101,6 @@ def book_appointment(
                 detail="Cannot book appointment with unapproved hospital"
             )
         
-        # Check if time slot is already booked for this doctor on this date
-        existing_result = supabase.table("appointments").select("*").eq(
-            "doctor_id", appointment.doctor_id
-        ).eq("date", str(appointment.date)).eq("time_slot", appointment.time_slot).neq(
-            "status", "cancelled"
-        ).execute()
-        
-        if existing_result.data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Time slot already booked"
-            )
-        
         # Create appointment record
         appointment_record = {
             "user_id": current_user["id"],
@@ -123,15 +112,19 @@ def book_appointment(
             "reason": getattr(appointment, 'reason', None)
         }
         
-        result = supabase.table("appointments").insert(appointment_record).execute()
-        if not result.data:
+        # Reserve the slot and insert in one atomic step (no check-then-insert race)
+        db_appointment, slot_error = reserve_appointment_slot(appointment_record)
+        if slot_error == SLOT_TAKEN_MESSAGE:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=slot_error
+            )
+        if slot_error or not db_appointment:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create appointment"
+                detail=slot_error or "Failed to create appointment"
             )
-        
-        db_appointment = result.data[0]
-        
+
         # Save to CSV and send WhatsApp (background tasks)
         if hospital_id and hospital:
             csv_data = {
@@ -156,7 +149,8 @@ def book_appointment(
                     time_slot=appointment.time_slot,
                     hospital_name=hospital.get("name", ""),
                     specialty=None,
-                    custom_template=hospital.get("whatsapp_confirmation_template")
+                    custom_template=hospital.get("whatsapp_confirmation_template"),
+                    hospital_id=hospital_id
                 )
                 background_tasks.add_task(
                     send_whatsapp_message_by_hospital_id,
@@ -189,8 +183,9 @@ def book_appointment(
         )
 
 @router.get("/my-appointments", response_model=List[dict])
-def get_my_appointments(current_user: dict = Depends(get_current_user)):
-    """Get all appointments for current user - using Supabase"""
+def get_my_appointments(fields: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Get all appointments for current user - using Supabase (fields=id,date,... to project)"""
+    selected = parse_fields(fields)
     supabase = get_supabase()
     if not supabase:
         raise HTTPException(
@@ -199,23 +194,16 @@ def get_my_appointments(current_user: dict = Depends(get_current_user)):
         )
     
     try:
-        result = supabase.table("appointments").select("*").eq("user_id", current_user["id"]).order("date", desc=False).order("time_slot", desc=False).execute()
+        rows = appointment_repo.for_user(current_user["id"])
+        # One batched users lookup for every doctor in the listing
+        doctors = user_repo.contacts_by_ids(apt.get("doctor_id") for apt in rows)
         
         appointments = []
-        for apt in (result.data or []):
-            # Fetch doctor info
-            doctor_info = {}
-            if apt.get("doctor_id"):
-                doctor_result = supabase.table("users").select("id, name, mobile").eq("id", apt["doctor_id"]).execute()
-                if doctor_result.data:
-                    doctor_info = doctor_result.data[0]
+        for apt in rows:
+            doctor_info = doctors.get(apt.get("doctor_id"), {})
             
             # Fetch hospital info
-            hospital_info = {}
-            if apt.get("hospital_id"):
-                hospital_result = supabase.table("hospitals").select("id, name").eq("id", apt["hospital_id"]).execute()
-                if hospital_result.data:
-                    hospital_info = hospital_result.data[0]
+            hospital_info = get_hospital(apt.get("hospital_id")) or {}
             
             appointments.append({
                 "id": apt["id"],
@@ -230,7 +218,7 @@ def get_my_appointments(current_user: dict = Depends(get_current_user)):
                 "hospital_name": hospital_info.get("name", "Unknown Hospital")
             })
         
-        return appointments
+        return list_response(appointments, selected)
     except HTTPException:
         raise
     except Exception as e:
@@ -241,30 +229,24 @@ def get_my_appointments(current_user: dict = Depends(get_current_user)):
         )
 
 @router.get("/doctor-appointments", response_model=List[dict])
-def get_doctor_appointments(current_doctor: dict = Depends(get_current_doctor)):
-    """Get all appointments for current doctor - using Supabase"""
+def get_doctor_appointments(fields: Optional[str] = None, current_doctor: dict = Depends(get_current_doctor)):
+    """Get all appointments for current doctor - using Supabase (fields=id,date,... to project)"""
+    selected = parse_fields(fields)
     supabase = get_supabase()
     if not supabase:
         return []
     
     try:
-        result = supabase.table("appointments").select("*").eq("doctor_id", current_doctor["id"]).order("date", desc=False).order("time_slot", desc=False).execute()
+        rows = appointment_repo.for_doctor(current_doctor["id"])
+        # One batched users lookup for every patient in the listing
+        patients = user_repo.contacts_by_ids(apt.get("user_id") for apt in rows)
         
         appointments = []
-        for apt in (result.data or []):
-            # Fetch user info
-            user_info = {}
-            if apt.get("user_id"):
-                user_result = supabase.table("users").select("id, name, mobile").eq("id", apt["user_id"]).execute()
-                if user_result.data:
-                    user_info = user_result.data[0]
+        for apt in rows:
+            user_info = patients.get(apt.get("user_id"), {})
             
             # Fetch hospital info
-            hospital_info = {}
-            if apt.get("hospital_id"):
-                hospital_result = supabase.table("hospitals").select("id, name").eq("id", apt["hospital_id"]).execute()
-                if hospital_result.data:
-                    hospital_info = hospital_result.data[0]
+            hospital_info = get_hospital(apt.get("hospital_id")) or {}
             
             appointments.append({
                 "id": apt["id"],
@@ -279,7 +261,7 @@ def get_doctor_appointments(current_doctor: dict = Depends(get_current_doctor)):
                 "hospital_name": hospital_info.get("name", "Unknown Hospital")
             })
         
-        return appointments
+        return list_response(appointments, selected)
     except Exception as e:
         logger.error(f"Error fetching doctor appointments: {e}")
         return []
@@ -449,13 +431,12 @@ def get_available_slots(
     
     try:
         # Verify doctor exists
-        doctor_result = supabase.table("users").select("*").eq("id", doctor_id).eq("role", "doctor").eq("is_active", True).execute()
-        if not doctor_result.data:
+        doctor = get_doctor(doctor_id)
+        if not doctor:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Doctor not found"
             )
-        doctor = doctor_result.data[0]
         
         # Get all time slots
         all_slots = [
@@ -465,11 +446,7 @@ def get_available_slots(
         ]
         
         # Get booked appointments
-        booked_result = supabase.table("appointments").select("time_slot").eq(
-            "doctor_id", doctor_id
-        ).eq("date", date).neq("status", "cancelled").execute()
-        
-        booked_slots = [apt["time_slot"] for apt in (booked_result.data or [])]
+        booked_slots = appointment_repo.booked_slots(doctor_id, date)
         available_slots = [slot for slot in all_slots if slot not in booked_slots]
         
         return {
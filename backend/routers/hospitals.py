@@ -7,7 +7,13 @@ from typing import Optional, List
 from pydantic import BaseModel
 import logging
 from services.whatsapp_service import open_whatsapp_session, get_whatsapp_driver, check_whatsapp_session_health, close_whatsapp_session
-from services.email_service import send_hospital_registration_email
+from services.whatsapp_outbox import enqueue_whatsapp_action, OPEN_SESSION, CLOSE_SESSION
+from services.worker_role import is_primary
+from services.email_service import send_hospital_registration_email, close_smtp_connections
+from services.metadata_cache import invalidate_hospital
+from services.upi_qr import prerender_hospital_qr_codes
+from services.message_templates import TEMPLATE_COLUMNS, TemplateError, validate_template, invalidate_hospital_templates
+from services.responses import parse_fields, list_response, PRIVATE_HOSPITAL_FIELDS
 from auth import get_current_user
 
 logger = logging.getLogger(__name__)
@@ -144,6 +150,11 @@ def register_hospital(
                 detail="Failed to register hospital"
             )
 
+        # Drop any cached "not found" for the new id
+        invalidate_hospital(result.data[0]["id"])
+        # Warm the fixed-amount fee QR codes off the request path
+        background_tasks.add_task(prerender_hospital_qr_codes, result.data[0])
+
     except HTTPException:
         raise
     except Exception as e:
@@ -200,7 +211,7 @@ def get_hospital_payment_info(hospital_id: Optional[int] = None):
             "bhim_upi_id": hospital.get("bhim_upi_id") or default_upi
         }
     except Exception as e:
-        print(f"Error fetching hospital payment info: {e}")
+        logger.error(f"Error fetching hospital payment info: {e}")
         # Return default values on error
         return {
             "upi_id": "hospital@upi",
@@ -212,9 +223,11 @@ def get_hospital_payment_info(hospital_id: Optional[int] = None):
 
 @router.get("/", response_model=List[dict])
 def get_hospitals(
-    status_filter: Optional[str] = None
+    status_filter: Optional[str] = None,
+    fields: Optional[str] = None
 ):
-    """Get list of hospitals (filtered by status if provided) - using Supabase"""
+    """Get list of hospitals (filtered by status if provided, fields=id,name,... to project) - using Supabase"""
+    selected = parse_fields(fields)
     supabase = get_supabase()
     if not supabase:
         return []
@@ -224,14 +237,15 @@ def get_hospitals(
         if status_filter:
             query = query.eq("status", status_filter)
         result = query.order("created_at", desc=True).execute()
-        return result.data if result.data else []
+        return list_response(result.data or [], selected, exclude=PRIVATE_HOSPITAL_FIELDS)
     except Exception as e:
-        print(f"Error fetching hospitals: {e}")
+        logger.error(f"Error fetching hospitals: {e}")
         return []
 
 @router.get("/approved", response_model=List[dict])
-def get_approved_hospitals():
+def get_approved_hospitals(fields: Optional[str] = None):
     """Get list of approved hospitals - using Supabase. Returns all hospitals (approved and pending) for booking purposes."""
+    selected = parse_fields(fields)
     supabase = get_supabase()
     if not supabase:
         return []
@@ -240,7 +254,7 @@ def get_approved_hospitals():
         # Return all hospitals (approved and pending) for booking purposes
         # This allows users to book with hospitals that are pending approval
         result = supabase.table("hospitals").select("*").order("name").execute()
-        return result.data if result.data else []
+        return list_response(result.data or [], selected, exclude=PRIVATE_HOSPITAL_FIELDS)
     except Exception as e:
         logger.error(f"Error fetching hospitals: {e}")
         return []
@@ -305,6 +319,7 @@ def approve_hospital(hospital_id: int):
                 detail="Failed to approve hospital"
             )
         
+        invalidate_hospital(hospital_id)
         return {"message": "Hospital approved successfully", "hospital": update_result.data[0]}
     except HTTPException:
         raise
@@ -344,6 +359,7 @@ def reject_hospital(hospital_id: int):
                 detail="Failed to reject hospital"
             )
         
+        invalidate_hospital(hospital_id)
         return {"message": "Hospital rejected successfully", "hospital": update_result.data[0]}
     except HTTPException:
         raise
@@ -360,6 +376,7 @@ class WhatsAppSettingsUpdate(BaseModel):
     whatsapp_enabled: Optional[str] = None
     whatsapp_confirmation_template: Optional[str] = None
     whatsapp_followup_template: Optional[str] = None
+    whatsapp_reminder_template: Optional[str] = None
 
 
 class SMTPConfigUpdate(BaseModel):
@@ -371,7 +388,6 @@ class SMTPConfigUpdate(BaseModel):
     smtp_from_email: Optional[str] = None
     smtp_enabled: Optional[bool] = None
     smtp_use_ssl: Optional[bool] = None
-    whatsapp_reminder_template: Optional[str] = None
 
 
 @router.put("/{hospital_id}/whatsapp-settings")
@@ -400,12 +416,20 @@ def update_whatsapp_settings(
         update_data = {}
         if settings.whatsapp_enabled is not None:
             update_data["whatsapp_enabled"] = settings.whatsapp_enabled
-        if settings.whatsapp_confirmation_template is not None:
-            update_data["whatsapp_confirmation_template"] = settings.whatsapp_confirmation_template
-        if settings.whatsapp_followup_template is not None:
-            update_data["whatsapp_followup_template"] = settings.whatsapp_followup_template
-        if settings.whatsapp_reminder_template is not None:
-            update_data["whatsapp_reminder_template"] = settings.whatsapp_reminder_template
+        for kind, column in TEMPLATE_COLUMNS.items():
+            template = getattr(settings, column)
+            if template is None:
+                continue
+            # Reject bad placeholders now rather than sending them to patients later
+            if template:
+                try:
+                    validate_template(kind, template)
+                except TemplateError as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Invalid {kind} template: {str(e)}"
+                    )
+            update_data[column] = template
         
         # Update hospital
         result = supabase.table("hospitals").update(update_data).eq("id", hospital_id).execute()
@@ -416,6 +440,9 @@ def update_whatsapp_settings(
                 detail="Failed to update WhatsApp settings"
             )
         
+        # Bookings read templates from the metadata cache
+        invalidate_hospital(hospital_id)
+        invalidate_hospital_templates(hospital_id)
         hospital = result.data[0]
         return {
             "message": "WhatsApp settings updated",
@@ -452,6 +479,14 @@ def get_whatsapp_status(hospital_id: int):
             )
         
         hospital = hospital_result.data[0]
+        if not is_primary():
+            # Sessions are held by the primary worker only
+            return {
+                "hospital_id": hospital_id,
+                "whatsapp_enabled": hospital.get("whatsapp_enabled") == "true" or hospital.get("whatsapp_enabled") is True,
+                "session_active": None,
+                "message": "Session status is only known to the primary worker; retry the request"
+            }
         is_healthy = check_whatsapp_session_health(hospital_id)
         
         return {
@@ -491,6 +526,14 @@ def initialize_whatsapp_session(hospital_id: int):
         # Enable WhatsApp if not already enabled
         if hospital.get("whatsapp_enabled") != "true" and hospital.get("whatsapp_enabled") is not True:
             supabase.table("hospitals").update({"whatsapp_enabled": "true"}).eq("id", hospital_id).execute()
+            invalidate_hospital(hospital_id)
+        
+        if not is_primary():
+            enqueue_whatsapp_action(OPEN_SESSION, hospital_id)
+            return {
+                "message": "WhatsApp session initialization queued on the primary worker. Please scan QR code in the browser window.",
+                "status": "queued"
+            }
         
         # Initialize driver (will open browser for QR scan)
         # Hospital admin scans QR once only. Session remains logged in.
@@ -533,6 +576,13 @@ def close_whatsapp_session_endpoint(hospital_id: int):
                 detail="Hospital not found"
             )
         
+        if not is_primary():
+            enqueue_whatsapp_action(CLOSE_SESSION, hospital_id)
+            return {
+                "message": "WhatsApp session close queued on the primary worker",
+                "hospital_id": hospital_id
+            }
+        
         close_whatsapp_session(hospital_id)
         
         return {
@@ -610,6 +660,11 @@ async def update_smtp_settings(
     result = supabase.table("hospitals").update(update_data).eq("id", hospital_id).execute()
     
     if result.data:
+        # Email sending reads SMTP config from the metadata cache
+        invalidate_hospital(hospital_id)
+        # Drop the pooled session authenticated with the old settings
+        await close_smtp_connections(hospital_id)
+        
         # Log audit event
         from services.audit_logger import log_audit_event
         log_audit_event(
@@ -3,7 +3,10 @@ from datetime import date, datetime
 from database import get_supabase
 from schemas import OperationCreate, OperationResponse
 from auth import get_current_user, get_current_doctor
-from typing import List
+from typing import List, Optional
+from services.metadata_cache import get_hospital, get_doctor
+from services.responses import parse_fields, list_response
+from repositories import users as user_repo, operations as operation_repo
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,13 +35,12 @@ def book_operation(
             )
         
         # Verify doctor exists and is a doctor
-        doctor_result = supabase.table("users").select("*").eq("id", operation.doctor_id).eq("role", "doctor").eq("is_active", True).execute()
-        if not doctor_result.data:
+        doctor = get_doctor(operation.doctor_id)
+        if not doctor:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Doctor not found"
             )
-        doctor = doctor_result.data[0]
         
         # Validate doctor-hospital relationship
         doctor_hospital_id = doctor.get("hospital_id")
@@ -62,13 +64,12 @@ def book_operation(
         hospital_id = doctor_hospital_id
         
         # Verify hospital exists and is approved
-        hospital_result = supabase.table("hospitals").select("*").eq("id", hospital_id).execute()
-        if not hospital_result.data:
+        hospital = get_hospital(hospital_id)
+        if not hospital:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Hospital not found"
             )
-        hospital = hospital_result.data[0]
         
         # Ensure hospital is approved
         if hospital.get("status") != "approved":
@@ -130,8 +131,9 @@ def book_operation(
         )
 
 @router.get("/my-operations", response_model=List[dict])
-def get_my_operations(current_user: dict = Depends(get_current_user)):
-    """Get all operations for current user - using Supabase"""
+def get_my_operations(fields: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Get all operations for current user - using Supabase (fields=id,date,... to project)"""
+    selected = parse_fields(fields)
     supabase = get_supabase()
     if not supabase:
         raise HTTPException(
@@ -140,24 +142,17 @@ def get_my_operations(current_user: dict = Depends(get_current_user)):
         )
     
     try:
-        result = supabase.table("operations").select("*").eq("patient_id", current_user["id"]).order("operation_date", desc=False).execute()
+        rows = operation_repo.for_patient(current_user["id"])
+        # One batched users lookup for every doctor in the listing
+        doctors = user_repo.contacts_by_ids(op.get("doctor_id") for op in rows)
         
         operations = []
-        for op in (result.data or []):
-            # Fetch doctor info
-            doctor_info = {}
-            if op.get("doctor_id"):
-                doctor_result = supabase.table("users").select("id, name, mobile").eq("id", op["doctor_id"]).execute()
-                if doctor_result.data:
-                    doctor_info = doctor_result.data[0]
+        for op in rows:
+            doctor_info = doctors.get(op.get("doctor_id"), {})
             
             # Fetch hospital info
-            hospital_info = {}
             hospital_id = op.get("hospital_id")
-            if hospital_id:
-                hospital_result = supabase.table("hospitals").select("id, name").eq("id", hospital_id).execute()
-                if hospital_result.data:
-                    hospital_info = hospital_result.data[0]
+            hospital_info = get_hospital(hospital_id) or {}
             
             operations.append({
                 "id": op["id"],
@@ -174,7 +169,7 @@ def get_my_operations(current_user: dict = Depends(get_current_user)):
                 "hospital_name": hospital_info.get("name", "Unknown Hospital")
             })
         
-        return operations
+        return list_response(operations, selected)
     except HTTPException:
         raise
     except Exception as e:
@@ -185,31 +180,25 @@ def get_my_operations(current_user: dict = Depends(get_current_user)):
         )
 
 @router.get("/doctor-operations", response_model=List[dict])
-def get_doctor_operations(current_doctor: dict = Depends(get_current_doctor)):
-    """Get all operations for current doctor - using Supabase"""
+def get_doctor_operations(fields: Optional[str] = None, current_doctor: dict = Depends(get_current_doctor)):
+    """Get all operations for current doctor - using Supabase (fields=id,date,... to project)"""
+    selected = parse_fields(fields)
     supabase = get_supabase()
     if not supabase:
         return []
     
     try:
-        result = supabase.table("operations").select("*").eq("doctor_id", current_doctor["id"]).order("operation_date", desc=False).execute()
+        rows = operation_repo.for_doctor(current_doctor["id"])
+        # One batched users lookup for every patient in the listing
+        patients = user_repo.contacts_by_ids(op.get("patient_id") for op in rows)
         
         operations = []
-        for op in (result.data or []):
-            # Fetch patient info
-            patient_info = {}
-            if op.get("patient_id"):
-                patient_result = supabase.table("users").select("id, name, mobile").eq("id", op["patient_id"]).execute()
-                if patient_result.data:
-                    patient_info = patient_result.data[0]
+        for op in rows:
+            patient_info = patients.get(op.get("patient_id"), {})
             
             # Fetch hospital info
-            hospital_info = {}
             hospital_id = op.get("hospital_id")
-            if hospital_id:
-                hospital_result = supabase.table("hospitals").select("id, name").eq("id", hospital_id).execute()
-                if hospital_result.data:
-                    hospital_info = hospital_result.data[0]
+            hospital_info = get_hospital(hospital_id) or {}
             
             operations.append({
                 "id": op["id"],
@@ -226,7 +215,7 @@ def get_doctor_operations(current_doctor: dict = Depends(get_current_doctor)):
                 "hospital_name": hospital_info.get("name", "Unknown Hospital")
             })
         
-        return operations
+        return list_response(operations, selected)
     except Exception as e:
         logger.error(f"Error fetching doctor operations: {e}")
         return []
@@ -342,37 +331,22 @@ def get_operations_by_specialty(
     
     try:
         if current_user.get("role") == "doctor":
-            result = supabase.table("operations").select("*").eq(
-                "specialty", specialty
-            ).eq("doctor_id", current_user["id"]).order("operation_date", desc=False).execute()
+            rows = operation_repo.for_doctor(current_user["id"], specialty)
         else:
-            result = supabase.table("operations").select("*").eq(
-                "specialty", specialty
-            ).eq("patient_id", current_user["id"]).order("operation_date", desc=False).execute()
+            rows = operation_repo.for_patient(current_user["id"], specialty)
+        # One batched users lookup for every patient and doctor in the listing
+        people = user_repo.contacts_by_ids(
+            [op.get("patient_id") for op in rows] + [op.get("doctor_id") for op in rows]
+        )
         
         operations = []
-        for op in (result.data or []):
-            # Fetch patient info
-            patient_info = {}
-            if op.get("patient_id"):
-                patient_result = supabase.table("users").select("id, name, mobile").eq("id", op["patient_id"]).execute()
-                if patient_result.data:
-                    patient_info = patient_result.data[0]
-            
-            # Fetch doctor info
-            doctor_info = {}
-            if op.get("doctor_id"):
-                doctor_result = supabase.table("users").select("id, name, mobile").eq("id", op["doctor_id"]).execute()
-                if doctor_result.data:
-                    doctor_info = doctor_result.data[0]
+        for op in rows:
+            patient_info = people.get(op.get("patient_id"), {})
+            doctor_info = people.get(op.get("doctor_id"), {})
             
             # Fetch hospital info
-            hospital_info = {}
             hospital_id = op.get("hospital_id")
-            if hospital_id:
-                hospital_result = supabase.table("hospitals").select("id, name").eq("id", hospital_id).execute()
-                if hospital_result.data:
-                    hospital_info = hospital_result.data[0]
+            hospital_info = get_hospital(hospital_id) or {}
             
             operations.append({
                 "id": op["id"],
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Header
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Header, Query
+from fastapi.responses import StreamingResponse
 from database import get_supabase
 from models import PaymentStatus, PaymentMethod
 # Note: Payment, Appointment, Operation, User, Hospital SQLAlchemy models removed - using Supabase now
@@ -6,6 +7,7 @@ from auth import get_current_user, get_current_doctor
 from typing import Optional, Union
 from datetime import datetime
 from pydantic import BaseModel, validator
+import asyncio
 import uuid
 import json
 import logging
@@ -13,18 +15,20 @@ import os
 
 # Import Razorpay services
 from services.razorpay_service import RazorpayService
+from services.metadata_cache import get_hospital
+from services.webhook_queue import get_webhook_pool
+from services.upi_qr import render_upi_qr, prerender_hospital_qr_codes, hospital_upi_ids, parse_fee_amounts, QR_FORMATS
+from services.payment_events import notify_payment_changed, watch_payment, wait_for_status_change, clamp_timeout
+from services.responses import parse_fields, list_response
+from repositories import payments as payment_repo
 from payment_gateway import PaymentGateway
 
 logger = logging.getLogger(__name__)
 
-# Try to import QR code library
-try:
-    import qrcode
-    import io
-    import base64
-    QR_AVAILABLE = True
-except ImportError:
-    QR_AVAILABLE = False
+# Columns returned by the status endpoints (user_id for the ownership check)
+PAYMENT_STATUS_FIELDS = "id, user_id, status, razorpay_payment_id, completed_at"
+# Statuses a payment never leaves; waiting on them returns at once
+FINAL_PAYMENT_STATUSES = ["COMPLETED", "CANCELLED", "REFUNDED", "PARTIALLY_REFUNDED"]
 
 router = APIRouter(prefix="/api/payments", tags=["payments"])
 
@@ -32,39 +36,17 @@ class PaymentCreate(BaseModel):
     appointment_id: Optional[int] = None
     operation_id: Optional[int] = None
     amount: str = "500"
+    qr_format: str = "png"  # "png" or "svg"
 
-class QRGenerateRequest(BaseModel):
-    upi_id: str
-    amount: str = "500"
-    transaction_id: Optional[str] = None
+    @validator('qr_format')
+    def validate_qr_format(cls, v):
+        if v not in QR_FORMATS:
+            raise ValueError(f"qr_format must be one of {', '.join(QR_FORMATS)}")
+        return v
 
-def generate_upi_qr_code(upi_id: str, amount: str, transaction_id: str) -> str:
-    """Generate UPI QR code as base64 string"""
-    if not QR_AVAILABLE:
-        # Return placeholder if QR library not available
-        return "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjUwIiBoZWlnaHQ9IjI1MCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj48cmVjdCB3aWR0aD0iMjUwIiBoZWlnaHQ9IjI1MCIgZmlsbD0iI2Y5ZmFmYiIvPjx0ZXh0IHg9IjUwJSIgeT0iNTAlIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiM2YjcyODAiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIuM2VtIj5VUEkgUVIgQ29kZTwvdGV4dD48L3N2Zz4="
-    
-    # UPI payment URL format
-    upi_url = f"upi://pay?pa={upi_id}&am={amount}&tn=Appointment%20Payment&tr={transaction_id}"
-    
-    try:
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(upi_url)
-        qr.make(fit=True)
-        
-        # Create image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        
-        return f"data:image/png;base64,{img_str}"
-    except Exception as e:
-        # Return placeholder on error
-        return "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjUwIiBoZWlnaHQ9IjI1MCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj48cmVjdCB3aWR0aD0iMjUwIiBoZWlnaHQ9IjI1MCIgZmlsbD0iI2Y5ZmFmYiIvPjx0ZXh0IHg9IjUwJSIgeT0iNTAlIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiM2YjcyODAiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIuM2VtIj5VUEkgUVIgQ29kZTwvdGV4dD48L3N2Zz4="
+def generate_upi_qr_code(upi_id: str, amount: str, transaction_id: str, fmt: str = "png") -> str:
+    """Generate UPI QR code as base64 data URI (cached per upi_id/amount/transaction_id/format)"""
+    return render_upi_qr(upi_id, amount, transaction_id, fmt)
 
 @router.post("/create")
 def create_payment(
@@ -107,16 +89,16 @@ def create_payment(
     if not hospital_id:
         raise HTTPException(status_code=400, detail="Hospital not found")
     
-    hospital_result = supabase.table("hospitals").select("*").eq("id", hospital_id).execute()
-    if not hospital_result.data:
+    hospital = get_hospital(hospital_id)
+    if not hospital:
         raise HTTPException(status_code=404, detail="Hospital not found")
-    hospital = hospital_result.data[0]
     
     # Get UPI IDs for each payment app (use app-specific or fallback to default)
-    gpay_upi = hospital.get("gpay_upi_id") or hospital.get("upi_id") or "hospital@upi"
-    phonepay_upi = hospital.get("phonepay_upi_id") or hospital.get("upi_id") or "hospital@upi"
-    paytm_upi = hospital.get("paytm_upi_id") or hospital.get("upi_id") or "hospital@upi"
-    bhim_upi = hospital.get("bhim_upi_id") or hospital.get("upi_id") or "hospital@upi"
+    upi_ids = hospital_upi_ids(hospital)
+    gpay_upi = upi_ids["gpay"]
+    phonepay_upi = upi_ids["phonepay"]
+    paytm_upi = upi_ids["paytm"]
+    bhim_upi = upi_ids["bhimupi"]
     default_upi = hospital.get("upi_id") or "hospital@upi"
     
     # Generate transaction ID
@@ -144,10 +126,8 @@ def create_payment(
     
     # Generate QR codes for each UPI app using their specific UPI IDs
     qr_codes = {
-        "gpay": generate_upi_qr_code(gpay_upi, payment_data.amount, transaction_id),
-        "phonepay": generate_upi_qr_code(phonepay_upi, payment_data.amount, transaction_id),
-        "paytm": generate_upi_qr_code(paytm_upi, payment_data.amount, transaction_id),
-        "bhimupi": generate_upi_qr_code(bhim_upi, payment_data.amount, transaction_id)
+        app: generate_upi_qr_code(upi_id, payment_data.amount, transaction_id, payment_data.qr_format)
+        for app, upi_id in upi_ids.items()
     }
     
     # Generate UPI payment URLs for each app
@@ -233,6 +213,7 @@ def complete_payment(
         update_data["upi_transaction_id"] = upi_transaction_id
     
     supabase.table("payments").update(update_data).eq("id", payment_id).execute()
+    notify_payment_changed(payment_id, payment.get("razorpay_order_id"))
     
     # Update appointment/operation status if payment completed
     if payment.get("appointment_id"):
@@ -247,9 +228,11 @@ def complete_payment(
 
 @router.get("/my-payments")
 def get_my_payments(
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all payments for current user"""
+    """Get all payments for current user (fields=id,status,... to project)"""
+    selected = parse_fields(fields)
     supabase = get_supabase()
     if not supabase:
         raise HTTPException(
@@ -258,12 +241,8 @@ def get_my_payments(
         )
     
     try:
-        result = supabase.table("payments").select("*").eq(
-            "user_id", current_user["id"]
-        ).order("created_at", desc=True).execute()
-        
         payments = []
-        for p in (result.data or []):
+        for p in payment_repo.for_user(current_user["id"]):
             payments.append({
                 "id": p["id"],
                 "appointment_id": p.get("appointment_id"),
@@ -282,7 +261,7 @@ def get_my_payments(
                 "failure_reason": p.get("failure_reason")
             })
         
-        return payments
+        return list_response(payments, selected)
     except Exception as e:
         logger.error(f"Error fetching payments: {e}")
         raise HTTPException(
@@ -294,6 +273,13 @@ class QRGenerateRequest(BaseModel):
     upi_id: str
     amount: str = "500"
     transaction_id: Optional[str] = None
+    format: str = "png"  # "png" or "svg"
+
+    @validator('format')
+    def validate_format(cls, v):
+        if v not in QR_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(QR_FORMATS)}")
+        return v
 
 @router.post("/generate-qr")
 def generate_qr_code(request: QRGenerateRequest):
@@ -302,13 +288,38 @@ def generate_qr_code(request: QRGenerateRequest):
     if not request.transaction_id:
         request.transaction_id = f"HOME{datetime.now().strftime('%Y%m%d%H%M%S')}"
     
-    qr_code = generate_upi_qr_code(request.upi_id, request.amount, request.transaction_id)
+    qr_code = generate_upi_qr_code(request.upi_id, request.amount, request.transaction_id, request.format)
     return {
         "qr_code": qr_code,
         "upi_id": request.upi_id,
         "amount": request.amount
     }
 
+@router.get("/hospital/{hospital_id}/fee-qr")
+def get_hospital_fee_qr_codes(
+    hospital_id: int,
+    amounts: Optional[str] = None,
+    fmt: str = Query("png", alias="format"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Reusable fixed-amount fee QR codes for a hospital (pre-rendered and cached)"""
+    if fmt not in QR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(QR_FORMATS)}")
+    try:
+        fee_amounts = parse_fee_amounts(amounts) if amounts else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    hospital = get_hospital(hospital_id)
+    if not hospital:
+        raise HTTPException(status_code=404, detail="Hospital not found")
+
+    return {
+        "hospital_id": hospital_id,
+        "upi_ids": hospital_upi_ids(hospital),
+        "qr_codes": prerender_hospital_qr_codes(hospital, fee_amounts, fmt)
+    }
+
 # ============================================
 # Razorpay Payment Endpoints
 # ============================================
@@ -624,11 +635,14 @@ def create_razorpay_order(
 @router.post("/webhook")
 async def razorpay_webhook(
     request: Request,
-    x_razorpay_signature: Optional[str] = Header(None, alias="X-Razorpay-Signature")
+    x_razorpay_signature: Optional[str] = Header(None, alias="X-Razorpay-Signature"),
+    x_razorpay_event_id: Optional[str] = Header(None, alias="X-Razorpay-Event-Id")
 ):
     """
     Razorpay webhook endpoint
-    Handles payment.captured, payment.failed, and other events
+    Handles payment.captured, payment.failed, and other events.
+    Verified events are queued and applied by the webhook worker pool when
+    it is running; otherwise they are processed inline.
     """
     supabase = get_supabase()
     if not supabase:
@@ -652,7 +666,7 @@ async def razorpay_webhook(
         
         # Process webhook event
         process_result = RazorpayService.process_webhook_event(
-            webhook_payload, x_razorpay_signature
+            webhook_payload, x_razorpay_signature, event_id=x_razorpay_event_id
         )
         
         if not process_result.get("success"):
@@ -660,116 +674,25 @@ async def razorpay_webhook(
             return {"status": "error", "message": process_result.get("error")}
         
         webhook_id = process_result.get("webhook_id")
-        event_type = process_result.get("event_type")
-        razorpay_payment_id = process_result.get("razorpay_payment_id")
         razorpay_order_id = process_result.get("razorpay_order_id")
-        payment_entity = process_result.get("payment_entity")
         
-        # Check idempotency
-        if RazorpayService.check_webhook_idempotency(webhook_id):
+        # Razorpay retries: answer from the in-memory recent-id set without touching the DB
+        if RazorpayService.webhook_seen_recently(webhook_id):
             logger.info(f"Webhook {webhook_id} already processed, skipping")
             return {"status": "success", "message": "Already processed"}
         
-        # Save webhook event
-        webhook_record_id = RazorpayService.save_webhook_event(
-            webhook_id=webhook_id,
-            event_type=event_type,
-            payment_id=None,  # Will be set after finding payment
-            razorpay_payment_id=razorpay_payment_id,
-            razorpay_order_id=razorpay_order_id,
-            webhook_payload=webhook_payload,
-            signature_verified=True
-        )
-        
-        if not webhook_record_id:
-            logger.error("Failed to save webhook event")
-            return {"status": "error", "message": "Failed to save webhook"}
-        
-        # Find payment by razorpay_order_id
-        payment_result = supabase.table("payments").select("*").eq(
-            "razorpay_order_id", razorpay_order_id
-        ).execute()
-        
-        if not payment_result.data:
-            logger.error(f"Payment not found for order_id: {razorpay_order_id}")
-            RazorpayService.mark_webhook_processed(
-                webhook_id, error=f"Payment not found for order {razorpay_order_id}"
+        # Acknowledge fast: persist to the local queue and let the worker pool apply it
+        webhook_pool = get_webhook_pool()
+        if webhook_pool:
+            queued = await asyncio.to_thread(
+                webhook_pool.queue.enqueue,
+                webhook_id, razorpay_order_id or webhook_id, body_str, x_razorpay_signature
             )
-            return {"status": "error", "message": "Payment not found"}
-        
-        payment = payment_result.data[0]
-        payment_id = payment["id"]
+            webhook_pool.notify()
+            return {"status": "success", "message": "Queued" if queued else "Already queued"}
         
-        # Verify payment from Razorpay API (backend-owned verification)
-        razorpay_payment = RazorpayService.verify_payment_from_razorpay(razorpay_payment_id)
-        
-        if not razorpay_payment:
-            logger.error(f"Could not fetch payment from Razorpay: {razorpay_payment_id}")
-            RazorpayService.mark_webhook_processed(
-                webhook_id, payment_id=payment_id,
-                error="Could not fetch payment from Razorpay"
-            )
-            return {"status": "error", "message": "Payment verification failed"}
-        
-        # Cross-verify: Compare webhook data with Razorpay API response
-        if (razorpay_payment.get("order_id") != razorpay_order_id or
-            float(razorpay_payment.get("amount", 0)) / 100 != float(payment.get("amount", 0))):
-            logger.error("Payment verification mismatch")
-            RazorpayService.mark_webhook_processed(
-                webhook_id, payment_id=payment_id,
-                error="Payment verification mismatch"
-            )
-            return {"status": "error", "message": "Payment verification mismatch"}
-        
-        # Process based on event type
-        if event_type == "payment.captured":
-            # Update payment status to COMPLETED
-            update_data = {
-                "status": "COMPLETED",
-                "razorpay_payment_id": razorpay_payment_id,
-                "razorpay_signature": x_razorpay_signature,
-                "gateway_transaction_id": razorpay_payment.get("id"),
-                "completed_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat()
-            }
-            
-            supabase.table("payments").update(update_data).eq("id", payment_id).execute()
-            
-            # Update appointment/operation status
-            if payment.get("appointment_id"):
-                supabase.table("appointments").update({
-                    "status": "confirmed"
-                }).eq("id", payment["appointment_id"]).execute()
-            elif payment.get("operation_id"):
-                supabase.table("operations").update({
-                    "status": "confirmed"
-                }).eq("id", payment["operation_id"]).execute()
-            
-            # Mark webhook as processed
-            RazorpayService.mark_webhook_processed(webhook_id, payment_id=payment_id)
-            
-            logger.info(f"Payment {payment_id} marked as COMPLETED via webhook {webhook_id}")
-            
-        elif event_type == "payment.failed":
-            # Update payment status to FAILED
-            failure_reason = payment_entity.get("error_description") or payment_entity.get("error_code", "Unknown error")
-            update_data = {
-                "status": "FAILED",
-                "razorpay_payment_id": razorpay_payment_id,
-                "failure_reason": failure_reason,
-                "failure_code": payment_entity.get("error_code"),
-                "failed_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat()
-            }
-            
-            supabase.table("payments").update(update_data).eq("id", payment_id).execute()
-            
-            # Mark webhook as processed
-            RazorpayService.mark_webhook_processed(webhook_id, payment_id=payment_id)
-            
-            logger.info(f"Payment {payment_id} marked as FAILED via webhook {webhook_id}")
-        
-        return {"status": "success", "message": "Webhook processed"}
+        result = await RazorpayService.handle_webhook(process_result, x_razorpay_signature)
+        return {"status": result["status"], "message": result["message"]}
         
     except Exception as e:
         logger.error(f"Error processing webhook: {e}")
@@ -824,6 +747,26 @@ def get_payment(
             detail=f"Error fetching payment: {str(e)}"
         )
 
+def _status_response(payment: dict) -> dict:
+    return {
+        "payment_id": payment["id"],
+        "status": payment["status"],
+        "razorpay_payment_id": payment.get("razorpay_payment_id"),
+        "completed_at": payment.get("completed_at")
+    }
+
+def _status_loader(supabase, payment_id: int, user_id: int):
+    """Blocking status read that enforces ownership"""
+    def load():
+        result = supabase.table("payments").select(PAYMENT_STATUS_FIELDS).eq("id", payment_id).execute()
+        if not result.data:
+            return None
+        payment = result.data[0]
+        if payment.get("user_id") != user_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+        return payment
+    return load
+
 @router.get("/{payment_id}/status")
 def get_payment_status(
     payment_id: int,
@@ -838,9 +781,7 @@ def get_payment_status(
         )
     
     try:
-        result = supabase.table("payments").select("id, status, razorpay_payment_id, completed_at").eq(
-            "id", payment_id
-        ).execute()
+        result = supabase.table("payments").select(PAYMENT_STATUS_FIELDS).eq("id", payment_id).execute()
         
         if not result.data:
             raise HTTPException(
@@ -857,12 +798,7 @@ def get_payment_status(
                 detail="Not authorized"
             )
         
-        return {
-            "payment_id": payment["id"],
-            "status": payment["status"],
-            "razorpay_payment_id": payment.get("razorpay_payment_id"),
-            "completed_at": payment.get("completed_at")
-        }
+        return _status_response(payment)
         
     except HTTPException:
         raise
@@ -873,6 +809,108 @@ def get_payment_status(
             detail=f"Error fetching payment status: {str(e)}"
         )
 
+@router.get("/{payment_id}/status/wait")
+async def wait_for_payment_status(
+    payment_id: int,
+    known_status: Optional[str] = None,
+    timeout: Optional[float] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Long-poll payment status: returns as soon as the status differs from
+    known_status (default: the current status), or after timeout seconds
+    with the unchanged status. Replaces tight polling of /status.
+    """
+    supabase = get_supabase()
+    if not supabase:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database not configured"
+        )
+    
+    try:
+        payment = await wait_for_status_change(
+            _status_loader(supabase, payment_id, current_user["id"]),
+            known_status=known_status,
+            timeout=clamp_timeout(timeout),
+            final_statuses=FINAL_PAYMENT_STATUSES,
+            payment_id=payment_id
+        )
+        if not payment:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Payment not found"
+            )
+        return _status_response(payment)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error waiting for payment status: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching payment status: {str(e)}"
+        )
+
+@router.get("/{payment_id}/events")
+async def stream_payment_status(
+    payment_id: int,
+    timeout: Optional[float] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Server-sent events: a "status" event now and on every status change,
+    closing once the payment reaches a final status or after timeout seconds.
+    Comment lines are sent every 15 seconds to keep proxies from idling out.
+    """
+    supabase = get_supabase()
+    if not supabase:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database not configured"
+        )
+    
+    load = _status_loader(supabase, payment_id, current_user["id"])
+    payment = await asyncio.to_thread(load)
+    if not payment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Payment not found")
+    
+    duration = clamp_timeout(timeout)
+    
+    async def events():
+        nonlocal payment
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + duration
+        # Registered here so the finally below always unregisters it, even if
+        # the client disconnects before the first event
+        watch = watch_payment(payment_id)
+        try:
+            # Re-read after registering so a change since the 404 check is not missed
+            payment = await asyncio.to_thread(load) or payment
+            yield f"event: status\ndata: {json.dumps(_status_response(payment))}\n\n"
+            last_status = payment["status"]
+            # Without a registry slot the client gets the current status and reconnects
+            while watch and last_status not in FINAL_PAYMENT_STATUSES:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                if not await watch.wait(min(remaining, 15)):
+                    yield ": keepalive\n\n"
+                    continue
+                payment = await asyncio.to_thread(load)
+                if payment and payment["status"] != last_status:
+                    last_status = payment["status"]
+                    yield f"event: status\ndata: {json.dumps(_status_response(payment))}\n\n"
+        finally:
+            if watch:
+                watch.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/{payment_id}/verify")
 def verify_payment_manually(
     payment_id: int,
@@ -941,6 +979,7 @@ def verify_payment_manually(
                 update_data["failure_reason"] = razorpay_payment.get("error_description")
             
             supabase.table("payments").update(update_data).eq("id", payment_id).execute()
+            notify_payment_changed(payment_id, payment.get("razorpay_order_id"))
         
         return {
             "verified": True,
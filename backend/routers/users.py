@@ -7,8 +7,15 @@ from auth import (
     get_password_hash, get_current_doctor
 )
 from datetime import datetime, timedelta
+from typing import Optional
 import config
 from services.audit_logger import log_login_attempt
+from services.metadata_cache import invalidate_doctor
+from services.responses import parse_fields, list_response
+from repositories import users as user_repo
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
@@ -24,8 +31,7 @@ def register_user(user: UserCreate):
     
     try:
         # Check if mobile already exists
-        existing = supabase.table("users").select("id").eq("mobile", user.mobile).execute()
-        if existing.data:
+        if user_repo.mobile_taken(user.mobile):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Mobile number already registered"
@@ -89,6 +95,8 @@ def register_user(user: UserCreate):
         result = supabase.table("users").insert(user_record).execute()
         if result.data:
             db_user = result.data[0]
+            if db_user.get("role") == "doctor":
+                invalidate_doctor(db_user["id"])
             # Remove password hash from response
             db_user.pop("password_hash", None)
             access_token = create_access_token(data={"sub": str(db_user["id"]), "role": db_user["role"]})
@@ -190,8 +198,7 @@ def register_doctor(
     
     try:
         # Check if mobile already exists
-        existing = supabase.table("users").select("id").eq("mobile", user.mobile).execute()
-        if existing.data:
+        if user_repo.mobile_taken(user.mobile):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Mobile number already registered"
@@ -219,6 +226,7 @@ def register_doctor(
         result = supabase.table("users").insert(user_record).execute()
         if result.data:
             db_user = result.data[0]
+            invalidate_doctor(db_user["id"])
             db_user.pop("password_hash", None)
             return db_user
         else:
@@ -235,15 +243,15 @@ def register_doctor(
         )
 
 @router.get("/doctors")
-def get_all_doctors(current_user: dict = Depends(get_current_user)):
-    """Get list of all registered doctors - using Supabase. Requires authentication."""
+def get_all_doctors(fields: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Get list of all registered doctors - using Supabase. Requires authentication. fields=id,name,... to project."""
+    selected = parse_fields(fields)
     supabase = get_supabase()
     if not supabase:
         return []
     
     try:
-        result = supabase.table("users").select("id, name, mobile, degree, institute_name").eq("role", "doctor").eq("is_active", True).execute()
-        return result.data if result.data else []
+        return list_response(user_repo.active_doctors(), selected)
     except Exception as e:
-        print(f"Error fetching doctors: {e}")
+        logger.error(f"Error fetching doctors: {e}")
         return []
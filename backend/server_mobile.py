@@ -7,14 +7,28 @@ Or: uvicorn server_mobile:app --reload --host 127.0.0.1 --port 8000
 import os
 import sys
 from pathlib import Path
+from contextlib import asynccontextmanager
 
 # Override config module before any other imports
 import config_mobile
 sys.modules['config'] = config_mobile
 import config
 
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import HTMLResponse
+# Queued, non-blocking structured logging (before anything logs)
+import logging
+from services.log_pipeline import configure_logging
+configure_logging(
+    "mobile",
+    level=config.LOG_LEVEL,
+    fmt=config.LOG_FORMAT,
+    levels=config.LOG_LEVELS,
+    debug_sample_rate=config.LOG_DEBUG_SAMPLE_RATE,
+    queue_size=config.LOG_QUEUE_SIZE
+)
+logger = logging.getLogger(__name__)
+
+from fastapi import FastAPI, HTTPException, Body, Request
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional, List, Tuple
 from datetime import datetime, timedelta
@@ -23,6 +37,22 @@ from supabase import create_client, Client
 import bcrypt
 from jose import JWTError, jwt
 from payment_gateway import PaymentGateway
+from services.razorpay_client import close_clients as close_razorpay_clients
+from services.slot_reservation import is_unique_violation
+from services.city_index import CityIndex, city_relevance_key, load_active_cities
+from services.lru_cache import LRUCache
+from services.static_assets import StaticAsset
+from services.health import HealthMonitor, HealthCheck, supabase_check
+from services.request_metrics import configure_request_metrics, instrument_supabase
+from services.local_db import get_local_client
+from services.query_trace import configure_query_tracing
+from services.responses import (
+    json_response_class, configure_response_pipeline, parse_fields, list_response, project_rows,
+    PRIVATE_HOSPITAL_FIELDS
+)
+from services.doctor_index import DoctorIndex, load_active_doctors
+from services.payment_events import notify_payment_changed, wait_for_status_change, clamp_timeout, get_waiter_stats
+from repositories import set_client_provider, users as user_repo
 
 # Load environment variables from current or parent directory
 env_path = Path(__file__).parent / ".env"
@@ -35,7 +65,38 @@ elif env_path.exists():
 else:
     load_dotenv(override=True)
 
-app = FastAPI(title="Anagha Hospital Solutions API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: load city and doctor search indexes and keep them fresh in the background
+    if supabase:
+        city_index.refresh(lambda: load_active_cities(supabase))
+        city_index.start_background_refresh(lambda: load_active_cities(supabase), config.CITY_INDEX_REFRESH_SECONDS)
+        doctor_index.refresh(lambda: load_active_doctors(supabase))
+        doctor_index.start_background_refresh(lambda: load_active_doctors(supabase), config.DOCTOR_INDEX_REFRESH_SECONDS)
+    health_monitor.start()
+    yield
+    # Shutdown
+    health_monitor.stop()
+    city_index.stop_background_refresh()
+    doctor_index.stop_background_refresh()
+    await close_razorpay_clients()
+
+app = FastAPI(title="Anagha Hospital Solutions API", lifespan=lifespan, default_response_class=json_response_class())
+
+# Response compression (gzip/brotli above RESPONSE_COMPRESSION_MIN_SIZE)
+configure_response_pipeline(app)
+
+# Per-request Supabase query tracing with N+1 detection (inside the metrics middleware)
+configure_query_tracing(
+    app,
+    enabled=config.QUERY_TRACE_ENABLED,
+    threshold=config.QUERY_TRACE_N_PLUS_ONE_THRESHOLD,
+    log_all=config.QUERY_TRACE_LOG_ALL,
+    response_header=config.QUERY_TRACE_RESPONSE_HEADER
+)
+
+# Per-route latency/size/Supabase-call metrics and GET /metrics
+configure_request_metrics(app, "mobile", enabled=config.METRICS_ENABLED)
 
 # Supabase Configuration
 SUPABASE_URL = config.SUPABASE_URL
@@ -43,19 +104,22 @@ SUPABASE_KEY = config.SUPABASE_KEY
 
 # Initialize Supabase client
 supabase: Optional[Client] = None
-if SUPABASE_URL and SUPABASE_KEY:
+if config.DATABASE_BACKEND == "sqlite":
+    supabase = get_local_client(config.SQLITE_PATH)
+elif SUPABASE_URL and SUPABASE_KEY:
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("✅ Supabase client initialized successfully")
+        supabase = instrument_supabase(create_client(SUPABASE_URL, SUPABASE_KEY))
+        logger.info("✅ Supabase client initialized successfully")
     except Exception as e:
-        print(f"⚠️ Warning: Could not initialize Supabase client: {e}")
-        print("⚠️ Server will continue with in-memory storage as fallback")
+        logger.warning(f"⚠️ Could not initialize Supabase client: {e}; continuing with in-memory storage")
         supabase = None
 else:
-    print("⚠️ Warning: SUPABASE_URL or SUPABASE_KEY not found in .env")
-    print("⚠️ Server will continue with in-memory storage as fallback")
+    logger.warning("⚠️ SUPABASE_URL or SUPABASE_KEY not found in .env; continuing with in-memory storage")
     supabase = None
 
+# Repositories use this server's client rather than database.get_supabase
+set_client_provider(lambda: supabase)
+
 # Fallback in-memory storage (if Supabase not available)
 hospitals_storage = []
 users_storage = []
@@ -99,22 +163,25 @@ app.add_middleware(
 BASE_DIR = Path(__file__).parent
 ADMIN_PANEL_PATH = BASE_DIR.parent / "frontend" / "web" / "templates" / "admin_panel.html"
 
+# Admin panel served from memory (reloaded when the file changes) with ETag/gzip/brotli
+admin_panel_asset = StaticAsset(
+    "admin_panel",
+    # New location first, old location for backward compatibility
+    [ADMIN_PANEL_PATH, BASE_DIR / "admin_panel.html"],
+    cache_control=config.ADMIN_PANEL_CACHE_CONTROL,
+    check_interval=config.STATIC_ASSET_CHECK_INTERVAL
+)
+
 # Serve admin panel HTML file
-@app.get("/admin_panel.html", response_class=HTMLResponse)
-@app.get("/admin", response_class=HTMLResponse)
-@app.get("/", response_class=HTMLResponse)
-async def admin_panel():
+@app.api_route("/admin_panel.html", methods=["GET", "HEAD"], response_class=HTMLResponse)
+@app.api_route("/admin", methods=["GET", "HEAD"], response_class=HTMLResponse)
+@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def admin_panel(request: Request):
     """Serve the web admin panel"""
     try:
-        # Try new location first
-        if ADMIN_PANEL_PATH.exists():
-            with open(ADMIN_PANEL_PATH, "r", encoding="utf-8") as f:
-                return HTMLResponse(content=f.read())
-        # Fallback to old location (for backward compatibility)
-        admin_panel_path = BASE_DIR / "admin_panel.html"
-        if admin_panel_path.exists():
-            with open(admin_panel_path, "r", encoding="utf-8") as f:
-                return HTMLResponse(content=f.read())
+        response = admin_panel_asset.response(request)
+        if response is not None:
+            return response
         return HTMLResponse(
             content="<html><body><h1>Admin Panel Not Found</h1></body></html>",
             status_code=404
@@ -189,33 +256,37 @@ async def register_hospital(hospital_data: dict = Body(...)):
             
         raise HTTPException(status_code=500, detail="Failed to register hospital")
     except Exception as e:
-        print(f"Error registering hospital: {e}")
+        logger.error(f"Error registering hospital: {e}")
         raise HTTPException(status_code=500, detail=f"Error registering hospital: {str(e)}")
 
 @app.get("/api/hospitals/pending")
-async def get_pending_hospitals():
-    """Get all pending hospitals"""
+async def get_pending_hospitals(fields: Optional[str] = None):
+    """Get all pending hospitals (fields=id,name,... to project)"""
+    selected = parse_fields(fields)
     try:
         if supabase:
             result = supabase.table("hospitals").select("*").eq("status", "pending").execute()
-            return result.data if result.data else []
+            return list_response(result.data or [], selected, exclude=PRIVATE_HOSPITAL_FIELDS)
         else:
-            return [h for h in hospitals_storage if h.get("status") == "pending"]
+            return list_response([h for h in hospitals_storage if h.get("status") == "pending"], selected,
+                                 exclude=PRIVATE_HOSPITAL_FIELDS)
     except Exception as e:
-        print(f"Error fetching pending hospitals: {e}")
+        logger.error(f"Error fetching pending hospitals: {e}")
         return []
 
 @app.get("/api/hospitals/approved")
-async def get_approved_hospitals():
-    """Get all approved hospitals"""
+async def get_approved_hospitals(fields: Optional[str] = None):
+    """Get all approved hospitals (fields=id,name,... to project)"""
+    selected = parse_fields(fields)
     try:
         if supabase:
             result = supabase.table("hospitals").select("*").eq("status", "approved").execute()
-            return result.data if result.data else []
+            return list_response(result.data or [], selected, exclude=PRIVATE_HOSPITAL_FIELDS)
         else:
-            return [h for h in hospitals_storage if h.get("status") == "approved"]
+            return list_response([h for h in hospitals_storage if h.get("status") == "approved"], selected,
+                                 exclude=PRIVATE_HOSPITAL_FIELDS)
     except Exception as e:
-        print(f"Error fetching approved hospitals: {e}")
+        logger.error(f"Error fetching approved hospitals: {e}")
         return []
 
 @app.put("/api/hospitals/{hospital_id}/approve")
@@ -259,7 +330,7 @@ async def approve_hospital(hospital_id: int):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error approving hospital: {e}")
+        logger.error(f"Error approving hospital: {e}")
         raise HTTPException(status_code=500, detail=f"Error approving hospital: {str(e)}")
 
 # ============================================
@@ -307,8 +378,7 @@ async def register_user(user_data: dict):
         
         if supabase:
             # Check if user exists
-            existing = supabase.table("users").select("id").eq("mobile", user_data.get("mobile")).execute()
-            if existing.data:
+            if user_repo.mobile_taken(user_data.get("mobile")):
                 raise HTTPException(status_code=400, detail="User with this mobile number already exists")
             
             result = supabase.table("users").insert(user_record).execute()
@@ -344,7 +414,7 @@ async def register_user(user_data: dict):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error registering user: {e}")
+        logger.error(f"Error registering user: {e}")
         raise HTTPException(status_code=500, detail=f"Error registering user: {str(e)}")
 
 @app.post("/api/users/login")
@@ -399,7 +469,7 @@ async def login_user(credentials: dict):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error logging in user: {e}")
+        logger.error(f"Error logging in user: {e}")
         raise HTTPException(status_code=500, detail=f"Error logging in: {str(e)}")
 
 # ============================================
@@ -490,13 +560,23 @@ async def book_appointment(appointment_data: dict):
             "status": "confirmed" if payment_status == "completed" else "pending"
         }
         
+        # Re-check just before inserting; concurrent requests in any worker that
+        # still race to the same slot are stopped by the partial unique index on
+        # (hospital_id, appointment_date, appointment_time) and get a 409 below
+        is_safe, deadlock_msg = check_booking_deadlock(patient_mobile, hospital_id, date)
+        if not is_safe:
+            raise HTTPException(status_code=409, detail=deadlock_msg)
+        is_available, slot_msg = check_time_slot_availability(hospital_id, date, time)
+        if not is_available:
+            raise HTTPException(status_code=409, detail=slot_msg)
+        
         if supabase:
-            # Use transaction-like approach (check again before insert to prevent race condition)
-            is_available, slot_msg = check_time_slot_availability(hospital_id, date, time)
-            if not is_available:
-                raise HTTPException(status_code=409, detail=slot_msg)
-            
-            result = supabase.table("appointments").insert(appointment_record).execute()
+            try:
+                result = supabase.table("appointments").insert(appointment_record).execute()
+            except Exception as e:
+                if is_unique_violation(e):
+                    raise HTTPException(status_code=409, detail=f"Time slot {time} is already booked. Please choose another time.")
+                raise
             if result.data:
                 appointment = result.data[0]
                 return {
@@ -509,12 +589,12 @@ async def book_appointment(appointment_data: dict):
             appointment = {"id": appointment_id, **appointment_record, "created_at": datetime.now().isoformat()}
             appointments_storage.append(appointment)
             return {"id": appointment_id, "message": "Appointment booked successfully", "appointment": appointment}
-            
+        
         raise HTTPException(status_code=500, detail="Failed to book appointment")
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error booking appointment: {e}")
+        logger.error(f"Error booking appointment: {e}")
         raise HTTPException(status_code=500, detail=f"Error booking appointment: {str(e)}")
 
 # ============================================
@@ -601,13 +681,23 @@ async def book_operation(operation_data: dict):
             "status": "confirmed" if payment_status == "completed" else "pending"
         }
         
+        # Re-check just before inserting; concurrent requests in any worker that
+        # still race to the same slot are stopped by the partial unique index on
+        # (hospital_id, operation_date, operation_time) and get a 409 below
+        is_safe, deadlock_msg = check_booking_deadlock(patient_mobile, hospital_id, date)
+        if not is_safe:
+            raise HTTPException(status_code=409, detail=deadlock_msg)
+        is_available, slot_msg = check_time_slot_availability(hospital_id, date, time)
+        if not is_available:
+            raise HTTPException(status_code=409, detail=slot_msg)
+        
         if supabase:
-            # Double-check time slot before insert (prevent race condition)
-            is_available, slot_msg = check_time_slot_availability(hospital_id, date, time)
-            if not is_available:
-                raise HTTPException(status_code=409, detail=slot_msg)
-            
-            result = supabase.table("operations").insert(operation_record).execute()
+            try:
+                result = supabase.table("operations").insert(operation_record).execute()
+            except Exception as e:
+                if is_unique_violation(e):
+                    raise HTTPException(status_code=409, detail=f"Time slot {time} conflicts with an operation. Please choose another time.")
+                raise
             if result.data:
                 operation = result.data[0]
                 return {
@@ -620,12 +710,12 @@ async def book_operation(operation_data: dict):
             operation = {"id": operation_id, **operation_record, "created_at": datetime.now().isoformat()}
             operations_storage.append(operation)
             return {"id": operation_id, "message": "Operation booked successfully", "operation": operation}
-            
+        
         raise HTTPException(status_code=500, detail="Failed to book operation")
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error booking operation: {e}")
+        logger.error(f"Error booking operation: {e}")
         raise HTTPException(status_code=500, detail=f"Error booking operation: {str(e)}")
 
 # ============================================
@@ -678,76 +768,78 @@ async def admin_login(credentials: dict):
 # BOOKING VALIDATION & EDGE CASE HANDLING
 # ============================================
 
+def _slot_minutes(time: str) -> int:
+    """Convert a "HH:MM AM/PM" slot to minutes since midnight"""
+    time_parts = (time or "").split()
+    time_value = time_parts[0] if time_parts else "00:00"
+    am_pm = time_parts[1] if len(time_parts) > 1 else "AM"
+    
+    hour, minute = map(int, time_value.split(':'))
+    if am_pm.upper() == "PM" and hour != 12:
+        hour += 12
+    elif am_pm.upper() == "AM" and hour == 12:
+        hour = 0
+    return hour * 60 + minute
+
+def _within_30_minutes(requested: int, stored: str) -> bool:
+    """True if a stored slot is within 30 minutes; unparseable stored values are logged and skipped"""
+    try:
+        return abs(requested - _slot_minutes(stored)) < 30
+    except ValueError:
+        logger.warning(f"⚠️ Skipping unparseable stored slot time {stored!r}")
+        return False
+
 def check_time_slot_availability(hospital_id: int, date: str, time: str) -> Tuple[bool, str]:
     """
     Check if time slot is available (no conflicts)
+    Advisory only: the ±30 minute window and appointment/operation overlap are
+    checked here, but only the exact slot is enforced by the database (partial
+    unique indexes on hospital/date/time), so two workers can still book
+    overlapping but different times
     Returns: (is_available, error_message)
     """
+    try:
+        requested = _slot_minutes(time)
+    except ValueError:
+        return False, "Invalid time format. Use HH:MM AM/PM."
+    
     try:
         if not supabase:
-            return True, ""  # Skip validation if no database
-        
-        # Parse time
-        time_parts = time.split()
-        time_value = time_parts[0] if time_parts else "00:00"
-        am_pm = time_parts[1] if len(time_parts) > 1 else "AM"
-        
-        # Convert to 24-hour format for comparison
-        hour, minute = map(int, time_value.split(':'))
-        if am_pm.upper() == "PM" and hour != 12:
-            hour += 12
-        elif am_pm.upper() == "AM" and hour == 12:
-            hour = 0
+            # In-memory fallback: same ±30 minute rule against local storage
+            for apt in appointments_storage:
+                if apt.get("hospital_id") == hospital_id and apt.get("appointment_date") == date \
+                        and apt.get("status") != "cancelled" \
+                        and _within_30_minutes(requested, apt.get("appointment_time")):
+                    return False, f"Time slot {time} is already booked. Please choose another time."
+            for op in operations_storage:
+                if op.get("hospital_id") == hospital_id and op.get("operation_date") == date \
+                        and op.get("status") != "cancelled" \
+                        and _within_30_minutes(requested, op.get("operation_time")):
+                    return False, f"Time slot {time} conflicts with an operation. Please choose another time."
+            return True, ""
         
         # Check appointments for same hospital, date, and time slot (±30 minutes)
-        appointment_result = supabase.table("appointments").select("*").eq(
+        appointment_result = supabase.table("appointments").select("appointment_time").eq(
             "hospital_id", hospital_id
-        ).eq("appointment_date", date).execute()
+        ).eq("appointment_date", date).neq("status", "cancelled").execute()
         
-        if appointment_result.data:
-            for apt in appointment_result.data:
-                apt_time = apt.get("appointment_time", "")
-                apt_parts = apt_time.split()
-                apt_time_value = apt_parts[0] if apt_parts else "00:00"
-                apt_am_pm = apt_parts[1] if len(apt_parts) > 1 else "AM"
-                
-                apt_hour, apt_minute = map(int, apt_time_value.split(':'))
-                if apt_am_pm.upper() == "PM" and apt_hour != 12:
-                    apt_hour += 12
-                elif apt_am_pm.upper() == "AM" and apt_hour == 12:
-                    apt_hour = 0
-                
-                # Check if within 30 minutes (conflict)
-                time_diff = abs((hour * 60 + minute) - (apt_hour * 60 + apt_minute))
-                if time_diff < 30:
-                    return False, f"Time slot {time} is already booked. Please choose another time."
+        for apt in appointment_result.data or []:
+            if _within_30_minutes(requested, apt.get("appointment_time")):
+                return False, f"Time slot {time} is already booked. Please choose another time."
         
         # Check operations for same hospital, date, and time slot
-        operation_result = supabase.table("operations").select("*").eq(
+        operation_result = supabase.table("operations").select("operation_time").eq(
             "hospital_id", hospital_id
-        ).eq("operation_date", date).execute()
+        ).eq("operation_date", date).neq("status", "cancelled").execute()
         
-        if operation_result.data:
-            for op in operation_result.data:
-                op_time = op.get("operation_time", "")
-                op_parts = op_time.split()
-                op_time_value = op_parts[0] if op_parts else "00:00"
-                op_am_pm = op_parts[1] if len(op_parts) > 1 else "AM"
-                
-                op_hour, op_minute = map(int, op_time_value.split(':'))
-                if op_am_pm.upper() == "PM" and op_hour != 12:
-                    op_hour += 12
-                elif op_am_pm.upper() == "AM" and op_hour == 12:
-                    op_hour = 0
-                
-                time_diff = abs((hour * 60 + minute) - (op_hour * 60 + op_minute))
-                if time_diff < 30:
-                    return False, f"Time slot {time} conflicts with an operation. Please choose another time."
+        for op in operation_result.data or []:
+            if _within_30_minutes(requested, op.get("operation_time")):
+                return False, f"Time slot {time} conflicts with an operation. Please choose another time."
         
         return True, ""
     except Exception as e:
-        print(f"Error checking time slot: {e}")
-        return True, ""  # Allow booking if check fails (fail open)
+        logger.error(f"Error checking time slot: {e}")
+        return False, "Unable to verify time slot availability. Please try again."  # Fail closed
 
 def verify_payment_before_booking(order_id: str) -> Tuple[bool, str]:
     """
@@ -771,7 +863,7 @@ def verify_payment_before_booking(order_id: str) -> Tuple[bool, str]:
         
         return True, ""
     except Exception as e:
-        print(f"Error verifying payment: {e}")
+        logger.error(f"Error verifying payment: {e}")
         return False, "Payment verification failed. Please try again."
 
 def check_booking_deadlock(patient_mobile: str, hospital_id: int, date: str) -> Tuple[bool, str]:
@@ -781,41 +873,59 @@ def check_booking_deadlock(patient_mobile: str, hospital_id: int, date: str) ->
     """
     try:
         if not supabase:
+            for apt in appointments_storage:
+                if apt.get("patient_mobile") == patient_mobile and apt.get("hospital_id") == hospital_id \
+                        and apt.get("appointment_date") == date and apt.get("status") == "pending":
+                    return False, "You already have a pending appointment for this date. Please complete or cancel it first."
             return True, ""
         
         # Check for pending bookings for same patient, hospital, date
-        appointment_result = supabase.table("appointments").select("*").eq(
+        appointment_result = supabase.table("appointments").select("id").eq(
             "patient_mobile", patient_mobile
         ).eq("hospital_id", hospital_id).eq("appointment_date", date).eq(
             "status", "pending"
-        ).execute()
+        ).limit(1).execute()
         
-        if appointment_result.data and len(appointment_result.data) > 0:
+        if appointment_result.data:
             return False, "You already have a pending appointment for this date. Please complete or cancel it first."
         
         # Check for pending operations
-        operation_result = supabase.table("operations").select("*").eq(
+        operation_result = supabase.table("operations").select("id").eq(
             "patient_mobile", patient_mobile
         ).eq("hospital_id", hospital_id).eq("operation_date", date).eq(
             "status", "pending"
-        ).execute()
+        ).limit(1).execute()
         
-        if operation_result.data and len(operation_result.data) > 0:
+        if operation_result.data:
             return False, "You already have a pending operation for this date. Please complete or cancel it first."
         
         return True, ""
     except Exception as e:
-        print(f"Error checking deadlock: {e}")
-        return True, ""  # Fail open
+        logger.error(f"Error checking deadlock: {e}")
+        return False, "Unable to verify existing bookings. Please try again."  # Fail closed
 
 # ============================================
 # CITY AUTOCOMPLETE ENDPOINTS WITH CACHING
 # ============================================
 
-# In-memory cache for city searches
-city_search_cache = {}
-CACHE_TTL = 3600  # Cache for 1 hour
-cache_timestamps = {}
+# Prefix index over the full active cities table (loaded at startup)
+city_index = CityIndex()
+
+# Bounded caches for city searches (used only until the index is loaded),
+# popular cities and doctor searches
+city_search_cache = LRUCache(
+    "city_search",
+    maxsize=config.SEARCH_CACHE_MAX_SIZE,
+    ttl=config.CITY_CACHE_TTL,
+    negative_ttl=config.SEARCH_CACHE_NEGATIVE_TTL
+)
+popular_cities_cache = LRUCache("popular_cities", maxsize=1, ttl=config.CITY_CACHE_TTL)
+doctor_search_cache = LRUCache(
+    "doctor_search",
+    maxsize=config.SEARCH_CACHE_MAX_SIZE,
+    ttl=config.DOCTOR_SEARCH_CACHE_TTL,
+    negative_ttl=config.SEARCH_CACHE_NEGATIVE_TTL
+)
 
 # Popular Indian cities for autocomplete
 POPULAR_CITIES = [
@@ -852,31 +962,6 @@ ALL_CITIES = POPULAR_CITIES + [
     "Puttur", "Madanapalle", "Punganur", "Palamaner", "Kuppam", "Bangarupalem"
 ]
 
-def get_cached_cities(query: str) -> Optional[List[dict]]:
-    """Get cities from cache if available and not expired"""
-    cache_key = query.lower()
-    if cache_key in city_search_cache:
-        # Check if cache is still valid
-        if cache_key in cache_timestamps:
-            age = (datetime.now() - cache_timestamps[cache_key]).total_seconds()
-            if age < CACHE_TTL:
-                print(f"✅ Cache HIT for query: '{query}' (age: {age:.1f}s)")
-                return city_search_cache[cache_key]
-            else:
-                # Cache expired, remove it
-                del city_search_cache[cache_key]
-                del cache_timestamps[cache_key]
-                print(f"⏰ Cache EXPIRED for query: '{query}'")
-    print(f"❌ Cache MISS for query: '{query}'")
-    return None
-
-def set_cached_cities(query: str, cities: List[dict]):
-    """Store cities in cache with timestamp"""
-    cache_key = query.lower()
-    city_search_cache[cache_key] = cities
-    cache_timestamps[cache_key] = datetime.now()
-    print(f"💾 Cached results for query: '{query}' ({len(cities)} cities)")
-
 def query_city_database(query: str) -> List[dict]:
     """
     Query the Supabase database for cities with state information
@@ -899,16 +984,12 @@ def query_city_database(query: str) -> List[dict]:
                     }
                     for city in result.data
                 ]
-                print(f"📊 Found {len(cities_list)} cities in database for query: '{query}'")
+                logger.debug("📊 Found %d cities in database for query: %r", len(cities_list), query)
         except Exception as e:
-            print(f"⚠️ Error querying database: {e}")
+            logger.warning(f"⚠️ Error querying database: {e}")
     
     # Sort by relevance (exact match first, then starts with, then contains)
-    cities_list.sort(key=lambda x: (
-        0 if x["city_name"].lower().startswith(query.lower()) else 1,
-        x["city_name"].lower().index(query.lower()) if query.lower() in x["city_name"].lower() else 999,
-        len(x["city_name"])
-    ))
+    cities_list.sort(key=lambda x: city_relevance_key(x["city_name"], query.lower()))
     
     # Return top 20 matches
     return cities_list[:20]
@@ -918,8 +999,8 @@ async def search_cities(q: str = ""):
     """
     Search cities dynamically based on query
     Returns cities with state_name for auto-filling state field
-    Flow: Cache → Database (from CSV import)
-    Uses caching for fast and reliable search
+    Flow: In-memory index → Cache → Database (from CSV import)
+    The index holds every active city, so the database is only hit before it loads
     Powered by city data imported from CSV
     """
     try:
@@ -927,94 +1008,100 @@ async def search_cities(q: str = ""):
         if len(query) < 2:
             return {"cities": [], "source": "empty_query"}
         
-        # Step 1: Check cache
-        cached_results = get_cached_cities(query)
-        if cached_results is not None:
+        if city_index.ready:
             return {
-                "cities": cached_results,
-                "source": "cache",
+                "cities": city_index.search(query),
+                "source": "index",
                 "cached": True
             }
         
-        # Step 2: Cache miss - query database
-        print(f"🔍 Querying database for: '{query}'")
-        matching_cities = query_city_database(query)
+        # Cache → database (concurrent misses for one query share a single lookup;
+        # empty results are cached briefly as negatives)
+        loaded = []
         
-        # Step 3: Store in cache
-        if matching_cities:
-            set_cached_cities(query, matching_cities)
+        def load():
+            loaded.append(True)
+            return query_city_database(query) or None
         
-        # Step 4: Return results
+        matching_cities = city_search_cache.get_or_load(query, load) or []
         return {
             "cities": matching_cities,
-            "source": "database",
-            "cached": False
+            "source": "database" if loaded else "cache",
+            "cached": not loaded
         }
     except Exception as e:
-        print(f"Error searching cities: {e}")
+        logger.error(f"Error searching cities: {e}")
         return {"cities": [], "source": "error", "error": str(e)}
 
 @app.get("/api/cities/popular")
 async def get_popular_cities():
     """Get popular cities (cached)"""
     try:
-        cache_key = "popular"
-        cached = get_cached_cities(cache_key)
-        if cached:
-            return {"cities": cached, "source": "cache", "cached": True}
-        
-        # Try to get from database first
-        popular = POPULAR_CITIES[:15]
-        if supabase:
-            try:
-                result = supabase.table("cities").select("city_name").eq(
-                    "is_active", True
-                ).limit(15).execute()
-                if result.data:
-                    popular = [city["city_name"] for city in result.data[:15]]
-            except Exception as e:
-                print(f"⚠️ Error fetching popular cities from DB: {e}")
-        
-        set_cached_cities(cache_key, popular)
-        return {"cities": popular, "source": "database", "cached": False}
+        loaded = []
+        
+        def load():
+            loaded.append(True)
+            # Try to get from database first
+            popular = POPULAR_CITIES[:15]
+            if supabase:
+                try:
+                    result = supabase.table("cities").select("city_name").eq(
+                        "is_active", True
+                    ).limit(15).execute()
+                    if result.data:
+                        popular = [city["city_name"] for city in result.data[:15]]
+                except Exception as e:
+                    logger.warning(f"⚠️ Error fetching popular cities from DB: {e}")
+            return popular
+        
+        popular = popular_cities_cache.get_or_load("popular", load)
+        return {
+            "cities": popular,
+            "source": "database" if loaded else "cache",
+            "cached": not loaded
+        }
     except Exception as e:
-        print(f"Error getting popular cities: {e}")
+        logger.error(f"Error getting popular cities: {e}")
         return {"cities": POPULAR_CITIES[:10], "source": "fallback"}
 
 # ============================================
 # DOCTOR ENDPOINTS (for Pharma Professionals)
 # ============================================
 
+# Trigram index of active doctors (loaded at startup)
+doctor_index = DoctorIndex()
+
 @app.get("/api/doctors/search")
 async def search_doctors(q: str = "", hospital_id: Optional[int] = None):
-    """Search doctors dynamically based on query"""
+    """Search doctors dynamically based on query (fuzzy, typo-tolerant once the index is loaded)"""
     try:
         query = q.strip().lower()
         if len(query) < 2:
             return {"doctors": []}
         
+        if doctor_index.ready:
+            return {"doctors": doctor_index.search(query, hospital_id)}
+        
         if not supabase:
             return {"doctors": []}
         
-        # Build query
-        doctor_query = supabase.table("doctors").select("*").ilike(
-            "doctor_name", f"%{query}%"
-        ).eq("is_active", True)
-        
-        # Filter by hospital if provided
-        if hospital_id:
-            doctor_query = doctor_query.eq("hospital_id", hospital_id)
-        
-        result = doctor_query.limit(20).execute()
-        
-        doctors = []
-        if result.data:
-            doctors = result.data
-            print(f"📊 Found {len(doctors)} doctors for query: '{query}'")
+        def load():
+            # Build query
+            doctor_query = supabase.table("doctors").select("*").ilike(
+                "doctor_name", f"%{query}%"
+            ).eq("is_active", True)
+            
+            # Filter by hospital if provided
+            if hospital_id:
+                doctor_query = doctor_query.eq("hospital_id", hospital_id)
+            
+            result = doctor_query.limit(20).execute()
+            return result.data or None
         
+        doctors = doctor_search_cache.get_or_load((query, hospital_id), load) or []
         return {"doctors": doctors}
     except Exception as e:
-        print(f"Error searching doctors: {e}")
+        logger.error(f"Error searching doctors: {e}")
         return {"doctors": []}
 
 @app.post("/api/doctors/add")
@@ -1061,7 +1148,10 @@ async def add_new_doctor(doctor_data: dict = Body(...)):
         result = supabase.table("doctors").insert(new_doctor).execute()
         
         if result.data:
-            print(f"✅ New doctor added: {doctor_name} (ID: {result.data[0]['id']})")
+            # New doctor must show up in searches immediately
+            doctor_index.add(result.data[0])
+            doctor_search_cache.clear()
+            logger.info(f"✅ New doctor added: {doctor_name} (ID: {result.data[0]['id']})")
             return {
                 "message": "Doctor added successfully",
                 "doctor_name": doctor_name,
@@ -1073,7 +1163,7 @@ async def add_new_doctor(doctor_data: dict = Body(...)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error adding doctor: {e}")
+        logger.error(f"Error adding doctor: {e}")
         raise HTTPException(status_code=500, detail=f"Error adding doctor: {str(e)}")
 
 @app.post("/api/cities/add")
@@ -1113,14 +1203,15 @@ async def add_new_city(city_data: dict = Body(...)):
         result = supabase.table("cities").insert(new_city).execute()
         
         if result.data:
-            # Clear cache for this city name to refresh results
-            cache_key = city_name.lower()
-            if cache_key in city_search_cache:
-                del city_search_cache[cache_key]
-                if cache_key in cache_timestamps:
-                    del cache_timestamps[cache_key]
+            city_index.add({
+                "city_name": city_name,
+                "state_name": new_city["state_name"] or ""
+            })
+            
+            # Any cached query (including cached empty results) may now match
+            city_search_cache.clear()
             
-            print(f"✅ New city added: {city_name} (ID: {result.data[0]['id']})")
+            logger.info(f"✅ New city added: {city_name} (ID: {result.data[0]['id']})")
             return {
                 "message": "City added successfully",
                 "city_name": city_name,
@@ -1132,9 +1223,20 @@ async def add_new_city(city_data: dict = Body(...)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error adding city: {e}")
+        logger.error(f"Error adding city: {e}")
         raise HTTPException(status_code=500, detail=f"Error adding city: {str(e)}")
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Search cache and city index statistics"""
+    return {
+        "city_index": city_index.stats(),
+        "doctor_index": doctor_index.stats(),
+        "city_search": city_search_cache.stats(),
+        "popular_cities": popular_cities_cache.stats(),
+        "doctor_search": doctor_search_cache.stats()
+    }
+
 # ============================================
 # PAYMENT ENDPOINTS
 # ============================================
@@ -1143,8 +1245,6 @@ async def add_new_city(city_data: dict = Body(...)):
 async def create_payment_order(payment_data: dict = Body(...)):
     """Create a payment order for appointments, operations, or hospital registration"""
     try:
-        print(f"[Mobile] Payment order request received: {payment_data}")
-        
         payment_type = payment_data.get("type")
         hospital_id = payment_data.get("hospital_id", 0)
         patient_name = payment_data.get("patient_name", "")
@@ -1152,24 +1252,23 @@ async def create_payment_order(payment_data: dict = Body(...)):
         
         # Ensure amount is converted to float (handles int from mobile app)
         amount_raw = payment_data.get("amount", 0)
-        print(f"[Mobile] Amount raw type: {type(amount_raw)}, value: {amount_raw}")
         
         if isinstance(amount_raw, (int, float, str)):
             amount = float(amount_raw)
         else:
             amount = 0.0
         
-        print(f"[Mobile] Amount converted to float: {amount} (type: {type(amount)})")
+        logger.debug("Payment order request: type=%s hospital_id=%s amount=%s (raw %s %r)",
+                     payment_type, hospital_id, amount, type(amount_raw).__name__, amount_raw)
         
         metadata = payment_data.get("metadata", {})
         
         if not payment_type or amount <= 0:
-            print(f"[Mobile] Validation failed: payment_type={payment_type}, amount={amount}")
+            logger.info("Payment order rejected: payment_type=%s amount=%s", payment_type, amount)
             raise HTTPException(status_code=400, detail="Invalid payment data")
         
         # Use PaymentGateway to create order
-        payment_gateway = PaymentGateway()
-        order_response = payment_gateway.create_order(
+        order_response = await PaymentGateway.create_order_async(
             amount=amount,
             currency="INR",
             receipt=f"{payment_type}_{int(datetime.now().timestamp())}",
@@ -1206,7 +1305,7 @@ async def create_payment_order(payment_data: dict = Body(...)):
             try:
                 supabase.table("payments").insert(payment_record).execute()
             except Exception as e:
-                print(f"Warning: Could not store payment order in database: {e}")
+                logger.warning(f"⚠️ Could not store payment order in database: {e}")
         
         # Ensure all numeric values are returned as float for mobile app compatibility
         response = {
@@ -1216,14 +1315,12 @@ async def create_payment_order(payment_data: dict = Body(...)):
             "status": "created",
             "message": "Payment order created successfully"
         }
-        print(f"[Mobile] Payment order created successfully: {response}")
+        logger.info("✅ Payment order created: order_id=%s type=%s amount=%s", response["order_id"], payment_type, amount)
         return response
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Mobile] Error creating payment order: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Error creating payment order: {e}")
         raise HTTPException(status_code=500, detail=f"Error creating payment order: {str(e)}")
 
 @app.post("/api/payments/verify")
@@ -1252,12 +1349,13 @@ async def verify_payment(verification_data: dict = Body(...)):
                 "status": "paid",
                 "paid_at": datetime.now().isoformat()
             }).eq("order_id", order_id).execute()
+            notify_payment_changed(order_id=order_id)
         
         return {"verified": is_verified}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error verifying payment: {e}")
+        logger.error(f"Error verifying payment: {e}")
         raise HTTPException(status_code=500, detail=f"Error verifying payment: {str(e)}")
 
 @app.get("/api/payments/status/{order_id}")
@@ -1272,19 +1370,51 @@ async def get_payment_status(order_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error getting payment status: {e}")
+        logger.error(f"Error getting payment status: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting payment status: {str(e)}")
+
+@app.get("/api/payments/status/{order_id}/wait")
+async def wait_for_payment_status(order_id: str, known_status: Optional[str] = None,
+                                  timeout: Optional[float] = None):
+    """
+    Long-poll payment status by order ID: returns once the status differs from
+    known_status (default: the current status) or after timeout seconds
+    """
+    try:
+        if not supabase:
+            raise HTTPException(status_code=404, detail="Payment order not found")
+        
+        def load():
+            result = supabase.table("payments").select("*").eq("order_id", order_id).execute()
+            return result.data[0] if result.data else None
+        
+        payment = await wait_for_status_change(
+            load,
+            known_status=known_status,
+            timeout=clamp_timeout(timeout),
+            final_statuses=["paid", "refunded"],
+            order_id=order_id
+        )
+        if not payment:
+            raise HTTPException(status_code=404, detail="Payment order not found")
+        return payment
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error waiting for payment status: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting payment status: {str(e)}")
 
 @app.get("/api/payments/history/{patient_mobile}")
-async def get_payment_history(patient_mobile: str):
-    """Get payment history for a patient"""
+async def get_payment_history(patient_mobile: str, fields: Optional[str] = None):
+    """Get payment history for a patient (fields=id,status,... to project)"""
+    selected = parse_fields(fields)
     try:
         if supabase:
             result = supabase.table("payments").select("*").eq("patient_mobile", patient_mobile).order("created_at", desc=True).execute()
-            return {"payments": result.data if result.data else []}
+            return {"payments": project_rows(result.data or [], selected)}
         return {"payments": []}
     except Exception as e:
-        print(f"Error getting payment history: {e}")
+        logger.error(f"Error getting payment history: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting payment history: {str(e)}")
 
 @app.post("/api/payments/refund")
@@ -1298,11 +1428,11 @@ async def process_refund(refund_data: dict = Body(...)):
         if not payment_id:
             raise HTTPException(status_code=400, detail="Payment ID is required")
         
-        payment_gateway = PaymentGateway()
-        refund_result = payment_gateway.create_refund(
+        refund_result = await PaymentGateway.create_refund_async(
             payment_id=payment_id,
             amount=amount,
-            notes={"reason": reason} if reason else None
+            notes={"reason": reason} if reason else None,
+            idempotency_key=refund_data.get("idempotency_key")
         )
         
         if refund_result and supabase:
@@ -1324,39 +1454,76 @@ async def process_refund(refund_data: dict = Body(...)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error processing refund: {e}")
+        logger.error(f"Error processing refund: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing refund: {str(e)}")
 
 # ============================================
 # HEALTH CHECK
 # ============================================
 
+# Dependencies are checked in the background; probes read the snapshot
+health_monitor = HealthMonitor(
+    "mobile",
+    interval=config.HEALTH_CHECK_INTERVAL,
+    timeout=config.HEALTH_CHECK_TIMEOUT,
+    stale_after=config.HEALTH_STALE_AFTER
+)
+health_monitor.add_check("database", supabase_check(lambda: supabase))
+
+
+def index_check(index) -> HealthCheck:
+    """Search index stats; failing while Supabase is configured but the index never loaded"""
+    def check():
+        stats = index.stats()
+        if supabase and not stats["ready"]:
+            raise RuntimeError("index not loaded")
+        return stats
+    return check
+
+
+health_monitor.add_check("city_index", index_check(city_index), critical=False)
+health_monitor.add_check("doctor_index", index_check(doctor_index), critical=False)
+health_monitor.add_check("payment_waiters", get_waiter_stats, critical=False)
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is serving requests (no dependency checks)"""
+    return health_monitor.liveness()
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: last background check of the database and search indexes"""
+    readiness = health_monitor.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    try:
-        if supabase:
-            # Test database connection
-            supabase.table("hospitals").select("id").limit(1).execute()
-            return {
-                "status": "ok",
-                "message": "Server is running",
-                "database": "connected",
-                "supabase_url": SUPABASE_URL[:30] + "..." if SUPABASE_URL else None
-            }
-        else:
-            return {
-                "status": "ok",
-                "message": "Server is running",
-                "database": "in-memory (Supabase not configured)"
-            }
-    except Exception as e:
+    """Health check endpoint (reads the background-refreshed database status)"""
+    if not supabase:
+        return {
+            "status": "ok",
+            "message": "Server is running",
+            "database": "in-memory (Supabase not configured)"
+        }
+    database = health_monitor.component("database")
+    if database is None:
+        return {"status": "ok", "message": "Server is running", "database": "checking"}
+    if database["ok"]:
         return {
             "status": "ok",
             "message": "Server is running",
-            "database": "error",
-            "error": str(e)
+            "database": "connected",
+            "supabase_url": SUPABASE_URL[:30] + "..." if SUPABASE_URL else None
         }
+    return {
+        "status": "ok",
+        "message": "Server is running",
+        "database": "error",
+        "error": database.get("error")
+    }
 
 # ============================================
 # MAIN
@@ -32,6 +32,19 @@ import config_web
 sys.modules['config'] = config_web
 import config
 
+# Queued, non-blocking structured logging (before anything logs)
+import logging
+from services.log_pipeline import configure_logging
+configure_logging(
+    "web",
+    level=config.LOG_LEVEL,
+    fmt=config.LOG_FORMAT,
+    levels=config.LOG_LEVELS,
+    debug_sample_rate=config.LOG_DEBUG_SAMPLE_RATE,
+    queue_size=config.LOG_QUEUE_SIZE
+)
+logger = logging.getLogger(__name__)
+
 # Import error monitoring and audit logging
 # Note: Sentry initializes automatically when error_monitoring module is imported
 from services.error_monitoring import capture_exception, log_error_with_context
@@ -44,28 +57,77 @@ from database import init_db, get_supabase
 from routers import users, hospitals, appointments, operations, payments, admin, whatsapp_logs
 
 # Import scheduler service
-from services.scheduler_service import start_scheduler, shutdown_scheduler
+from services.scheduler_service import start_scheduler, shutdown_scheduler, get_scheduler_status
+from services.whatsapp_service import get_session_stats as get_whatsapp_session_stats
+from services.health import HealthMonitor, supabase_check
+from services.worker_role import start_primary_election, stop_primary_election, get_role_stats
+from services.whatsapp_outbox import get_outbox_stats
+from services.request_metrics import configure_request_metrics, instrument_supabase
+from services.query_trace import configure_query_tracing
+
+# Pooled Razorpay HTTP clients and SMTP sessions (closed on shutdown)
+from services.razorpay_client import close_clients as close_razorpay_clients
+from services.email_service import close_smtp_connections
+from services.appointment_export import flush_exports
+from services.responses import json_response_class, configure_response_pipeline
+
+# Razorpay webhook queue and worker pool
+from services.webhook_queue import start_webhook_workers, stop_webhook_workers, get_webhook_pool
+from services.razorpay_service import RazorpayService
 
 # Lifespan context manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    print("🚀 Starting Web Server...")
+    logger.info("🚀 Starting Web Server...")
     init_db()
-    start_scheduler()
+    # Scheduler (and WhatsApp sessions) run in one worker only; see services.worker_role
+    start_primary_election(config.PRIMARY_LOCK_PATH, start_scheduler, config.PRIMARY_LOCK_RETRY_SECONDS)
+    if config.WEBHOOK_QUEUE_ENABLED:
+        start_webhook_workers(
+            config.WEBHOOK_QUEUE_PATH,
+            RazorpayService.process_queued_webhook,
+            workers=config.WEBHOOK_QUEUE_WORKERS,
+            max_attempts=config.WEBHOOK_QUEUE_MAX_ATTEMPTS,
+            retention_seconds=config.WEBHOOK_QUEUE_RETENTION_DAYS * 86400
+        )
+    health_monitor.start()
     yield
     # Shutdown
-    print("🛑 Shutting down Web Server...")
+    logger.info("🛑 Shutting down Web Server...")
+    health_monitor.stop()
     shutdown_scheduler()
+    stop_primary_election()
+    await stop_webhook_workers()
+    await close_razorpay_clients()
+    await close_smtp_connections()
+    flush_exports()
 
 # Create FastAPI app
 app = FastAPI(
     title="Hospital Booking System - Web API",
     description="Web interface and API for Hospital Booking System",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=json_response_class()
 )
 
+# Response compression (gzip/brotli above RESPONSE_COMPRESSION_MIN_SIZE)
+configure_response_pipeline(app)
+
+# Per-request Supabase query tracing with N+1 detection (inside the metrics middleware)
+configure_query_tracing(
+    app,
+    enabled=config.QUERY_TRACE_ENABLED,
+    threshold=config.QUERY_TRACE_N_PLUS_ONE_THRESHOLD,
+    log_all=config.QUERY_TRACE_LOG_ALL,
+    response_header=config.QUERY_TRACE_RESPONSE_HEADER
+)
+
+# Per-route latency/size/Supabase-call metrics and GET /metrics
+configure_request_metrics(app, "web", enabled=config.METRICS_ENABLED)
+instrument_supabase(get_supabase())
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -97,36 +159,59 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": "Internal server error. Error has been logged."}
     )
 
+# Health checks: dependencies are checked in the background, probes read the snapshot
+health_monitor = HealthMonitor(
+    "web",
+    interval=config.HEALTH_CHECK_INTERVAL,
+    timeout=config.HEALTH_CHECK_TIMEOUT,
+    stale_after=config.HEALTH_STALE_AFTER
+)
+health_monitor.add_check("database", supabase_check(get_supabase))
+health_monitor.add_check("scheduler", get_scheduler_status, critical=False)
+health_monitor.add_check("whatsapp", get_whatsapp_session_stats, critical=False)
+health_monitor.add_check("whatsapp_outbox", get_outbox_stats, critical=False)
+health_monitor.add_check("worker", get_role_stats, critical=False)
+health_monitor.add_check(
+    "webhook_queue",
+    lambda: get_webhook_pool().stats() if get_webhook_pool() else {"running": False},
+    critical=False
+)
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is serving requests (no dependency checks)"""
+    return health_monitor.liveness()
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: last background check of the database, scheduler, WhatsApp sessions and webhook queue"""
+    readiness = health_monitor.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    try:
-        supabase = get_supabase()
-        if supabase:
-            # Test database connection
-            supabase.table("hospitals").select("id").limit(1).execute()
-            return {
-                "status": "healthy",
-                "database": "connected",
-                "service": "web"
-            }
-        else:
-            return {
-                "status": "healthy",
-                "database": "not_configured",
-                "service": "web"
-            }
-    except Exception as e:
-        return JSONResponse(
-            status_code=503,
-            content={
-                "status": "unhealthy",
-                "database": "error",
-                "error": str(e),
-                "service": "web"
-            }
-        )
+    """Health check endpoint (reads the background-refreshed database status)"""
+    readiness = health_monitor.readiness()
+    database = health_monitor.component("database") or {}
+    if readiness["ready"] or readiness["status"] == "starting":
+        return {
+            "status": "healthy",
+            "database": database.get("database", "checking"),
+            "service": "web"
+        }
+    return JSONResponse(
+        status_code=503,
+        content={
+            "status": "unhealthy",
+            "database": "error" if not database.get("ok", True) else database.get("database"),
+            "error": database.get("error"),
+            "service": "web"
+        }
+    )
 
 # Note: React frontend is served separately on port 5173 (Vite dev server)
 # This server only handles API requests
@@ -138,5 +223,5 @@ if __name__ == "__main__":
         "server_web:app",
         host=config.SERVER_HOST,
         port=config.SERVER_PORT,
-        reload=True
+        reload=config.SERVER_RELOAD
     )
\ No newline at end of file
@@ -0,0 +1,310 @@
+"""
+Appointment Export
+Bookings are buffered in memory and appended in batches to per-hospital,
+per-day CSV files (appointment_exports/hospital_{id}/appointments_{day}.csv)
+under an exclusive file lock, so several server processes can share the
+directory. With several workers (config.SERVER_WORKERS > 1) each row is
+appended as soon as it is recorded: a buffer is per process, and an admin
+listing served by one worker could not flush the others. Closed days can be
+compacted to compressed Parquet when pyarrow is installed. Admin downloads
+stream straight from Supabase pages instead of reading the files.
+"""
+import csv
+import io
+import os
+import re
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+from services.metrics import counter
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+EXPORT_DIR = Path(__file__).parent.parent / "appointment_exports"
+
+# Same columns (and order) as the original hospital_{id}_appointments.csv
+FILE_COLUMNS = ["name", "mobile", "date", "time_slot", "doctor", "specialty", "followup_date"]
+STREAM_COLUMNS = ["appointment_id", "name", "mobile", "date", "time_slot", "doctor",
+                  "status", "followup_date", "created_at"]
+
+_DAY_FILE = re.compile(r"^appointments_(\d{4}-\d{2}-\d{2})\.(csv|parquet)$")
+
+_rows_written = counter("appointment_export_rows_total", "Booking rows written to export files", ["result"])
+_rows_streamed = counter("appointment_export_streamed_rows_total", "Rows streamed by admin exports")
+
+
+def normalize_mobile(mobile: str) -> str:
+    """Mobile number with +91 prefix"""
+    mobile = (mobile or "").strip().replace(" ", "").replace("-", "")
+    if not mobile or mobile.startswith("+91"):
+        return mobile
+    if mobile.startswith("91") and len(mobile) == 12:
+        return "+" + mobile
+    if mobile.startswith("0"):
+        return "+91" + mobile[1:]
+    return "+91" + mobile
+
+
+def hospital_dir(hospital_id: int) -> Path:
+    return EXPORT_DIR / f"hospital_{int(hospital_id)}"
+
+
+def day_file(hospital_id: int, day: str, extension: str = "csv") -> Path:
+    return hospital_dir(hospital_id) / f"appointments_{day}.{extension}"
+
+
+def _append_rows(path: Path, rows: List[List[str]]):
+    """Append rows to a day file, writing the header if the file is new (exclusive lock held)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", newline="", encoding="utf-8") as file:
+        if fcntl:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            # Checked under the lock: another process may have just created the file
+            file.seek(0, os.SEEK_END)
+            writer = csv.writer(file)
+            if file.tell() == 0:
+                writer.writerow(FILE_COLUMNS)
+            writer.writerows(rows)
+            file.flush()
+        finally:
+            if fcntl:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class ExportBuffer:
+    """
+    Rows waiting to be written, grouped by (hospital, day). Flushed when
+    max_rows are pending, flush_interval seconds after the first buffered
+    row, and on shutdown.
+    """
+
+    def __init__(self, max_rows: int = 500, flush_interval: float = 5):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[int, str], List[List[str]]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # One writer at a time per process
+        self._timer: Optional[threading.Timer] = None
+
+    def add(self, hospital_id: int, row: List[str], day: Optional[str] = None):
+        day = day or date.today().isoformat()
+        with self._lock:
+            self._pending.setdefault((hospital_id, day), []).append(row)
+            self._count += 1
+            full = self._count >= self.max_rows
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write all pending rows; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._count = self._pending, {}, 0
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            written = 0
+            for (hospital_id, day), rows in pending.items():
+                try:
+                    _append_rows(day_file(hospital_id, day), rows)
+                    written += len(rows)
+                    _rows_written.inc(len(rows), result="written")
+                except Exception as e:
+                    logger.error(f"❌ Error writing {len(rows)} export row(s) for hospital {hospital_id}: {e}")
+                    _rows_written.inc(len(rows), result="error")
+            return written
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._count
+
+
+_buffer = ExportBuffer(
+    max_rows=1 if config.SERVER_WORKERS > 1 else config.EXPORT_BUFFER_MAX_ROWS,
+    flush_interval=config.EXPORT_FLUSH_INTERVAL
+)
+
+
+def record_appointment(hospital_id: int, appointment_data: Dict[str, Any]):
+    """
+    Buffer one booking for the hospital's export file for today
+
+    Args:
+        hospital_id: Hospital ID
+        appointment_data: name, mobile, date, time_slot, doctor, specialty, followup_date
+    """
+    row = [
+        appointment_data.get("name") or "",
+        normalize_mobile(appointment_data.get("mobile") or ""),
+        appointment_data.get("date") or "",
+        appointment_data.get("time_slot") or "",
+        appointment_data.get("doctor") or "",
+        appointment_data.get("specialty") or "",
+        appointment_data.get("followup_date") or ""
+    ]
+    _buffer.add(hospital_id, row)
+
+
+def flush_exports() -> int:
+    """Write buffered rows now (shutdown, before listing files)"""
+    return _buffer.flush()
+
+
+def compact_day_files(before_day: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Convert closed day CSVs (days before before_day, default today) to
+    zstd-compressed Parquet and remove the CSV. No-op unless
+    EXPORT_COLUMNAR_FORMAT is "parquet" and pyarrow is installed.
+    """
+    if config.EXPORT_COLUMNAR_FORMAT != "parquet":
+        return {"compacted": 0, "skipped": "disabled"}
+    if not PARQUET_AVAILABLE:
+        logger.warning("⚠️ EXPORT_COLUMNAR_FORMAT=parquet but pyarrow is not installed; keeping CSV exports")
+        return {"compacted": 0, "skipped": "pyarrow not installed"}
+
+    before_day = before_day or date.today().isoformat()
+    compacted, errors = 0, []
+    # Columns are read as text so values round-trip exactly as written
+    convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in FILE_COLUMNS})
+    for path in sorted(EXPORT_DIR.glob("hospital_*/appointments_*.csv")):
+        match = _DAY_FILE.match(path.name)
+        if not match or match.group(1) >= before_day:
+            continue
+        target = path.with_suffix(".parquet")
+        try:
+            with open(path, "rb") as file:
+                if fcntl:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+                table = pa_csv.read_csv(file, convert_options=convert_options)
+                if target.exists():
+                    # Late rows for a day that was already compacted
+                    table = pa.concat_tables([pa_parquet.read_table(target), table])
+                tmp = target.with_suffix(".parquet.tmp")
+                pa_parquet.write_table(table, tmp, compression="zstd")
+                os.replace(tmp, target)
+                path.unlink()
+            compacted += 1
+        except Exception as e:
+            logger.error(f"❌ Error compacting {path}: {e}")
+            errors.append(f"{path.name}: {e}")
+    if compacted:
+        logger.info(f"✅ Compacted {compacted} appointment export file(s) to Parquet")
+    return {"compacted": compacted, "errors": errors}
+
+
+def list_export_files(hospital_id: int) -> List[Dict[str, Any]]:
+    """Day files written for a hospital, newest first"""
+    directory = hospital_dir(hospital_id)
+    if not directory.is_dir():
+        return []
+    files = []
+    for path in directory.iterdir():
+        match = _DAY_FILE.match(path.name)
+        if match:
+            stat = path.stat()
+            files.append({"name": path.name, "day": match.group(1), "format": match.group(2),
+                          "size": stat.st_size, "modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat()})
+    return sorted(files, key=lambda f: (f["day"], f["format"]), reverse=True)
+
+
+def get_export_file(hospital_id: int, name: str) -> Optional[Path]:
+    """Path of one day file, or None (names outside the day-file pattern are rejected)"""
+    if not _DAY_FILE.match(name):
+        return None
+    path = hospital_dir(hospital_id) / name
+    return path if path.is_file() else None
+
+
+def _csv_line(values: List[Any]) -> str:
+    out = io.StringIO()
+    csv.writer(out).writerow(["" if v is None else v for v in values])
+    return out.getvalue()
+
+
+def stream_appointments_csv(supabase, hospital_id: int, start_date: Optional[str] = None,
+                            end_date: Optional[str] = None, doctor_id: Optional[int] = None,
+                            page_size: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield a CSV export of a hospital's appointments page by page
+
+    Keyset pagination on appointments.id keeps each page an index range scan
+    and memory bounded by page_size; patient and doctor names for a page are
+    fetched in one users query.
+
+    Args:
+        supabase: Supabase client
+        hospital_id: Hospital ID
+        start_date / end_date: Inclusive appointment date range (YYYY-MM-DD)
+        doctor_id: Only this doctor's appointments
+        page_size: Rows per Supabase request (default EXPORT_PAGE_SIZE)
+    """
+    page_size = page_size or config.EXPORT_PAGE_SIZE
+    yield _csv_line(STREAM_COLUMNS)
+    last_id = 0
+    while True:
+        query = supabase.table("appointments").select(
+            "id, user_id, doctor_id, date, time_slot, status, followup_date, created_at"
+        ).eq("hospital_id", hospital_id)
+        if start_date:
+            query = query.gte("date", start_date)
+        if end_date:
+            query = query.lte("date", end_date)
+        if doctor_id:
+            query = query.eq("doctor_id", doctor_id)
+        rows = query.gt("id", last_id).order("id").limit(page_size).execute().data or []
+        if not rows:
+            return
+
+        user_ids = sorted({r[k] for r in rows for k in ("user_id", "doctor_id") if r.get(k)})
+        users = {}
+        if user_ids:
+            result = supabase.table("users").select("id, name, mobile").in_("id", user_ids).execute()
+            users = {u["id"]: u for u in result.data or []}
+
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for r in rows:
+            patient = users.get(r.get("user_id"), {})
+            writer.writerow([
+                r["id"], patient.get("name") or "", normalize_mobile(patient.get("mobile") or ""),
+                r.get("date") or "", r.get("time_slot") or "", users.get(r.get("doctor_id"), {}).get("name") or "",
+                r.get("status") or "", r.get("followup_date") or "", r.get("created_at") or ""
+            ])
+        _rows_streamed.inc(len(rows))
+        yield out.getvalue()
+
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+def get_export_stats() -> Dict[str, Any]:
+    return {
+        "buffered_rows": _buffer.pending(),
+        "max_rows": _buffer.max_rows,
+        "flush_interval_seconds": _buffer.flush_interval,
+        "columnar_format": config.EXPORT_COLUMNAR_FORMAT or None,
+        "parquet_available": PARQUET_AVAILABLE
+    }
@@ -5,6 +5,9 @@ Logs all critical actions for legal safety and compliance
 from datetime import datetime
 from typing import Optional, Dict, Any
 from database import get_supabase
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def log_audit_event(
@@ -48,7 +51,7 @@ def log_audit_event(
         supabase = get_supabase()
         if not supabase:
             # Fallback to console logging if Supabase not available
-            print(f"[AUDIT] {event_type}: {action} by user {user_id} - {status}")
+            logger.info(f"[AUDIT] {event_type}: {action} by user {user_id} - {status}")
             return
         
         audit_data = {
@@ -74,7 +77,7 @@ def log_audit_event(
         return None
     except Exception as e:
         # Never fail the main operation due to audit logging issues
-        print(f"[AUDIT ERROR] Failed to log event {event_type}: {str(e)}")
+        logger.error(f"[AUDIT ERROR] Failed to log event {event_type}: {str(e)}")
         return None
 
 
@@ -268,6 +271,6 @@ def get_audit_logs(
         result = query.execute()
         return result.data if result.data else []
     except Exception as e:
-        print(f"[AUDIT ERROR] Failed to retrieve logs: {str(e)}")
+        logger.error(f"[AUDIT ERROR] Failed to retrieve logs: {str(e)}")
         return []
 
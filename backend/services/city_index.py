@@ -0,0 +1,128 @@
+"""
+City Autocomplete Index
+In-memory sorted-prefix index over the active cities table with substring
+fallback, so /api/cities/search can answer every keystroke without the database
+"""
+import threading
+import time
+import heapq
+from bisect import bisect_left
+from typing import List, Dict, Tuple
+from services.refreshable_index import RefreshableIndex
+
+DEFAULT_LIMIT = 20
+PAGE_SIZE = 1000  # PostgREST default max rows per request
+
+
+def city_relevance_key(city_name: str, query: str) -> Tuple[int, int, int]:
+    """
+    Relevance sort key for a city against a lowercase query:
+    prefix matches first, then earlier substring position, then shorter names.
+    """
+    name = city_name.lower()
+    return (
+        0 if name.startswith(query) else 1,
+        name.index(query) if query in name else 999,
+        len(city_name)
+    )
+
+
+def load_active_cities(supabase) -> List[Dict[str, str]]:
+    """Read every active city (city_name, state_name) from Supabase in pages"""
+    cities = []
+    start = 0
+    while True:
+        result = supabase.table("cities").select("city_name, state_name").eq(
+            "is_active", True
+        ).order("id").range(start, start + PAGE_SIZE - 1).execute()
+        rows = result.data or []
+        cities.extend(
+            {"city_name": row.get("city_name") or "", "state_name": row.get("state_name") or ""}
+            for row in rows
+            if row.get("city_name")
+        )
+        if len(rows) < PAGE_SIZE:
+            return cities
+        start += PAGE_SIZE
+
+
+class CityIndex(RefreshableIndex):
+    """Sorted-prefix city index; rebuilt wholesale and swapped atomically on refresh"""
+
+    name = "city"
+    item_label = "cities"
+
+    def __init__(self):
+        super().__init__()
+        # (sorted lowercase names, city dicts in the same order)
+        self._data: Tuple[List[str], List[Dict[str, str]]] = ([], [])
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data[0])
+
+    def load(self, cities: List[Dict[str, str]]):
+        """Replace the index contents with the given cities"""
+        entries = sorted(
+            ((city["city_name"].lower(), city) for city in cities),
+            key=lambda entry: entry[0]
+        )
+        with self._lock:
+            self._data = ([name for name, _ in entries], [city for _, city in entries])
+            self.loaded_at = time.time()
+
+    def add(self, city: Dict[str, str]):
+        """Insert one city without a full rebuild (e.g. after /api/cities/add)"""
+        name = city["city_name"].lower()
+        with self._lock:
+            names, records = list(self._data[0]), list(self._data[1])
+            position = bisect_left(names, name)
+            names.insert(position, name)
+            records.insert(position, city)
+            self._data = (names, records)
+            if self.loaded_at is None:
+                self.loaded_at = time.time()
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> List[Dict[str, str]]:
+        """
+        Find cities matching query, ranked by city_relevance_key.
+
+        Args:
+            query: Search text (case-insensitive)
+            limit: Maximum number of results
+
+        Returns:
+            List of dicts with city_name and state_name
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        names, records = self._data
+
+        # Prefix matches are a contiguous run in the sorted list
+        prefix_matches = []
+        position = bisect_left(names, query)
+        while position < len(names) and names[position].startswith(query):
+            prefix_matches.append(records[position])
+            position += 1
+        results = heapq.nsmallest(limit, prefix_matches, key=lambda city: len(city["city_name"]))
+
+        # Substring fallback only when prefixes don't fill the page
+        if len(results) < limit:
+            substring_matches = [
+                records[i] for i, name in enumerate(names)
+                if query in name and not name.startswith(query)
+            ]
+            results.extend(heapq.nsmallest(
+                limit - len(results),
+                substring_matches,
+                key=lambda city: city_relevance_key(city["city_name"], query)
+            ))
+        return [dict(city) for city in results]
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "ready": self.ready,
+            "size": len(self),
+            "loaded_at": self.loaded_at
+        }
@@ -2,17 +2,14 @@
 CSV Export Service for Appointments
 Exports appointment data to CSV files with +91 mobile prefix
 """
-import csv
 import os
-from datetime import datetime
 from typing import Dict, Optional
+from services.appointment_export import record_appointment
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Directory for CSV files
 # CSV export directory - relative to backend directory
-import os
 from pathlib import Path
 BACKEND_DIR = Path(__file__).parent.parent
 CSV_DIR = str(BACKEND_DIR / "appointment_exports")
@@ -22,32 +19,13 @@ def ensure_csv_directory():
     os.makedirs(CSV_DIR, exist_ok=True)
 
 
-def normalize_mobile(mobile: str) -> str:
-    """
-    Normalize mobile number to include +91 prefix.
-    
-    Args:
-        mobile: Mobile number in any format
-    
-    Returns:
-        str: Mobile number with +91 prefix
-    """
-    mobile = mobile.strip().replace(" ", "").replace("-", "")
-    
-    if mobile.startswith("+91"):
-        return mobile
-    elif mobile.startswith("91") and len(mobile) == 12:
-        return "+" + mobile
-    elif mobile.startswith("0"):
-        return "+91" + mobile[1:]
-    else:
-        return "+91" + mobile
-
-
 def save_appointment_csv(hospital_id: int, appointment_data: Dict) -> bool:
     """
-    Save appointment data to CSV file.
-    Appends to existing file (never overwrites).
+    Record appointment data in the hospital's export file for today,
+    appointment_exports/hospital_{hospital_id}/appointments_{day}.csv.
+    A single server process buffers rows and appends them in batches; with
+    several workers each row is appended immediately
+    (see services.appointment_export).
     
     Format: name,mobile,date,time_slot,doctor,specialty,followup_date
     
@@ -67,46 +45,11 @@ def save_appointment_csv(hospital_id: int, appointment_data: Dict) -> bool:
             - followup_date: Follow-up date (optional)
     
     Returns:
-        bool: True if saved successfully
+        bool: True if the row was buffered or written
     """
     try:
-        ensure_csv_directory()
-        
-        # Filename format: hospital_{hospital_id}_appointments.csv
-        filename = f"{CSV_DIR}/hospital_{hospital_id}_appointments.csv"
-        file_exists = os.path.exists(filename)
-        
-        # Normalize mobile number - Always prefix with +91
-        mobile = appointment_data.get("mobile", "")
-        if not mobile.startswith("+91"):
-            mobile = "+91" + mobile
-        
-        # Prepare row data in exact format: name,mobile,date,time_slot,doctor,specialty,followup_date
-        row = [
-            appointment_data.get("name", ""),
-            mobile,
-            appointment_data.get("date", ""),
-            appointment_data.get("time_slot", ""),
-            appointment_data.get("doctor", ""),
-            appointment_data.get("specialty", ""),
-            appointment_data.get("followup_date", "")
-        ]
-        
-        # Write to CSV - Append mode (never overwrite)
-        with open(filename, "a", newline="", encoding="utf-8") as file:
-            writer = csv.writer(file)
-            
-            # Write header if file is new
-            if not file_exists:
-                header = ["name", "mobile", "date", "time_slot", "doctor", "specialty", "followup_date"]
-                writer.writerow(header)
-            
-            # Append row (never overwrite)
-            writer.writerow(row)
-        
-        logger.info(f"Appointment saved to CSV: {filename}")
+        record_appointment(hospital_id, appointment_data)
         return True
-        
     except Exception as e:
         logger.error(f"Error saving appointment to CSV: {str(e)}")
         return False
@@ -114,7 +57,8 @@ def save_appointment_csv(hospital_id: int, appointment_data: Dict) -> bool:
 
 def get_appointments_csv(hospital_id: int) -> Optional[str]:
     """
-    Get path to hospital's CSV file.
+    Get path to hospital's legacy single CSV file (written before per-day
+    export files; see services.appointment_export.list_export_files).
     
     Returns:
         str: Path to CSV file, or None if doesn't exist
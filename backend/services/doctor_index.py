@@ -0,0 +1,175 @@
+"""
+Doctor Search Index
+In-process trigram index over active doctors, partitioned by hospital, for
+fuzzy, typo-tolerant /api/doctors/search without hitting the database
+"""
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import List, Dict, Optional, Set, Any
+from services.refreshable_index import RefreshableIndex
+
+DEFAULT_LIMIT = 20
+PAGE_SIZE = 1000  # PostgREST default max rows per request
+MIN_SIMILARITY = 0.55  # Share of query trigrams a name must contain to match
+
+# Columns returned by doctor search (projection instead of select("*"))
+SEARCH_FIELDS = ["id", "doctor_name", "place", "mobile", "degree", "specialization", "hospital_id"]
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_TITLE = re.compile(r"^(dr|doctor)\b\.?\s*")
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, drop punctuation and a leading "Dr." title"""
+    text = _NON_WORD.sub(" ", (name or "").lower().replace(".", ". "))
+    text = " ".join(text.split())
+    return _TITLE.sub("", text)
+
+
+def _trigrams(text: str, open_ended: bool = False) -> Set[str]:
+    """
+    Word-level trigrams padded like pg_trgm ("  w", " wo", "wor", "ord", "rd ").
+    open_ended skips the trailing pad on the last word so partially typed
+    queries still match as prefixes.
+    """
+    grams = set()
+    words = text.split()
+    for position, word in enumerate(words):
+        last = position == len(words) - 1
+        padded = "  " + word + ("" if open_ended and last else " ")
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def load_active_doctors(supabase) -> List[Dict[str, Any]]:
+    """Read every active doctor (projected columns) from Supabase in pages"""
+    doctors = []
+    start = 0
+    while True:
+        result = supabase.table("doctors").select(", ".join(SEARCH_FIELDS)).eq(
+            "is_active", True
+        ).order("id").range(start, start + PAGE_SIZE - 1).execute()
+        rows = result.data or []
+        doctors.extend(row for row in rows if row.get("doctor_name"))
+        if len(rows) < PAGE_SIZE:
+            return doctors
+        start += PAGE_SIZE
+
+
+class DoctorIndex(RefreshableIndex):
+    """Trigram index of doctors; rebuilt wholesale on refresh, updated in place on add"""
+
+    name = "doctor"
+    item_label = "doctors"
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._doctors: Dict[Any, Dict[str, Any]] = {}
+        self._names: Dict[Any, str] = {}
+        self._postings: Dict[str, Set[Any]] = defaultdict(set)
+        self._by_hospital: Dict[Any, Set[Any]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._doctors)
+
+    def _insert(self, doctor: Dict[str, Any]):
+        doctor_id = doctor["id"]
+        if doctor_id in self._doctors:
+            self._remove(doctor_id)
+        record = {field: doctor.get(field) for field in SEARCH_FIELDS}
+        name = normalize_name(record["doctor_name"])
+        self._doctors[doctor_id] = record
+        self._names[doctor_id] = name
+        for gram in _trigrams(name):
+            self._postings[gram].add(doctor_id)
+        self._by_hospital[record.get("hospital_id")].add(doctor_id)
+
+    def _remove(self, doctor_id: Any):
+        record = self._doctors.pop(doctor_id)
+        for gram in _trigrams(self._names.pop(doctor_id)):
+            self._postings[gram].discard(doctor_id)
+        self._by_hospital[record.get("hospital_id")].discard(doctor_id)
+
+    def load(self, doctors: List[Dict[str, Any]]):
+        """Replace the index contents with the given doctors"""
+        fresh = DoctorIndex()
+        for doctor in doctors:
+            fresh._insert(doctor)
+        with self._lock:
+            self._doctors = fresh._doctors
+            self._names = fresh._names
+            self._postings = fresh._postings
+            self._by_hospital = fresh._by_hospital
+            self.loaded_at = time.time()
+
+    def add(self, doctor: Dict[str, Any]):
+        """Insert or replace one doctor (e.g. after /api/doctors/add)"""
+        with self._lock:
+            self._insert(doctor)
+            if self.loaded_at is None:
+                self.loaded_at = time.time()
+
+    def search(self, query: str, hospital_id: Optional[int] = None, limit: int = DEFAULT_LIMIT) -> List[Dict[str, Any]]:
+        """
+        Fuzzy search doctors by name.
+
+        Ranking: exact substring matches first (earlier position wins), then
+        by trigram similarity, then shorter names.
+
+        Args:
+            query: Search text (case-insensitive, typos tolerated)
+            hospital_id: Restrict to one hospital's doctors
+            limit: Maximum number of results
+
+        Returns:
+            List of doctor dicts with SEARCH_FIELDS
+        """
+        text = normalize_name(query)
+        if not text:
+            return []
+        query_grams = _trigrams(text, open_ended=True)
+
+        with self._lock:
+            allowed = self._by_hospital.get(hospital_id, set()) if hospital_id else None
+            shared = Counter()
+            for gram in query_grams:
+                postings = self._postings.get(gram)
+                if postings:
+                    shared.update(postings if allowed is None else postings & allowed)
+
+            if len(text) < 3 or not shared:
+                # Short queries only produce word-start trigrams ("am" never
+                # reaches "ramesh"); scan names so recall matches ilike '%q%'
+                for doctor_id in (self._names if allowed is None else allowed):
+                    if text in self._names[doctor_id]:
+                        shared.setdefault(doctor_id, 0)
+
+            ranked = []
+            for doctor_id, hits in shared.items():
+                name = self._names[doctor_id]
+                similarity = hits / len(query_grams)
+                position = name.find(text)
+                if position < 0 and similarity < MIN_SIMILARITY:
+                    continue
+                ranked.append((
+                    0 if position >= 0 else 1,
+                    position if position >= 0 else 999,
+                    -similarity,
+                    len(name),
+                    doctor_id
+                ))
+            ranked.sort()
+            return [dict(self._doctors[entry[-1]]) for entry in ranked[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "size": len(self),
+            "hospitals": len([ids for ids in self._by_hospital.values() if ids]),
+            "trigrams": len(self._postings),
+            "loaded_at": self.loaded_at
+        }
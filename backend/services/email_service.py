@@ -1,17 +1,25 @@
 """
 Email Service with per-hospital SMTP configuration
-Supports both hospital-specific and global SMTP settings
+Supports both hospital-specific and global SMTP settings; mail goes out over
+pooled per-account SMTP sessions
 """
-import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional, Dict
-from database import get_supabase
+from typing import Optional, Dict, List
+from services.metadata_cache import get_hospital
+from services.smtp_pool import SMTPConnectionPool
 import config
 import logging
 
 logger = logging.getLogger(__name__)
 
+_smtp_pool = SMTPConnectionPool(
+    "email",
+    idle_timeout=config.SMTP_POOL_IDLE_TIMEOUT,
+    max_messages=config.SMTP_POOL_MAX_MESSAGES,
+    require_starttls=config.SMTP_REQUIRE_STARTTLS
+)
+
 
 def get_hospital_smtp_config(hospital_id: Optional[int] = None) -> Dict:
     """
@@ -19,19 +27,15 @@ def get_hospital_smtp_config(hospital_id: Optional[int] = None) -> Dict:
     Falls back to global config if hospital doesn't have custom settings.
     
     Returns:
-        Dict with SMTP configuration keys: host, port, username, password, from_email, use_ssl, enabled
+        Dict with SMTP configuration keys: host, port, username, password, from_email, use_ssl, enabled,
+        pool_key (hospital id for hospital settings, None for the global account)
     """
-    supabase = get_supabase()
-    
-    if hospital_id and supabase:
+    if hospital_id:
         try:
-            result = supabase.table("hospitals").select(
-                "smtp_host, smtp_port, smtp_username, smtp_password, "
-                "smtp_from_email, smtp_enabled, smtp_use_ssl"
-            ).eq("id", hospital_id).execute()
+            # Hospital row comes from the shared metadata cache
+            hospital_config = get_hospital(hospital_id)
             
-            if result.data and result.data[0].get("smtp_enabled"):
-                hospital_config = result.data[0]
+            if hospital_config and hospital_config.get("smtp_enabled"):
                 # Only return config if all required fields are present
                 if hospital_config.get("smtp_host") and hospital_config.get("smtp_username"):
                     return {
@@ -41,7 +45,8 @@ def get_hospital_smtp_config(hospital_id: Optional[int] = None) -> Dict:
                         "password": hospital_config.get("smtp_password"),
                         "from_email": hospital_config.get("smtp_from_email") or hospital_config.get("smtp_username"),
                         "use_ssl": hospital_config.get("smtp_use_ssl", False),
-                        "enabled": True
+                        "enabled": True,
+                        "pool_key": hospital_id
                     }
         except Exception as e:
             logger.error(f"Error fetching hospital SMTP config for hospital {hospital_id}: {e}")
@@ -54,10 +59,27 @@ def get_hospital_smtp_config(hospital_id: Optional[int] = None) -> Dict:
         "password": config.SMTP_PASSWORD,
         "from_email": config.SMTP_FROM_EMAIL or config.SMTP_USERNAME,
         "use_ssl": False,
-        "enabled": bool(config.SMTP_HOST and config.SMTP_USERNAME)
+        "enabled": bool(config.SMTP_HOST and config.SMTP_USERNAME),
+        "pool_key": None
     }
 
 
+def _build_message(smtp_config: Dict, to_email: str, subject: str, body_text: str,
+                   body_html: Optional[str] = None) -> MIMEMultipart:
+    message = MIMEMultipart("alternative")
+    message["From"] = smtp_config["from_email"]
+    message["To"] = to_email
+    message["Subject"] = subject
+    
+    # Add plain text part
+    message.attach(MIMEText(body_text, "plain"))
+    
+    # Add HTML part if provided
+    if body_html:
+        message.attach(MIMEText(body_html, "html"))
+    return message
+
+
 async def send_email(
     to_email: str,
     subject: str,
@@ -78,62 +100,62 @@ async def send_email(
     Returns:
         True if email sent successfully, False otherwise
     """
+    results = await send_bulk(
+        [{"to_email": to_email, "subject": subject, "body_text": body_text, "body_html": body_html}],
+        hospital_id=hospital_id
+    )
+    return results[0]
+
+
+async def send_bulk(emails: List[Dict], hospital_id: Optional[int] = None) -> List[bool]:
+    """
+    Send many emails over one pooled SMTP session (one handshake and AUTH)
+    
+    Args:
+        emails: Dicts with to_email, subject, body_text and optional body_html
+        hospital_id: Hospital ID to use hospital-specific SMTP (optional)
+    
+    Returns:
+        One bool per email, in order: True if accepted by the SMTP server
+    """
+    if not emails:
+        return []
+    
     smtp_config = get_hospital_smtp_config(hospital_id)
     
     if not smtp_config.get("enabled"):
-        logger.warning(f"SMTP not enabled (hospital_id={hospital_id}), skipping email to {to_email}")
-        return False
+        logger.warning(f"SMTP not enabled (hospital_id={hospital_id}), skipping {len(emails)} email(s)")
+        return [False] * len(emails)
     
     if not smtp_config.get("host") or not smtp_config.get("username") or not smtp_config.get("password"):
         logger.error(f"SMTP configuration incomplete for hospital {hospital_id}")
-        return False
-    
-    try:
-        # Create message
-        message = MIMEMultipart("alternative")
-        message["From"] = smtp_config["from_email"]
-        message["To"] = to_email
-        message["Subject"] = subject
-        
-        # Add plain text part
-        text_part = MIMEText(body_text, "plain")
-        message.attach(text_part)
-        
-        # Add HTML part if provided
-        if body_html:
-            html_part = MIMEText(body_html, "html")
-            message.attach(html_part)
-        
-        # Send email
-        if smtp_config["use_ssl"]:
-            # SSL connection (port 465)
-            await aiosmtplib.send(
-                message,
-                hostname=smtp_config["host"],
-                port=smtp_config["port"],
-                username=smtp_config["username"],
-                password=smtp_config["password"],
-                use_tls=False,
-                start_tls=False
-            )
+        return [False] * len(emails)
+    
+    messages = [
+        _build_message(smtp_config, email["to_email"], email["subject"], email["body_text"], email.get("body_html"))
+        for email in emails
+    ]
+    errors = await _smtp_pool.send_messages(smtp_config["pool_key"], smtp_config, messages)
+    
+    source = "hospital" if smtp_config["pool_key"] is not None else "global"
+    for email, error in zip(emails, errors):
+        if error:
+            logger.error(f"❌ Error sending email to {email['to_email']} (hospital_id={hospital_id}): {error}")
         else:
-            # TLS connection (port 587)
-            await aiosmtplib.send(
-                message,
-                hostname=smtp_config["host"],
-                port=smtp_config["port"],
-                username=smtp_config["username"],
-                password=smtp_config["password"],
-                use_tls=True,
-                start_tls=True
-            )
-        
-        logger.info(f"✅ Email sent to {to_email} using {'hospital' if hospital_id else 'global'} SMTP (hospital_id={hospital_id})")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Error sending email to {to_email} (hospital_id={hospital_id}): {e}")
-        return False
+            logger.info(f"✅ Email sent to {email['to_email']} using {source} SMTP (hospital_id={hospital_id})")
+    return [error is None for error in errors]
+
+
+async def close_smtp_connections(hospital_id: Optional[int] = None):
+    """
+    Close pooled SMTP sessions: one hospital's (after its SMTP settings change)
+    or all of them (shutdown)
+    """
+    await _smtp_pool.close(hospital_id)
+
+
+def get_smtp_pool_stats() -> Dict:
+    return _smtp_pool.stats()
 
 
 async def send_hospital_registration_email(hospital_data: dict, hospital_id: Optional[int] = None) -> bool:
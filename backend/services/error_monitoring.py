@@ -7,11 +7,7 @@ from typing import Optional
 from functools import wraps
 from fastapi import Request
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Handlers and format are set up by services.log_pipeline.configure_logging
 logger = logging.getLogger(__name__)
 
 
@@ -0,0 +1,146 @@
+"""
+Health Monitor
+Liveness and readiness for load balancer probes. Dependency checks (Supabase,
+scheduler, WhatsApp sessions, webhook queue) run on a background thread every
+HEALTH_CHECK_INTERVAL seconds; the probe endpoints only read the last
+snapshot, so probing costs no database traffic and a slow database cannot make
+probes time out.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeout
+from typing import Optional, Dict, Any, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A check returns a detail dict; raising marks the component as failing
+HealthCheck = Callable[[], Dict[str, Any]]
+
+
+class HealthMonitor:
+    """
+    Background-refreshed component status
+
+    Args:
+        service: Service name reported in responses
+        interval: Seconds between refreshes
+        timeout: Seconds a single check may take before it is reported as failing
+        stale_after: Readiness fails if no refresh completed for this long
+    """
+
+    def __init__(self, service: str, interval: float = 15, timeout: float = 5, stale_after: float = 60):
+        self.service = service
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.started_at = time.time()
+        self._checks: Dict[str, tuple] = {}  # name -> (check, critical)
+        self._snapshot: Dict[str, Dict[str, Any]] = {}
+        self._refreshed_at: Optional[float] = None
+        self._in_flight: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_check(self, name: str, check: HealthCheck, critical: bool = True):
+        """Register a component; failing critical components make the service not ready"""
+        self._checks[name] = (check, critical)
+
+    def refresh(self):
+        """Run every check once (bounded by timeout each) and publish the snapshot"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="health-check")
+        futures = {}
+        for name, (check, _) in self._checks.items():
+            previous = self._in_flight.get(name)
+            if previous is not None and not previous.done():
+                continue  # Still hung from an earlier refresh; don't pile up threads
+            futures[name] = (self._executor.submit(check), time.monotonic())
+            self._in_flight[name] = futures[name][0]
+
+        snapshot = dict(self._snapshot)
+        for name, (check, critical) in self._checks.items():
+            if name not in futures:
+                entry = {"ok": False, "error": f"check still running after {self.timeout}s"}
+            else:
+                future, started = futures[name]
+                try:
+                    detail = future.result(timeout=max(0.0, self.timeout - (time.monotonic() - started)))
+                    entry = dict(detail or {}, ok=True)
+                except FutureTimeout:
+                    entry = {"ok": False, "error": f"timed out after {self.timeout}s"}
+                except Exception as e:
+                    entry = {"ok": False, "error": str(e)}
+                entry["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+            entry.update(critical=critical, checked_at=time.time())
+            if not entry["ok"] and snapshot.get(name, {}).get("ok", True):
+                logger.warning(f"⚠️ Health check {name} failing: {entry.get('error')}")
+            snapshot[name] = entry
+        self._snapshot = snapshot
+        self._refreshed_at = time.time()
+
+    def start(self):
+        """Refresh now and then every interval on a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"❌ Health refresh failed: {e}")
+                if self._stop.wait(self.interval):
+                    return
+
+        self._thread = threading.Thread(target=run, name=f"{self.service}-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def liveness(self) -> Dict[str, Any]:
+        return {"status": "alive", "service": self.service, "uptime_seconds": round(time.time() - self.started_at, 1)}
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        Last snapshot plus a verdict: "ready", "degraded" (a non-critical
+        component is failing), "starting" (no refresh yet) or "not_ready"
+        """
+        snapshot = self._snapshot
+        refreshed_at = self._refreshed_at
+        age = time.time() - refreshed_at if refreshed_at else None
+        if refreshed_at is None:
+            verdict = "starting"
+        elif age > self.stale_after or any(not c["ok"] for c in snapshot.values() if c["critical"]):
+            verdict = "not_ready"
+        elif any(not c["ok"] for c in snapshot.values()):
+            verdict = "degraded"
+        else:
+            verdict = "ready"
+        return {
+            "status": verdict,
+            "ready": verdict in ("ready", "degraded"),
+            "service": self.service,
+            "checked_age_seconds": round(age, 1) if age is not None else None,
+            "components": snapshot
+        }
+
+    def component(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._snapshot.get(name)
+
+
+def supabase_check(get_client: Callable[[], Any]) -> HealthCheck:
+    """Check that runs the one-row query the old /health ran on every probe"""
+    def check():
+        client = get_client()
+        if not client:
+            return {"database": "not_configured"}
+        client.table("hospitals").select("id").limit(1).execute()
+        return {"database": "connected"}
+    return check
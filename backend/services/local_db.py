@@ -0,0 +1,814 @@
+"""
+Local Database
+SQLite backend for single-clinic deployments and offline test/benchmark runs
+(DATABASE_BACKEND=sqlite). LocalClient implements the part of the Supabase
+client API the servers use - table().select/insert/upsert/update/delete with
+eq/neq/gt/gte/lt/lte/like/ilike/in_/is_/not_/or_ filters, order, limit,
+range, count="exact", single() and execute() - so every call site works
+unchanged. Tables, indexes and unique constraints mirror complete_schema.sql
+plus the mobile tables, and nothing else: an unknown table or column is an
+error here just as it is against PostgREST. Errors are raised as postgrest
+APIError with the Postgres/PostgREST codes (23505 duplicate key, 42P01/42703
+unknown table/column, PGRST204 unknown column written, PGRST202 unknown RPC)
+so is_unique_violation and the RPC fallbacks behave as they do against Supabase.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlencode
+from postgrest.exceptions import APIError
+from services.request_metrics import record_db_call
+import logging
+
+logger = logging.getLogger(__name__)
+
+_NOW = "(strftime('%Y-%m-%dT%H:%M:%f', 'now'))"
+
+# complete_schema.sql in SQLite terms. CHECK/NOT NULL/foreign keys are left
+# out: web and mobile write different column sets to the same tables.
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS hospitals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT, email TEXT UNIQUE, mobile TEXT, status TEXT DEFAULT 'pending',
+    address_line1 TEXT, address_line2 TEXT, address_line3 TEXT, city TEXT, state TEXT, pincode TEXT,
+    registration_date TIMESTAMP DEFAULT {_NOW}, approved_date TIMESTAMP, plan TEXT, expiry_date DATE,
+    is_active BOOLEAN DEFAULT 1, upi_id TEXT, gpay_upi_id TEXT, phonepay_upi_id TEXT, paytm_upi_id TEXT,
+    bhim_upi_id TEXT, whatsapp_enabled TEXT DEFAULT 'false', whatsapp_confirmation_template TEXT,
+    whatsapp_followup_template TEXT, whatsapp_reminder_template TEXT, smtp_host TEXT,
+    smtp_port INTEGER DEFAULT 587, smtp_username TEXT, smtp_password TEXT, smtp_from_email TEXT,
+    smtp_enabled BOOLEAN DEFAULT 0, smtp_use_ssl BOOLEAN DEFAULT 0,
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT, mobile TEXT UNIQUE, role TEXT, password_hash TEXT, is_active BOOLEAN DEFAULT 1,
+    hospital_id INTEGER, address_line1 TEXT, address_line2 TEXT, address_line3 TEXT, last_login_at TIMESTAMP,
+    company_name TEXT, product1 TEXT, product2 TEXT, product3 TEXT, product4 TEXT, degree TEXT,
+    institute_name TEXT, experience1 TEXT, experience2 TEXT, experience3 TEXT, experience4 TEXT,
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER, doctor_id INTEGER, date DATE, time_slot TEXT, status TEXT DEFAULT 'pending',
+    hospital_id INTEGER, reason TEXT, visit_date DATE, followup_date DATE, amount TEXT,
+    payment_required TEXT DEFAULT 'false',
+    patient_id INTEGER, patient_name TEXT, patient_mobile TEXT, place TEXT, appointment_date DATE,
+    appointment_time TEXT, payment_method TEXT, payment_status TEXT,
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS operations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER, doctor_id INTEGER, specialty TEXT, operation_date DATE, status TEXT DEFAULT 'pending',
+    hospital_id INTEGER, notes TEXT, amount TEXT, payment_required TEXT DEFAULT 'false',
+    patient_name TEXT, patient_mobile TEXT, operation_time TEXT, payment_method TEXT, payment_status TEXT,
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER, hospital_id INTEGER, amount NUMERIC, currency TEXT DEFAULT 'INR',
+    status TEXT DEFAULT 'INITIATED', appointment_id INTEGER, operation_id INTEGER, payment_method TEXT,
+    razorpay_order_id TEXT, razorpay_payment_id TEXT, razorpay_signature TEXT, internal_transaction_id TEXT,
+    gateway_transaction_id TEXT, transaction_id TEXT, upi_transaction_id TEXT,
+    initiated_at TIMESTAMP DEFAULT {_NOW}, completed_at TIMESTAMP, failed_at TIMESTAMP, refunded_at TIMESTAMP,
+    payment_date TIMESTAMP, failure_reason TEXT, failure_code TEXT, metadata JSON, notes TEXT,
+    order_id TEXT, entity_type TEXT, entity_id INTEGER, patient_name TEXT, patient_mobile TEXT,
+    description TEXT,
+    updated_at TIMESTAMP DEFAULT {_NOW}, created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS payment_webhooks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    webhook_id TEXT UNIQUE, event_type TEXT, payment_id INTEGER, razorpay_payment_id TEXT,
+    razorpay_order_id TEXT, webhook_payload JSON, signature_verified BOOLEAN DEFAULT 0,
+    processed BOOLEAN DEFAULT 0, processed_at TIMESTAMP, processing_error TEXT, retry_count INTEGER DEFAULT 0,
+    received_at TIMESTAMP DEFAULT {_NOW}, created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS payment_refunds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payment_id INTEGER, razorpay_refund_id TEXT UNIQUE, razorpay_payment_id TEXT, amount NUMERIC,
+    currency TEXT DEFAULT 'INR', status TEXT, reason TEXT, refund_type TEXT, initiated_at TIMESTAMP DEFAULT {_NOW},
+    processed_at TIMESTAMP, notes TEXT, metadata JSON,
+    created_at TIMESTAMP DEFAULT {_NOW}, updated_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS payment_retry_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payment_id INTEGER, webhook_id INTEGER, retry_type TEXT, retry_count INTEGER DEFAULT 0,
+    max_retries INTEGER DEFAULT 5, next_retry_at TIMESTAMP, last_attempt_at TIMESTAMP,
+    status TEXT DEFAULT 'pending', last_error TEXT, error_count INTEGER DEFAULT 0, payload JSON,
+    created_at TIMESTAMP DEFAULT {_NOW}, updated_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS payment_manual_review (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payment_id INTEGER, reason TEXT, priority TEXT DEFAULT 'medium', status TEXT DEFAULT 'pending',
+    resolved_by INTEGER, resolved_at TIMESTAMP, resolution_notes TEXT,
+    created_at TIMESTAMP DEFAULT {_NOW}, updated_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS audit_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type TEXT, user_id INTEGER, user_role TEXT, action TEXT, resource_type TEXT, resource_id INTEGER,
+    details JSON, ip_address TEXT, user_agent TEXT, status TEXT DEFAULT 'success', error_message TEXT,
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS whatsapp_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hospital_id INTEGER, mobile TEXT, message TEXT, message_type TEXT, status TEXT DEFAULT 'sent',
+    error_message TEXT, retry_count INTEGER DEFAULT 0, sent_at TIMESTAMP DEFAULT {_NOW},
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT, mobile TEXT, place TEXT,
+    created_at TIMESTAMP DEFAULT {_NOW}, updated_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS cities (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    city_name TEXT, state_name TEXT, district_name TEXT, pincode TEXT, source TEXT, is_active BOOLEAN DEFAULT 1,
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS doctors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doctor_name TEXT, place TEXT, mobile TEXT, email TEXT, degree TEXT, specialization TEXT, hospital_id INTEGER,
+    source TEXT, is_active BOOLEAN DEFAULT 1,
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS admin_users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE, password_hash TEXT, role TEXT DEFAULT 'admin', is_active BOOLEAN DEFAULT 1,
+    last_login_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+
+CREATE INDEX IF NOT EXISTS idx_hospitals_status ON hospitals(status);
+CREATE INDEX IF NOT EXISTS idx_hospitals_is_active ON hospitals(is_active);
+CREATE INDEX IF NOT EXISTS idx_users_hospital_id ON users(hospital_id);
+CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+CREATE INDEX IF NOT EXISTS idx_appointments_hospital_id ON appointments(hospital_id);
+CREATE INDEX IF NOT EXISTS idx_appointments_user_id ON appointments(user_id);
+CREATE INDEX IF NOT EXISTS idx_appointments_doctor_id ON appointments(doctor_id);
+CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(date);
+CREATE INDEX IF NOT EXISTS idx_appointments_followup_date ON appointments(followup_date);
+CREATE INDEX IF NOT EXISTS idx_appointments_visit_date ON appointments(visit_date);
+CREATE INDEX IF NOT EXISTS idx_appointments_status_date ON appointments(status, date);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_doctor_slot_active
+    ON appointments(doctor_id, date, time_slot) WHERE status <> 'cancelled';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_hospital_slot_active
+    ON appointments(hospital_id, appointment_date, appointment_time) WHERE status <> 'cancelled';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_operations_hospital_slot_active
+    ON operations(hospital_id, operation_date, operation_time) WHERE status <> 'cancelled';
+CREATE INDEX IF NOT EXISTS idx_appointments_hospital_day ON appointments(hospital_id, appointment_date);
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_mobile ON appointments(patient_mobile);
+CREATE INDEX IF NOT EXISTS idx_operations_hospital_id ON operations(hospital_id, operation_date);
+CREATE INDEX IF NOT EXISTS idx_operations_patient_id ON operations(patient_id);
+CREATE INDEX IF NOT EXISTS idx_operations_doctor_id ON operations(doctor_id);
+CREATE INDEX IF NOT EXISTS idx_operations_operation_date ON operations(operation_date);
+CREATE INDEX IF NOT EXISTS idx_operations_status ON operations(status);
+CREATE INDEX IF NOT EXISTS idx_operations_patient_mobile ON operations(patient_mobile);
+CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id);
+CREATE INDEX IF NOT EXISTS idx_payments_appointment_id ON payments(appointment_id);
+CREATE INDEX IF NOT EXISTS idx_payments_operation_id ON payments(operation_id);
+CREATE INDEX IF NOT EXISTS idx_payments_hospital_id ON payments(hospital_id);
+CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status);
+CREATE INDEX IF NOT EXISTS idx_payments_transaction_id ON payments(transaction_id);
+CREATE INDEX IF NOT EXISTS idx_payments_razorpay_order_id ON payments(razorpay_order_id) WHERE razorpay_order_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_payments_razorpay_payment_id ON payments(razorpay_payment_id) WHERE razorpay_payment_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_payments_internal_transaction_id ON payments(internal_transaction_id) WHERE internal_transaction_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_payments_initiated_at ON payments(initiated_at);
+CREATE INDEX IF NOT EXISTS idx_payments_created_at ON payments(created_at);
+CREATE INDEX IF NOT EXISTS idx_payments_order_id ON payments(order_id) WHERE order_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_payments_patient_mobile ON payments(patient_mobile, created_at);
+CREATE INDEX IF NOT EXISTS idx_payment_webhooks_payment_id ON payment_webhooks(payment_id);
+CREATE INDEX IF NOT EXISTS idx_payment_webhooks_razorpay_payment_id ON payment_webhooks(razorpay_payment_id);
+CREATE INDEX IF NOT EXISTS idx_payment_webhooks_processed ON payment_webhooks(processed);
+CREATE INDEX IF NOT EXISTS idx_payment_refunds_payment_id ON payment_refunds(payment_id);
+CREATE INDEX IF NOT EXISTS idx_payment_refunds_status ON payment_refunds(status);
+CREATE INDEX IF NOT EXISTS idx_payment_retry_queue_next_retry_at ON payment_retry_queue(next_retry_at);
+CREATE INDEX IF NOT EXISTS idx_payment_retry_queue_status ON payment_retry_queue(status);
+CREATE INDEX IF NOT EXISTS idx_payment_manual_review_payment_id ON payment_manual_review(payment_id);
+CREATE INDEX IF NOT EXISTS idx_payment_manual_review_status ON payment_manual_review(status);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_user_id ON audit_logs(user_id);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_event_type ON audit_logs(event_type);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_resource ON audit_logs(resource_type, resource_id);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_created_at ON audit_logs(created_at);
+CREATE INDEX IF NOT EXISTS idx_whatsapp_logs_hospital_id ON whatsapp_logs(hospital_id);
+CREATE INDEX IF NOT EXISTS idx_whatsapp_logs_mobile ON whatsapp_logs(mobile);
+CREATE INDEX IF NOT EXISTS idx_whatsapp_logs_sent_at ON whatsapp_logs(sent_at);
+CREATE INDEX IF NOT EXISTS idx_patients_mobile ON patients(mobile);
+CREATE INDEX IF NOT EXISTS idx_cities_city_name ON cities(city_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_doctors_doctor_name ON doctors(doctor_name COLLATE NOCASE);
+"""
+
+# Further columns of the mobile project's tables that server_mobile.py writes;
+# added to existing database files too (like complete_schema.sql's ADD COLUMN blocks)
+MOBILE_COLUMNS = {
+    "hospitals": ("approved_at TIMESTAMP", "default_upi_id TEXT", "google_pay_upi_id TEXT", "phonepe_upi_id TEXT",
+                  "payment_qr_code TEXT", "whatsapp_number TEXT"),
+    "users": ("email TEXT", "city TEXT", "state TEXT", "pincode TEXT", "doctor_name TEXT", "place TEXT",
+              "patient_referred_name TEXT", "problem TEXT", "patient_mobile TEXT", "ref_no TEXT"),
+    "operations": ("place TEXT",),
+    "payments": ("payment_id TEXT", "signature TEXT", "paid_at TIMESTAMP", "refund_id TEXT", "refund_amount NUMERIC",
+                 "refund_status TEXT", "refund_reason TEXT"),
+}
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Postgres error codes for SQLite constraint failures
+_INTEGRITY_CODES = (("UNIQUE", "23505", "duplicate key value violates unique constraint"),
+                    ("NOT NULL", "23502", "null value violates not-null constraint"),
+                    ("CHECK", "23514", "new row violates check constraint"))
+
+
+def _quote(name: str) -> str:
+    if not _IDENTIFIER.match(name):
+        raise APIError({"code": "42703", "message": f"Invalid column or table name: {name}"})
+    return f'"{name}"'
+
+
+def _api_error(error: sqlite3.Error) -> APIError:
+    text = str(error)
+    if isinstance(error, sqlite3.IntegrityError):
+        for marker, code, message in _INTEGRITY_CODES:
+            if marker in text:
+                return APIError({"code": code, "message": message, "details": text, "hint": None})
+        return APIError({"code": "23000", "message": "integrity constraint violation", "details": text, "hint": None})
+    if "ON CONFLICT clause does not match" in text:
+        return APIError({"code": "42P10", "message": "there is no unique or exclusion constraint matching the ON CONFLICT specification",
+                         "details": text, "hint": None})
+    return APIError({"code": "XX000", "message": text, "details": None, "hint": None})
+
+
+class LocalResponse:
+    """Same shape as postgrest's APIResponse: data (list or dict) and count"""
+
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class LocalDatabase:
+    """One SQLite file; a connection per thread (and per process after fork)"""
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._columns: Dict[str, Dict[str, str]] = {}
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection().executescript(SCHEMA)
+        self._add_mobile_columns()
+
+    def connection(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != pid:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA temp_store=MEMORY")
+            self._local.connection, self._local.pid = connection, pid
+        return connection
+
+    # ---- schema --------------------------------------------------------
+
+    def _load_columns(self, table: str) -> Dict[str, str]:
+        rows = self.connection().execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+        columns = {row["name"]: (row["type"] or "TEXT").upper() for row in rows}
+        self._columns[table] = columns
+        return columns
+
+    def _add_mobile_columns(self):
+        connection = self.connection()
+        for table, definitions in MOBILE_COLUMNS.items():
+            existing = self._load_columns(table)
+            for definition in definitions:
+                name = definition.split()[0]
+                if name in existing:
+                    continue
+                try:
+                    connection.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {definition}")
+                except sqlite3.OperationalError as e:
+                    # Another process opening the same file may have added it first
+                    if "duplicate column" not in str(e):
+                        raise
+        self._columns.clear()
+
+    def columns(self, table: str) -> Dict[str, str]:
+        """
+        Column name -> declared type
+
+        Raises:
+            APIError: 42P01 if the table is not in SCHEMA
+        """
+        columns = self._columns.get(table)
+        if columns is None:
+            columns = self._load_columns(table)
+            if not columns:
+                raise APIError({"code": "42P01", "message": f'relation "public.{table}" does not exist',
+                                "details": None, "hint": None})
+        return columns
+
+    def require_columns(self, table: str, names, writing: bool = False) -> Dict[str, str]:
+        """
+        Columns of table, after checking every name exists
+
+        Raises:
+            APIError: 42703 for an unknown column read or filtered on,
+                PGRST204 for one written (PostgREST's schema cache error)
+        """
+        columns = self.columns(table)
+        for name in names:
+            if name not in columns:
+                if writing:
+                    raise APIError({"code": "PGRST204", "message": f"Could not find the '{name}' column of '{table}' in the schema cache",
+                                    "details": None, "hint": None})
+                raise APIError({"code": "42703", "message": f"column {table}.{name} does not exist",
+                                "details": None, "hint": None})
+        return columns
+
+    # ---- values --------------------------------------------------------
+
+    @staticmethod
+    def to_sql(value: Any, declared: str = "TEXT") -> Any:
+        if value is None:
+            return None
+        if declared == "BOOLEAN" and isinstance(value, str):
+            return {"true": 1, "false": 0}.get(value.lower(), value)
+        if isinstance(value, bool):
+            return int(value) if declared != "TEXT" else str(value).lower()
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, default=str)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return float(value)
+        return value
+
+    def row_to_dict(self, table: str, row: sqlite3.Row) -> Dict[str, Any]:
+        columns = self._columns.get(table) or {}
+        record = dict(row)
+        for name, value in record.items():
+            if value is None:
+                continue
+            declared = columns.get(name)
+            if declared == "BOOLEAN" and isinstance(value, int):
+                record[name] = bool(value)
+            elif declared == "JSON" and isinstance(value, str):
+                try:
+                    record[name] = json.loads(value)
+                except ValueError:
+                    pass
+        return record
+
+
+class LocalQuery:
+    """Builder with the supabase-py SyncRequestBuilder surface; execute() runs one statement"""
+
+    def __init__(self, database: LocalDatabase, table: str):
+        self.database = database
+        self.table = table
+        self.operation = "select"
+        self.columns = "*"
+        self.count_mode: Optional[str] = None
+        self.payload: Any = None
+        self.on_conflict: Optional[str] = None
+        self.ignore_duplicates = False
+        self.conditions: List[Tuple[str, str, Any, bool]] = []  # (column, operator, value, negated)
+        self.orders: List[Tuple[str, bool, Optional[bool]]] = []
+        self.limit_count: Optional[int] = None
+        self.offset_count: Optional[int] = None
+        self.single_mode: Optional[str] = None
+        self._negate = False
+
+    # ---- operations ----------------------------------------------------
+
+    def select(self, *columns: str, count: Optional[str] = None):
+        self.operation = "select"
+        self.columns = ",".join(columns) if columns else "*"
+        self.count_mode = count
+        return self
+
+    def insert(self, json: Any, *, count: Optional[str] = None, returning: str = "representation",
+               upsert: bool = False, default_to_null: bool = True):
+        self.operation = "upsert" if upsert else "insert"
+        self.payload = json
+        self.count_mode = count
+        return self
+
+    def upsert(self, json: Any, *, count: Optional[str] = None, returning: str = "representation",
+               ignore_duplicates: bool = False, on_conflict: str = "", default_to_null: bool = True):
+        self.operation = "upsert"
+        self.payload = json
+        self.count_mode = count
+        self.on_conflict = on_conflict or None
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, json: Dict[str, Any], *, count: Optional[str] = None, returning: str = "representation"):
+        self.operation = "update"
+        self.payload = json
+        self.count_mode = count
+        return self
+
+    def delete(self, *, count: Optional[str] = None, returning: str = "representation"):
+        self.operation = "delete"
+        self.count_mode = count
+        return self
+
+    # ---- filters -------------------------------------------------------
+
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def _add(self, column: str, operator: str, value: Any):
+        negate, self._negate = self._negate, False
+        self.conditions.append((column, operator, value, negate))
+        return self
+
+    def eq(self, column: str, value: Any):
+        return self._add(column, "eq", value)
+
+    def neq(self, column: str, value: Any):
+        return self._add(column, "neq", value)
+
+    def gt(self, column: str, value: Any):
+        return self._add(column, "gt", value)
+
+    def gte(self, column: str, value: Any):
+        return self._add(column, "gte", value)
+
+    def lt(self, column: str, value: Any):
+        return self._add(column, "lt", value)
+
+    def lte(self, column: str, value: Any):
+        return self._add(column, "lte", value)
+
+    def like(self, column: str, pattern: str):
+        return self._add(column, "like", pattern)
+
+    def ilike(self, column: str, pattern: str):
+        return self._add(column, "ilike", pattern)
+
+    def in_(self, column: str, values: List[Any]):
+        return self._add(column, "in", list(values))
+
+    def is_(self, column: str, value: Any):
+        return self._add(column, "is", value)
+
+    def match(self, query: Dict[str, Any]):
+        for column, value in query.items():
+            self.eq(column, value)
+        return self
+
+    def filter(self, column: str, operator: str, criteria: str):
+        """PostgREST-syntax filter, e.g. filter("status", "in", "(a,b)")"""
+        negate = operator.startswith("not.")
+        if negate:
+            operator = operator[4:]
+            self._negate = True
+        if operator == "in":
+            return self.in_(column, _split_list(criteria))
+        return self._add(column, operator, criteria)
+
+    def or_(self, filters: str, reference_table: Optional[str] = None):
+        """PostgREST or= syntax: "status.eq.pending,amount.gt.100" """
+        return self._add("", "or", filters)
+
+    # ---- modifiers -----------------------------------------------------
+
+    def order(self, column: str, *, desc: bool = False, nullsfirst: Optional[bool] = None,
+              foreign_table: Optional[str] = None):
+        self.orders.append((column, desc, nullsfirst))
+        return self
+
+    def limit(self, size: int, *, foreign_table: Optional[str] = None):
+        self.limit_count = size
+        return self
+
+    def offset(self, size: int):
+        self.offset_count = size
+        return self
+
+    def range(self, start: int, end: int, foreign_table: Optional[str] = None):
+        self.offset_count = start
+        self.limit_count = end - start + 1
+        return self
+
+    def single(self):
+        self.single_mode = "single"
+        return self
+
+    def maybe_single(self):
+        self.single_mode = "maybe"
+        return self
+
+    # ---- SQL -----------------------------------------------------------
+
+    def _projection(self) -> Tuple[str, List[Tuple[str, str]]]:
+        """SELECT list and (output key, column) pairs; "*" keeps every column"""
+        items = [item.strip() for item in self.columns.split(",") if item.strip()]
+        if not items or "*" in items:
+            return "*", []
+        pairs = []
+        for item in items:
+            if "(" in item:
+                raise APIError({"code": "PGRST200", "message": f"Embedded resources are not supported by the local database: {item}",
+                                "details": None, "hint": None})
+            alias, _, column = item.rpartition(":")
+            column = column.split("::")[0].strip()
+            pairs.append((alias.strip() or column, column))
+        self.database.require_columns(self.table, [column for _, column in pairs])
+        return ", ".join(_quote(column) for _, column in pairs), pairs
+
+    def _condition(self, column: str, operator: str, value: Any, negate: bool,
+                   columns: Dict[str, str]) -> Tuple[str, List[Any]]:
+        if operator == "or":
+            parts, params = [], []
+            for item in _split_list(value):
+                inner_column, inner_operator, inner_value = _parse_filter(item)
+                inner_negate = inner_operator.startswith("not.")
+                if inner_negate:
+                    inner_operator = inner_operator[4:]
+                if inner_operator == "in":
+                    inner_value = _split_list(inner_value)
+                sql, inner_params = self._condition(inner_column, inner_operator, inner_value, inner_negate,
+                                                    self.database.require_columns(self.table, [inner_column]))
+                parts.append(sql)
+                params.extend(inner_params)
+            sql = "(" + " OR ".join(parts) + ")"
+            return (f"NOT {sql}" if negate else sql), params
+
+        declared = columns.get(column, "TEXT")
+        quoted = _quote(column)
+        if operator == "is":
+            text = str(value).lower() if not isinstance(value, bool) and value is not None else value
+            if value is None or text == "null":
+                sql = f"{quoted} IS NULL"
+            elif value is True or text == "true":
+                sql = f"{quoted} = 1"
+            elif value is False or text == "false":
+                sql = f"{quoted} = 0"
+            else:
+                raise APIError({"code": "PGRST100", "message": f"Unsupported is value: {value}", "details": None, "hint": None})
+            return (f"NOT ({sql})" if negate else sql), []
+        if operator == "in":
+            values = [self.database.to_sql(item, declared) for item in value]
+            if not values:
+                sql = "0"
+            else:
+                sql = f"{quoted} IN ({', '.join('?' * len(values))})"
+            return (f"NOT ({sql})" if negate else sql), values
+        if operator in ("like", "ilike"):
+            pattern = str(value).replace("*", "%")
+            if operator == "like":
+                # GLOB is case sensitive like Postgres LIKE
+                sql = f"{quoted} GLOB ?"
+                pattern = pattern.replace("%", "*").replace("_", "?")
+            else:
+                sql = f"{quoted} LIKE ?"
+            return (f"NOT ({sql})" if negate else sql), [pattern]
+        symbol = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}.get(operator)
+        if symbol is None:
+            raise APIError({"code": "PGRST100", "message": f"Unsupported operator: {operator}", "details": None, "hint": None})
+        sql = f"{quoted} {symbol} ?"
+        return (f"NOT ({sql})" if negate else sql), [self.database.to_sql(value, declared)]
+
+    def _where(self) -> Tuple[str, List[Any]]:
+        if not self.conditions:
+            return "", []
+        columns = self.database.require_columns(self.table, [column for column, *_ in self.conditions if column])
+        parts, params = [], []
+        for column, operator, value, negate in self.conditions:
+            sql, condition_params = self._condition(column, operator, value, negate, columns)
+            parts.append(sql)
+            params.extend(condition_params)
+        return " WHERE " + " AND ".join(parts), params
+
+    def _order_by(self) -> str:
+        if not self.orders:
+            return ""
+        self.database.require_columns(self.table, [column for column, _, _ in self.orders])
+        terms = []
+        for column, desc, nullsfirst in self.orders:
+            # Postgres defaults: NULLS LAST ascending, NULLS FIRST descending
+            nulls_first = desc if nullsfirst is None else nullsfirst
+            terms.append(f"{_quote(column)} {'DESC' if desc else 'ASC'} NULLS {'FIRST' if nulls_first else 'LAST'}")
+        return " ORDER BY " + ", ".join(terms)
+
+    def _rows(self) -> List[Dict[str, Any]]:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        return [row for row in rows if row is not None]
+
+    def _run(self) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        database = self.database
+        connection = database.connection()
+        table = _quote(self.table)
+        database.columns(self.table)
+
+        if self.operation == "select":
+            select_list, pairs = self._projection()
+            where, params = self._where()
+            sql = f"SELECT {select_list} FROM {table}{where}{self._order_by()}"
+            paging: List[Any] = []
+            if self.limit_count is not None or self.offset_count:
+                sql += " LIMIT ? OFFSET ?"
+                paging = [self.limit_count if self.limit_count is not None else -1, self.offset_count or 0]
+            rows = [database.row_to_dict(self.table, row) for row in connection.execute(sql, params + paging)]
+            if pairs:
+                rows = [{alias: row.get(column) for alias, column in pairs} for row in rows]
+            count = None
+            if self.count_mode:
+                count = connection.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+            return rows, count
+
+        if self.operation in ("insert", "upsert"):
+            rows = self._rows()
+            columns = database.require_columns(self.table, {name for row in rows for name in row}, writing=True)
+            conflict, targets = None, []
+            if self.operation == "upsert":
+                targets = [name.strip() for name in (self.on_conflict or "id").split(",")]
+                conflict = ", ".join(_quote(name) for name in targets)
+            inserted = []
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    names = list(row)
+                    sql = (f"INSERT INTO {table} ({', '.join(_quote(name) for name in names)}) "
+                           f"VALUES ({', '.join('?' * len(names))})") if names else f"INSERT INTO {table} DEFAULT VALUES"
+                    if conflict:
+                        updates = [name for name in names if name not in targets]
+                        if self.ignore_duplicates or not updates:
+                            sql += f" ON CONFLICT ({conflict}) DO NOTHING"
+                        else:
+                            sql += f" ON CONFLICT ({conflict}) DO UPDATE SET " + ", ".join(
+                                f"{_quote(name)} = excluded.{_quote(name)}" for name in updates)
+                    sql += " RETURNING *"
+                    values = [database.to_sql(row[name], columns.get(name, "TEXT")) for name in names]
+                    inserted.extend(database.row_to_dict(self.table, r) for r in connection.execute(sql, values))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            return inserted, (len(inserted) if self.count_mode else None)
+
+        if self.operation == "update":
+            changes = self.payload or {}
+            columns = database.require_columns(self.table, changes, writing=True)
+            if not changes:
+                return [], None
+            where, params = self._where()
+            assignments = ", ".join(f"{_quote(name)} = ?" for name in changes)
+            values = [database.to_sql(value, columns.get(name, "TEXT")) for name, value in changes.items()]
+            rows = connection.execute(f"UPDATE {table} SET {assignments}{where} RETURNING *", values + params).fetchall()
+            data = [database.row_to_dict(self.table, row) for row in rows]
+            return data, (len(data) if self.count_mode else None)
+
+        if self.operation == "delete":
+            where, params = self._where()
+            rows = connection.execute(f"DELETE FROM {table}{where} RETURNING *", params).fetchall()
+            data = [database.row_to_dict(self.table, row) for row in rows]
+            return data, (len(data) if self.count_mode else None)
+
+        raise APIError({"code": "PGRST117", "message": f"Unsupported operation {self.operation}", "details": None, "hint": None})
+
+    def _url(self) -> str:
+        """PostgREST-equivalent URL, so request metrics and query traces treat local calls alike"""
+        params: List[Tuple[str, str]] = []
+        if self.operation == "select":
+            params.append(("select", self.columns))
+        elif self.on_conflict:
+            params.append(("on_conflict", self.on_conflict))
+        for column, operator, value, negate in self.conditions:
+            prefix = "not." if negate else ""
+            if operator == "or":
+                params.append(("or", f"({value})"))
+            elif operator == "in":
+                params.append((column, f"{prefix}in.({','.join(str(item) for item in value)})"))
+            else:
+                params.append((column, f"{prefix}{operator}.{value}"))
+        if self.orders:
+            params.append(("order", ",".join(f"{column}.{'desc' if desc else 'asc'}" for column, desc, _ in self.orders)))
+        if self.limit_count is not None:
+            params.append(("limit", str(self.limit_count)))
+        if self.offset_count:
+            params.append(("offset", str(self.offset_count)))
+        return f"sqlite:///rest/v1/{self.table}?{urlencode(params)}"
+
+    def execute(self) -> LocalResponse:
+        method = {"select": "GET", "insert": "POST", "upsert": "POST", "update": "PATCH", "delete": "DELETE"}[self.operation]
+        started = time.perf_counter()
+        status = "error"
+        data: List[Dict[str, Any]] = []
+        try:
+            try:
+                data, count = self._run()
+            except sqlite3.Error as e:
+                error = _api_error(e)
+                status = "409" if error.code == "23505" else "400"
+                raise error from e
+            except APIError:
+                status = "400"
+                raise
+            status = "201" if method == "POST" else "200"
+            if self.single_mode:
+                if len(data) == 1:
+                    return LocalResponse(data[0], count)
+                if self.single_mode == "maybe" and not data:
+                    return LocalResponse(None, count)
+                status = "406"
+                raise APIError({"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned",
+                                "details": f"The result contains {len(data)} rows", "hint": None})
+            return LocalResponse(data, count)
+        finally:
+            record_db_call(self.table, method, time.perf_counter() - started, self._url(), status, len(data))
+
+
+class LocalRpc:
+    """No stored procedures locally: PGRST202 sends callers to their non-RPC fallbacks"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def execute(self):
+        record_db_call(f"rpc/{self.name}", "POST", 0.0, f"sqlite:///rest/v1/rpc/{self.name}", "404", None)
+        raise APIError({"code": "PGRST202", "message": f"Could not find the function public.{self.name} in the schema cache",
+                        "details": None, "hint": None})
+
+
+class LocalClient:
+    """Stands in for supabase.Client (table/from_/rpc)"""
+
+    # Calls are recorded by LocalQuery itself; instrument_supabase leaves it alone
+    _request_metrics_instrumented = True
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.database = LocalDatabase(path, busy_timeout)
+
+    def table(self, name: str) -> LocalQuery:
+        return LocalQuery(self.database, name)
+
+    def from_(self, name: str) -> LocalQuery:
+        return self.table(name)
+
+    def rpc(self, fn: str, params: Optional[Dict[str, Any]] = None, count: Optional[str] = None) -> LocalRpc:
+        return LocalRpc(fn)
+
+
+def _split_list(text: str) -> List[str]:
+    """ "(a,b,\"c,d\")" / "a.eq.1,b.eq.2" -> items, respecting quotes and parentheses"""
+    text = text.strip()
+    if text.startswith("(") and text.endswith(")"):
+        text = text[1:-1]
+    items, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+            continue
+        if not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            items.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if current:
+        items.append("".join(current).strip())
+    return [item for item in items if item]
+
+
+def _parse_filter(item: str) -> Tuple[str, str, str]:
+    """ "amount.gt.100" -> ("amount", "gt", "100"); "status.not.eq.x" -> ("status", "not.eq", "x")"""
+    column, _, rest = item.partition(".")
+    operator, _, value = rest.partition(".")
+    if operator == "not":
+        inner, _, value = value.partition(".")
+        operator = f"not.{inner}"
+    return column, operator, value
+
+
+_clients: Dict[str, LocalClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_local_client(path: str) -> LocalClient:
+    """Shared client per database file (the web routers and services use one)"""
+    with _clients_lock:
+        client = _clients.get(path)
+        if client is None:
+            client = LocalClient(path)
+            _clients[path] = client
+            logger.info(f"✅ Local SQLite database at {path}")
+        return client
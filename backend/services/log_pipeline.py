@@ -0,0 +1,232 @@
+"""
+Logging Pipeline
+Non-blocking structured logging for both servers. Request threads only put
+records on a bounded in-memory queue (QueueHandler); a single listener thread
+formats them (JSON lines or text) and writes to stderr, so slow stdout/stderr
+never stalls a request. High-frequency DEBUG records are sampled, levels are
+set per module (LOG_LEVELS), and records are dropped and counted when the
+queue is full instead of blocking.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict
+from services.metrics import counter
+
+_dropped = counter("log_records_dropped_total", "Log records dropped because the log queue was full", ["level"])
+_sampled_out = counter("log_records_sampled_out_total", "Log records skipped by sampling", ["logger"])
+
+# LogRecord attributes that are not user-supplied `extra=` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample_rate"}
+
+# Loggers owned by uvicorn; their handlers are removed so they go through the queue too
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_settings: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """
+    Per-module levels from "httpx=WARNING,services.query_trace=INFO"
+
+    Raises:
+        ValueError: Unknown level name
+    """
+    levels = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, level = item.partition("=")
+        value = logging.getLevelName(level.strip().upper())
+        if not isinstance(value, int):
+            raise ValueError(f"Unknown log level for {name.strip()}: {level.strip()}")
+        levels[name.strip()] = value
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, service, logger, message, extras, exc"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep 1 in every round(1 / rate) records per call site (logger + message
+    template). Applies to DEBUG records and to any record logged with
+    `extra={"sample_rate": 0.01}`; everything else passes.
+    """
+
+    def __init__(self, debug_rate: float = 1.0):
+        super().__init__()
+        self.debug_rate = debug_rate
+        self._seen: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            if record.levelno > logging.DEBUG:
+                return True
+            rate = self.debug_rate
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            _sampled_out.inc(logger=record.name)
+            return False
+        every = max(1, round(1 / rate))
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            if len(self._seen) > 10000:
+                self._seen.clear()  # Bound memory when messages aren't templates
+            self._seen[key] = seen + 1
+        if seen % every == 0:
+            return True
+        _sampled_out.inc(logger=record.name)
+        return False
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking on a full queue"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback on the calling thread (args may be
+        # mutated later); formatting into JSON/text happens on the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped.inc(level=record.levelname)
+
+
+def configure_logging(service: str, level: str = "INFO", fmt: str = "json", levels: str = "",
+                      debug_sample_rate: float = 1.0, queue_size: int = 10000):
+    """
+    Route all logging through the queue (call once at server import; calling
+    again replaces the previous setup)
+
+    Args:
+        service: Service name added to every JSON record
+        level: Root level
+        fmt: "json" or "text"
+        levels: Per-module levels, see parse_levels
+        debug_sample_rate: Fraction of DEBUG records kept per call site
+        queue_size: Records buffered before new ones are dropped
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _stop_listener(_listener, 5.0)
+        _settings.update(service=service, level=level, fmt=fmt, levels=levels,
+                         debug_sample_rate=debug_sample_rate, queue_size=queue_size)
+
+        output = logging.StreamHandler(sys.stderr)
+        if fmt == "json":
+            output.setFormatter(JsonFormatter(service))
+        else:
+            output.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        handler = _NonBlockingQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(debug_sample_rate))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(logging.getLevelName(level.upper()))
+
+        route_uvicorn_loggers()
+        for name, module_level in parse_levels(levels).items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+
+
+def route_uvicorn_loggers():
+    """Send uvicorn's loggers through the root queue handler (uvicorn and its gunicorn worker install their own)"""
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+
+def _reinit_after_fork():
+    """
+    The listener thread doesn't survive fork (gunicorn --preload imports the
+    app in the master): give the child its own queue and listener
+    """
+    global _lock, _listener
+    _lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        configure_logging(**_settings)
+
+
+def _stop_listener(listener: logging.handlers.QueueListener, timeout: float):
+    """Stop after the queued records are written (the stop sentinel needs a free slot)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            listener.stop()
+            return
+        except queue.Full:
+            if time.monotonic() > deadline:
+                return
+            time.sleep(0.01)
+
+
+def shutdown_logging(timeout: float = 5.0):
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        _stop_listener(listener, timeout)
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
@@ -0,0 +1,187 @@
+"""
+Bounded LRU Cache
+Size-bounded, thread-safe LRU cache with TTL, negative caching and
+single-flight loading, instrumented with Prometheus-style counters
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+from services.metrics import counter
+
+_hits = counter("app_cache_hits_total", "Cache lookups served from cache", ["cache"])
+_misses = counter("app_cache_misses_total", "Cache lookups that required a load", ["cache"])
+_negative_hits = counter("app_cache_negative_hits_total", "Cache hits on a cached 'not found'", ["cache"])
+_evictions = counter("app_cache_evictions_total", "Entries evicted to respect maxsize", ["cache"])
+_loads = counter("app_cache_loads_total", "Loader calls (one per collapsed group of concurrent misses)", ["cache"])
+_load_errors = counter("app_cache_load_errors_total", "Loader calls that raised", ["cache"])
+_collapsed = counter("app_cache_collapsed_misses_total", "Misses that waited on an in-flight load instead of loading", ["cache"])
+_invalidations = counter("app_cache_invalidations_total", "Explicit invalidations", ["cache"])
+
+_NEGATIVE = object()
+
+
+class _Flight:
+    """An in-progress load that concurrent callers for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache.
+
+    Args:
+        name: Label used for metrics and stats
+        maxsize: Maximum number of entries (least recently used are evicted)
+        ttl: Seconds an entry stays fresh (None = no expiry)
+        negative_ttl: Seconds to remember that a loader returned None
+            (None = don't cache misses)
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: Optional[float] = None,
+                 negative_ttl: Optional[float] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _lookup(self, key: Hashable) -> Any:
+        """Return cached value, _NEGATIVE, or None if absent/expired (lock held)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]):
+        """Insert and evict down to maxsize (lock held)"""
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            _evictions.inc(cache=self.name)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a cached value without loading"""
+        with self._lock:
+            value = self._lookup(key)
+        if value is None:
+            _misses.inc(cache=self.name)
+            return default
+        if value is _NEGATIVE:
+            _negative_hits.inc(cache=self.name)
+            return default
+        _hits.inc(cache=self.name)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value (None is stored as a negative entry if negative caching is on)"""
+        with self._lock:
+            if value is None:
+                if self.negative_ttl is not None:
+                    self._store(key, _NEGATIVE, self.negative_ttl)
+                return
+            self._store(key, value, ttl if ttl is not None else self.ttl)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for key, calling loader() on a miss.
+
+        Concurrent misses for the same key share a single loader call.
+        A loader result of None is cached for negative_ttl seconds.
+        Loader exceptions propagate to every waiting caller and are not cached.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                if value is _NEGATIVE:
+                    _negative_hits.inc(cache=self.name)
+                    return None
+                _hits.inc(cache=self.name)
+                return value
+            _misses.inc(cache=self.name)
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                generation = self._generation
+
+        if not leader:
+            _collapsed.inc(cache=self.name)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        _loads.inc(cache=self.name)
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            _load_errors.inc(cache=self.name)
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                # Don't store a value read before a concurrent invalidation
+                if flight.error is None and generation == self._generation:
+                    if flight.value is None:
+                        if self.negative_ttl is not None:
+                            self._store(key, _NEGATIVE, self.negative_ttl)
+                    else:
+                        self._store(key, flight.value, self.ttl)
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, key: Hashable = None):
+        """Drop one key, or everything when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._generation += 1
+        _invalidations.inc(cache=self.name)
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current size/config plus lifetime counters for this cache"""
+        hits = _hits.value(cache=self.name)
+        misses = _misses.value(cache=self.name)
+        negative_hits = _negative_hits.value(cache=self.name)
+        lookups = hits + misses + negative_hits
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "negative_ttl_seconds": self.negative_ttl,
+            "hits": hits,
+            "negative_hits": negative_hits,
+            "misses": misses,
+            "hit_rate": round((hits + negative_hits) / lookups, 4) if lookups else 0.0,
+            "loads": _loads.value(cache=self.name),
+            "load_errors": _load_errors.value(cache=self.name),
+            "collapsed_misses": _collapsed.value(cache=self.name),
+            "evictions": _evictions.value(cache=self.name),
+            "invalidations": _invalidations.value(cache=self.name)
+        }
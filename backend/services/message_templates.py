@@ -1,9 +1,60 @@
 """
 Message Templates for WhatsApp Notifications
-Hospital-specific customizable message templates
+Hospital-specific customizable message templates, compiled once into render
+functions and cached per hospital and template text
 """
-from typing import Optional
+import re
+from functools import lru_cache
+from typing import Optional, Dict, Any, Callable, Iterable, List, Mapping
 from datetime import datetime
+from services.lru_cache import LRUCache
+
+# Placeholders a hospital may use in each kind of custom template
+PLACEHOLDERS = {
+    "confirmation": {"patient_name", "doctor_name", "date", "time", "hospital_name", "specialty"},
+    "followup": {"patient_name", "doctor_name", "followup_date", "hospital_name"},
+    "reminder": {"patient_name", "doctor_name", "date", "time", "hospital_name"},
+    "operation_reminder": {"patient_name", "doctor_name", "date", "hospital_name", "specialty"},
+}
+
+# hospitals column holding each kind's custom template
+TEMPLATE_COLUMNS = {
+    "confirmation": "whatsapp_confirmation_template",
+    "followup": "whatsapp_followup_template",
+    "reminder": "whatsapp_reminder_template",
+}
+
+MAX_TEMPLATE_LENGTH = 500  # hospitals.whatsapp_*_template are VARCHAR(500)
+
+# Defaults may also use the derived fields short_date ("10 Feb") and specialty_text (" (Ortho)")
+DEFAULT_TEMPLATES = {
+    "confirmation": (
+        "Hello {patient_name},\nYour appointment with Dr {doctor_name}{specialty_text} is confirmed.\n"
+        "🗓 Date: {short_date}\n⏰ Time: {time}\n– {hospital_name}"
+    ),
+    "followup": (
+        "Hello {patient_name},\n\nThis is a reminder for your follow-up visit with Dr {doctor_name}.\n\n"
+        "📅 Date: {followup_date}\n\n– {hospital_name}"
+    ),
+    "reminder": (
+        "Hello {patient_name},\n\nReminder: Your appointment with Dr {doctor_name} is scheduled for:\n\n"
+        "🗓 Date: {date}\n⏰ Time: {time}\n\nPlease arrive on time.\n\n– {hospital_name}"
+    ),
+    "operation_reminder": (
+        "Hello {patient_name},\n\nReminder: Your {specialty} procedure with Dr {doctor_name} is scheduled for:\n\n"
+        "🗓 Date: {date}\n\nPlease follow the pre-operation instructions you were given.\n\n– {hospital_name}"
+    ),
+}
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+# (hospital_id, kind) -> (template text, render function); the text is the template version
+_compiled_cache = LRUCache("message_templates", maxsize=2048)
+
+
+class TemplateError(ValueError):
+    """Raised for a custom template that cannot be saved"""
+
 
 def format_date(date_obj) -> str:
     """Format date object to readable string."""
@@ -15,6 +66,7 @@ def format_date(date_obj) -> str:
         return str(date_obj)
 
 
+@lru_cache(maxsize=256)
 def format_time(time_slot: str) -> str:
     """Format time slot to readable format."""
     try:
@@ -28,12 +80,139 @@ def format_time(time_slot: str) -> str:
             period = "PM"
             if hour > 12:
                 hour -= 12
-        
+
         return f"{hour}:{minute:02d} {period}"
     except:
         return time_slot
 
 
+@lru_cache(maxsize=1024)
+def _short_date_from_str(date: str) -> str:
+    try:
+        return datetime.strptime(date, "%Y-%m-%d").strftime("%d %b")  # "10 Feb"
+    except:
+        return date
+
+
+def format_short_date(date) -> str:
+    """Format date as "10 Feb" (day and month only)"""
+    if isinstance(date, str):
+        return _short_date_from_str(date)
+    try:
+        return date.strftime("%d %b")
+    except:
+        return format_date(date)
+
+
+def validate_template(kind: str, template: str):
+    """
+    Check a custom template before it is saved
+
+    Raises:
+        TemplateError: Unknown placeholder, stray brace or over-long template
+    """
+    if len(template) > MAX_TEMPLATE_LENGTH:
+        raise TemplateError(f"Template is longer than {MAX_TEMPLATE_LENGTH} characters")
+
+    allowed = PLACEHOLDERS[kind]
+    unknown = sorted({name for name in _PLACEHOLDER.findall(template) if name not in allowed})
+    if unknown:
+        raise TemplateError(
+            f"Unknown placeholder(s) {', '.join('{' + n + '}' for n in unknown)}; "
+            f"allowed: {', '.join('{' + n + '}' for n in sorted(allowed))}"
+        )
+
+    leftover = _PLACEHOLDER.sub("", template)
+    if "{" in leftover or "}" in leftover:
+        raise TemplateError("Braces may only be used around placeholders, e.g. {patient_name}")
+
+
+def _optional(formatter: Callable[[Any], str], field: str) -> Callable[[Mapping[str, Any]], str]:
+    return lambda row: formatter(row[field]) if row.get(field) is not None else ""
+
+
+# Placeholder -> how to produce it from a message row; only the placeholders a template uses are computed
+_FIELDS: Dict[str, Callable[[Mapping[str, Any]], str]] = {
+    "patient_name": lambda row: row.get("patient_name") or "",
+    "doctor_name": lambda row: row.get("doctor_name") or "",
+    "hospital_name": lambda row: row.get("hospital_name") or "",
+    "date": _optional(format_date, "date"),
+    "short_date": _optional(format_short_date, "date"),
+    "time": lambda row: format_time(row["time_slot"]) if row.get("time_slot") else "",
+    "followup_date": _optional(format_date, "followup_date"),
+    "specialty": lambda row: row.get("specialty") or "",
+    "specialty_text": lambda row: f" ({row['specialty']})" if row.get("specialty") else "",
+}
+
+
+def compile_template(template: str) -> Callable[[Mapping[str, Any]], str]:
+    """
+    Parse a template once into a render function taking a message row.
+    Only the placeholders the template uses are computed per message; text
+    that isn't a known {placeholder} (including unknown ones in templates
+    saved before validation existed) is kept literally.
+    """
+    parts = []
+    used = {}
+    position = 0
+    for match in _PLACEHOLDER.finditer(template):
+        name = match.group(1)
+        if name in _FIELDS:
+            parts.append(template[position:match.start()].replace("{", "{{").replace("}", "}}"))
+            parts.append("{" + name + "}")
+            used[name] = _FIELDS[name]
+            position = match.end()
+    parts.append(template[position:].replace("{", "{{").replace("}", "}}"))
+    format_string = "".join(parts)
+    fields = tuple(used.items())
+
+    def render(row: Mapping[str, Any]) -> str:
+        return format_string.format_map({name: field(row) for name, field in fields})
+
+    return render
+
+
+def get_compiled_template(kind: str, custom_template: Optional[str] = None,
+                          hospital_id: Optional[int] = None) -> Callable[[Mapping[str, Any]], str]:
+    """Render function for a hospital's custom template (or the default), compiled at most once per version"""
+    template = custom_template or DEFAULT_TEMPLATES[kind]
+    key = (hospital_id, kind)
+    cached = _compiled_cache.get(key)
+    if cached and cached[0] == template:
+        return cached[1]
+    render = compile_template(template)
+    _compiled_cache.set(key, (template, render))
+    return render
+
+
+def invalidate_hospital_templates(hospital_id: Optional[int] = None):
+    """Drop a hospital's compiled templates (all hospitals if None)"""
+    if hospital_id is None:
+        _compiled_cache.invalidate()
+        return
+    for kind in PLACEHOLDERS:
+        _compiled_cache.invalidate((hospital_id, kind))
+
+
+def render_messages(kind: str, rows: Iterable[Mapping[str, Any]], custom_template: Optional[str] = None,
+                    hospital_id: Optional[int] = None) -> List[str]:
+    """
+    Render one message per row with a single compiled template
+
+    Args:
+        kind: confirmation, followup, reminder or operation_reminder
+        rows: patient_name, doctor_name, hospital_name and whichever of date,
+            time_slot, followup_date, specialty the template needs
+        custom_template: Hospital's custom template (None for the default)
+        hospital_id: Cache key for the compiled template
+
+    Returns:
+        Messages in row order
+    """
+    render = get_compiled_template(kind, custom_template, hospital_id)
+    return [render(row) for row in rows]
+
+
 def get_confirmation_message(
     patient_name: str,
     doctor_name: str,
@@ -41,11 +220,12 @@ def get_confirmation_message(
     time_slot: str,
     hospital_name: str,
     specialty: Optional[str] = None,
-    custom_template: Optional[str] = None
+    custom_template: Optional[str] = None,
+    hospital_id: Optional[int] = None
 ) -> str:
     """
     Generate appointment confirmation message.
-    
+
     Args:
         patient_name: Patient's name
         doctor_name: Doctor's name
@@ -54,38 +234,20 @@ def get_confirmation_message(
         hospital_name: Hospital name
         specialty: Specialty (optional)
         custom_template: Custom template from hospital settings
-    
+        hospital_id: Hospital the custom template belongs to (cache key)
+
     Returns:
         str: Formatted message
     """
-    if custom_template:
-        # Use custom template with placeholders
-        message = custom_template
-        message = message.replace("{patient_name}", patient_name)
-        message = message.replace("{doctor_name}", doctor_name)
-        message = message.replace("{date}", format_date(date))
-        message = message.replace("{time}", format_time(time_slot))
-        message = message.replace("{hospital_name}", hospital_name)
-        if specialty:
-            message = message.replace("{specialty}", specialty)
-        return message
-    
-    # Default template - Exact format as required
-    # Format: "Hello Rahul, Your appointment with Dr Mehta (Ortho) is confirmed. 🗓 Date: 10 Feb ⏰ Time: 10:30 AM – ABC Hospital"
-    specialty_text = f" ({specialty})" if specialty else ""
-    
-    # Format date as "10 Feb" (day and month only)
-    try:
-        if isinstance(date, str):
-            from datetime import datetime
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-        else:
-            date_obj = date
-        formatted_date = date_obj.strftime("%d %b")  # "10 Feb"
-    except:
-        formatted_date = format_date(date)
-    
-    return f"Hello {patient_name},\nYour appointment with Dr {doctor_name}{specialty_text} is confirmed.\n🗓 Date: {formatted_date}\n⏰ Time: {format_time(time_slot)}\n– {hospital_name}"
+    # Default format: "Hello Rahul, Your appointment with Dr Mehta (Ortho) is confirmed. 🗓 Date: 10 Feb ⏰ Time: 10:30 AM – ABC Hospital"
+    return render_messages("confirmation", [{
+        "patient_name": patient_name,
+        "doctor_name": doctor_name,
+        "date": date,
+        "time_slot": time_slot,
+        "hospital_name": hospital_name,
+        "specialty": specialty
+    }], custom_template, hospital_id)[0]
 
 
 def get_followup_message(
@@ -93,37 +255,29 @@ def get_followup_message(
     doctor_name: str,
     followup_date: str,
     hospital_name: str,
-    custom_template: Optional[str] = None
+    custom_template: Optional[str] = None,
+    hospital_id: Optional[int] = None
 ) -> str:
     """
     Generate follow-up reminder message.
-    
+
     Args:
         patient_name: Patient's name
         doctor_name: Doctor's name
         followup_date: Follow-up date
         hospital_name: Hospital name
         custom_template: Custom template from hospital settings
-    
+        hospital_id: Hospital the custom template belongs to (cache key)
+
     Returns:
         str: Formatted message
     """
-    if custom_template:
-        message = custom_template
-        message = message.replace("{patient_name}", patient_name)
-        message = message.replace("{doctor_name}", doctor_name)
-        message = message.replace("{followup_date}", format_date(followup_date))
-        message = message.replace("{hospital_name}", hospital_name)
-        return message
-    
-    # Default template
-    return f"""Hello {patient_name},
-
-This is a reminder for your follow-up visit with Dr {doctor_name}.
-
-📅 Date: {format_date(followup_date)}
-
-– {hospital_name}"""
+    return render_messages("followup", [{
+        "patient_name": patient_name,
+        "doctor_name": doctor_name,
+        "followup_date": followup_date,
+        "hospital_name": hospital_name
+    }], custom_template, hospital_id)[0]
 
 
 def get_reminder_message(
@@ -132,11 +286,12 @@ def get_reminder_message(
     date: str,
     time_slot: str,
     hospital_name: str,
-    custom_template: Optional[str] = None
+    custom_template: Optional[str] = None,
+    hospital_id: Optional[int] = None
 ) -> str:
     """
     Generate appointment reminder message (for upcoming appointments).
-    
+
     Args:
         patient_name: Patient's name
         doctor_name: Doctor's name
@@ -144,28 +299,15 @@ def get_reminder_message(
         time_slot: Time slot
         hospital_name: Hospital name
         custom_template: Custom template from hospital settings
-    
+        hospital_id: Hospital the custom template belongs to (cache key)
+
     Returns:
         str: Formatted message
     """
-    if custom_template:
-        message = custom_template
-        message = message.replace("{patient_name}", patient_name)
-        message = message.replace("{doctor_name}", doctor_name)
-        message = message.replace("{date}", format_date(date))
-        message = message.replace("{time}", format_time(time_slot))
-        message = message.replace("{hospital_name}", hospital_name)
-        return message
-    
-    # Default template
-    return f"""Hello {patient_name},
-
-Reminder: Your appointment with Dr {doctor_name} is scheduled for:
-
-🗓 Date: {format_date(date)}
-⏰ Time: {format_time(time_slot)}
-
-Please arrive on time.
-
-– {hospital_name}"""
-
+    return render_messages("reminder", [{
+        "patient_name": patient_name,
+        "doctor_name": doctor_name,
+        "date": date,
+        "time_slot": time_slot,
+        "hospital_name": hospital_name
+    }], custom_template, hospital_id)[0]
@@ -0,0 +1,82 @@
+"""
+Hospital and Doctor Metadata Cache
+Read-through cache for rarely-changing hospital and doctor rows with TTL,
+size bounds and explicit invalidation from the endpoints that modify them
+"""
+from typing import Optional, Dict, Any
+from repositories import hospitals, users
+from services.lru_cache import LRUCache
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+_hospital_cache = LRUCache(
+    "hospitals",
+    maxsize=config.METADATA_CACHE_MAX_SIZE,
+    ttl=config.METADATA_CACHE_TTL,
+    negative_ttl=config.METADATA_CACHE_NEGATIVE_TTL
+)
+_doctor_cache = LRUCache(
+    "doctors",
+    maxsize=config.METADATA_CACHE_MAX_SIZE,
+    ttl=config.METADATA_CACHE_TTL,
+    negative_ttl=config.METADATA_CACHE_NEGATIVE_TTL
+)
+
+
+def _load_hospital(hospital_id: int) -> Optional[Dict[str, Any]]:
+    return hospitals.settings(hospital_id)
+
+
+def _load_doctor(doctor_id: int) -> Optional[Dict[str, Any]]:
+    return users.active_doctor(doctor_id)
+
+
+def _copy(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # Callers get their own dict so adding display fields cannot change the cached row
+    return dict(row) if row is not None else None
+
+
+def get_hospital(hospital_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Get a copy of a hospital row (all columns), served from cache when fresh.
+
+    Returns:
+        Hospital dict or None if not found
+    """
+    if not hospital_id:
+        return None
+    hospital_id = int(hospital_id)
+    return _copy(_hospital_cache.get_or_load(hospital_id, lambda: _load_hospital(hospital_id)))
+
+
+def get_doctor(doctor_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Get a copy of an active doctor's users row (profile columns, no password_hash), served from cache when fresh.
+
+    Returns:
+        Doctor dict or None if not found / not an active doctor
+    """
+    if not doctor_id:
+        return None
+    doctor_id = int(doctor_id)
+    return _copy(_doctor_cache.get_or_load(doctor_id, lambda: _load_doctor(doctor_id)))
+
+
+def invalidate_hospital(hospital_id: Optional[int] = None):
+    """Drop one hospital (or all hospitals when hospital_id is None) from the cache"""
+    _hospital_cache.invalidate(int(hospital_id) if hospital_id else None)
+
+
+def invalidate_doctor(doctor_id: Optional[int] = None):
+    """Drop one doctor (or all doctors when doctor_id is None) from the cache"""
+    _doctor_cache.invalidate(int(doctor_id) if doctor_id else None)
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/size statistics for each metadata cache"""
+    return {
+        "hospitals": _hospital_cache.stats(),
+        "doctors": _doctor_cache.stats()
+    }
@@ -0,0 +1,180 @@
+"""
+Payment Status Events
+Per-process registry of requests waiting for a payment to change status.
+Status endpoints park here instead of being polled; whatever moves a payment
+(webhook handler, reconciler, manual verification) calls notify_payment_changed
+to wake them. Waiters in other server processes are not woken and simply fall
+back to their timeout.
+"""
+import asyncio
+import threading
+from typing import Optional, Dict, Any, Set, Callable, Iterable
+from services.metrics import counter
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+_waits = counter("payment_status_waits_total", "Long-poll/SSE status waits by how they ended", ["result"])
+_notifications = counter("payment_status_notifications_total", "Payment status change notifications published")
+
+
+class _Watch:
+    """One parked request; woken from any thread via its event loop"""
+
+    def __init__(self, hub: "PaymentStatusHub", keys: Iterable[str]):
+        self.hub = hub
+        self.keys = tuple(keys)
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    async def wait(self, timeout: float) -> bool:
+        """True if notified within timeout"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+    def close(self):
+        self.hub._remove(self)
+
+
+class PaymentStatusHub:
+    """Subscription registry keyed by "payment:<id>" / "order:<razorpay order id>" """
+
+    def __init__(self, max_waiters: int = 10000):
+        self.max_waiters = max_waiters
+        self._watches: Dict[str, Set[_Watch]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def watch(self, *keys: str) -> Optional[_Watch]:
+        """Register a waiter (call from the event loop); None when the registry is full"""
+        watch = _Watch(self, keys)
+        with self._lock:
+            if self._count >= self.max_waiters:
+                return None
+            for key in watch.keys:
+                self._watches.setdefault(key, set()).add(watch)
+            self._count += 1
+        return watch
+
+    def _remove(self, watch: _Watch):
+        with self._lock:
+            removed = False
+            for key in watch.keys:
+                watchers = self._watches.get(key)
+                if watchers and watch in watchers:
+                    watchers.discard(watch)
+                    removed = True
+                    if not watchers:
+                        del self._watches[key]
+            if removed:
+                self._count -= 1
+
+    def publish(self, *keys: str) -> int:
+        """Wake everyone watching any of the keys (thread-safe); returns the number woken"""
+        with self._lock:
+            targets = set()
+            for key in keys:
+                targets.update(self._watches.get(key, ()))
+        for watch in targets:
+            try:
+                watch.wake()
+            except RuntimeError:
+                # Loop already closed (request torn down)
+                pass
+        return len(targets)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"waiters": self._count, "keys": len(self._watches), "max_waiters": self.max_waiters}
+
+
+_hub = PaymentStatusHub(max_waiters=config.PAYMENT_STATUS_MAX_WAITERS)
+
+
+def payment_keys(payment_id: Optional[int] = None, order_id: Optional[str] = None) -> list:
+    keys = []
+    if payment_id is not None:
+        keys.append(f"payment:{payment_id}")
+    if order_id:
+        keys.append(f"order:{order_id}")
+    return keys
+
+
+def notify_payment_changed(payment_id: Optional[int] = None, order_id: Optional[str] = None):
+    """Wake requests waiting on this payment (by payments.id and/or gateway order id)"""
+    keys = payment_keys(payment_id, order_id)
+    if keys and _hub.publish(*keys):
+        _notifications.inc()
+
+
+def watch_payment(payment_id: Optional[int] = None, order_id: Optional[str] = None) -> Optional[_Watch]:
+    """Register a waiter for a payment (see PaymentStatusHub.watch)"""
+    return _hub.watch(*payment_keys(payment_id, order_id))
+
+
+def clamp_timeout(timeout: Optional[float]) -> float:
+    if timeout is None:
+        return config.PAYMENT_STATUS_WAIT_TIMEOUT
+    return max(0.0, min(float(timeout), config.PAYMENT_STATUS_WAIT_MAX_TIMEOUT))
+
+
+async def wait_for_status_change(load: Callable[[], Optional[Dict[str, Any]]],
+                                 known_status: Optional[str], timeout: float,
+                                 final_statuses: Iterable[str],
+                                 payment_id: Optional[int] = None,
+                                 order_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Long-poll a payment row
+
+    Args:
+        load: Blocking loader returning the payment row (or None if missing)
+        known_status: Status the client already has (default: the current one)
+        timeout: Seconds to park before returning the unchanged row
+        final_statuses: Statuses that never change again; returned immediately
+        payment_id / order_id: Keys the payment is published under
+
+    Returns:
+        The payment row once its status differs from known_status, is final,
+        or the timeout passes; None if the payment does not exist
+    """
+    final_statuses = set(final_statuses)
+    # Register before reading so a transition between the read and the wait isn't missed
+    watch = watch_payment(payment_id, order_id)
+    try:
+        row = await asyncio.to_thread(load)
+        if row is None:
+            return None
+        baseline = known_status or row.get("status")
+        if watch is None:
+            _waits.inc(result="registry_full")
+            return row
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        waited = False
+        while row.get("status") == baseline and row.get("status") not in final_statuses:
+            remaining = deadline - loop.time()
+            if remaining <= 0 or not await watch.wait(remaining):
+                _waits.inc(result="timeout")
+                return row
+            waited = True
+            row = await asyncio.to_thread(load)
+            if row is None:
+                return None
+        _waits.inc(result="changed" if waited else "immediate")
+        return row
+    finally:
+        if watch is not None:
+            watch.close()
+
+
+def get_waiter_stats() -> Dict[str, Any]:
+    return _hub.stats()
@@ -0,0 +1,337 @@
+"""
+Payment Reconciliation
+Scheduled job that settles payments stuck in INITIATED/PENDING by asking
+Razorpay what happened to their orders, instead of waiting for a client to
+poll or a doctor to verify each payment by hand
+"""
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+import config
+from database import get_supabase
+from payment_gateway import RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET
+from services.razorpay_client import AsyncRazorpayHTTPClient
+from services.slot_reservation import is_function_not_found
+from services.audit_logger import log_audit_event
+from services.payment_events import notify_payment_changed
+from services.metrics import counter
+import logging
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ["INITIATED", "PENDING"]
+
+# Columns needed to decide a payment's fate (projection instead of select("*"))
+SCAN_FIELDS = "id, amount, status, razorpay_order_id, initiated_at"
+
+# Order ids of PaymentGateway._create_upi_order (no Razorpay order behind them);
+# the gateway can never resolve these, so they are left to manual verification
+UPI_FALLBACK_ORDER_PATTERN = "UPI_%"
+
+_outcomes = counter("payment_reconciliation_total", "Stale payments examined by the reconciler", ["outcome"])
+
+# Set to False the first time apply_payment_reconciliation turns out not to be deployed
+_bulk_rpc_available = True
+
+_run_lock = threading.Lock()
+_last_report: Optional[Dict[str, Any]] = None
+_current_run_id: Optional[str] = None
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all tasks"""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def decide_transition(payment: Dict[str, Any], gateway_payments: List[Dict[str, Any]],
+                      fail_cutoff: str) -> Dict[str, Any]:
+    """
+    Work out what a stale payment should become, given its order's payments at Razorpay
+
+    Args:
+        payment: Row from the payments table (SCAN_FIELDS)
+        gateway_payments: Items of GET /orders/{id}/payments
+        fail_cutoff: Payments initiated before this (ISO) are failed if every attempt failed
+
+    Returns:
+        {"outcome": str, "update": dict or None}; update carries the new status
+    """
+    expected_amount = round(float(payment.get("amount") or 0) * 100)
+
+    captured = [p for p in gateway_payments if p.get("status") in ("captured", "refunded")]
+    if captured:
+        gateway_payment = captured[0]
+        if int(gateway_payment.get("amount", 0)) != expected_amount:
+            return {"outcome": "amount_mismatch", "update": None}
+        return {"outcome": "completed", "update": {
+            "id": payment["id"],
+            "status": "COMPLETED",
+            "razorpay_payment_id": gateway_payment.get("id"),
+            "failure_reason": None,
+            "failure_code": None
+        }}
+
+    if not gateway_payments:
+        return {"outcome": "no_attempts", "update": None}
+    if any(p.get("status") in ("created", "authorized") for p in gateway_payments):
+        return {"outcome": "in_progress", "update": None}
+
+    # Every attempt failed; give the customer time to retry before closing it
+    if (payment.get("initiated_at") or "") >= fail_cutoff:
+        return {"outcome": "failed_recently", "update": None}
+    latest = max(gateway_payments, key=lambda p: p.get("created_at") or 0)
+    return {"outcome": "failed", "update": {
+        "id": payment["id"],
+        "status": "FAILED",
+        "razorpay_payment_id": latest.get("id"),
+        "failure_reason": latest.get("error_description") or latest.get("error_code", "Unknown error"),
+        "failure_code": latest.get("error_code")
+    }}
+
+
+def apply_transitions(supabase, updates: List[Dict[str, Any]]) -> int:
+    """
+    Apply reconciler transitions in bulk (one RPC per page).
+    Rows that moved on in the meantime (e.g. via a webhook) are left alone.
+
+    Returns:
+        Number of payments updated
+    """
+    global _bulk_rpc_available
+    if not updates:
+        return 0
+
+    if _bulk_rpc_available:
+        try:
+            result = supabase.rpc("apply_payment_reconciliation", {"p_updates": updates}).execute()
+            for row in result.data or []:
+                notify_payment_changed(row["payment_id"], row.get("razorpay_order_id"))
+            return len(result.data or [])
+        except Exception as e:
+            if not is_function_not_found(e):
+                raise
+            logger.warning("apply_payment_reconciliation RPC not found, updating rows individually")
+            _bulk_rpc_available = False
+
+    now = datetime.now().isoformat()
+    applied = 0
+    for update in updates:
+        data = {"status": update["status"], "updated_at": now}
+        if update.get("razorpay_payment_id"):
+            data["razorpay_payment_id"] = update["razorpay_payment_id"]
+        if update["status"] == "COMPLETED":
+            data["gateway_transaction_id"] = update["razorpay_payment_id"]
+            data["completed_at"] = now
+        else:
+            data["failed_at"] = now
+            data["failure_reason"] = update["failure_reason"]
+            data["failure_code"] = update["failure_code"]
+        result = supabase.table("payments").update(data).eq("id", update["id"]).in_(
+            "status", OPEN_STATUSES
+        ).execute()
+        if not result.data:
+            continue
+        applied += 1
+        row = result.data[0]
+        notify_payment_changed(row["id"], row.get("razorpay_order_id"))
+        if update["status"] == "COMPLETED":
+            if row.get("appointment_id"):
+                supabase.table("appointments").update({"status": "confirmed"}).eq("id", row["appointment_id"]).execute()
+            elif row.get("operation_id"):
+                supabase.table("operations").update({"status": "confirmed"}).eq("id", row["operation_id"]).execute()
+    return applied
+
+
+async def reconcile_stale_payments(stale_after_minutes: int = 15, fail_after_minutes: int = 60,
+                                   page_size: int = 200, concurrency: int = 8,
+                                   rate_per_second: float = 10, max_payments: int = 5000,
+                                   dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Reconcile INITIATED/PENDING Razorpay payments against the gateway
+
+    Args:
+        stale_after_minutes: Only payments initiated at least this long ago
+        fail_after_minutes: Mark FAILED only after this long with every attempt failed
+        page_size: Payments read (and transitioned) per page
+        concurrency: Maximum in-flight Razorpay calls
+        rate_per_second: Maximum Razorpay calls per second
+        max_payments: Stop after examining this many payments
+        dry_run: Decide but don't write
+
+    Returns:
+        Reconciliation report
+    """
+    supabase = get_supabase()
+    if not supabase:
+        raise RuntimeError("Database not configured")
+    if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
+        raise RuntimeError("Razorpay credentials not configured")
+
+    started = time.time()
+    now = datetime.now()
+    stale_cutoff = (now - timedelta(minutes=stale_after_minutes)).isoformat()
+    fail_cutoff = (now - timedelta(minutes=fail_after_minutes)).isoformat()
+
+    outcomes: Dict[str, int] = {}
+    errors: List[str] = []
+    scanned = updated = 0
+    last_id = 0
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = _RateLimiter(rate_per_second)
+    # Own client: the job runs on a scheduler thread with its own event loop
+    client = AsyncRazorpayHTTPClient(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET), pool_size=concurrency)
+
+    async def examine(payment: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            await limiter.wait()
+            try:
+                response = await client.get(f"/orders/{payment['razorpay_order_id']}/payments")
+            except Exception as e:
+                return {"outcome": "error", "update": None, "error": f"payment {payment['id']}: {e}"}
+        if response.status_code != 200:
+            return {"outcome": "error", "update": None,
+                    "error": f"payment {payment['id']}: HTTP {response.status_code}"}
+        return decide_transition(payment, response.json().get("items", []), fail_cutoff)
+
+    try:
+        while scanned < max_payments:
+            # Keyset pagination: stable under concurrent updates, no OFFSET scans
+            page = supabase.table("payments").select(SCAN_FIELDS).in_(
+                "status", OPEN_STATUSES
+            ).not_.is_("razorpay_order_id", "null").not_.like(
+                "razorpay_order_id", UPI_FALLBACK_ORDER_PATTERN
+            ).lt(
+                "initiated_at", stale_cutoff
+            ).gt("id", last_id).order("id").limit(min(page_size, max_payments - scanned)).execute()
+            rows = page.data or []
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            scanned += len(rows)
+
+            decisions = await asyncio.gather(*(examine(row) for row in rows))
+            updates = []
+            for decision in decisions:
+                outcome = decision["outcome"]
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                _outcomes.inc(outcome=outcome)
+                if decision.get("error"):
+                    errors.append(decision["error"])
+                if decision["update"]:
+                    updates.append(decision["update"])
+
+            if updates and not dry_run:
+                updated += await asyncio.to_thread(apply_transitions, supabase, updates)
+            if len(rows) < page_size:
+                break
+    finally:
+        await client.aclose()
+
+    report = {
+        "started_at": datetime.fromtimestamp(started).isoformat(),
+        "duration_seconds": round(time.time() - started, 3),
+        "dry_run": dry_run,
+        "scanned": scanned,
+        "updated": updated,
+        "outcomes": outcomes,
+        "errors": errors[:20],
+        "error_count": len(errors)
+    }
+    return report
+
+
+def run_reconciliation_job(dry_run: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Scheduler entry point: run one reconciliation pass and record the report
+
+    Returns:
+        The report, or None if a run is already in progress or it failed
+    """
+    if not _run_lock.acquire(blocking=False):
+        logger.info("ℹ️ Payment reconciliation already running, skipping")
+        return None
+    return _run_locked(uuid.uuid4().hex, dry_run)
+
+
+def start_reconciliation_run(dry_run: bool = False) -> Optional[str]:
+    """
+    Start a reconciliation pass on a background thread (admin "run now")
+
+    Returns:
+        The run id (reported as run_id by get_last_report), or None if a run
+        is already in progress
+    """
+    if not _run_lock.acquire(blocking=False):
+        return None
+    run_id = uuid.uuid4().hex
+    threading.Thread(
+        target=_run_locked, args=(run_id, dry_run), name="payment-reconciliation", daemon=True
+    ).start()
+    return run_id
+
+
+def _run_locked(run_id: str, dry_run: bool) -> Optional[Dict[str, Any]]:
+    """Run one pass with _run_lock already held by the caller; releases it"""
+    global _last_report, _current_run_id
+    _current_run_id = run_id
+    try:
+        report = asyncio.run(reconcile_stale_payments(
+            stale_after_minutes=config.RECONCILE_STALE_MINUTES,
+            fail_after_minutes=config.RECONCILE_FAIL_AFTER_MINUTES,
+            page_size=config.RECONCILE_PAGE_SIZE,
+            concurrency=config.RECONCILE_CONCURRENCY,
+            rate_per_second=config.RECONCILE_RATE_PER_SECOND,
+            max_payments=config.RECONCILE_MAX_PAYMENTS,
+            dry_run=dry_run
+        ))
+        report["run_id"] = run_id
+        _last_report = report
+        logger.info(
+            f"✅ Payment reconciliation: scanned {report['scanned']}, updated {report['updated']}, "
+            f"outcomes {report['outcomes']}, errors {report['error_count']}"
+        )
+        if report["scanned"]:
+            log_audit_event(
+                event_type="payment_update",
+                action="Payment reconciliation run",
+                resource_type="payment_reconciliation",
+                details=report,
+                status="success" if not report["error_count"] else "failed",
+                error_message=f"{report['error_count']} gateway lookup(s) failed" if report["error_count"] else None
+            )
+        return report
+    except Exception as e:
+        logger.error(f"❌ Payment reconciliation failed: {e}")
+        _last_report = {"run_id": run_id, "started_at": datetime.now().isoformat(), "error": str(e)}
+        return None
+    finally:
+        _current_run_id = None
+        _run_lock.release()
+
+
+def get_running_run_id() -> Optional[str]:
+    """Id of the reconciliation pass in progress in this process, if any"""
+    return _current_run_id
+
+
+def get_last_report() -> Optional[Dict[str, Any]]:
+    """Report of the most recent reconciliation run in this process"""
+    return _last_report
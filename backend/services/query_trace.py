@@ -0,0 +1,184 @@
+"""
+Query Tracing
+Per-request record of every Supabase call (table, operation, filter shape,
+duration, rows) built on the request_metrics client instrumentation, with N+1
+detection: a handler issuing the same query shape more than
+QUERY_TRACE_N_PLUS_ONE_THRESHOLD times is logged (and counted) as an N+1
+offender. In dev mode the summary is also returned in X-Query-Trace and
+Server-Timing response headers.
+"""
+import json
+import time
+from collections import Counter as ShapeCounter
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlsplit, parse_qsl
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.metrics import counter
+from services.request_metrics import begin_request_stats, end_request_stats
+import logging
+
+logger = logging.getLogger(__name__)
+
+# HTTP method -> PostgREST operation
+OPERATIONS = {"GET": "select", "HEAD": "select", "POST": "insert", "PATCH": "update", "PUT": "upsert", "DELETE": "delete"}
+
+# Query parameters whose value is part of the shape (not a filter value)
+_SHAPE_PARAMS = {"select", "order", "on_conflict", "columns"}
+_PAGING_PARAMS = {"limit", "offset"}
+
+_n_plus_one = counter("query_n_plus_one_total", "Requests that repeated one query shape above the threshold",
+                      ["handler", "table"])
+
+
+def query_shape(table: str, method: str, url: str) -> str:
+    """
+    Filter shape of a PostgREST call with the values stripped:
+    "select users id=eq select=id,name,mobile"
+    """
+    operation = "rpc" if table.startswith("rpc/") else OPERATIONS.get(method, method.lower())
+    parts = [operation, table]
+    for key, value in parse_qsl(urlsplit(url).query, keep_blank_values=True):
+        if key in _SHAPE_PARAMS:
+            parts.append(f"{key}={value}")
+        elif key in _PAGING_PARAMS:
+            parts.append(key)
+        else:
+            # id=eq.5 -> id=eq ; or=(a.eq.1,b.eq.2) -> or
+            operator = value.split(".", 1)[0] if "." in value and not value.startswith("(") else ""
+            parts.append(f"{key}={operator}" if operator else key)
+    return " ".join(parts)
+
+
+class QueryTrace:
+    """Calls made while handling one request"""
+
+    def __init__(self, max_calls: int = 200):
+        self.max_calls = max_calls
+        self.calls: List[Dict[str, Any]] = []
+        self.shapes: ShapeCounter = ShapeCounter()
+        self.total_calls = 0
+        self.total_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def record(self, table: str, method: str, seconds: float, url: str, status: str, rows: Optional[int]):
+        shape = query_shape(table, method, url)
+        self.shapes[shape] += 1
+        self.total_calls += 1
+        self.total_seconds += seconds
+        if len(self.calls) < self.max_calls:
+            self.calls.append({
+                "table": table,
+                "operation": shape.split(" ", 1)[0],
+                "shape": shape,
+                "ms": round(seconds * 1000, 2),
+                "rows": rows,
+                "status": status,
+                "at_ms": round((time.perf_counter() - self.started) * 1000 - seconds * 1000, 2)
+            })
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """Shapes issued more than threshold times"""
+        return {shape: n for shape, n in self.shapes.items() if n > threshold}
+
+    def summary(self, threshold: int) -> Dict[str, Any]:
+        return {
+            "db_calls": self.total_calls,
+            "db_ms": round(self.total_seconds * 1000, 2),
+            "distinct_shapes": len(self.shapes),
+            "n_plus_one": self.repeated(threshold)
+        }
+
+
+def _header_value(text: str, limit: int = 512) -> str:
+    """Latin-1 safe, bounded header value"""
+    return text.encode("latin-1", "replace").decode("latin-1")[:limit]
+
+
+class QueryTraceMiddleware:
+    """
+    Attach a QueryTrace to every HTTP request and report it when the request
+    finishes
+
+    Args:
+        threshold: Repeats of one query shape tolerated before flagging N+1
+        log_all: Log every request's trace (dev), not only N+1 offenders
+        response_header: Add X-Query-Trace / Server-Timing headers (dev only:
+            exposes table and column names)
+        max_calls: Calls kept in detail per request
+    """
+
+    def __init__(self, app: ASGIApp, threshold: int = 5, log_all: bool = False,
+                 response_header: bool = False, max_calls: int = 200):
+        self.app = app
+        self.threshold = threshold
+        self.log_all = log_all
+        self.response_header = response_header
+        self.max_calls = max_calls
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = begin_request_stats()
+        trace = QueryTrace(self.max_calls)
+        stats.listeners.append(trace.record)
+
+        def detach():
+            if trace.record in stats.listeners:
+                stats.listeners.remove(trace.record)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Background tasks run after this and aren't part of the request's trace
+                await send(message)
+                detach()
+                return
+            if message["type"] == "http.response.start" and self.response_header:
+                summary = trace.summary(self.threshold)
+                headers = MutableHeaders(scope=message)
+                headers["X-Query-Trace"] = _header_value(
+                    f"calls={summary['db_calls']}; db_ms={summary['db_ms']}; shapes={summary['distinct_shapes']}"
+                    + "".join(f"; n+1={shape} x{n}" for shape, n in summary["n_plus_one"].items())
+                )
+                headers.append("Server-Timing", f'db;dur={summary["db_ms"]};desc="{summary["db_calls"]} queries"')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            detach()
+            end_request_stats(token)
+            self._report(scope, trace)
+
+    def _report(self, scope: Scope, trace: QueryTrace):
+        if not trace.total_calls:
+            return
+        repeated = trace.repeated(self.threshold)
+        if not repeated and not self.log_all:
+            return
+        endpoint = scope.get("endpoint")
+        handler = getattr(endpoint, "__name__", None) or "unmatched"
+        record = {
+            "event": "query_trace",
+            "handler": handler,
+            "method": scope["method"],
+            "path": scope["path"],
+            **trace.summary(self.threshold),
+            "calls": trace.calls
+        }
+        if repeated:
+            for shape in repeated:
+                _n_plus_one.inc(handler=handler, table=shape.split(" ", 2)[1])
+            logger.warning(f"⚠️ N+1 queries in {handler}: " + json.dumps(record, default=str))
+        else:
+            logger.info(json.dumps(record, default=str))
+
+
+def configure_query_tracing(app, enabled: bool, threshold: int, log_all: bool = False,
+                            response_header: bool = False):
+    """Install QueryTraceMiddleware (add before the request metrics middleware so it runs inside it)"""
+    if enabled:
+        app.add_middleware(QueryTraceMiddleware, threshold=threshold, log_all=log_all,
+                           response_header=response_header)
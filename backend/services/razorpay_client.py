@@ -0,0 +1,254 @@
+"""
+Razorpay HTTP Client
+Shared keep-alive sessions (sync and async) for Razorpay API calls with
+connect/read timeouts, bounded retries and per-endpoint latency histograms
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Any, Tuple
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from services.metrics import counter, histogram
+import logging
+
+logger = logging.getLogger(__name__)
+
+RAZORPAY_BASE_URL = os.getenv("RAZORPAY_BASE_URL", "https://api.razorpay.com/v1").rstrip("/")
+RAZORPAY_CONNECT_TIMEOUT = float(os.getenv("RAZORPAY_CONNECT_TIMEOUT", 3.05))  # seconds
+RAZORPAY_READ_TIMEOUT = float(os.getenv("RAZORPAY_READ_TIMEOUT", 10))  # seconds
+RAZORPAY_MAX_RETRIES = int(os.getenv("RAZORPAY_MAX_RETRIES", 2))
+RAZORPAY_RETRY_BACKOFF = float(os.getenv("RAZORPAY_RETRY_BACKOFF", 0.25))  # seconds, doubled per attempt
+RAZORPAY_POOL_SIZE = int(os.getenv("RAZORPAY_POOL_SIZE", 10))
+
+IDEMPOTENCY_HEADER = "X-Idempotency-Key"
+
+# Responses that mean "not processed, safe to try again"
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+_request_latency = histogram(
+    "razorpay_request_duration_seconds",
+    "Razorpay API call latency (including retries)",
+    ["method", "endpoint", "status"]
+)
+_request_retries = counter(
+    "razorpay_request_retries_total",
+    "Razorpay API call retries",
+    ["method", "endpoint", "reason"]
+)
+
+_ID_SEGMENT = re.compile(r"/(pay|order|rfnd|cust|inv|plan|sub)_[A-Za-z0-9]+")
+
+
+def endpoint_label(path: str) -> str:
+    """Collapse resource ids so /payments/pay_X/refund is labelled /payments/{id}/refund"""
+    return _ID_SEGMENT.sub("/{id}", path)
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, RAZORPAY_RETRY_BACKOFF * (2 ** attempt))
+
+
+def _retry_reason_for_status(status_code: int) -> Optional[str]:
+    return f"status_{status_code}" if status_code in RETRYABLE_STATUS else None
+
+
+class RazorpayHTTPClient:
+    """
+    Thread-safe synchronous client backed by one pooled requests.Session.
+
+    GETs are retried on connection errors, timeouts and 429/5xx. POSTs carry
+    an idempotency key (reused across retries) and are retried only when the
+    request cannot have been processed: connect failures and 429/502/503/504.
+    """
+
+    def __init__(self, base_url: str = RAZORPAY_BASE_URL, auth: Optional[Tuple[str, str]] = None,
+                 connect_timeout: float = RAZORPAY_CONNECT_TIMEOUT,
+                 read_timeout: float = RAZORPAY_READ_TIMEOUT,
+                 max_retries: int = RAZORPAY_MAX_RETRIES,
+                 pool_size: int = RAZORPAY_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers.update({"Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None,
+                idempotency_key: Optional[str] = None) -> requests.Response:
+        """
+        Send a request, retrying per the policy above.
+
+        Raises:
+            requests.RequestException: if the last attempt failed without a response
+        """
+        method = method.upper()
+        endpoint = endpoint_label(path)
+        headers = {}
+        if method == "POST":
+            headers[IDEMPOTENCY_HEADER] = idempotency_key or uuid.uuid4().hex
+
+        started = time.perf_counter()
+        status = "error"
+        try:
+            for attempt in range(self.max_retries + 1):
+                last_attempt = attempt == self.max_retries
+                try:
+                    response = self.session.request(
+                        method, f"{self.base_url}{path}", json=json, headers=headers, timeout=self.timeout
+                    )
+                except requests.ConnectTimeout:
+                    reason = "connect_timeout"
+                    if last_attempt:
+                        raise
+                except requests.ReadTimeout:
+                    # The server may have acted on a POST; only GETs are safe to repeat
+                    reason = "read_timeout"
+                    if last_attempt or method != "GET":
+                        raise
+                except requests.ConnectionError:
+                    reason = "connection_error"
+                    if last_attempt:
+                        raise
+                else:
+                    status = str(response.status_code)
+                    reason = _retry_reason_for_status(response.status_code)
+                    if method == "GET" and response.status_code >= 500:
+                        reason = f"status_{response.status_code}"
+                    if not reason or last_attempt:
+                        return response
+                _request_retries.inc(method=method, endpoint=endpoint, reason=reason)
+                time.sleep(_backoff(attempt))
+        finally:
+            _request_latency.observe(time.perf_counter() - started, method=method, endpoint=endpoint, status=status)
+
+    def get(self, path: str) -> requests.Response:
+        return self.request("GET", path)
+
+    def post(self, path: str, json: Optional[Dict[str, Any]] = None,
+             idempotency_key: Optional[str] = None) -> requests.Response:
+        return self.request("POST", path, json=json, idempotency_key=idempotency_key)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncRazorpayHTTPClient:
+    """Async counterpart of RazorpayHTTPClient backed by one pooled httpx.AsyncClient"""
+
+    def __init__(self, base_url: str = RAZORPAY_BASE_URL, auth: Optional[Tuple[str, str]] = None,
+                 connect_timeout: float = RAZORPAY_CONNECT_TIMEOUT,
+                 read_timeout: float = RAZORPAY_READ_TIMEOUT,
+                 max_retries: int = RAZORPAY_MAX_RETRIES,
+                 pool_size: int = RAZORPAY_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            auth=auth,
+            headers={"Content-Type": "application/json"},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None,
+                      idempotency_key: Optional[str] = None) -> httpx.Response:
+        """
+        Send a request, retrying per RazorpayHTTPClient's policy.
+
+        Raises:
+            httpx.HTTPError: if the last attempt failed without a response
+        """
+        method = method.upper()
+        endpoint = endpoint_label(path)
+        headers = {}
+        if method == "POST":
+            headers[IDEMPOTENCY_HEADER] = idempotency_key or uuid.uuid4().hex
+
+        started = time.perf_counter()
+        status = "error"
+        try:
+            for attempt in range(self.max_retries + 1):
+                last_attempt = attempt == self.max_retries
+                try:
+                    response = await self.client.request(method, path, json=json, headers=headers)
+                except (httpx.ConnectTimeout, httpx.ConnectError):
+                    reason = "connection_error"
+                    if last_attempt:
+                        raise
+                except httpx.TimeoutException:
+                    reason = "read_timeout"
+                    if last_attempt or method != "GET":
+                        raise
+                except httpx.TransportError:
+                    reason = "transport_error"
+                    if last_attempt or method != "GET":
+                        raise
+                else:
+                    status = str(response.status_code)
+                    reason = _retry_reason_for_status(response.status_code)
+                    if method == "GET" and response.status_code >= 500:
+                        reason = f"status_{response.status_code}"
+                    if not reason or last_attempt:
+                        return response
+                _request_retries.inc(method=method, endpoint=endpoint, reason=reason)
+                await asyncio.sleep(_backoff(attempt))
+        finally:
+            _request_latency.observe(time.perf_counter() - started, method=method, endpoint=endpoint, status=status)
+
+    async def get(self, path: str) -> httpx.Response:
+        return await self.request("GET", path)
+
+    async def post(self, path: str, json: Optional[Dict[str, Any]] = None,
+                   idempotency_key: Optional[str] = None) -> httpx.Response:
+        return await self.request("POST", path, json=json, idempotency_key=idempotency_key)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_client: Optional[RazorpayHTTPClient] = None
+_async_client: Optional[AsyncRazorpayHTTPClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client(auth: Optional[Tuple[str, str]] = None) -> RazorpayHTTPClient:
+    """Process-wide sync client (created on first use)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RazorpayHTTPClient(auth=auth)
+    return _client
+
+
+def get_async_client(auth: Optional[Tuple[str, str]] = None) -> AsyncRazorpayHTTPClient:
+    """Process-wide async client (created on first use, bound to the running event loop)"""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncRazorpayHTTPClient(auth=auth)
+    return _async_client
+
+
+async def close_clients():
+    """Close pooled connections (call from application shutdown)"""
+    global _client, _async_client
+    with _client_lock:
+        async_client, _async_client = _async_client, None
+    if async_client is not None:
+        await async_client.aclose()
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -3,6 +3,7 @@ Razorpay Payment Service
 Handles payment order creation, webhook processing, and verification
 """
 
+import asyncio
 import os
 import json
 import hashlib
@@ -11,10 +12,24 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 from database import get_supabase
 from payment_gateway import PaymentGateway
+from services.lru_cache import LRUCache
+from services.slot_reservation import is_function_not_found
+from services.payment_events import notify_payment_changed
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Recently handled webhook ids, so Razorpay's retries are answered without a DB round trip
+WEBHOOK_RECENT_IDS_MAX = int(os.getenv("WEBHOOK_RECENT_IDS_MAX", 10000))
+WEBHOOK_RECENT_IDS_TTL = int(os.getenv("WEBHOOK_RECENT_IDS_TTL", 86400))  # seconds
+_recent_webhooks = LRUCache("recent_webhook_ids", maxsize=WEBHOOK_RECENT_IDS_MAX, ttl=WEBHOOK_RECENT_IDS_TTL)
+
+# Set to False the first time apply_payment_webhook turns out not to be deployed
+_apply_rpc_available = True
+
+# Payment states a webhook may no longer move out of
+_SETTLED_STATUSES = ["COMPLETED", "REFUNDED", "PARTIALLY_REFUNDED"]
+
 class RazorpayService:
     """Service for Razorpay payment operations"""
     
@@ -105,15 +120,21 @@ class RazorpayService:
         """
         return PaymentGateway.get_payment_details(razorpay_payment_id)
     
+    @staticmethod
+    async def verify_payment_from_razorpay_async(razorpay_payment_id: str) -> Optional[Dict[str, Any]]:
+        """Async variant of verify_payment_from_razorpay (doesn't block the event loop)"""
+        return await PaymentGateway.get_payment_details_async(razorpay_payment_id)
+    
     @staticmethod
     def process_webhook_event(webhook_payload: Dict[str, Any], 
-                             signature: str) -> Dict[str, Any]:
+                             signature: str, event_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Process Razorpay webhook event
         
         Args:
             webhook_payload: Webhook payload from Razorpay
             signature: Webhook signature
+            event_id: X-Razorpay-Event-Id header (used when the payload has no id)
         
         Returns:
             Processing result
@@ -140,7 +161,7 @@ class RazorpayService:
         
         razorpay_payment_id = entity.get("id")
         razorpay_order_id = entity.get("order_id")
-        webhook_id = webhook_payload.get("id")
+        webhook_id = webhook_payload.get("id") or event_id
         
         if not webhook_id:
             logger.error("No webhook ID in payload")
@@ -268,4 +289,219 @@ class RazorpayService:
         except Exception as e:
             logger.error(f"Error marking webhook as processed: {e}")
             return False
-
+    
+    @staticmethod
+    async def handle_webhook(process_result: Dict[str, Any], signature: str) -> Dict[str, Any]:
+        """
+        Verify a parsed webhook against the Razorpay API and apply it
+        
+        Args:
+            process_result: Successful result of process_webhook_event
+            signature: Webhook signature
+        
+        Returns:
+            {"status": "success" | "error", "message": str, "retry": bool}
+            (retry is True when the event was not applied and may succeed later)
+        """
+        webhook_id = process_result.get("webhook_id")
+        event_type = process_result.get("event_type")
+        razorpay_payment_id = process_result.get("razorpay_payment_id")
+        razorpay_order_id = process_result.get("razorpay_order_id")
+        
+        # Verify payment from Razorpay API (backend-owned verification)
+        razorpay_payment = await RazorpayService.verify_payment_from_razorpay_async(razorpay_payment_id)
+        
+        if not razorpay_payment:
+            # Not claimed, so a retry (or reconciliation) can still apply it
+            logger.error(f"Could not fetch payment from Razorpay: {razorpay_payment_id}")
+            return {"status": "error", "message": "Payment verification failed", "retry": True}
+        
+        # Claim the webhook id and apply the state transition in one transaction
+        result = await asyncio.to_thread(
+            RazorpayService.apply_webhook_event,
+            webhook_id=webhook_id,
+            event_type=event_type,
+            razorpay_payment_id=razorpay_payment_id,
+            razorpay_order_id=razorpay_order_id,
+            webhook_payload=process_result.get("webhook_payload"),
+            signature=signature,
+            gateway_payment=razorpay_payment
+        )
+        RazorpayService.remember_webhook(webhook_id)
+        outcome = result.get("outcome")
+        payment_id = result.get("payment_id")
+        
+        if outcome == "duplicate":
+            logger.info(f"Webhook {webhook_id} already processed, skipping")
+            return {"status": "success", "message": "Already processed", "retry": False}
+        if outcome == "payment_not_found":
+            logger.error(f"Payment not found for order_id: {razorpay_order_id}")
+            return {"status": "error", "message": "Payment not found", "retry": False}
+        if outcome == "verification_mismatch":
+            logger.error("Payment verification mismatch")
+            return {"status": "error", "message": "Payment verification mismatch", "retry": False}
+        
+        logger.info(f"Payment {payment_id} {event_type} applied via webhook {webhook_id} ({outcome})")
+        if outcome == "processed":
+            notify_payment_changed(payment_id, razorpay_order_id)
+        return {"status": "success", "message": "Webhook processed", "retry": False}
+    
+    @staticmethod
+    async def process_queued_webhook(event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Worker-pool handler for events persisted by the webhook endpoint
+        
+        Args:
+            event: Queue row (webhook_id, body, signature, ...)
+        
+        Returns:
+            Same shape as handle_webhook
+        """
+        if RazorpayService.webhook_seen_recently(event["webhook_id"]):
+            return {"status": "success", "message": "Already processed", "retry": False}
+        
+        process_result = RazorpayService.process_webhook_event(
+            json.loads(event["body"]), event["signature"], event_id=event["webhook_id"]
+        )
+        if not process_result.get("success"):
+            return {"status": "error", "message": process_result.get("error"), "retry": False}
+        
+        return await RazorpayService.handle_webhook(process_result, event["signature"])
+    
+    @staticmethod
+    def webhook_seen_recently(webhook_id: str) -> bool:
+        """True if this worker already handled the webhook id (in-memory, bounded)"""
+        return _recent_webhooks.get(webhook_id, False)
+    
+    @staticmethod
+    def remember_webhook(webhook_id: str):
+        """Record a handled webhook id in the in-memory recent-id set"""
+        _recent_webhooks.set(webhook_id, True)
+    
+    @staticmethod
+    def apply_webhook_event(webhook_id: str, event_type: str,
+                            razorpay_payment_id: Optional[str],
+                            razorpay_order_id: Optional[str],
+                            webhook_payload: Dict[str, Any],
+                            signature: str,
+                            gateway_payment: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Claim a webhook id and apply its payment state transition
+        
+        Runs the apply_payment_webhook Postgres function: the claim (upsert on
+        webhook_id), payment lookup, verification against the gateway's copy,
+        payment/appointment/operation updates and the processed mark commit
+        together in one round trip. Falls back to an upsert claim plus
+        sequential updates if the function is not deployed.
+        
+        Args:
+            webhook_id: Razorpay webhook event ID
+            event_type: Event type (e.g., 'payment.captured')
+            razorpay_payment_id: Razorpay payment ID
+            razorpay_order_id: Razorpay order ID
+            webhook_payload: Full webhook payload
+            signature: Webhook signature
+            gateway_payment: Payment as fetched from the Razorpay API
+        
+        Returns:
+            {"outcome": processed | duplicate | payment_not_found |
+             verification_mismatch | ignored, "payment_id": int or None}
+        """
+        global _apply_rpc_available
+        
+        supabase = get_supabase()
+        if not supabase:
+            raise RuntimeError("Database not configured")
+        
+        entity = webhook_payload.get("payload", {}).get("payment", {}).get("entity", {})
+        failure_reason = entity.get("error_description") or entity.get("error_code", "Unknown error")
+        
+        if _apply_rpc_available:
+            try:
+                result = supabase.rpc("apply_payment_webhook", {
+                    "p_webhook_id": webhook_id,
+                    "p_event_type": event_type,
+                    "p_razorpay_payment_id": razorpay_payment_id,
+                    "p_razorpay_order_id": razorpay_order_id,
+                    "p_payload": webhook_payload,
+                    "p_signature": signature,
+                    "p_gateway_order_id": gateway_payment.get("order_id"),
+                    "p_gateway_amount": int(gateway_payment.get("amount", 0)),
+                    "p_failure_reason": failure_reason,
+                    "p_failure_code": entity.get("error_code")
+                }).execute()
+                return result.data or {"outcome": "duplicate"}
+            except Exception as e:
+                if not is_function_not_found(e):
+                    raise
+                logger.warning("apply_payment_webhook RPC not found, using sequential fallback")
+                _apply_rpc_available = False
+        
+        # Fallback: claim with an upsert (no separate existence check), then update step by step
+        claim = supabase.table("payment_webhooks").upsert({
+            "webhook_id": webhook_id,
+            "event_type": event_type,
+            "razorpay_payment_id": razorpay_payment_id,
+            "razorpay_order_id": razorpay_order_id,
+            "webhook_payload": webhook_payload,
+            "signature_verified": True,
+            "processed": False
+        }, on_conflict="webhook_id", ignore_duplicates=True).execute()
+        if not claim.data and RazorpayService.check_webhook_idempotency(webhook_id):
+            return {"outcome": "duplicate", "payment_id": None}
+        
+        payment_result = supabase.table("payments").select(
+            "id, amount, status, appointment_id, operation_id"
+        ).eq("razorpay_order_id", razorpay_order_id).order("id").limit(1).execute()
+        
+        if not payment_result.data:
+            RazorpayService.mark_webhook_processed(
+                webhook_id, error=f"Payment not found for order {razorpay_order_id}"
+            )
+            return {"outcome": "payment_not_found", "payment_id": None}
+        
+        payment = payment_result.data[0]
+        payment_id = payment["id"]
+        
+        if (gateway_payment.get("order_id") != razorpay_order_id or
+            round(float(payment.get("amount", 0)) * 100) != int(gateway_payment.get("amount", 0))):
+            RazorpayService.mark_webhook_processed(
+                webhook_id, payment_id=payment_id, error="Payment verification mismatch"
+            )
+            return {"outcome": "verification_mismatch", "payment_id": payment_id}
+        
+        outcome = "processed"
+        now = datetime.now().isoformat()
+        if event_type == "payment.captured":
+            supabase.table("payments").update({
+                "status": "COMPLETED",
+                "razorpay_payment_id": razorpay_payment_id,
+                "razorpay_signature": signature,
+                "gateway_transaction_id": gateway_payment.get("id"),
+                "completed_at": now,
+                "updated_at": now
+            }).eq("id", payment_id).not_.in_("status", _SETTLED_STATUSES).execute()
+            
+            if payment.get("appointment_id"):
+                supabase.table("appointments").update({
+                    "status": "confirmed"
+                }).eq("id", payment["appointment_id"]).execute()
+            elif payment.get("operation_id"):
+                supabase.table("operations").update({
+                    "status": "confirmed"
+                }).eq("id", payment["operation_id"]).execute()
+        elif event_type == "payment.failed":
+            # A late payment.failed from an earlier attempt must not undo a captured payment
+            supabase.table("payments").update({
+                "status": "FAILED",
+                "razorpay_payment_id": razorpay_payment_id,
+                "failure_reason": failure_reason,
+                "failure_code": entity.get("error_code"),
+                "failed_at": now,
+                "updated_at": now
+            }).eq("id", payment_id).in_("status", ["INITIATED", "PENDING", "FAILED"]).execute()
+        else:
+            outcome = "ignored"
+        
+        RazorpayService.mark_webhook_processed(webhook_id, payment_id=payment_id)
+        return {"outcome": outcome, "payment_id": payment_id}
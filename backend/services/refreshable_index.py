@@ -0,0 +1,57 @@
+"""
+Refreshable Index
+Base for the in-memory search indexes (cities, doctors): rebuilt wholesale
+from a loader, periodically on a daemon thread, keeping the previous contents
+when a reload fails
+"""
+import threading
+from typing import List, Dict, Optional, Callable, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshableIndex:
+    """Subclasses implement load(rows) and set `name` / `item_label` for logs and the thread name"""
+
+    name = "index"
+    item_label = "rows"
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def load(self, rows: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def refresh(self, loader: Callable[[], List[Dict[str, Any]]]) -> bool:
+        """Reload the index from loader(); keeps the old contents on failure"""
+        try:
+            rows = loader()
+            self.load(rows)
+            logger.info(f"✅ {self.name.capitalize()} index loaded ({len(rows)} {self.item_label})")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ {self.name.capitalize()} index refresh failed: {e}")
+            return False
+
+    def start_background_refresh(self, loader: Callable[[], List[Dict[str, Any]]], interval: int):
+        """Refresh the index every `interval` seconds on a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self.refresh(loader)
+
+        self._thread = threading.Thread(target=run, name=f"{self.name}-index-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
@@ -0,0 +1,249 @@
+"""
+Request Metrics
+ASGI middleware recording per-route latency, requests in flight and response
+sizes, plus per-request Supabase call counts and time. Supabase clients are
+instrumented at their HTTP session, and calls are attributed to the request
+through a context variable (FastAPI copies the context into the threadpool
+that runs sync handlers). Everything lands on the shared metrics registry and
+is exposed by GET /metrics.
+"""
+import threading
+import time
+from contextvars import ContextVar, Token
+from typing import Optional, Dict, Callable, Tuple
+from urllib.parse import urlsplit
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.metrics import counter, gauge, histogram, render_prometheus
+import logging
+
+logger = logging.getLogger(__name__)
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+DB_CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+_request_latency = histogram(
+    "http_request_duration_seconds", "Time to the last response byte, by route",
+    ["service", "method", "route", "status"]
+)
+_in_flight = gauge("http_requests_in_progress", "Requests being handled", ["service"])
+_response_size = histogram(
+    "http_response_size_bytes", "Response body bytes (after compression), by route",
+    ["service", "method", "route"], buckets=SIZE_BUCKETS
+)
+_request_db_calls = histogram(
+    "http_request_db_calls", "Supabase calls made while handling one request, by route",
+    ["service", "method", "route"], buckets=DB_CALL_BUCKETS
+)
+_request_db_time = histogram(
+    "http_request_db_seconds", "Time spent in Supabase calls while handling one request, by route",
+    ["service", "method", "route"]
+)
+_db_calls = counter("supabase_requests_total", "Supabase REST calls", ["table", "method", "status"])
+_db_latency = histogram("supabase_request_duration_seconds", "Supabase REST call latency", ["table", "method"])
+
+
+class RequestStats:
+    """Database work attributed to one HTTP request"""
+
+    __slots__ = ("route", "db_calls", "db_seconds", "_lock", "listeners")
+
+    def __init__(self):
+        self.route: Optional[str] = None
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self._lock = threading.Lock()
+        # Extra per-call hooks (table, method, seconds, url, status, rows) for tracing
+        self.listeners: list = []
+
+    def record_db(self, table: str, method: str, seconds: float, url: str, status: str, rows: Optional[int]):
+        with self._lock:
+            self.db_calls += 1
+            self.db_seconds += seconds
+        for listener in self.listeners:
+            listener(table, method, seconds, url, status, rows)
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """Stats of the request being handled (None outside a request, e.g. scheduler jobs)"""
+    return _current.get()
+
+
+def begin_request_stats() -> Tuple[RequestStats, Optional[Token]]:
+    """
+    Stats for the current request, creating them when RequestMetricsMiddleware
+    isn't installed; pass the token to end_request_stats
+    """
+    stats = _current.get()
+    if stats is not None:
+        return stats, None
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request_stats(token: Optional[Token]):
+    if token is not None:
+        _current.reset(token)
+
+
+def _row_count(content_range: Optional[str]) -> Optional[int]:
+    """Rows in a PostgREST response from Content-Range ("0-24/*" -> 25, "*/0" -> 0)"""
+    if not content_range:
+        return None
+    span = content_range.split("/", 1)[0]
+    if span == "*":
+        return 0
+    start, _, end = span.partition("-")
+    try:
+        return int(end) - int(start) + 1
+    except ValueError:
+        return None
+
+
+def _table_from_url(url: str) -> str:
+    """/rest/v1/appointments -> appointments, /rest/v1/rpc/fn -> rpc/fn"""
+    path = urlsplit(url).path
+    marker = "/rest/v1/"
+    index = path.find(marker)
+    return path[index + len(marker):] if index >= 0 else path
+
+
+def record_db_call(table: str, method: str, seconds: float, url: str, status: str, rows: Optional[int]):
+    """Count one database call and attribute it to the current request (HTTP and local backends)"""
+    _db_calls.inc(table=table, method=method, status=status)
+    _db_latency.observe(seconds, table=table, method=method)
+    stats = _current.get()
+    if stats is not None:
+        stats.record_db(table, method, seconds, url, status, rows)
+
+
+def _instrument_session(session):
+    if getattr(session, "_request_metrics_instrumented", False):
+        return
+    send = session.send
+
+    def instrumented_send(request, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        rows = None
+        try:
+            response = send(request, **kwargs)
+            status = str(response.status_code)
+            rows = _row_count(response.headers.get("content-range"))
+            return response
+        finally:
+            url = str(request.url)
+            record_db_call(_table_from_url(url), request.method, time.perf_counter() - started, url, status, rows)
+
+    session.send = instrumented_send
+    session._request_metrics_instrumented = True
+
+
+def instrument_supabase(client):
+    """
+    Count and time every PostgREST call made through a Supabase client. The
+    client rebuilds its PostgREST client on auth changes, so the factory is
+    wrapped too.
+    """
+    if client is None or getattr(client, "_request_metrics_instrumented", False):
+        return client
+    factory = client._init_postgrest_client
+
+    def init_postgrest_client(*args, **kwargs):
+        postgrest = factory(*args, **kwargs)
+        _instrument_session(postgrest.session)
+        return postgrest
+
+    client._init_postgrest_client = init_postgrest_client
+    if getattr(client, "_postgrest", None) is not None:
+        _instrument_session(client._postgrest.session)
+    client._request_metrics_instrumented = True
+    return client
+
+
+class RequestMetricsMiddleware:
+    """
+    Record latency, size and database usage per route. Routes are labelled
+    by their path template ("/api/payments/{payment_id}") so label
+    cardinality stays bounded; unmatched paths share one label.
+    """
+
+    def __init__(self, app: ASGIApp, service: str, fastapi_app: FastAPI):
+        self.app = app
+        self.service = service
+        self.fastapi_app = fastapi_app
+        self._templates: Optional[Dict[Callable, str]] = None
+
+    def _route_template(self, scope: Scope) -> str:
+        if self._templates is None:
+            templates = {}
+            for route in self.fastapi_app.routes:
+                endpoint = getattr(route, "endpoint", None)
+                if endpoint is not None:
+                    templates.setdefault(endpoint, getattr(route, "path", ""))
+            self._templates = templates
+        endpoint = scope.get("endpoint")
+        return self._templates.get(endpoint, "unmatched") if endpoint else "unmatched"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+        size = 0
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = self._route_template(scope)
+            stats.route = route
+            method = scope["method"]
+            _request_latency.observe(time.perf_counter() - started, service=self.service, method=method,
+                                     route=route, status=str(status_code))
+            _response_size.observe(size, service=self.service, method=method, route=route)
+            _request_db_calls.observe(stats.db_calls, service=self.service, method=method, route=route)
+            _request_db_time.observe(stats.db_seconds, service=self.service, method=method, route=route)
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await send(message)
+                    # Before background tasks run, so they don't count towards the request
+                    record()
+                    return
+            await send(message)
+
+        _in_flight.inc(service=self.service)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _in_flight.dec(service=self.service)
+            record()
+            _current.reset(token)
+
+
+def configure_request_metrics(app: FastAPI, service: str, enabled: bool = True):
+    """Install the middleware and GET /metrics (Prometheus text format)"""
+    if not enabled:
+        return
+    app.add_middleware(RequestMetricsMiddleware, service=service, fastapi_app=app)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus metrics"""
+        return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,206 @@
+"""
+Response Pipeline
+orjson response class, gzip/brotli compression middleware with a size
+threshold, and `fields=` projection for listing endpoints. Both servers call
+configure_response_pipeline(app); the knobs live in config (RESPONSE_*).
+"""
+import re
+import zlib
+from typing import Optional, List, Dict, Any, Iterable, Sequence
+from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.metrics import counter
+from services.static_assets import parse_accept_encoding
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson  # noqa: F401 (required by ORJSONResponse)
+    from fastapi.responses import ORJSONResponse
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Never buffered or compressed: SSE must reach the client event by event
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream", "image/", "application/zip", "application/gzip",
+                            "application/vnd.apache.parquet")
+
+# Columns never sent in listings (the SMTP settings endpoint only reports password_set)
+PRIVATE_HOSPITAL_FIELDS = ("smtp_password",)
+
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_compressed = counter("http_responses_compressed_total", "Responses compressed by the response pipeline", ["encoding"])
+
+
+def json_response_class():
+    """orjson-backed response class when enabled and installed, else the stdlib one"""
+    if config.RESPONSE_ORJSON_ENABLED and ORJSON_AVAILABLE:
+        return ORJSONResponse
+    return JSONResponse
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a `fields=id,name,status` query parameter
+
+    Raises:
+        HTTPException: 400 for a malformed field name
+    """
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    invalid = [name for name in names if not _FIELD_NAME.match(name)]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid field name(s): {', '.join(invalid)}"
+        )
+    return names or None
+
+
+def project_rows(rows: Iterable[Dict[str, Any]], fields: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+    """Keep only the requested keys of each row (all keys when fields is None)"""
+    if not fields:
+        return rows if isinstance(rows, list) else list(rows)
+    return [{name: row[name] for name in fields if name in row} for row in rows]
+
+
+def list_response(rows: Iterable[Dict[str, Any]], fields: Optional[Sequence[str]] = None, exclude: Iterable[str] = ()):
+    """
+    Serialize a listing directly with the fast JSON class (skipping FastAPI's
+    per-item jsonable_encoder pass), applying `fields=` projection
+
+    Args:
+        rows: Result rows
+        fields: Parsed `fields` parameter (see parse_fields; None for all keys)
+        exclude: Keys never returned (secrets stored on the row)
+    """
+    projected = project_rows(rows, fields)
+    if exclude:
+        exclude = set(exclude)
+        projected = [{k: v for k, v in row.items() if k not in exclude} for row in projected]
+    return json_response_class()(content=projected)
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compressed bytes for data; flushed so streamed chunks are sent immediately"""
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """br if accepted and available, else gzip if accepted, else None"""
+    accepted = parse_accept_encoding(accept_encoding)
+    if BROTLI_AVAILABLE and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compress response bodies with brotli or gzip per Accept-Encoding.
+    Single-message bodies under minimum_size, responses that already carry a
+    Content-Encoding (precompressed static assets), 204/304 responses and
+    UNCOMPRESSED_MEDIA_TYPES pass through untouched. Streamed bodies are
+    compressed chunk by chunk with a sync flush after each chunk.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                media_type = headers.get("content-type", "")
+                if ("content-encoding" in headers or start["status"] in (204, 304)
+                        or media_type.startswith(UNCOMPRESSED_MEDIA_TYPES)
+                        or (not more_body and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "etag" in headers and not headers["etag"].startswith("W/"):
+                    headers["ETag"] = "W/" + headers["etag"]
+                compressed = compressor.compress(body, final=not more_body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(compressed))
+                _compressed.inc(encoding=encoding)
+                await send(start)
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+                return
+
+            await send({"type": "http.response.body", "body": compressor.compress(body, final=not more_body),
+                        "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def configure_response_pipeline(app: FastAPI):
+    """Install compression per config (call once, after the app is created)"""
+    if config.RESPONSE_COMPRESSION_ENABLED:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=config.RESPONSE_COMPRESSION_MIN_SIZE,
+            gzip_level=config.RESPONSE_GZIP_LEVEL,
+            brotli_quality=config.RESPONSE_BROTLI_QUALITY
+        )
+    if config.RESPONSE_ORJSON_ENABLED and not ORJSON_AVAILABLE:
+        logger.warning("⚠️ RESPONSE_ORJSON_ENABLED but orjson is not installed; using the standard JSON encoder")
@@ -3,8 +3,9 @@ Background scheduler for sending WhatsApp reminders and follow-ups
 Uses APScheduler for reliable background job execution
 """
 import os
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Dict, Any, List
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.executors.pool import ThreadPoolExecutor
@@ -13,6 +14,8 @@ from apscheduler.triggers.interval import IntervalTrigger
 from database import get_supabase
 from services.audit_logger import log_message_send
 from services.error_monitoring import capture_exception
+from services.metadata_cache import get_hospital
+from services.message_templates import render_messages, TEMPLATE_COLUMNS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -54,6 +57,11 @@ def start_scheduler():
         capture_exception(e)
 
 
+def get_scheduler_status() -> dict:
+    """Scheduler state for readiness checks"""
+    return {"running": scheduler.running, "jobs": len(scheduler.get_jobs()) if scheduler.running else 0}
+
+
 def shutdown_scheduler():
     """Shutdown the scheduler gracefully"""
     try:
@@ -95,12 +103,111 @@ def add_scheduled_jobs():
             replace_existing=True
         )
         
+        # Appointment export compaction - closed day files to Parquet (when enabled), daily at 00:30
+        from services.appointment_export import compact_day_files
+        scheduler.add_job(
+            compact_day_files,
+            trigger=CronTrigger(hour=0, minute=30),
+            id='export_compaction',
+            name='Compact appointment export files',
+            max_instances=1,
+            replace_existing=True
+        )
+        
+        # Payment reconciliation - settles stale INITIATED/PENDING payments against Razorpay
+        from services.payment_reconciliation import run_reconciliation_job
+        import config
+        scheduler.add_job(
+            run_reconciliation_job,
+            trigger=IntervalTrigger(minutes=config.RECONCILE_INTERVAL_MINUTES),
+            id='payment_reconciliation',
+            name='Reconcile stale payments with Razorpay',
+            max_instances=1,
+            replace_existing=True
+        )
+        
+        # WhatsApp actions queued by secondary workers (multi-worker mode)
+        from services.whatsapp_outbox import drain_whatsapp_outbox
+        scheduler.add_job(
+            drain_whatsapp_outbox,
+            trigger=IntervalTrigger(seconds=config.WHATSAPP_OUTBOX_POLL_SECONDS),
+            id='whatsapp_outbox',
+            name='Send WhatsApp actions queued by other workers',
+            max_instances=1,
+            replace_existing=True
+        )
+        
         logger.info("✅ Scheduled jobs added to scheduler")
     except Exception as e:
         logger.error(f"❌ Failed to add scheduled jobs: {e}")
         capture_exception(e)
 
 
+def _load_users(supabase, user_ids) -> Dict[int, Dict[str, Any]]:
+    """Patients and doctors for a batch of records in one query"""
+    ids = sorted({user_id for user_id in user_ids if user_id})
+    if not ids:
+        return {}
+    result = supabase.table("users").select("id, name, mobile").in_("id", ids).execute()
+    return {row["id"]: row for row in result.data or []}
+
+
+def _send_whatsapp_batch(kind: str, records: List[Dict[str, Any]], users: Dict[int, Dict[str, Any]],
+                         patient_field: str, date_field: str, purpose: str) -> int:
+    """
+    Render one kind of message for many appointments/operations (one compiled
+    template per hospital) and send them over each hospital's WhatsApp session
+
+    Returns:
+        Number of messages sent
+    """
+    from services.whatsapp_service import send_whatsapp_message_by_hospital_id
+
+    by_hospital = defaultdict(list)
+    for record in records:
+        by_hospital[record.get("hospital_id")].append(record)
+
+    sent = 0
+    for hospital_id, group in by_hospital.items():
+        hospital = get_hospital(hospital_id) if hospital_id else None
+        if not hospital or not (hospital.get("whatsapp_enabled") == "true" or hospital.get("whatsapp_enabled") is True):
+            continue
+
+        rows = [{
+            "patient_name": users.get(record.get(patient_field), {}).get("name"),
+            "doctor_name": users.get(record.get("doctor_id"), {}).get("name"),
+            "hospital_name": hospital.get("name"),
+            "date": record.get(date_field),
+            "time_slot": record.get("time_slot"),
+            "followup_date": record.get("followup_date"),
+            "specialty": record.get("specialty")
+        } for record in group]
+        custom_template = hospital.get(TEMPLATE_COLUMNS[kind]) if kind in TEMPLATE_COLUMNS else None
+        messages = render_messages(kind, rows, custom_template, hospital_id)
+
+        for record, message in zip(group, messages):
+            patient = users.get(record.get(patient_field), {})
+            mobile = patient.get("mobile")
+            if not mobile:
+                continue
+            error = None
+            try:
+                success = send_whatsapp_message_by_hospital_id(hospital_id=hospital_id, mobile=mobile, message=message)
+            except Exception as e:
+                logger.error(f"Error sending {purpose.lower()} for record {record.get('id')}: {e}")
+                success, error = False, str(e)
+            sent += 1 if success else 0
+            log_message_send(
+                user_id=patient.get("id"),
+                message_type="whatsapp",
+                recipient=mobile,
+                subject_or_purpose=purpose,
+                success=success,
+                error_message=error
+            )
+    return sent
+
+
 def send_daily_reminders():
     """Send reminders for appointments/operations scheduled for today"""
     try:
@@ -111,59 +218,22 @@ def send_daily_reminders():
         
         today = datetime.now().date().isoformat()
         
-        # Get appointments scheduled for today
-        appointments = supabase.table("appointments").select("*").eq("date", today).eq("status", "confirmed").execute()
-        
-        if appointments.data:
-            from services.whatsapp_service import send_appointment_reminder
-            for apt in appointments.data:
-                try:
-                    send_appointment_reminder(apt)
-                    log_message_send(
-                        user_id=apt.get("patient_id"),
-                        message_type="whatsapp",
-                        recipient=apt.get("patient_mobile", ""),
-                        subject_or_purpose="Appointment reminder",
-                        success=True
-                    )
-                except Exception as e:
-                    logger.error(f"Error sending reminder for appointment {apt.get('id')}: {e}")
-                    log_message_send(
-                        user_id=apt.get("patient_id"),
-                        message_type="whatsapp",
-                        recipient=apt.get("patient_mobile", ""),
-                        subject_or_purpose="Appointment reminder",
-                        success=False,
-                        error_message=str(e)
-                    )
+        # Get appointments and operations scheduled for today
+        appointments = supabase.table("appointments").select(
+            "id, user_id, doctor_id, hospital_id, date, time_slot"
+        ).eq("date", today).eq("status", "confirmed").execute().data or []
+        operations = supabase.table("operations").select(
+            "id, patient_id, doctor_id, hospital_id, operation_date, specialty"
+        ).eq("operation_date", today).eq("status", "confirmed").execute().data or []
         
-        # Get operations scheduled for today
-        operations = supabase.table("operations").select("*").eq("operation_date", today).eq("status", "confirmed").execute()
+        users = _load_users(supabase, [a.get("user_id") for a in appointments] + [a.get("doctor_id") for a in appointments]
+                            + [o.get("patient_id") for o in operations] + [o.get("doctor_id") for o in operations])
         
-        if operations.data:
-            from services.whatsapp_service import send_operation_reminder
-            for op in operations.data:
-                try:
-                    send_operation_reminder(op)
-                    log_message_send(
-                        user_id=op.get("patient_id"),
-                        message_type="whatsapp",
-                        recipient=op.get("patient_mobile", ""),
-                        subject_or_purpose="Operation reminder",
-                        success=True
-                    )
-                except Exception as e:
-                    logger.error(f"Error sending reminder for operation {op.get('id')}: {e}")
-                    log_message_send(
-                        user_id=op.get("patient_id"),
-                        message_type="whatsapp",
-                        recipient=op.get("patient_mobile", ""),
-                        subject_or_purpose="Operation reminder",
-                        success=False,
-                        error_message=str(e)
-                    )
+        sent = _send_whatsapp_batch("reminder", appointments, users, "user_id", "date", "Appointment reminder")
+        sent += _send_whatsapp_batch("operation_reminder", operations, users, "patient_id", "operation_date",
+                                     "Operation reminder")
         
-        logger.info(f"✅ Daily reminders processed: {len(appointments.data or [])} appointments, {len(operations.data or [])} operations")
+        logger.info(f"✅ Daily reminders processed: {len(appointments)} appointments, {len(operations)} operations, {sent} sent")
     except Exception as e:
         logger.error(f"❌ Error in send_daily_reminders: {e}")
         capture_exception(e)
@@ -179,25 +249,15 @@ def send_follow_up_messages():
         
         yesterday = (datetime.now() - timedelta(days=1)).date().isoformat()
         
-        # Get completed appointments from yesterday
-        appointments = supabase.table("appointments").select("*").eq("date", yesterday).eq("status", "confirmed").execute()
+        # Get yesterday's appointments that have a follow-up visit booked
+        appointments = supabase.table("appointments").select(
+            "id, user_id, doctor_id, hospital_id, date, followup_date"
+        ).eq("date", yesterday).eq("status", "confirmed").not_.is_("followup_date", "null").execute().data or []
         
-        if appointments.data:
-            from services.whatsapp_service import send_follow_up
-            for apt in appointments.data:
-                try:
-                    send_follow_up(apt, "appointment")
-                    log_message_send(
-                        user_id=apt.get("patient_id"),
-                        message_type="whatsapp",
-                        recipient=apt.get("patient_mobile", ""),
-                        subject_or_purpose="Appointment follow-up",
-                        success=True
-                    )
-                except Exception as e:
-                    logger.error(f"Error sending follow-up for appointment {apt.get('id')}: {e}")
+        users = _load_users(supabase, [a.get("user_id") for a in appointments] + [a.get("doctor_id") for a in appointments])
+        sent = _send_whatsapp_batch("followup", appointments, users, "user_id", "date", "Appointment follow-up")
         
-        logger.info(f"✅ Follow-up messages processed: {len(appointments.data or [])} appointments")
+        logger.info(f"✅ Follow-up messages processed: {len(appointments)} appointments, {sent} sent")
     except Exception as e:
         logger.error(f"❌ Error in send_follow_up_messages: {e}")
         capture_exception(e)
@@ -253,18 +313,13 @@ def send_single_reminder(appointment_id: int):
         if not supabase:
             return
         
-        appointment = supabase.table("appointments").select("*").eq("id", appointment_id).execute()
+        appointment = supabase.table("appointments").select(
+            "id, user_id, doctor_id, hospital_id, date, time_slot"
+        ).eq("id", appointment_id).execute()
         if appointment.data:
             apt = appointment.data[0]
-            from services.whatsapp_service import send_appointment_reminder
-            send_appointment_reminder(apt)
-            log_message_send(
-                user_id=apt.get("patient_id"),
-                message_type="whatsapp",
-                recipient=apt.get("patient_mobile", ""),
-                subject_or_purpose="Appointment reminder",
-                success=True
-            )
+            users = _load_users(supabase, [apt.get("user_id"), apt.get("doctor_id")])
+            _send_whatsapp_batch("reminder", [apt], users, "user_id", "date", "Appointment reminder")
     except Exception as e:
         logger.error(f"❌ Error sending single reminder: {e}")
         capture_exception(e)
@@ -0,0 +1,147 @@
+"""
+Slot Reservation Service
+Atomically reserves appointment slots so concurrent bookings cannot double-book
+"""
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple, Hashable
+import logging
+
+logger = logging.getLogger(__name__)
+
+SLOT_TAKEN_MESSAGE = "Time slot already booked"
+INSERT_FAILED_MESSAGE = "Failed to create appointment"
+
+# Postgres error code for unique_violation and PostgREST code for unknown RPC
+UNIQUE_VIOLATION_CODE = "23505"
+FUNCTION_NOT_FOUND_CODE = "PGRST202"
+
+# Set to False the first time the RPC turns out not to be deployed, so we
+# don't pay an extra failed round trip on every booking afterwards
+_rpc_available = True
+
+# Per-slot locks (reference counted so the registry does not grow forever)
+_slot_locks: Dict[Hashable, list] = {}
+_slot_locks_guard = threading.Lock()
+
+
+@contextmanager
+def slot_lock(*key: Hashable):
+    """
+    Hold an in-process lock for one slot key, e.g. (doctor_id, date, time_slot).
+    Serializes check-then-insert for the same slot within this worker.
+    """
+    with _slot_locks_guard:
+        entry = _slot_locks.get(key)
+        if entry is None:
+            entry = [threading.Lock(), 0]
+            _slot_locks[key] = entry
+        entry[1] += 1
+    lock = entry[0]
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+        with _slot_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _slot_locks.pop(key, None)
+
+
+def _error_code(error: Exception) -> str:
+    """Best-effort extraction of a Postgres/PostgREST error code"""
+    code = getattr(error, "code", None)
+    if code:
+        return str(code)
+    text = str(error)
+    for known in (UNIQUE_VIOLATION_CODE, FUNCTION_NOT_FOUND_CODE):
+        if known in text:
+            return known
+    return ""
+
+
+def is_unique_violation(error: Exception) -> bool:
+    """True if the error is a unique constraint violation"""
+    return _error_code(error) == UNIQUE_VIOLATION_CODE or "duplicate key" in str(error).lower()
+
+
+def is_function_not_found(error: Exception) -> bool:
+    """True if PostgREST reports the called RPC function does not exist"""
+    return _error_code(error) == FUNCTION_NOT_FOUND_CODE
+
+
+def reserve_appointment_slot(appointment_record: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Reserve a doctor's time slot and create the appointment in one step.
+
+    Uses the reserve_appointment_slot Postgres function (one round trip,
+    INSERT ... ON CONFLICT DO NOTHING against the partial unique index on
+    doctor_id/date/time_slot). If the function is not deployed, falls back
+    to check-then-insert under an in-process per-slot lock; the unique index
+    still rejects duplicates coming from other workers.
+
+    Args:
+        appointment_record: Appointment fields (user_id, doctor_id, hospital_id,
+            date, time_slot, status, reason)
+
+    Returns:
+        (appointment, None) on success, (None, SLOT_TAKEN_MESSAGE) if the slot
+        is taken, (None, INSERT_FAILED_MESSAGE) if the insert returned no row
+    """
+    global _rpc_available
+
+    # Imported lazily so server_mobile can use slot_lock without the shared client
+    from database import get_supabase
+    supabase = get_supabase()
+    if not supabase:
+        return None, "Database not configured"
+
+    doctor_id = appointment_record["doctor_id"]
+    slot_date = str(appointment_record["date"])
+    time_slot = appointment_record["time_slot"]
+
+    if _rpc_available:
+        try:
+            result = supabase.rpc("reserve_appointment_slot", {
+                "p_user_id": appointment_record.get("user_id"),
+                "p_doctor_id": doctor_id,
+                "p_hospital_id": appointment_record.get("hospital_id"),
+                "p_date": slot_date,
+                "p_time_slot": time_slot,
+                "p_reason": appointment_record.get("reason"),
+                "p_status": appointment_record.get("status") or "pending"
+            }).execute()
+            rows = result.data or []
+            if isinstance(rows, dict):
+                rows = [rows]
+            if not rows:
+                return None, SLOT_TAKEN_MESSAGE
+            return rows[0], None
+        except Exception as e:
+            if is_unique_violation(e):
+                return None, SLOT_TAKEN_MESSAGE
+            if not is_function_not_found(e):
+                raise
+            logger.warning("reserve_appointment_slot RPC not found, using locked insert fallback")
+            _rpc_available = False
+
+    with slot_lock(doctor_id, slot_date, time_slot):
+        existing = supabase.table("appointments").select("id").eq(
+            "doctor_id", doctor_id
+        ).eq("date", slot_date).eq("time_slot", time_slot).neq(
+            "status", "cancelled"
+        ).limit(1).execute()
+        if existing.data:
+            return None, SLOT_TAKEN_MESSAGE
+
+        try:
+            result = supabase.table("appointments").insert(appointment_record).execute()
+        except Exception as e:
+            if is_unique_violation(e):
+                return None, SLOT_TAKEN_MESSAGE
+            raise
+
+        if not result.data:
+            return None, INSERT_FAILED_MESSAGE
+        return result.data[0], None
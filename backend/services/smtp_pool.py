@@ -0,0 +1,262 @@
+"""
+SMTP Connection Pool
+One authenticated SMTP session per hospital (or the global account), reused
+across emails until it idles out, so the TLS handshake and AUTH are paid once
+per burst of mail instead of once per message
+"""
+import asyncio
+import threading
+import time
+from email.message import Message
+from typing import Optional, Dict, Any, List, Hashable, Tuple
+import aiosmtplib
+from services.metrics import counter, histogram
+import logging
+
+logger = logging.getLogger(__name__)
+
+_connects = counter("smtp_connections_opened_total", "SMTP sessions opened (connect + TLS + AUTH)", ["pool"])
+_sent = counter("smtp_messages_total", "Messages handed to SMTP", ["pool", "result"])
+_send_latency = histogram(
+    "smtp_send_duration_seconds",
+    "Time to hand one message to the SMTP server (including any reconnect)",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+# Errors meaning the session is gone; only retried when raised by the NOOP probe,
+# i.e. before any part of the message went out
+_RECONNECT_ERRORS = (aiosmtplib.SMTPServerDisconnected, ConnectionError)
+
+# Default seconds of disuse before a session is probed with NOOP
+PROBE_AFTER_SECONDS = 5
+
+
+def _fingerprint(smtp_config: Dict[str, Any]) -> Tuple:
+    return (smtp_config["host"], smtp_config["port"], smtp_config["username"],
+            smtp_config["password"], bool(smtp_config.get("use_ssl")))
+
+
+class _Session:
+    """A connected client plus the bookkeeping needed to decide when to drop it"""
+
+    def __init__(self, client: aiosmtplib.SMTP, fingerprint: Tuple):
+        self.client = client
+        self.fingerprint = fingerprint
+        self.messages = 0
+        self.last_used = time.monotonic()
+        self.idle_handle: Optional[asyncio.TimerHandle] = None
+
+    async def close(self):
+        if self.idle_handle:
+            self.idle_handle.cancel()
+        try:
+            if self.client.is_connected:
+                await self.client.quit()
+        except Exception:
+            self.client.close()
+
+
+class SMTPConnectionPool:
+    """
+    Keyed SMTP sessions. Messages for one key are sent sequentially over its
+    session; a session is replaced when the account settings change, after
+    max_messages, after idle_timeout seconds without use, or when the server
+    drops it. Sessions belong to the event loop that first used the pool and
+    are only touched on that loop; callers on other loops (scheduler threads)
+    get one-off connections.
+
+    Args:
+        name: Label for metrics
+        idle_timeout: Seconds an unused session is kept open
+        max_messages: Messages per session before reconnecting (server limits)
+        require_starttls: Refuse to send without STARTTLS on non-SSL accounts
+        timeout: Connect/command timeout in seconds
+        probe_after: Seconds of disuse after which a session is checked with
+            NOOP before sending (a dead session is only replaced then, since a
+            failed send is never retried)
+    """
+
+    def __init__(self, name: str = "email", idle_timeout: float = 60, max_messages: int = 100,
+                 require_starttls: bool = True, timeout: float = 30,
+                 probe_after: float = PROBE_AFTER_SECONDS):
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.require_starttls = require_starttls
+        self.timeout = timeout
+        self.probe_after = probe_after
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._owner_lock = threading.Lock()  # guards taking over _loop from a closed one
+        self._sessions: Dict[Hashable, _Session] = {}
+        self._key_locks: Dict[Hashable, asyncio.Lock] = {}
+
+    async def _connect(self, smtp_config: Dict[str, Any]) -> aiosmtplib.SMTP:
+        use_ssl = bool(smtp_config.get("use_ssl"))
+        client = aiosmtplib.SMTP(
+            hostname=smtp_config["host"],
+            port=smtp_config["port"],
+            timeout=self.timeout,
+            # SSL accounts (465) use implicit TLS; others upgrade with STARTTLS
+            use_tls=use_ssl,
+            start_tls=False if use_ssl else (True if self.require_starttls else None)
+        )
+        await client.connect()
+        if smtp_config.get("username"):
+            await client.login(smtp_config["username"], smtp_config["password"])
+        _connects.inc(pool=self.name)
+        return client
+
+    async def _session(self, key: Hashable, smtp_config: Dict[str, Any]) -> _Session:
+        """Current usable session for key, (re)connecting when needed"""
+        session = self._sessions.get(key)
+        fingerprint = _fingerprint(smtp_config)
+        if session is not None:
+            if (session.fingerprint == fingerprint
+                    and session.messages < self.max_messages
+                    and time.monotonic() - session.last_used <= self.idle_timeout
+                    and session.client.is_connected):
+                return session
+            del self._sessions[key]
+            await session.close()
+        session = _Session(await self._connect(smtp_config), fingerprint)
+        self._sessions[key] = session
+        return session
+
+    def _schedule_idle_close(self, key: Hashable, session: _Session):
+        if session.idle_handle:
+            session.idle_handle.cancel()
+
+        def close_if_idle():
+            if self._sessions.get(key) is session and not self._key_locks[key].locked():
+                del self._sessions[key]
+                asyncio.ensure_future(session.close())
+
+        session.idle_handle = self._loop.call_later(self.idle_timeout, close_if_idle)
+
+    def _drop(self, key: Hashable):
+        session = self._sessions.pop(key, None)
+        if session:
+            if session.idle_handle:
+                session.idle_handle.cancel()
+            session.client.close()
+
+    async def _send_one(self, key: Hashable, smtp_config: Dict[str, Any], message: Message):
+        session = await self._session(key, smtp_config)
+        if session.messages and time.monotonic() - session.last_used >= self.probe_after:
+            try:
+                await session.client.noop()
+            except _RECONNECT_ERRORS:
+                # Reused session went away (server idle timeout); nothing was sent yet
+                self._drop(key)
+                session = await self._session(key, smtp_config)
+        try:
+            await session.client.send_message(message)
+        except (aiosmtplib.SMTPServerDisconnected, ConnectionError, asyncio.TimeoutError):
+            # The server may already have accepted the message: never resend,
+            # just don't reuse a session in an unknown state
+            self._drop(key)
+            raise
+        session.messages += 1
+        session.last_used = time.monotonic()
+        self._schedule_idle_close(key, session)
+
+    async def _send_unpooled(self, smtp_config: Dict[str, Any], messages: List[Message]) -> List[Optional[str]]:
+        client = await self._connect(smtp_config)
+        results: List[Optional[str]] = []
+        try:
+            for message in messages:
+                try:
+                    await client.send_message(message)
+                    results.append(None)
+                except Exception as e:
+                    results.append(str(e) or e.__class__.__name__)
+        finally:
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+        return results
+
+    async def send_messages(self, key: Hashable, smtp_config: Dict[str, Any],
+                            messages: List[Message]) -> List[Optional[str]]:
+        """
+        Send messages over the key's session, in order
+
+        Args:
+            key: Pool key (hospital id, or None for the global account)
+            smtp_config: Account settings (host, port, username, password, use_ssl)
+            messages: Prepared messages (From/To/Subject set)
+
+        Returns:
+            One entry per message: None if accepted, otherwise the error text
+        """
+        loop = asyncio.get_running_loop()
+        with self._owner_lock:
+            if self._loop is None or self._loop.is_closed():
+                # First use, or the owning loop is gone along with its sockets
+                self._loop = loop
+                self._sessions = {}
+                self._key_locks = {}
+            owned = loop is self._loop
+        if not owned:
+            try:
+                results = await self._send_unpooled(smtp_config, messages)
+            except Exception as e:
+                results = [str(e) or e.__class__.__name__] * len(messages)
+            for error in results:
+                _sent.inc(pool=self.name, result="error" if error else "sent")
+            return results
+
+        results: List[Optional[str]] = []
+        async with self._key_locks.setdefault(key, asyncio.Lock()):
+            for index, message in enumerate(messages):
+                started = time.monotonic()
+                try:
+                    await self._send_one(key, smtp_config, message)
+                    results.append(None)
+                except (aiosmtplib.SMTPAuthenticationError, aiosmtplib.SMTPConnectError) as e:
+                    # Every remaining message would fail the same way
+                    self._drop(key)
+                    remaining = len(messages) - index
+                    results.extend([str(e) or e.__class__.__name__] * remaining)
+                    _sent.inc(remaining, pool=self.name, result="error")
+                    return results
+                except Exception as e:
+                    results.append(str(e) or e.__class__.__name__)
+                _send_latency.observe(time.monotonic() - started)
+                _sent.inc(pool=self.name, result="error" if results[-1] else "sent")
+        return results
+
+    async def close(self, key: Hashable = None):
+        """Close one key's session (after its settings change) or all sessions"""
+        with self._owner_lock:
+            owner = self._loop
+        if owner is None or owner.is_closed():
+            return
+        if asyncio.get_running_loop() is owner:
+            await self._close_sessions(key)
+            return
+        # Sessions are only touched on their own loop
+        try:
+            owner.call_soon_threadsafe(lambda: asyncio.ensure_future(self._close_sessions(key)))
+        except RuntimeError:
+            pass  # Owner loop closed meanwhile; its sessions went with it
+
+    async def _close_sessions(self, key: Hashable = None):
+        keys = list(self._sessions) if key is None else [key]
+        for k in keys:
+            session = self._sessions.pop(k, None)
+            if session is not None:
+                await session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "sessions": len(self._sessions),
+            "idle_timeout_seconds": self.idle_timeout,
+            "max_messages_per_session": self.max_messages,
+            "per_key": {
+                str(key): {"messages": s.messages, "idle_seconds": round(now - s.last_used, 1)}
+                for key, s in list(self._sessions.items())
+            }
+        }
@@ -0,0 +1,168 @@
+"""
+Static Assets
+In-memory copies of small static files (the admin panel) served with strong
+ETags, If-None-Match revalidation and precomputed gzip/brotli variants. The
+file is re-read only when its mtime or size changes, and that stat is done at
+most once per check interval, so probes of / do no disk I/O.
+"""
+import gzip
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+from services.metrics import counter
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+MIN_COMPRESS_SIZE = 1024  # Smaller bodies are sent as-is
+
+_responses = counter("static_asset_responses_total", "Static asset responses", ["asset", "result"])
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """{"gzip": 1.0, "br": 0.5, ...} from an Accept-Encoding header"""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def etag_matches(if_none_match: Optional[str], etags: List[str]) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for this header)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(etag in candidates for etag in etags)
+
+
+class _Variant:
+    def __init__(self, body: bytes, etag: str, encoding: Optional[str]):
+        self.body = body
+        self.etag = etag
+        self.encoding = encoding
+
+
+class StaticAsset:
+    """
+    One file served from memory
+
+    Args:
+        name: Label for logs and metrics
+        paths: Candidate locations, first existing one wins
+        media_type: Content-Type
+        cache_control: Cache-Control header for 200/304 responses
+        check_interval: Seconds between mtime checks
+    """
+
+    def __init__(self, name: str, paths: List[Path], media_type: str = "text/html; charset=utf-8",
+                 cache_control: str = "no-cache", check_interval: float = 2.0):
+        self.name = name
+        self.paths = [Path(p) for p in paths]
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[str, float, int]] = None  # (path, mtime, size)
+        self._variants: Dict[Optional[str], _Variant] = {}
+        self._checked_at: Optional[float] = None
+        self._loads = 0
+
+    def _locate(self) -> Optional[Tuple[Path, float, int]]:
+        for path in self.paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            return path, stat.st_mtime, stat.st_size
+        return None
+
+    def _load(self, path: Path) -> Dict[Optional[str], _Variant]:
+        body = path.read_bytes()
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        variants = {None: _Variant(body, f'"{digest}"', None)}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            variants["gzip"] = _Variant(gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"', "gzip")
+            if BROTLI_AVAILABLE:
+                variants["br"] = _Variant(brotli.compress(body, quality=11), f'"{digest}-br"', "br")
+        return variants
+
+    def _current(self) -> Dict[Optional[str], _Variant]:
+        """Variants of the current file contents (empty if no candidate exists)"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._variants
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return self._variants
+            located = self._locate()
+            signature = (str(located[0]), located[1], located[2]) if located else None
+            if signature != self._signature:
+                self._variants = {}
+                if located:
+                    try:
+                        self._variants = self._load(located[0])
+                        self._loads += 1
+                        logger.info(f"📄 Loaded {self.name} from {located[0]} ({located[2]} bytes)")
+                    except OSError as e:
+                        logger.error(f"❌ Error loading {self.name}: {e}")
+                        signature = None  # Retry on the next check
+                self._signature = signature
+            self._checked_at = now
+            return self._variants
+
+    def exists(self) -> bool:
+        return bool(self._current())
+
+    def response(self, request: Request) -> Optional[Response]:
+        """200 with the best encoding the client accepts, 304 on a matching ETag, None if the file is missing"""
+        variants = self._current()
+        if not variants:
+            return None
+
+        accepted = parse_accept_encoding(request.headers.get("accept-encoding"))
+        variant = variants[None]
+        for encoding in ("br", "gzip"):
+            if encoding in variants and accepted.get(encoding, 0) > 0:
+                variant = variants[encoding]
+                break
+
+        headers = {"ETag": variant.etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), [v.etag for v in variants.values()]):
+            _responses.inc(asset=self.name, result="not_modified")
+            return Response(status_code=304, headers=headers)
+
+        if variant.encoding:
+            headers["Content-Encoding"] = variant.encoding
+        _responses.inc(asset=self.name, result=variant.encoding or "identity")
+        return Response(content=variant.body, media_type=self.media_type, headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        variants = self._variants
+        return {
+            "path": self._signature[0] if self._signature else None,
+            "loads": self._loads,
+            "variants": {encoding or "identity": len(v.body) for encoding, v in variants.items()},
+            "etag": variants[None].etag if variants else None
+        }
@@ -0,0 +1,169 @@
+"""
+UPI QR Codes
+Renders UPI payment QR codes as data URIs (PNG or compact SVG) behind an LRU
+cache keyed by (upi_id, amount, transaction_id, format), plus a batch
+pre-render of a hospital's fixed-amount fee codes
+"""
+from decimal import Decimal, InvalidOperation
+from typing import Optional, Dict, Any, Iterable, List
+from services.lru_cache import LRUCache
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import qrcode
+    import io
+    import base64
+    QR_AVAILABLE = True
+except ImportError:
+    QR_AVAILABLE = False
+
+QR_FORMATS = ("png", "svg")
+
+# Most fee amounts one fee-qr request may render (each is rendered per UPI app)
+MAX_FEE_AMOUNTS = 10
+
+# App name -> hospital column holding its UPI ID (falls back to hospitals.upi_id)
+UPI_APPS = {
+    "gpay": "gpay_upi_id",
+    "phonepay": "phonepay_upi_id",
+    "paytm": "paytm_upi_id",
+    "bhimupi": "bhim_upi_id",
+}
+
+PLACEHOLDER_QR = "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjUwIiBoZWlnaHQ9IjI1MCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj48cmVjdCB3aWR0aD0iMjUwIiBoZWlnaHQ9IjI1MCIgZmlsbD0iI2Y5ZmFmYiIvPjx0ZXh0IHg9IjUwJSIgeT0iNTAlIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiM2YjcyODAiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIuM2VtIj5VUEkgUVIgQ29kZTwvdGV4dD48L3N2Zz4="
+
+# Rendered codes never go stale for a given key, so entries only leave by LRU eviction
+_qr_cache = LRUCache("upi_qr", maxsize=config.UPI_QR_CACHE_MAX_SIZE)
+
+
+def build_upi_url(upi_id: str, amount: str, transaction_id: Optional[str] = None) -> str:
+    """UPI deep link encoded in the QR code (no tr= for reusable fee codes)"""
+    upi_url = f"upi://pay?pa={upi_id}&am={amount}&tn=Appointment%20Payment"
+    if transaction_id:
+        upi_url += f"&tr={transaction_id}"
+    return upi_url
+
+
+def _svg_from_matrix(matrix) -> bytes:
+    """
+    One <path> on a 1-unit module grid, each row's dark modules merged into
+    horizontal runs; far smaller than qrcode's own SVG factories
+    """
+    size = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            path.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/><path d="{"".join(path)}"/></svg>'
+    ).encode()
+
+
+def _render(upi_url: str, fmt: str) -> str:
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(upi_url)
+    qr.make(fit=True)
+
+    if fmt == "svg":
+        data = _svg_from_matrix(qr.get_matrix())
+        mime = "image/svg+xml"
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        buffered = io.BytesIO()
+        img.save(buffered, format="PNG")
+        data = buffered.getvalue()
+        mime = "image/png"
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+
+def render_upi_qr(upi_id: str, amount: str, transaction_id: Optional[str] = None,
+                  fmt: str = "png") -> str:
+    """
+    UPI QR code as a data URI, rendered once per distinct input
+
+    Args:
+        upi_id: Payee UPI ID
+        amount: Amount in rupees, as shown to the payer
+        transaction_id: Transaction reference (None for a reusable fee code)
+        fmt: "png" or "svg"
+
+    Returns:
+        data:image/...;base64 URI (a placeholder image if rendering is unavailable)
+    """
+    if fmt not in QR_FORMATS:
+        raise ValueError(f"Unsupported QR format: {fmt}")
+    if not QR_AVAILABLE:
+        return PLACEHOLDER_QR
+
+    upi_url = build_upi_url(upi_id, amount, transaction_id)
+    try:
+        return _qr_cache.get_or_load((upi_id, str(amount), transaction_id, fmt), lambda: _render(upi_url, fmt))
+    except Exception as e:
+        logger.warning(f"⚠️ Could not render UPI QR code: {e}")
+        return PLACEHOLDER_QR
+
+
+def hospital_upi_ids(hospital: Dict[str, Any]) -> Dict[str, str]:
+    """UPI ID per payment app for a hospital row (app-specific, else the default)"""
+    default_upi = hospital.get("upi_id") or "hospital@upi"
+    return {app: hospital.get(column) or default_upi for app, column in UPI_APPS.items()}
+
+
+def parse_fee_amounts(amounts: str) -> List[str]:
+    """
+    Comma-separated fee amounts -> normalised amount strings ("500", "99.50")
+
+    Raises:
+        ValueError: More than MAX_FEE_AMOUNTS entries, or an entry that is not
+            a positive amount with at most 2 decimal places
+    """
+    items = [a.strip() for a in amounts.split(",") if a.strip()]
+    if len(items) > MAX_FEE_AMOUNTS:
+        raise ValueError(f"At most {MAX_FEE_AMOUNTS} amounts allowed")
+    parsed = []
+    for item in items:
+        try:
+            value = Decimal(item)
+        except InvalidOperation:
+            raise ValueError(f"Invalid amount: {item}")
+        if not value.is_finite() or value <= 0 or value.as_tuple().exponent < -2:
+            raise ValueError(f"Invalid amount: {item}")
+        parsed.append(f"{value:f}")
+    return parsed
+
+
+def prerender_hospital_qr_codes(hospital: Dict[str, Any], amounts: Optional[Iterable[str]] = None,
+                                fmt: str = "png") -> Dict[str, Dict[str, str]]:
+    """
+    Render (and cache) a hospital's reusable fixed-amount fee QR codes
+
+    Args:
+        hospital: Hospital row with its UPI ID columns
+        amounts: Fee amounts in rupees (defaults to UPI_QR_FEE_AMOUNTS)
+        fmt: "png" or "svg"
+
+    Returns:
+        {amount: {app: data URI}}
+    """
+    if amounts is None:
+        amounts = [a.strip() for a in config.UPI_QR_FEE_AMOUNTS.split(",") if a.strip()]
+    upi_ids = hospital_upi_ids(hospital)
+    return {
+        str(amount): {app: render_upi_qr(upi_id, str(amount), None, fmt) for app, upi_id in upi_ids.items()}
+        for amount in amounts
+    }
+
+
+def get_qr_cache_stats() -> Dict[str, Any]:
+    return _qr_cache.stats()
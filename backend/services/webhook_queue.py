@@ -0,0 +1,352 @@
+"""
+Webhook Queue
+Durable local queue (SQLite) for verified Razorpay webhooks plus an asyncio
+worker pool that processes them in arrival order per razorpay_order_id, so the
+webhook endpoint can acknowledge as soon as the event is on disk
+"""
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+from services.metrics import counter, histogram
+import logging
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"  # Gave up after max_attempts; kept for inspection
+
+SCAN_LIMIT = 500  # Ready events fetched per dispatch pass
+
+_enqueued = counter("webhook_queue_enqueued_total", "Webhooks persisted to the local queue", ["result"])
+_processed = counter("webhook_queue_processed_total", "Queued webhooks processed by workers", ["result"])
+_queue_latency = histogram(
+    "webhook_queue_delay_seconds",
+    "Time from webhook receipt to processing completion",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    webhook_id TEXT NOT NULL UNIQUE,
+    order_key TEXT NOT NULL,
+    body TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    received_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    claimed_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_open ON webhook_events(status, id);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_order ON webhook_events(order_key, status, id);
+"""
+
+# Handler result: {"status": "success" | "error", "message": str, "retry": bool}
+WebhookHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class WebhookQueue:
+    """
+    SQLite-backed queue. Rows are fsynced before enqueue() returns, claimed
+    atomically (safe with several server processes sharing the file) and
+    kept until purged so duplicates are recognised by webhook_id.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(_SCHEMA)
+        self._closed = False
+
+    def enqueue(self, webhook_id: str, order_key: str, body: str, signature: str) -> bool:
+        """
+        Persist a verified webhook.
+
+        Returns:
+            True if stored, False if this webhook_id is already queued or processed
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO webhook_events "
+                "(webhook_id, order_key, body, signature, received_at, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (webhook_id, order_key, body, signature, now, now)
+            )
+        stored = cursor.rowcount == 1
+        _enqueued.inc(result="stored" if stored else "duplicate")
+        return stored
+
+    def ready_events(self, limit: int = SCAN_LIMIT) -> List[sqlite3.Row]:
+        """
+        The oldest open event of each order, if it is pending and due, oldest
+        first. Events waiting on a retry delay or behind an in-progress event of
+        the same order are left out, so they cannot crowd out other orders.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM webhook_events AS e WHERE e.status = ? AND e.next_attempt_at <= ? "
+                "AND NOT EXISTS (SELECT 1 FROM webhook_events AS o WHERE o.order_key = e.order_key "
+                "AND o.status IN (?, ?) AND (o.id < e.id OR o.status = ?)) "
+                "ORDER BY e.id LIMIT ?",
+                (PENDING, time.time(), PENDING, PROCESSING, PROCESSING, limit)
+            ).fetchall()
+
+    def claim(self, event_id: int) -> bool:
+        """Move one pending event to processing; False if another worker got it first"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE webhook_events SET status = ?, claimed_at = ?, attempts = attempts + 1 "
+                "WHERE id = ? AND status = ?",
+                (PROCESSING, time.time(), event_id, PENDING)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, event_id: int, error: Optional[str] = None):
+        with self._lock:
+            if self._closed:
+                return  # Shutdown raced the worker; the lease expires and the event is redone
+            self._conn.execute(
+                "UPDATE webhook_events SET status = ?, finished_at = ?, last_error = ? WHERE id = ?",
+                (DONE, time.time(), error, event_id)
+            )
+
+    def retry_later(self, event_id: int, error: str, delay: float, give_up: bool):
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute(
+                "UPDATE webhook_events SET status = ?, next_attempt_at = ?, last_error = ?, finished_at = ? "
+                "WHERE id = ?",
+                (FAILED if give_up else PENDING, time.time() + delay, error,
+                 time.time() if give_up else None, event_id)
+            )
+
+    def release_expired_leases(self) -> int:
+        """Return events stuck in processing (worker died) to pending"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE webhook_events SET status = ? WHERE status = ? AND claimed_at < ?",
+                (PENDING, PROCESSING, time.time() - self.lease_seconds)
+            )
+        return cursor.rowcount
+
+    def purge(self, older_than_seconds: float) -> int:
+        """Delete finished events (done or failed) older than the retention window"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM webhook_events WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, time.time() - older_than_seconds)
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) AS n, MIN(received_at) AS oldest FROM webhook_events GROUP BY status"
+            ).fetchall()
+        counts = {row["status"]: row["n"] for row in rows}
+        oldest_open = min(
+            (row["oldest"] for row in rows if row["status"] in (PENDING, PROCESSING)), default=None
+        )
+        return {
+            "path": self.path,
+            "pending": counts.get(PENDING, 0),
+            "processing": counts.get(PROCESSING, 0),
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "oldest_open_age_seconds": round(time.time() - oldest_open, 3) if oldest_open else None
+        }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._conn.close()
+
+
+class WebhookWorkerPool:
+    """
+    Dispatches queued events to at most `workers` concurrent handler calls.
+    Only the oldest open event of each order is eligible, so events for one
+    razorpay_order_id are applied in the order they were received.
+    """
+
+    def __init__(self, queue: WebhookQueue, handler: WebhookHandler, workers: int = 4,
+                 max_attempts: int = 8, retry_backoff: float = 2.0, retention_seconds: float = 7 * 86400,
+                 poll_interval: float = 1.0):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.retention_seconds = retention_seconds
+        self.poll_interval = poll_interval
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self._last_lease_check = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._dispatcher is not None and not self._dispatcher.done()
+
+    def notify(self):
+        """Wake the dispatcher (call after enqueue)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        if self.running:
+            return
+        self._release_expired_leases()
+        self._last_lease_check = time.time()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        logger.info(f"✅ Webhook worker pool started ({self.workers} workers)")
+
+    async def stop(self, timeout: float = 10):
+        """
+        Stop dispatching and wait (bounded) for in-flight events. Stragglers
+        are cancelled and awaited, so nothing touches the queue after this
+        returns; their rows stay leased and are redone once the lease expires.
+        """
+        if not self._dispatcher:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+        if self._in_flight:
+            _, pending = await asyncio.wait(list(self._in_flight.values()), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.warning(f"⚠️ Cancelled {len(pending)} webhook(s) still processing at shutdown")
+        logger.info("✅ Webhook worker pool stopped")
+
+    async def _dispatch_loop(self):
+        while True:
+            try:
+                await self._maybe_release_leases()
+                await self._dispatch_ready()
+                await self._maybe_purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Webhook dispatcher error: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch_ready(self):
+        for row in await asyncio.to_thread(self.queue.ready_events):
+            if len(self._in_flight) >= self.workers:
+                return
+            order_key = row["order_key"]
+            if order_key in self._in_flight:
+                continue
+            if not await asyncio.to_thread(self.queue.claim, row["id"]):
+                continue
+            task = asyncio.create_task(self._process(dict(row)))
+            self._in_flight[order_key] = task
+
+    async def _process(self, event: Dict[str, Any]):
+        order_key = event["order_key"]
+        try:
+            try:
+                result = await self.handler(event)
+            except Exception as e:
+                result = {"status": "error", "message": str(e), "retry": True}
+
+            if result.get("status") == "success" or not result.get("retry"):
+                error = None if result.get("status") == "success" else result.get("message")
+                await asyncio.to_thread(self.queue.complete, event["id"], error)
+                _processed.inc(result="success" if error is None else "rejected")
+                _queue_latency.observe(time.time() - event["received_at"])
+                return
+
+            attempts = event["attempts"] + 1
+            give_up = attempts >= self.max_attempts
+            delay = random.uniform(0, self.retry_backoff * (2 ** attempts))
+            await asyncio.to_thread(self.queue.retry_later, event["id"], result.get("message") or "error",
+                                    delay, give_up)
+            if give_up:
+                _processed.inc(result="failed")
+                logger.error(f"❌ Webhook {event['webhook_id']} failed after {attempts} attempts: {result.get('message')}")
+            else:
+                _processed.inc(result="retry")
+                logger.warning(f"⚠️ Webhook {event['webhook_id']} will be retried: {result.get('message')}")
+        finally:
+            self._in_flight.pop(order_key, None)
+            self.notify()
+
+    def _release_expired_leases(self):
+        released = self.queue.release_expired_leases()
+        if released:
+            logger.warning(f"⚠️ Re-queued {released} webhook(s) left in processing")
+
+    async def _maybe_release_leases(self):
+        # Leases of events whose worker died (here or in another process sharing the file)
+        if time.time() - self._last_lease_check < min(60.0, self.queue.lease_seconds / 2):
+            return
+        self._last_lease_check = time.time()
+        await asyncio.to_thread(self._release_expired_leases)
+
+    async def _maybe_purge(self):
+        if time.time() - self._last_purge < 3600:
+            return
+        self._last_purge = time.time()
+        purged = await asyncio.to_thread(self.queue.purge, self.retention_seconds)
+        if purged:
+            logger.info(f"Purged {purged} finished webhook event(s)")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.queue.stats()
+        stats.update({"running": self.running, "workers": self.workers, "in_flight": len(self._in_flight)})
+        return stats
+
+
+_pool: Optional[WebhookWorkerPool] = None
+
+
+def start_webhook_workers(path: str, handler: WebhookHandler, workers: int = 4, **options) -> WebhookWorkerPool:
+    """Open the queue and start the worker pool (call from application startup)"""
+    global _pool
+    if _pool is None:
+        _pool = WebhookWorkerPool(WebhookQueue(path), handler, workers=workers, **options)
+    _pool.start()
+    return _pool
+
+
+def get_webhook_pool() -> Optional[WebhookWorkerPool]:
+    """The running worker pool, or None when webhooks are processed inline"""
+    return _pool if _pool is not None and _pool.running else None
+
+
+async def stop_webhook_workers():
+    """Stop the worker pool and close the queue (call from application shutdown)"""
+    global _pool
+    if _pool is not None:
+        await _pool.stop()
+        _pool.queue.close()
+        _pool = None
@@ -0,0 +1,104 @@
+"""
+WhatsApp Outbox
+WhatsApp actions requested on a worker that doesn't own the Selenium sessions
+(see services.worker_role) are persisted to a local SQLite queue (the
+WebhookQueue storage, shared by all workers of the server) and performed by
+the primary worker's scheduler, in order per hospital.
+"""
+import json
+import random
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Dict, Any
+from services.webhook_queue import WebhookQueue, PENDING
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEND = "send"
+OPEN_SESSION = "open_session"
+CLOSE_SESSION = "close_session"
+
+RETENTION_SECONDS = 7 * 86400  # Finished actions kept for inspection
+
+_outbox: Optional[WebhookQueue] = None
+
+
+def get_outbox() -> WebhookQueue:
+    global _outbox
+    if _outbox is None:
+        _outbox = WebhookQueue(config.WHATSAPP_OUTBOX_PATH)
+    return _outbox
+
+
+def enqueue_whatsapp_action(action: str, hospital_id: int, **fields) -> bool:
+    """Queue an action for the primary worker; True once it is on disk"""
+    body = json.dumps(dict(fields, action=action, hospital_id=hospital_id))
+    stored = get_outbox().enqueue(uuid.uuid4().hex, f"hospital:{hospital_id}", body, "")
+    logger.info(f"📨 Queued WhatsApp {action} for hospital {hospital_id} on the primary worker")
+    return stored
+
+
+def _perform(action: Dict[str, Any]) -> bool:
+    from services.whatsapp_service import (
+        send_whatsapp_message_by_hospital_id, open_whatsapp_session, close_whatsapp_session
+    )
+    hospital_id = action["hospital_id"]
+    if action["action"] == SEND:
+        return send_whatsapp_message_by_hospital_id(hospital_id=hospital_id, mobile=action["mobile"],
+                                                    message=action["message"])
+    if action["action"] == OPEN_SESSION:
+        return open_whatsapp_session(hospital_id) is not None
+    if action["action"] == CLOSE_SESSION:
+        close_whatsapp_session(hospital_id)
+        return True
+    raise ValueError(f"Unknown WhatsApp action: {action['action']}")
+
+
+def drain_whatsapp_outbox(limit: int = 100) -> int:
+    """
+    Perform queued actions (primary worker only; scheduled every
+    WHATSAPP_OUTBOX_POLL_SECONDS). Returns the number performed.
+    """
+    if _outbox is None and not Path(config.WHATSAPP_OUTBOX_PATH).exists():
+        return 0  # Nothing was ever queued
+    outbox = get_outbox()
+    outbox.release_expired_leases()
+    outbox.purge(RETENTION_SECONDS)
+    performed = 0
+    seen = set()
+    for row in outbox.open_events():
+        if performed >= limit:
+            break
+        if row["order_key"] in seen:
+            continue  # An older action of this hospital is still open
+        if (row["status"] != PENDING or row["next_attempt_at"] > time.time()
+                or not outbox.claim(row["id"])):
+            seen.add(row["order_key"])
+            continue
+        try:
+            ok = _perform(json.loads(row["body"]))
+            error = None if ok else "WhatsApp action failed"
+        except Exception as e:
+            ok, error = False, str(e)
+        if ok:
+            outbox.complete(row["id"])
+            performed += 1
+            continue
+        seen.add(row["order_key"])
+        attempts = row["attempts"] + 1
+        give_up = attempts >= config.WHATSAPP_OUTBOX_MAX_ATTEMPTS
+        outbox.retry_later(row["id"], error, random.uniform(0, 30 * (2 ** attempts)), give_up)
+        log = logger.error if give_up else logger.warning
+        log(f"⚠️ WhatsApp outbox action {row['id']} failed (attempt {attempts}): {error}")
+    if performed:
+        logger.info(f"📤 Performed {performed} queued WhatsApp action(s)")
+    return performed
+
+
+def get_outbox_stats() -> Dict[str, Any]:
+    if _outbox is None and not Path(config.WHATSAPP_OUTBOX_PATH).exists():
+        return {"path": config.WHATSAPP_OUTBOX_PATH, "pending": 0}
+    return get_outbox().stats()
@@ -16,6 +16,8 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
 from services.message_logger import log_message
+from services.worker_role import is_primary
+from services.whatsapp_outbox import enqueue_whatsapp_action, SEND
 
 logger = logging.getLogger(__name__)
 
@@ -202,6 +204,10 @@ def send_whatsapp_message_by_hospital_id(
     # Remove any spaces or dashes
     mobile = mobile.replace(" ", "").replace("-", "")
     
+    # Sessions live in the primary worker; others hand the message over
+    if not is_primary():
+        return enqueue_whatsapp_action(SEND, hospital_id, mobile=mobile, message=message)
+    
     # Get driver
     driver = get_whatsapp_driver(hospital_id)
     if not driver:
@@ -243,3 +249,7 @@ def close_whatsapp_session(hospital_id: int):
         del _driver_sessions[hospital_id]
         logger.info(f"WhatsApp session closed for hospital {hospital_id}")
 
+
+def get_session_stats() -> dict:
+    """Open WhatsApp Web sessions (in-memory, no browser calls)"""
+    return {"sessions": len(_driver_sessions), "hospital_ids": sorted(_driver_sessions)}
@@ -0,0 +1,155 @@
+"""
+Worker Role
+With several server workers (run_servers.py --workers N) the singleton duties
+of the web server, the APScheduler jobs and the Selenium WhatsApp sessions
+(a hospital's Chrome profile can only be opened by one process), belong to
+exactly one worker: whichever holds an exclusive flock on PRIMARY_LOCK_PATH.
+The other workers keep retrying the lock, so a replacement takes over when
+the primary exits (crash, max-requests recycling or a rolling restart).
+With a single process the lock is simply always acquired.
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows: single process only, always primary
+    fcntl = None
+
+
+class PrimaryLock:
+    """Non-blocking exclusive lock on a file, held until release() or process exit"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            self._file = True
+            return True
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        file = open(self.path, "a+")
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+        file.seek(0)
+        file.truncate()
+        file.write(f"{os.getpid()}\n")
+        file.flush()
+        self._file = file
+        return True
+
+    def release(self):
+        file, self._file = self._file, None
+        if file is None or file is True:
+            return
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        finally:
+            file.close()
+
+
+class PrimaryElection:
+    """
+    Acquire the primary lock now or later and run on_acquire once when it is
+
+    Args:
+        path: Lock file shared by the workers of one service
+        on_acquire: Starts the singleton duties (called from the retry thread
+            when the lock is acquired after start())
+        interval: Seconds between attempts while another worker is primary
+    """
+
+    def __init__(self, path: str, on_acquire: Callable[[], None], interval: float = 10):
+        self.lock = PrimaryLock(path)
+        self.on_acquire = on_acquire
+        self.interval = interval
+        self.acquired_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def primary(self) -> bool:
+        return self.lock.held
+
+    def _attempt(self) -> bool:
+        if not self.lock.try_acquire():
+            return False
+        self.acquired_at = time.time()
+        logger.info(f"👑 Worker {os.getpid()} is primary (scheduler and WhatsApp sessions)")
+        try:
+            self.on_acquire()
+        except Exception as e:
+            logger.error(f"❌ Failed to start primary duties: {e}")
+        return True
+
+    def start(self):
+        self._stop.clear()
+        if self._attempt():
+            return
+        logger.info(f"Worker {os.getpid()} is secondary; retrying the primary lock every {self.interval}s")
+
+        def run():
+            while not self._stop.wait(self.interval):
+                if self._attempt():
+                    return
+
+        self._thread = threading.Thread(target=run, name="primary-election", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop retrying and release the lock (call after the duties are shut down)"""
+        self._stop.set()
+        self.lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "primary": self.primary,
+            "primary_since": self.acquired_at if self.primary else None,
+            "lock_path": self.lock.path
+        }
+
+
+_election: Optional[PrimaryElection] = None
+
+
+def start_primary_election(path: str, on_acquire: Callable[[], None], interval: float = 10) -> PrimaryElection:
+    global _election
+    _election = PrimaryElection(path, on_acquire, interval)
+    _election.start()
+    return _election
+
+
+def stop_primary_election():
+    if _election is not None:
+        _election.stop()
+
+
+def is_primary() -> bool:
+    """
+    True in the worker that owns the singleton duties. Processes that never
+    started an election (single-process scripts, tools) count as primary.
+    """
+    return _election is None or _election.primary
+
+
+def get_role_stats() -> Dict[str, Any]:
+    if _election is None:
+        return {"pid": os.getpid(), "primary": True, "election": False}
+    return _election.stats()
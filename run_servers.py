@@ -8,6 +8,13 @@ Usage:
     python3 run_servers.py --mobile  # Run only mobile server
     python3 run_servers.py --web     # Run only web server
     python3 run_servers.py --check   # Just check configuration
+    python3 run_servers.py --workers 4   # Production: gunicorn master + 4 uvicorn workers per server
+
+With --workers, each server runs under gunicorn (backend/gunicorn_conf.py):
+the app is preloaded in the master and forked, hung workers are replaced, and
+`kill -HUP <run_servers pid>` replaces every worker gracefully (add
+--no-preload so a SIGHUP also picks up code changes). One web worker owns the
+scheduler and WhatsApp sessions (backend/services/worker_role.py).
 """
 
 import os
@@ -159,7 +166,26 @@ def wait_for_server(url, name, timeout=30):
     print_warning(f"{name} server did not respond within {timeout} seconds")
     return False
 
-def run_mobile_server():
+def gunicorn_available():
+    """gunicorn is POSIX-only and optional (needed for --workers)"""
+    try:
+        import gunicorn  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def server_command(module, port, workers, host):
+    """`python <module>.py`, or a gunicorn master with uvicorn workers when workers > 1"""
+    if workers <= 1:
+        return [sys.executable, f"{module}.py"]
+    return [
+        sys.executable, "-m", "gunicorn", f"{module}:app",
+        "--config", "gunicorn_conf.py",
+        "--workers", str(workers),
+        "--bind", f"{host}:{port}",
+    ]
+
+def run_mobile_server(workers=1, host="0.0.0.0", preload=True):
     """Run mobile server on port 8000"""
     backend_dir = Path(__file__).parent / "backend"
     server_file = backend_dir / "server_mobile.py"
@@ -168,15 +194,17 @@ def run_mobile_server():
         print_error(f"Mobile server file not found: {server_file}")
         return None
     
-    print_info(f"Starting Mobile Server (Port 8000)...")
+    print_info(f"Starting Mobile Server (Port 8000)" + (f" with {workers} workers..." if workers > 1 else "..."))
     print_info(f"Directory: {backend_dir}")
     
     # Change to backend directory and run server
     env = os.environ.copy()
     env['PYTHONPATH'] = str(backend_dir)
+    env['GUNICORN_PRELOAD'] = "true" if preload else "false"
+    env['SERVER_WORKERS'] = str(workers)
     
     process = subprocess.Popen(
-        [sys.executable, "server_mobile.py"],
+        server_command("server_mobile", 8000, workers, host),
         cwd=str(backend_dir),
         env=env,
         stdout=subprocess.PIPE,
@@ -187,7 +215,7 @@ def run_mobile_server():
     
     return process
 
-def run_web_server():
+def run_web_server(workers=1, host="0.0.0.0", preload=True):
     """Run web server on port 3000"""
     backend_dir = Path(__file__).parent / "backend"
     server_file = backend_dir / "server_web.py"
@@ -196,15 +224,17 @@ def run_web_server():
         print_error(f"Web server file not found: {server_file}")
         return None
     
-    print_info(f"Starting Web Server (Port 3000)...")
+    print_info(f"Starting Web Server (Port 3000)" + (f" with {workers} workers..." if workers > 1 else "..."))
     print_info(f"Directory: {backend_dir}")
     
     # Change to backend directory and run server
     env = os.environ.copy()
     env['PYTHONPATH'] = str(backend_dir)
+    env['GUNICORN_PRELOAD'] = "true" if preload else "false"
+    env['SERVER_WORKERS'] = str(workers)
     
     process = subprocess.Popen(
-        [sys.executable, "server_web.py"],
+        server_command("server_web", 3000, workers, host),
         cwd=str(backend_dir),
         env=env,
         stdout=subprocess.PIPE,
@@ -226,6 +256,11 @@ def main():
     parser.add_argument('--mobile', action='store_true', help='Run only mobile server')
     parser.add_argument('--web', action='store_true', help='Run only web server')
     parser.add_argument('--check', action='store_true', help='Just check configuration')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes per server; above 1 runs gunicorn with uvicorn workers')
+    parser.add_argument('--host', default='0.0.0.0', help='Bind address with --workers (default: 0.0.0.0)')
+    parser.add_argument('--no-preload', action='store_true',
+                        help='Import the app in each worker instead of the master (SIGHUP then reloads code)')
     args = parser.parse_args()
     
     print_header("Hospital Project - Server Runner")
@@ -241,6 +276,10 @@ def main():
         print_success("Configuration check completed!")
         return
     
+    if args.workers > 1 and not gunicorn_available():
+        print_error("--workers needs gunicorn (Linux/macOS). Run: pip3 install gunicorn")
+        sys.exit(1)
+    
     # Determine which servers to run
     run_mobile = args.mobile or (not args.web and not args.mobile)
     run_web = args.web or (not args.mobile and not args.web)
@@ -263,14 +302,14 @@ def main():
     try:
         # Start servers
         if run_mobile:
-            mobile_process = run_mobile_server()
+            mobile_process = run_mobile_server(args.workers, args.host, not args.no_preload)
             if mobile_process:
                 processes.append(("Mobile", mobile_process, Colors.CYAN))
                 # Start thread to print output
                 Thread(target=print_output, args=(mobile_process, "Mobile", Colors.CYAN), daemon=True).start()
         
         if run_web:
-            web_process = run_web_server()
+            web_process = run_web_server(args.workers, args.host, not args.no_preload)
             if web_process:
                 processes.append(("Web", web_process, Colors.MAGENTA))
                 # Start thread to print output
@@ -280,6 +319,19 @@ def main():
             print_error("No servers started!")
             sys.exit(1)
         
+        # SIGHUP: gunicorn masters start fresh workers and drain the old ones
+        def reload_workers(signum, frame):
+            if args.workers <= 1:
+                print_warning("SIGHUP ignored: graceful reloads need --workers > 1")
+                return
+            for name, process, _ in processes:
+                if process.poll() is None:
+                    print_info(f"Reloading {name} workers...")
+                    process.send_signal(signal.SIGHUP)
+        
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, reload_workers)
+        
         # Wait a bit for servers to start
         time.sleep(3)
         
@@ -313,7 +365,8 @@ def main():
             print_info(f"Stopping {name} server...")
             process.terminate()
             try:
-                process.wait(timeout=5)
+                # gunicorn lets in-flight requests finish (GUNICORN_GRACEFUL_TIMEOUT)
+                process.wait(timeout=35 if args.workers > 1 else 5)
                 print_success(f"{name} server stopped")
             except subprocess.TimeoutExpired:
                 print_warning(f"{name} server didn't stop gracefully, forcing...")